@@ -0,0 +1,66 @@
+# bench_ble_commands.py - Dispatch cost per command for the BLE command router
+#
+# Run from firmware_esp32/: `python3 benchmarks/bench_ble_commands.py`
+# or on the unix port: `micropython benchmarks/bench_ble_commands.py`
+import sys
+import time
+
+sys.path.insert(0, ".")
+from tools.host_shims import install  # noqa: E402
+
+install()
+
+from lib.ble_commands import (  # noqa: E402
+    OP_OTA_CONFIG,
+    OP_SCAN,
+    OP_WIFI_SET,
+    REQ_MAGIC,
+    TAG_PASS,
+    TAG_SSID,
+    CommandRouter,
+    Request,
+    pack_tlv,
+    parse_ota_text,
+    parse_wifi_text,
+)
+
+ITERATIONS = 5000
+
+
+def _noop(req: Request) -> None:
+    pass
+
+
+def _sink(payload: bytes) -> None:
+    pass
+
+
+def main() -> None:
+    router = CommandRouter(_sink)
+    router.register(OP_SCAN, _noop, alias="CMD:SCAN")
+    router.register(OP_OTA_CONFIG, _noop)
+    router.register_prefix("OTA:", OP_OTA_CONFIG, parse_ota_text, fallthrough=True)
+    router.register(OP_WIFI_SET, _noop)
+    router.set_text_fallback(OP_WIFI_SET, parse_wifi_text)
+
+    wifi_tlv = pack_tlv(TAG_SSID, b"Depot-North") + pack_tlv(TAG_PASS, b"hunter22")
+    cases = [
+        ("binary SCAN", bytes((REQ_MAGIC, OP_SCAN, 1, 0))),
+        ("binary WIFI_SET", bytes((REQ_MAGIC, OP_WIFI_SET, 2, len(wifi_tlv))) + wifi_tlv),
+        ("text CMD:SCAN", b"CMD:SCAN"),
+        ("text OTA:", b"OTA:Maninder-mike:last_mile_tracker:86400"),
+        ("text JSON wifi", b'{"ssid": "Depot-North", "pass": "hunter22"}'),
+        ("text SSID:PASS", b"Depot-North:hunter22"),
+    ]
+
+    print("command               us/dispatch")
+    for name, frame in cases:
+        start = time.ticks_us()  # type: ignore[attr-defined]
+        for _ in range(ITERATIONS):
+            router.dispatch(frame)
+        elapsed = time.ticks_diff(time.ticks_us(), start)  # type: ignore[attr-defined]
+        print("%-20s %10.2f" % (name, elapsed / ITERATIONS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# bench_deadband.py - Upload decision cost per sample for the deadband policy
+#
+# Compares Deadband.check() with the old hard-coded HttpPoster check (degree
+# thresholds plus a dict copy of every uploaded sample), for the built-in rule
+# table and a larger one. About one sample in five is uploaded; the sent
+# snapshot is committed for those. On the unix port the heap allocated per
+# sample is printed as well.
+#
+# Run from firmware_esp32/: `python3 benchmarks/bench_deadband.py`
+# or on the unix port: `micropython benchmarks/bench_deadband.py`
+import gc
+import random
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, ".")
+from tools.host_shims import install  # noqa: E402
+
+install()
+
+from lib.deadband import TRIG_NONE, Deadband, default_rules  # noqa: E402
+
+SAMPLES = 5000
+WIDE_RULES = default_rules(500) + [
+    {"field": "internal_temp", "abs": 2},
+    {"field": "battery_mv", "rel": 0.03, "max_s": 1800},
+    {"field": "speed", "abs": 5},
+    {"field": "course", "abs": 20},
+    {"field": "gps_fix", "abs": 0},
+    {"field": "pos_err_m", "rel": 0.5},
+    {"field": "trip_state", "abs": 0},
+    {"field": "bat_drop", "max_s": 3600},
+]
+
+
+def make_samples(rng: random.Random) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    lat, lon, temp = 52.52, 13.405, 4.0
+    for i in range(SAMPLES):
+        lat += rng.uniform(-1, 1) * 0.00004
+        lon += rng.uniform(-1, 1) * 0.00006
+        temp += rng.uniform(-0.1, 0.1)
+        probes = {"28aa%02x" % k: temp + k * 0.3 for k in range(4)}
+        out.append(
+            {
+                "lat": lat,
+                "lon": lon,
+                "speed": 30.0 + rng.uniform(-3, 3),
+                "course": 90.0 + rng.uniform(-10, 10),
+                "temp": temp,
+                "all_temps": probes,
+                "shock": 900 if i % 500 == 0 else rng.randrange(50),
+                "battery_mv": 3900 - i // 100,
+                "internal_temp": 30.0,
+                "gps_fix": True,
+                "pos_err_m": 0,
+                "trip_state": 1,
+                "bat_drop": 12,
+            }
+        )
+    return out
+
+
+class LegacyCheck:
+    """The removed HttpPoster._should_send: degree thresholds, dict copy per upload"""
+
+    def __init__(self) -> None:
+        self.last: Optional[Dict[str, Any]] = None
+        self.last_time = 0.0
+
+    def check(self, data: Dict[str, Any], now_ms: int) -> bool:
+        last = self.last
+        if last is None or now_ms / 1000 - self.last_time > 3600:
+            return True
+        if abs(data["lat"] - last["lat"]) > 0.0001 or abs(data["lon"] - last["lon"]) > 0.0001:
+            return True
+        if abs(data.get("temp", 0) - last.get("temp", 0)) > 0.5:
+            return True
+        last_temps = last.get("all_temps", {})
+        for rom, val in data.get("all_temps", {}).items():
+            if abs(val - last_temps.get(rom, -999)) > 0.5:
+                return True
+        shock: int = data.get("shock", 0)
+        return shock > 500
+
+    def commit(self, data: Dict[str, Any], now_ms: int) -> None:
+        self.last = data.copy()
+        self.last_time = now_ms / 1000
+
+
+def _alloc() -> int:
+    return gc.mem_alloc() if hasattr(gc, "mem_alloc") else 0  # MicroPython only
+
+
+def run(policy: Any, samples: List[Dict[str, Any]]) -> Tuple[float, int, float]:
+    sent = 0
+    gc.collect()
+    before = _alloc()
+    start = time.ticks_us()  # type: ignore[attr-defined]
+    for i, data in enumerate(samples):
+        now_ms = i * 1000
+        if policy.check(data, now_ms):
+            policy.commit(data, now_ms)
+            sent += 1
+    elapsed = time.ticks_diff(time.ticks_us(), start)  # type: ignore[attr-defined]
+    return elapsed / len(samples), sent, (_alloc() - before) / len(samples)
+
+
+def main() -> None:
+    samples = make_samples(random.Random(7))
+    cases = (
+        ("legacy (deg, copy)", LegacyCheck()),
+        ("built-in table", Deadband(default_rules(500))),
+        ("12-rule table", Deadband(WIDE_RULES)),
+    )
+    print("policy               us/sample  uploads  bytes/sample")
+    for name, policy in cases:
+        us, sent, alloc = run(policy, samples)
+        print("%-20s %9.2f %8d %13.1f" % (name, us, sent, alloc))
+    assert TRIG_NONE == 0  # check() results are truthy exactly when an upload is due
+    print("%d samples at 1 Hz; bytes/sample is 0 on CPython (no gc.mem_alloc)" % SAMPLES)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# bench_deflate.py - CPU time against bytes saved for deflated upload batches
+#
+# Batches are built the way the upload window sends them: RecordPolicy
+# records from a simulated delivery round, stamped with boot and seconds
+# since boot. Each batch size is serialized plain and deflated (ZLIB format)
+# at several window sizes. On CPython the host shim uses zlib with fixed
+# Huffman codes to stay close to MicroPython's compressor, but the timings
+# that matter are the unix port's (and, scaled, the ESP32's).
+#
+# Run from firmware_esp32/: `python3 benchmarks/bench_deflate.py`
+# or on the unix port: `micropython benchmarks/bench_deflate.py`
+import random
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, ".")
+from tools.host_shims import install  # noqa: E402
+
+install()
+
+from lib.payload_writer import PayloadWriter  # noqa: E402
+from lib.record_policy import RecordPolicy  # noqa: E402
+
+BATCH_SIZES = (1, 3, 10, 25, 50)
+WBITS = (8, 10, 12)
+REPEAT = 20
+
+
+def make_records(n: int, rng: random.Random) -> List[Dict[str, Any]]:
+    policy = RecordPolicy(interval_s=10)
+    lat, lon, temp = 52.52, 13.405, 4.0
+    out: List[Dict[str, Any]] = []
+    t = 0
+    while len(out) < n:
+        lat += rng.uniform(-1, 1) * 0.0003
+        lon += rng.uniform(-1, 1) * 0.0005
+        temp += rng.uniform(-0.05, 0.05)
+        sample = {
+            "lat": round(lat, 6),
+            "lon": round(lon, 6),
+            "speed": round(rng.uniform(0, 50), 1),
+            "course": round(rng.uniform(0, 360), 1),
+            "temp": round(temp, 2),
+            "internal_temp": 31.0,
+            "shock": rng.randrange(60),
+            "battery_mv": 3900 - t // 600,
+            "gps_fix": True,
+            "trip_state": 1,
+        }
+        rec = policy.offer(sample, t * 1000, 1718409600 + t)
+        if rec is not None:
+            rec = rec.copy()
+            rec["boot"] = 12
+            rec["mono"] = t
+            rec["ts"] = 1718409600 + t
+            out.append(rec)
+        t += 1
+    return out
+
+
+def payload(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "device_id": "trk-0042",
+        "provisioned_id": "LMT-7Q2K",
+        "tenant_id": "acme-cold",
+        "timestamp": 1718409600,
+        "ts_synced": True,
+        "batch": records,
+        "boot": 12,
+        "mono": 4321,
+    }
+
+
+def timed(writer: PayloadWriter, body: Dict[str, Any]) -> Tuple[int, float]:
+    start = time.ticks_us()  # type: ignore[attr-defined]
+    for _ in range(REPEAT):
+        out, _enc = writer.encode(body)
+    elapsed = time.ticks_diff(time.ticks_us(), start)  # type: ignore[attr-defined]
+    return len(out), elapsed / REPEAT / 1000
+
+
+def main() -> None:
+    records = make_records(max(BATCH_SIZES), random.Random(3))
+    print("records  plain B  plain ms  wbits  deflate B  saved  deflate ms  B saved/ms")
+    for n in BATCH_SIZES:
+        body = payload(records[:n])
+        plain, plain_ms = timed(PayloadWriter(enabled=False), body)
+        for wbits in WBITS:
+            size, ms = timed(PayloadWriter(min_bytes=0, wbits=wbits), body)
+            extra = ms - plain_ms
+            per_ms = (plain - size) / extra if extra > 0 else 0.0
+            row = (n, plain, plain_ms, wbits, size, 100 - 100 * size / plain, ms, per_ms)
+            print("%7d %8d %9.2f %6d %10d %5.0f%% %11.2f %11.0f" % row)
+    print("saved = smaller body; B saved/ms = bytes saved per ms of added CPU")
+
+
+if __name__ == "__main__":
+    main()
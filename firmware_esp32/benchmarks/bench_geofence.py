@@ -0,0 +1,80 @@
+# bench_geofence.py - Position checks per second against fence count
+#
+# Compares GeofenceEngine.check() (grid index) with testing every fence, for
+# a mix of circles and polygons spread over a ~100 x 100 km delivery area.
+#
+# Run from firmware_esp32/: `python3 benchmarks/bench_geofence.py`
+# or on the unix port: `micropython benchmarks/bench_geofence.py`
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, ".")
+from tools.host_shims import install  # noqa: E402
+
+install()
+
+from lib.geofence import M_PER_DEG, GeofenceEngine  # noqa: E402
+
+CHECKS = 2000
+FENCE_COUNTS = (10, 50, 100, 300)
+LAT0 = 52.52
+LON0 = 13.405
+
+
+def make_fences(n: int, rng: random.Random) -> List[Dict[str, Any]]:
+    specs: List[Dict[str, Any]] = []
+    for i in range(n):
+        lat = LAT0 + rng.uniform(-0.45, 0.45)
+        lon = LON0 + rng.uniform(-0.75, 0.75)
+        if i % 3:
+            specs.append(
+                {"id": "c%d" % i, "lat": lat, "lon": lon, "radius_m": rng.uniform(50, 300)}
+            )
+        else:
+            d = rng.uniform(100, 400) / M_PER_DEG
+            pts = [[lat - d, lon - d], [lat - d, lon + d], [lat, lon + 2 * d], [lat + d, lon]]
+            specs.append({"id": "p%d" % i, "points": pts + [[lat + d, lon - d]]})
+    return specs
+
+
+def linear_check(engine: GeofenceEngine, lat: float, lon: float) -> int:
+    """Baseline: test every fence"""
+    hits = 0
+    for f in engine.fences:
+        if f.contains((lon - f.lon0) * f.kx, (lat - f.lat0) * M_PER_DEG):
+            hits += 1
+    return hits
+
+
+def main() -> None:
+    rng = random.Random(42)
+    fixes = [
+        (LAT0 + rng.uniform(-0.45, 0.45), LON0 + rng.uniform(-0.75, 0.75)) for _ in range(CHECKS)
+    ]
+    print("fences   grid checks/s  linear checks/s  fences tested/check")
+    for n in FENCE_COUNTS:
+        engine = GeofenceEngine(confirm_s=0)
+        engine.load(make_fences(n, rng))
+
+        tested = 0
+        start = time.ticks_us()  # type: ignore[attr-defined]
+        for i, (lat, lon) in enumerate(fixes):
+            engine.check(lat, lon, i * 100)
+            tested += engine.tested
+        grid_us = time.ticks_diff(time.ticks_us(), start)  # type: ignore[attr-defined]
+
+        start = time.ticks_us()  # type: ignore[attr-defined]
+        for lat, lon in fixes:
+            linear_check(engine, lat, lon)
+        linear_us = time.ticks_diff(time.ticks_us(), start)  # type: ignore[attr-defined]
+
+        print(
+            "%6d %15.0f %16.0f %20.2f"
+            % (n, CHECKS * 1e6 / grid_us, CHECKS * 1e6 / linear_us, tested / CHECKS)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# bench_sd_logger.py - Block writes and bytes per sample: per-line CSV, buffered CSV, binary archive
+#
+# Run from firmware_esp32/: `python3 benchmarks/bench_sd_logger.py`
+#
+# FakeFatCard models what FatFs does on an SD card: data goes out in 512-byte
+# sectors, and every sync/close rewrites the FAT sector and the directory entry.
+# Opening a file for append reads the directory but writes nothing.
+import sys
+from typing import Any, Dict
+
+sys.path.insert(0, ".")
+from tools.host_shims import install  # noqa: E402
+
+install()
+
+from lib.sd_archive import ArchiveWriter  # noqa: E402
+from lib.sd_logger import BufferedFileWriter, format_csv_line  # noqa: E402
+
+SECTOR = 512
+SAMPLES = 3000  # 5 minutes at 10 Hz
+
+
+class FakeFatCard:
+    def __init__(self) -> None:
+        self.block_writes = 0
+        self.opens = 0
+        self.size = 0
+
+    def open(self, path: str, mode: str) -> "FakeFatFile":
+        self.opens += 1
+        return FakeFatFile(self)
+
+
+class FakeFatFile:
+    def __init__(self, card: FakeFatCard) -> None:
+        self.card = card
+        self.dirty_tail = False
+
+    def __enter__(self) -> "FakeFatFile":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def write(self, data: object) -> int:
+        n = len(data)  # type: ignore[arg-type]
+        card = self.card
+        start = card.size
+        card.size += n
+        # Every sector touched by this write is written once (partial tail stays cached)
+        full_sectors = card.size // SECTOR - start // SECTOR
+        card.block_writes += full_sectors
+        self.dirty_tail = card.size % SECTOR != 0
+        return n
+
+    def flush(self) -> None:
+        self._sync()
+
+    def close(self) -> None:
+        self._sync()
+
+    def _sync(self) -> None:
+        # Partial data sector + FAT sector + directory entry sector
+        self.card.block_writes += (1 if self.dirty_tail else 0) + 2
+        self.dirty_tail = False
+
+
+def _sample(i: int) -> Dict[str, Any]:
+    return {
+        "lat": 52.52 + i * 1e-5,
+        "lon": 13.405,
+        "speed": 42.0,
+        "temp": 4.5,
+        "shock": i % 50,
+        "battery_mv": 3900,
+        "internal_temp": 31.0,
+    }
+
+
+def per_line() -> FakeFatCard:
+    """Baseline: the old SDLogger.log (open, append one line, close)"""
+    card = FakeFatCard()
+    for i in range(SAMPLES):
+        f = card.open("/sd/sensor_log.csv", "a")
+        f.write(format_csv_line(1700000000 + i // 10, _sample(i)).encode())
+        f.close()
+    return card
+
+
+def buffered() -> FakeFatCard:
+    card = FakeFatCard()
+    writer = BufferedFileWriter("/sd/sensor_log.csv", opener=card.open)
+    for i in range(SAMPLES):
+        writer.append(format_csv_line(1700000000 + i // 10, _sample(i)))
+    writer.close()
+    return card
+
+
+def archive() -> FakeFatCard:
+    card = FakeFatCard()
+    writer = ArchiveWriter("/nonexistent/arch", opener=card.open)
+    for i in range(SAMPLES):
+        writer.append(1700000000 + i // 10, _sample(i))
+    writer.close()
+    return card
+
+
+def main() -> None:
+    print("strategy        opens  block_writes  writes/sample  bytes/sample")
+    for name, fn in (("per-line", per_line), ("buffered", buffered), ("archive", archive)):
+        card = fn()
+        per_sample = card.block_writes / SAMPLES
+        print(
+            "%-14s %6d %13d %14.3f %13.1f"
+            % (name, card.opens, card.block_writes, per_sample, card.size / SAMPLES)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,49 @@
 # BLE GATT Server for ESP32-C6
-from typing import Any, Callable, Optional, List
+from typing import Any, Callable, Dict, Optional, List
 import bluetooth
+import time
+import uasyncio as asyncio
 from micropython import const
+from lib.ble_link import MODE_ADVERTISING, MODE_IDLE, LinkPolicy
 
 _IRQ_CENTRAL_CONNECT = const(1)
 _IRQ_CENTRAL_DISCONNECT = const(2)
 _IRQ_GATTS_WRITE = const(3)
 _IRQ_GATTS_INDICATE_DONE = const(20)
+_IRQ_MTU_EXCHANGED = const(21)
+
+_DEFAULT_MTU = const(23)
+_PREFERRED_MTU = const(247)
 
 
 class BLEAdvertiser:
     def __init__(
-        self, name: str = "Last-Mile-Tracker", service_uuid: Optional[str] = None, version: int = 1
+        self,
+        name: str = "Last-Mile-Tracker",
+        service_uuid: Optional[str] = None,
+        version: int = 1,
+        adv_interval_ms: int = 100,
     ) -> None:
         self._ble = bluetooth.BLE()
         self._ble.active(True)
+        try:
+            # Offer a large ATT MTU; the central still decides during exchange
+            self._ble.config(mtu=_PREFERRED_MTU)
+        except Exception as e:
+            print(f"BLE MTU config failed: {e}")
         self._ble.irq(self._irq)
 
         self._name = name
         self._version = version  # Firmware version
         self._connected = False
         self._conn_handle: Optional[int] = None
+        self._mtu: int = _DEFAULT_MTU
+        self._indicate_pending = False
+        self._indicate_status = 0
+        self._link = LinkPolicy(adv_interval_ms)
+        self._adv_interval_ms = adv_interval_ms
+        self._advertising = False
+        self._hint_due = False
         self._write_callback: Optional[Callable[[int, int, bytes], None]] = None
         self._connect_callback: Optional[Callable[[], None]] = None
         self._disconnect_callback: Optional[Callable[[], None]] = None
@@ -75,10 +98,10 @@ class BLEAdvertiser:
             bluetooth.FLAG_WRITE | bluetooth.FLAG_WRITE_NO_RESPONSE,
         )
 
-        # WiFi Config: Write + Notify (for scan results)
+        # WiFi Config: Write + Notify/Indicate (indications pace bulk scan results)
         WIFI_CONFIG_CHAR = (
             bluetooth.UUID("0000FF01-0000-1000-8000-00805F9B34FB"),
-            bluetooth.FLAG_WRITE | bluetooth.FLAG_NOTIFY,
+            bluetooth.FLAG_WRITE | bluetooth.FLAG_NOTIFY | bluetooth.FLAG_INDICATE,
         )
 
         ENV_SERVICE = (
@@ -108,6 +131,13 @@ class BLEAdvertiser:
         # 512 bytes allows efficient chunked transfers.
         self._ble.gatts_set_buffer(self._ota_ctrl_handle, 512)
         self._ble.gatts_set_buffer(self._ota_data_handle, 512)
+        # Command frames and SSID/password writes exceed the 20-byte default too
+        self._ble.gatts_set_buffer(self._wifi_config_handle, 256)
+
+    @property
+    def mtu(self) -> int:
+        """Negotiated ATT MTU; one notification carries at most mtu - 3 bytes"""
+        return self._mtu
 
     @property
     def ext_sensor_handle(self) -> int:
@@ -135,6 +165,11 @@ class BLEAdvertiser:
         if event == _IRQ_CENTRAL_CONNECT:
             self._conn_handle, _, _ = data
             self._connected = True
+            self._mtu = _DEFAULT_MTU
+            self._indicate_pending = False
+            self._advertising = False
+            self._link.set_mode(MODE_IDLE)
+            self._hint_due = True  # Sent from task context once the central is settled
             print(f"Connected: {self._conn_handle}")
             if self._connect_callback:
                 self._connect_callback()
@@ -142,6 +177,8 @@ class BLEAdvertiser:
         elif event == _IRQ_CENTRAL_DISCONNECT:
             self._conn_handle = None
             self._connected = False
+            self._indicate_pending = False
+            self._link.set_mode(MODE_ADVERTISING)
             print("Disconnected")
             if self._disconnect_callback:
                 self._disconnect_callback()
@@ -154,6 +191,13 @@ class BLEAdvertiser:
             if self._write_callback:
                 self._write_callback(conn_handle, value_handle, value)
 
+        elif event == _IRQ_MTU_EXCHANGED:
+            _, self._mtu = data
+
+        elif event == _IRQ_GATTS_INDICATE_DONE:
+            _, _, self._indicate_status = data
+            self._indicate_pending = False
+
     def restart_advertising(self, name: Optional[str] = None) -> None:
         """Update advertising name and restart"""
         if name:
@@ -167,9 +211,9 @@ class BLEAdvertiser:
         self._payload_buf = bytearray(31)
         self._payload_len = 0
         self._update_payload(name=self._name)  # Pass self._name
-        # 100ms = 100,000us
-        self._ble.gap_advertise(100_000, adv_data=self._advertising_payload())
-        print(f"Advertising as '{self._name}'")
+        self._ble.gap_advertise(self._adv_interval_ms * 1000, adv_data=self._advertising_payload())
+        self._advertising = True
+        print(f"Advertising as '{self._name}' every {self._adv_interval_ms}ms")
 
     def _update_payload(
         self,
@@ -215,6 +259,47 @@ class BLEAdvertiser:
         # Rule 3: Return a memoryview of the pre-allocated buffer
         return memoryview(self._payload_buf)[: self._payload_len]
 
+    # --- Link mode management ---
+
+    def set_link_mode(self, mode: int) -> None:
+        """Enter idle/bulk/OTA mode and ask the central for matching connection parameters.
+
+        MicroPython has no peripheral-side connection parameter update call, so
+        the preferred parameters are sent to the app (framed notify on 0xFF01),
+        which applies them, e.g. via Android's requestConnectionPriority.
+        """
+        if not self._connected:
+            return
+        if self._link.set_mode(mode):
+            self._send_link_hint()
+
+    def _send_link_hint(self) -> None:
+        self._hint_due = False
+        frame = self._link.hint_frame()
+        if frame:
+            self.notify(frame, self._wifi_config_handle)
+
+    def tick_link(self, battery_mv: int, moving: bool) -> None:
+        """Periodic upkeep from update_task: pending hints and advertising interval"""
+        if self._connected:
+            if self._hint_due:
+                self._send_link_hint()
+            return
+        interval = self._link.adv_interval_ms(battery_mv, moving)
+        if interval != self._adv_interval_ms:
+            self._adv_interval_ms = interval
+            if self._advertising:
+                self._ble.gap_advertise(None)
+                self.start_advertising()
+
+    @property
+    def link_mode(self) -> int:
+        return self._link.mode
+
+    def link_times(self) -> Dict[str, int]:
+        """Milliseconds spent advertising and in each connected link mode since boot"""
+        return self._link.time_in_modes()
+
     def is_connected(self) -> bool:
         return self._connected
 
@@ -227,3 +312,27 @@ class BLEAdvertiser:
                 self._ble.gatts_notify(self._conn_handle, target_handle, data)
             except Exception as e:
                 print(f"BLE Notify Error: {e}")
+
+    async def send_acked(self, data: bytes, handle: int, timeout_ms: int = 2000) -> bool:
+        """Send as an indication and wait for the central's confirmation.
+
+        Paces bulk transfers by actual delivery instead of fixed sleeps.
+        Returns False on timeout, error or disconnect.
+        """
+        if not self._connected or self._conn_handle is None:
+            return False
+        try:
+            self._indicate_pending = True
+            self._ble.gatts_indicate(self._conn_handle, handle, data)
+        except Exception as e:
+            self._indicate_pending = False
+            print(f"BLE Indicate Error: {e}")
+            return False
+
+        start = time.ticks_ms()  # type: ignore[attr-defined]
+        while self._indicate_pending:
+            if time.ticks_diff(time.ticks_ms(), start) > timeout_ms:  # type: ignore[attr-defined]
+                self._indicate_pending = False
+                return False
+            await asyncio.sleep_ms(5)  # type: ignore[attr-defined]
+        return self._indicate_status == 0 and self._connected
@@ -0,0 +1,309 @@
+# ble_commands.py - Table-driven command router for the WiFi/config characteristic
+#
+# Binary request:  0xB1, opcode(1), req_id(1), len(1), TLV[len]
+# Binary response: 0xB2, opcode(1), req_id(1), status(1), len(1), TLV[len]
+# TLV:             tag(1), len(1), value[len]
+#
+# 0xB1 can never start valid UTF-8, so binary frames and the legacy text
+# commands (CMD:SCAN, OTA:owner:repo:interval, JSON, SSID:PASS) share one
+# characteristic without ambiguity. Text commands are mapped onto the same
+# opcodes and handlers; their replies keep the legacy text notifications.
+import json
+import uasyncio as asyncio
+from micropython import const
+from lib.logger import Logger
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+REQ_MAGIC = const(0xB1)
+RESP_MAGIC = const(0xB2)
+_REQ_HDR = const(4)
+_RESP_HDR = const(5)
+
+# Opcodes
+OP_SCAN = const(0x01)
+OP_IDENTIFY = const(0x02)
+OP_REBOOT = const(0x03)
+OP_RESET_WIFI = const(0x04)
+OP_OTA_CONFIG = const(0x05)
+OP_WIFI_SET = const(0x06)
+OP_SHOCK_EVENTS = const(0x07)  # Summary + waveform frames for recent shock events
+OP_WIFI_ADD = const(0x08)  # Add / update a known network (SSID, PASS, PRIORITY)
+OP_WIFI_REMOVE = const(0x09)  # Forget a known network (SSID)
+
+# TLV tags
+TAG_SSID = const(0x01)
+TAG_PASS = const(0x02)
+TAG_OWNER = const(0x03)
+TAG_REPO = const(0x04)
+TAG_INTERVAL = const(0x05)  # u32 little-endian seconds
+TAG_DETAIL = const(0x06)  # UTF-8 status detail in responses
+TAG_COUNT = const(0x07)  # u16 little-endian count in responses
+TAG_FORMAT = const(0x08)  # Result format: 0 = legacy text lines, 1 = packed pages
+TAG_PRIORITY = const(0x09)  # u8 known-network priority, higher is preferred
+
+# Response status
+ST_OK = const(0)
+ST_ACCEPTED = const(1)  # Work continues asynchronously; a final response follows
+ST_FAILED = const(2)
+ST_UNKNOWN = const(3)
+ST_BAD_ARGS = const(4)
+ST_BUSY = const(5)
+
+
+class Request:
+    """One decoded command. Handlers keep it to reply after async work."""
+
+    __slots__ = ("opcode", "req_id", "binary", "args")
+
+    def __init__(self, opcode: int, req_id: int, binary: bool, args: Dict[int, bytes]) -> None:
+        self.opcode = opcode
+        self.req_id = req_id
+        self.binary = binary
+        self.args = args
+
+    def text(self, tag: int, default: str = "") -> str:
+        value = self.args.get(tag)
+        return value.decode() if value is not None else default
+
+    def uint(self, tag: int, default: int = 0) -> int:
+        value = self.args.get(tag)
+        return int.from_bytes(value, "little") if value else default
+
+
+Handler = Callable[[Request], None]
+TextParser = Callable[[str], Optional[Dict[int, bytes]]]
+
+
+def parse_tlv(buf: Any, start: int, end: int) -> Optional[Dict[int, bytes]]:
+    """Decode TLV triplets in buf[start:end]; None if truncated"""
+    args: Dict[int, bytes] = {}
+    i = start
+    while i < end:
+        if i + 2 > end:
+            return None
+        tag = buf[i]
+        n = buf[i + 1]
+        if i + 2 + n > end:
+            return None
+        args[tag] = bytes(buf[i + 2 : i + 2 + n])
+        i += 2 + n
+    return args
+
+
+def pack_tlv(tag: int, value: bytes) -> bytes:
+    return bytes((tag, len(value))) + value
+
+
+def parse_ota_text(command: str) -> Optional[Dict[int, bytes]]:
+    """OTA:OWNER:REPO[:INTERVAL]"""
+    parts = command.split(":")
+    if len(parts) < 3:
+        return None
+    args = {TAG_OWNER: parts[1].encode(), TAG_REPO: parts[2].encode()}
+    if len(parts) >= 4:
+        try:
+            args[TAG_INTERVAL] = int(parts[3]).to_bytes(4, "little")
+        except ValueError:
+            pass
+    return args
+
+
+def parse_scan_text(command: str) -> Optional[Dict[int, bytes]]:
+    """CMD:SCAN:PACKED lets text-protocol apps opt into packed scan pages"""
+    if command == "CMD:SCAN:PACKED":
+        return {TAG_FORMAT: b"\x01"}
+    return None
+
+
+def parse_wifi_add_text(command: str) -> Optional[Dict[int, bytes]]:
+    """CMD:WIFI_ADD:{"ssid": .., "pass": .., "prio": ..}"""
+    try:
+        cfg = json.loads(command[len("CMD:WIFI_ADD:") :])
+        ssid = cfg["ssid"]
+        args = {TAG_SSID: ssid.encode(), TAG_PASS: (cfg.get("pass") or "").encode()}
+        if "prio" in cfg:
+            args[TAG_PRIORITY] = bytes((int(cfg["prio"]) & 0xFF,))
+        return args
+    except Exception:
+        return None
+
+
+def parse_wifi_remove_text(command: str) -> Optional[Dict[int, bytes]]:
+    """CMD:WIFI_DEL:SSID"""
+    ssid = command[len("CMD:WIFI_DEL:") :]
+    return {TAG_SSID: ssid.encode()} if ssid else None
+
+
+def parse_wifi_text(command: str) -> Optional[Dict[int, bytes]]:
+    """{"ssid": .., "pass": ..} or legacy SSID:PASSWORD"""
+    ssid = None
+    password = None
+    if command.startswith("{") and command.endswith("}"):
+        try:
+            cfg = json.loads(command)
+            ssid = cfg.get("ssid")
+            password = cfg.get("pass")
+        except Exception:
+            return None
+    elif ":" in command:
+        ssid, password = command.split(":", 1)
+    if not ssid:
+        return None
+    return {TAG_SSID: ssid.encode(), TAG_PASS: (password or "").encode()}
+
+
+class CommandRouter:
+    """Decode writes into Requests and dispatch them through an opcode table.
+
+    `submit()` is safe to call from the BLE IRQ: it only parks the raw
+    value in a fixed ring and wakes `run()`, which does the parsing.
+    """
+
+    def __init__(self, notify: Callable[[bytes], None], queue_len: int = 4) -> None:
+        if queue_len < 1:
+            raise ValueError("Queue length must be positive")
+        self._notify = notify
+        self._handlers: Dict[int, Handler] = {}
+        self._aliases: Dict[bytes, int] = {}
+        self._prefixes: List[Tuple[str, int, TextParser, bool]] = []
+        self._fallback: Optional[Tuple[int, TextParser]] = None
+
+        self._queue: List[Optional[bytes]] = [None] * queue_len
+        self._head = 0
+        self._count = 0
+        self._flag = getattr(asyncio, "ThreadSafeFlag", asyncio.Event)()
+        self._resp_buf = bytearray(_RESP_HDR + 255)
+        self.dropped = 0
+
+    # --- Registration ---
+
+    def register(self, opcode: int, handler: Handler, alias: Optional[str] = None) -> None:
+        self._handlers[opcode] = handler
+        if alias:
+            self._aliases[alias.encode()] = opcode
+
+    def register_prefix(
+        self, prefix: str, opcode: int, parser: TextParser, fallthrough: bool = False
+    ) -> None:
+        """Text with this prefix is dropped if `parser` rejects it, unless `fallthrough`"""
+        self._prefixes.append((prefix, opcode, parser, fallthrough))
+
+    def set_text_fallback(self, opcode: int, parser: TextParser) -> None:
+        """Parser tried on text that matched no alias or prefix"""
+        self._fallback = (opcode, parser)
+
+    # --- Decoding ---
+
+    def decode(self, value: bytes) -> Optional[Request]:
+        if not value:
+            return None
+        if value[0] == REQ_MAGIC:
+            return self._decode_binary(value)
+        return self._decode_text(value)
+
+    def _decode_binary(self, value: bytes) -> Optional[Request]:
+        if len(value) < _REQ_HDR:
+            return None
+        end = _REQ_HDR + value[3]
+        if end > len(value):
+            return None
+        args = parse_tlv(value, _REQ_HDR, end)
+        if args is None:
+            self._reply_raw(value[1], value[2], ST_BAD_ARGS, b"")
+            return None
+        return Request(value[1], value[2], True, args)
+
+    def _decode_text(self, value: bytes) -> Optional[Request]:
+        key = value.strip()
+        opcode = self._aliases.get(key)
+        if opcode is not None:
+            return Request(opcode, 0, False, {})
+
+        try:
+            command = key.decode()
+        except UnicodeError:
+            return None
+        for prefix, opcode, parser, fallthrough in self._prefixes:
+            if command.startswith(prefix):
+                args = parser(command)
+                if args is not None:
+                    return Request(opcode, 0, False, args)
+                if not fallthrough:
+                    return None  # Malformed command, never a WiFi SSID:PASS
+        if self._fallback is not None:
+            args = self._fallback[1](command)
+            if args is not None:
+                return Request(self._fallback[0], 0, False, args)
+        return None
+
+    # --- Dispatch ---
+
+    def dispatch(self, value: bytes) -> Optional[Request]:
+        """Decode and run one command synchronously. Returns the Request handled."""
+        req = self.decode(value)
+        if req is None:
+            Logger.log(f"BLE: Unrecognised command ({len(value)} bytes)")
+            return None
+        handler = self._handlers.get(req.opcode)
+        if handler is None:
+            self.reply(req, ST_UNKNOWN)
+            return req
+        try:
+            handler(req)
+        except Exception as e:
+            Logger.log(f"BLE: Command 0x{req.opcode:02x} error: {e}")
+            self.reply(req, ST_FAILED)
+        return req
+
+    def submit(self, value: bytes) -> bool:
+        """IRQ-safe enqueue; drops the write if the ring is full"""
+        if self._count >= len(self._queue):
+            self.dropped += 1
+            return False
+        self._queue[(self._head + self._count) % len(self._queue)] = value
+        self._count += 1
+        self._flag.set()
+        return True
+
+    def drain(self) -> int:
+        handled = 0
+        while self._count:
+            value = self._queue[self._head]
+            self._queue[self._head] = None
+            self._head = (self._head + 1) % len(self._queue)
+            self._count -= 1
+            if value is not None:
+                self.dispatch(value)
+                handled += 1
+        return handled
+
+    async def run(self) -> None:
+        """Background task: parse and execute queued writes outside the IRQ"""
+        Logger.log("Task: BLE command router started.")
+        while True:
+            await self._flag.wait()
+            if hasattr(self._flag, "clear"):
+                self._flag.clear()
+            self.drain()
+
+    # --- Responses ---
+
+    def reply(
+        self, req: Request, status: int, payload: bytes = b"", text: Optional[bytes] = None
+    ) -> None:
+        """Binary requests get a framed response; text requests get `text` if given"""
+        if req.binary:
+            self._reply_raw(req.opcode, req.req_id, status, payload)
+        elif text is not None:
+            self._notify(text)
+
+    def _reply_raw(self, opcode: int, req_id: int, status: int, payload: bytes) -> None:
+        n = min(len(payload), 255)
+        buf = self._resp_buf
+        buf[0] = RESP_MAGIC
+        buf[1] = opcode
+        buf[2] = req_id
+        buf[3] = status
+        buf[4] = n
+        buf[_RESP_HDR : _RESP_HDR + n] = payload[:n]
+        self._notify(bytes(memoryview(buf)[: _RESP_HDR + n]))
@@ -0,0 +1,86 @@
+# ble_link.py - BLE link mode policy: connection parameters, advertising interval, time accounting
+import struct
+import time
+from micropython import const
+from typing import Dict, Tuple
+
+MODE_ADVERTISING = const(0)  # No central connected
+MODE_IDLE = const(1)  # Periodic telemetry notifies only
+MODE_BULK = const(2)  # Scan results, history sync
+MODE_OTA = const(3)  # Firmware transfer
+
+MODE_NAMES = ("advertising", "idle", "bulk", "ota")
+
+# (min_interval, max_interval) in 1.25 ms units, slave latency, supervision timeout in 10 ms units.
+# Timeouts satisfy the spec bound: timeout > (1 + latency) * max_interval * 2.
+CONN_PARAMS: Dict[int, Tuple[int, int, int, int]] = {
+    MODE_IDLE: (400, 800, 2, 800),  # 500-1000 ms, skip 2 events, 8 s timeout
+    MODE_BULK: (12, 24, 0, 400),  # 15-30 ms, 4 s timeout
+    MODE_OTA: (6, 12, 0, 400),  # 7.5-15 ms, 4 s timeout
+}
+
+# Hint frame sent to the central on 0xFF01 (same layout as command responses):
+# 0xB2, OP_LINK_PARAMS, req_id=0, status=0, len=13, TLV(mode), TLV(params)
+OP_LINK_PARAMS = const(0x10)
+_TAG_MODE = const(0x10)
+_TAG_CONN = const(0x11)  # <HHHH min, max, latency, timeout
+
+
+class LinkPolicy:
+    """Pure decision logic for BLEAdvertiser; no radio access here."""
+
+    def __init__(self, base_adv_interval_ms: int = 100) -> None:
+        if base_adv_interval_ms < 20:
+            raise ValueError("Advertising interval below BLE minimum")
+        self._base_adv_ms = base_adv_interval_ms
+        self._mode: int = MODE_ADVERTISING
+        self._since = time.ticks_ms()  # type: ignore[attr-defined]
+        self._time_ms = [0, 0, 0, 0]
+        self._hint_buf = bytearray(18)
+
+    @property
+    def mode(self) -> int:
+        return self._mode
+
+    def set_mode(self, mode: int) -> bool:
+        """Switch mode, charging elapsed time to the old one. Returns True if changed."""
+        if mode == self._mode:
+            return False
+        now = time.ticks_ms()  # type: ignore[attr-defined]
+        self._time_ms[self._mode] += time.ticks_diff(now, self._since)  # type: ignore[attr-defined]
+        self._since = now
+        self._mode = mode
+        return True
+
+    def time_in_modes(self) -> Dict[str, int]:
+        """Milliseconds spent in each mode, including the current one so far"""
+        elapsed = time.ticks_diff(time.ticks_ms(), self._since)  # type: ignore[attr-defined]
+        return {
+            name: self._time_ms[i] + (elapsed if i == self._mode else 0)
+            for i, name in enumerate(MODE_NAMES)
+        }
+
+    def adv_interval_ms(self, battery_mv: int, moving: bool) -> int:
+        """Advertise fast when someone is likely nearby, slowly when parked or on low battery"""
+        if 0 < battery_mv < 1000:  # USB / wired power (see update_task)
+            return self._base_adv_ms
+        if battery_mv and battery_mv < 3400:
+            return 4000
+        if battery_mv and battery_mv < 3600:
+            return 2000
+        if moving:
+            return max(self._base_adv_ms, 250)
+        return 1000
+
+    def hint_frame(self) -> bytes:
+        """Preferred connection parameters for the current mode, for the central to apply"""
+        params = CONN_PARAMS.get(self._mode)
+        if params is None:
+            return b""
+        buf = self._hint_buf
+        buf[0:7] = bytes((0xB2, OP_LINK_PARAMS, 0, 0, 13, _TAG_MODE, 1))
+        buf[7] = self._mode
+        buf[8] = _TAG_CONN
+        buf[9] = 8
+        struct.pack_into("<HHHH", buf, 10, *params)
+        return bytes(buf)
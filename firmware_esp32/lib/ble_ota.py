@@ -1,6 +1,7 @@
 import os
 import hashlib
 from lib.logger import Logger
+from lib.ble_link import MODE_IDLE, MODE_OTA
 from typing import Any, BinaryIO
 
 
@@ -61,6 +62,8 @@ class BleOta:
 
             self._file_handle = open(self._update_filename, "wb")
             Logger.log(f"OTA: Starting upload for {name} ({size} bytes)")
+            if self._ble:
+                self._ble.set_link_mode(MODE_OTA)
 
             # Notify central that we are ready
             if self._ble:
@@ -124,6 +127,8 @@ class BleOta:
         if self._file_handle:
             self._file_handle.close()
             self._file_handle = None
+        if self._ble:
+            self._ble.set_link_mode(MODE_IDLE)
 
     def _apply_update(self) -> None:
         """Rename .tmp to actual file and reset"""
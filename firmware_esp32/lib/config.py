@@ -9,7 +9,15 @@ class Config:
         "device_id": None,  # None means auto-generate from MAC
         "wifi_ssid": "",
         "wifi_pass": "",  # nosec
+        "wifi_networks": [],  # Known networks, see lib/known_networks.py (max 8)
+        "wifi_link_cache": None,  # Last good AP, channel and lease, for fast reconnects
+        "wifi_lease_ttl_sec": 3600,  # Reuse the cached DHCP lease this long (0 = always DHCP)
+        "wifi_scan_ttl_sec": 30,  # CMD:SCAN reuses a scan this recent (0 = always rescan)
         "shock_threshold": 500,  # 0-1000 scale
+        "shock_rate_hz": 100,  # IMU sampling rate for shock waveform capture
+        "shock_pre_ms": 200,  # Waveform kept before the trigger
+        "shock_post_ms": 300,  # Waveform captured after the trigger
+        "shock_tree": None,  # Classifier nodes [feature, threshold, if_ge, if_lt]; None = built-in
         "sleep_timeout": 300,  # Seconds before deep sleep
         "adv_interval": 100,  # ms
         # Hardware
@@ -23,16 +31,80 @@ class Config:
         "ingest_url": "",
         "ingest_token": "",  # nosec
         "ingest_interval_sec": 60,
+        "wifi_upload_window": False,  # WiFi only up while uploading (ignored if espnow_enabled)
+        "upload_batch_size": 10,  # Queued records per request in an upload window
+        "upload_deadband": None,  # Live upload rules, see lib/deadband.py; None = built-in
+        "upload_heartbeat_sec": 3600,  # Live upload at least this often (0 = off)
+        "upload_delta": False,  # Live uploads carry only fields changed since the last ack
+        "upload_keyframe_sec": 3600,  # Delta mode: full payload this often (0 = on request)
+        "upload_deflate": False,  # Deflate request bodies (server must accept Content-Encoding)
+        "upload_deflate_min_bytes": 1024,  # Smaller bodies go out plain
+        "upload_deflate_wbits": 10,  # Compression window 2**wbits bytes (8-15)
+        "ingest_transport": "http",  # "http" (ingest_url) or "mqtt" (lib/mqtt_uplink.py)
+        "mqtt_host": "",
+        "mqtt_port": 1883,
+        "mqtt_tls": False,
+        "mqtt_keepalive_sec": 60,
+        "mqtt_topic_prefix": "lmt",  # <prefix>/<device_id>/up and .../down
+        "mqtt_inflight": 4,  # Unacknowledged publishes at once (1-64)
+        # Recording policy (SD archive and offline upload queue)
+        "log_interval_sec": 10,  # One aggregated SD record per interval
+        "log_burst_interval_sec": 1,  # Record rate after a shock / fix change / geofence event
+        "log_burst_sec": 30,  # Burst duration
+        "log_daily_budget_kb": 1024,  # SD bytes per UTC day (0 = unlimited)
+        "upload_burst_interval_sec": 10,  # Queued-record rate during a burst while offline
+        "upload_daily_budget_kb": 256,  # Offline upload queue bytes per UTC day (0 = unlimited)
+        # Trip detection (drives trip_state and trip summaries)
+        "trip_start_kmh": 8,  # Speed that counts as moving
+        "trip_stop_kmh": 3,  # Speed that counts as stationary
+        "trip_start_sec": 10,  # Continuous movement before a trip starts or resumes
+        "trip_stop_sec": 30,  # Stationary time before a delivery stop is counted
+        "trip_end_sec": 600,  # Stop length that ends the trip
+        "trip_motion_threshold": 15,  # IMU motion (shock scale) that counts as moving without a fix
+        # Dead reckoning between GPS fixes (IMU task)
+        "dr_enabled": True,
+        "dr_max_outage_sec": 120,  # Stop estimating this long after the last fix
+        "dr_still_counts": 200,  # Accel activity (raw counts) below which the vehicle is stopped
+        # GPS receiver power and output rate (u-blox UBX commands)
+        "gps_power_mgmt": True,
+        "gps_rate_moving_ms": 1000,  # Navigation rate while moving
+        "gps_rate_stopped_ms": 5000,  # Power-save rate at stops and just after parking
+        "gps_backup_after_sec": 300,  # Parked with no IMU motion this long: backup mode
+        "gps_backup_max_sec": 3600,  # Backup is re-requested after this (receiver wake timer)
+        "gps_last_fix": None,  # [lat, lon, unix ts] saved on backup, for hot starts
+        # Boot-relative timestamps (lib/timebase.py); maintained by the firmware
+        "boot_id": 0,  # Incremented at every power-up or deep-sleep wake
+        "time_offsets": [],  # [boot_id, utc - seconds since boot, exact] for recent boots
+        "time_handoff": None,  # [boot_id, seconds since boot, sleep s] left before deep sleep
+        # WiFi positioning without a GPS fix (lib/wifi_locate.py)
+        "wifi_locate": True,
+        "wifi_loc_cache": [],  # [bssid hex, lat, lon, acc_m] from server replies, LRU order
+        "wifi_loc_cache_size": 32,  # BSSIDs kept on the device
+        "wifi_loc_hold_sec": 900,  # A WiFi position stands this long unless the trip is moving
+        # Geofences (circles {"id", "lat", "lon", "radius_m"} or polygons {"id", "points"})
+        "geofences": [],
+        "geofence_margin_m": 20,  # Exit only this far outside the boundary
+        "geofence_confirm_sec": 5,  # Consecutive inside/outside time before enter/exit
+        "geofence_dwell_sec": 300,  # Default dwell event time; per-fence "dwell_s" overrides
+        "geofence_cell_deg": 0.01,  # Grid index cell size (min 0.01, about 1.1 km)
+        # ESP-NOW peer relay (trackers without WiFi hand telemetry to one with it)
+        "espnow_enabled": False,
+        "espnow_channel": 0,  # 0 = keep current; must match the relay's AP channel
+        "espnow_rate_per_min": 12,  # Relayed messages accepted per peer per minute
         # Firmware Version (semver)
         "firmware_version": "0.0.2",
         # Remote Management
         "config_url": "",
+        "config_etag": "",  # ETag of the applied remote config (If-None-Match)
         "ota_url": "",
         "ota_check_interval": 86400,  # 24h
         "ota_github_owner": "Maninder-mike",
         "ota_github_repo": "last_mile_tracker",
         # Time
         "ntp_server": "pool.ntp.org",
+        "ntp_max_error_ms": 1000,  # Resync before the estimated clock error exceeds this
+        "ntp_min_interval_sec": 900,  # Resync interval bounds (the maximum is capped at 2 days)
+        "ntp_max_interval_sec": 172800,
         "timezone_offset": 0,  # Hours (0=UTC)
     }
 
@@ -0,0 +1,294 @@
+# dead_reckoning.py - IMU-aided position estimate between GPS fixes
+#
+# A fixed-size complementary filter in integer arithmetic (MicroPython small
+# ints, no allocation at the IMU rate):
+#   - gravity is the mean accelerometer reading over GPS seconds in which the
+#     vehicle neither changed speed nor turned (decided when the next fix
+#     arrives); the rest is horizontal acceleration in the sensor frame
+#   - the vehicle's forward axis in the sensor frame is learned from GPS speed
+#     changes, so the mounting orientation does not need configuring
+#   - after a fix, speed integrates the forward acceleration and leaks back
+#     towards the last GPS speed (the low-frequency half of the filter);
+#     heading integrates the gyro yaw rate about gravity, or holds the last GPS
+#     course without a gyro; position integrates speed along heading
+#   - low motion activity with no yaw means stopped, so speed decays to zero
+#   - every GPS fix resets position, speed and heading (the GPS dominates)
+#
+# Units: mm, mm/s, heading in 1/65536 turn clockwise from north, raw MPU6050
+# counts (16384 per g at +/-2 g, 131 per deg/s at +/-250 deg/s).
+import math
+import time
+from array import array
+from micropython import const
+from typing import Any
+
+from lib.shock_classifier import isqrt
+
+M_PER_DEG = 111195.0
+LSB_PER_G = const(16384)
+LSB_PER_DPS = const(131)
+_MM_S2_PER_G = const(9807)
+_G_SHIFT = const(7)  # Gravity EMA over ~128 samples at rest after boot; Q7 state
+_ACT_SHIFT = const(5)  # Motion activity EMA (~0.3 s)
+_H_CLAMP = const(16383)  # Accel / gyro clamps keep every product below 2^30
+_W_CLAMP = const(8191)  # ~62 deg/s
+_MAX_DT_MS = const(50)
+_V_MAX = const(50000)  # 180 km/h
+_V_TAU_S = const(60)  # Speed leaks back to the last GPS speed over ~60 s
+_STEADY_MM_S2 = const(200)  # GPS acceleration below this: gravity may be updated
+_STEADY_TURN = const(546)  # ~3 deg of course change per fix
+_LEARN_MIN_MM_S2 = const(400)  # GPS acceleration needed to learn the forward axis
+_LEARN_MIN_COUNTS = const(50)
+_LEARNED = const(3)  # Forward axis updates before accelerometer speed is used
+_HEADING_MIN_MM_S = const(1400)  # GPS course is noise below ~5 km/h
+_STILL_MM_S = const(300)  # Gyro bias is learned below this GPS speed
+_FRESH_MS = const(1500)  # A fix older than this no longer counts as current
+# Heading units per (gyro count * ms), scaled by 1e6: 65536 / (131 * 360 * 1000) * 1e6
+_YAW_SCALE = const(1390)
+
+# Uncertainty model: mm, mm/s^2, and per-mille of distance travelled
+_R_FIX_MM = const(5000)
+_ACC_ERR = const(60)  # Residual accel bias once the forward axis is learned
+_HOLD_ERR = const(200)  # Speed held without accelerometer help: 20% of distance
+_HEAD_ERR0 = const(35)  # ~2 deg at the last fix
+_HEAD_RATE_GYRO = const(4)  # ~0.2 deg/s gyro drift
+_HEAD_RATE_HOLD = const(17)  # ~1 deg/s: no gyro, turns are not tracked
+
+
+def _sin_table() -> Any:
+    t = array("h", bytes(2 * 257))
+    for i in range(257):
+        t[i] = int(round(math.sin(2 * math.pi * i / 256) * 16384))
+    return t
+
+
+_SIN = _sin_table()
+
+
+def sin_q14(h: int) -> int:
+    """sin of a 1/65536-turn heading in Q14: table lookup with linear interpolation"""
+    h &= 0xFFFF
+    i = h >> 8
+    a: int = _SIN[i]
+    b: int = _SIN[i + 1]
+    return a + (((b - a) * (h & 0xFF)) >> 8)
+
+
+def _clamp(x: int, lim: int) -> int:
+    return lim if x > lim else -lim if x < -lim else x
+
+
+class DeadReckoner:
+    def __init__(self, use_gyro: bool = True, max_outage_s: int = 120, still_counts: int = 200):
+        if max_outage_s <= 0 or still_counts < 0:
+            raise ValueError("Invalid dead reckoning parameters")
+        self.use_gyro = use_gyro
+        self._max_outage_ms = max_outage_s * 1000
+        self._still = still_counts << _ACT_SHIFT  # Activity below this with no yaw = stopped
+
+        self._s16 = [0, 0, 0, 0, 0, 0]  # Decoded raw sample
+        self._g = [0, 0, LSB_PER_G << _G_SHIFT]  # Gravity EMA, counts << _G_SHIFT
+        self._f = [LSB_PER_G, 0, 0]  # Forward axis in the sensor frame, Q14
+        self.learned = 0
+        self._hsum = [0, 0, 0]  # Horizontal accel summed since the last fix
+        self._hn = 0
+        self._bias = 0  # Gyro yaw bias, counts << _G_SHIFT
+        self._act = 0  # |horizontal accel| EMA, counts << _ACT_SHIFT
+        self._last_ms = -1
+
+        self.has_fix = False
+        self._fix_ms = 0
+        self._fix_lat = 0.0
+        self._fix_lon = 0.0
+        self._kx = M_PER_DEG
+        self._fix_v = 0
+        self._fix_hdg = 0
+        self.v = 0  # mm/s
+        self.heading = 0
+        self.east = 0  # mm from the last fix
+        self.north = 0
+        self.dist = 0  # mm travelled since the last fix
+        self._rv = 0  # Remainders keep the integer integration exact
+        self._rh = 0
+        self._re = 0
+        self._rn = 0
+        self._rd = 0
+
+        # Outputs of estimate()
+        self.lat = 0.0
+        self.lon = 0.0
+        self.radius_m = 0
+        self.speed_kmh = 0.0
+
+    def imu(self, raw: Any, now_ms: int) -> None:
+        """14 big-endian bytes from ACCEL_XOUT_H: accel x/y/z, temperature, gyro x/y/z"""
+        s = self._s16
+        for k in range(6):
+            off = 2 * k + 2 if k >= 3 else 2 * k  # Skip the temperature word
+            x = (raw[off] << 8) | raw[off + 1]
+            s[k] = x - 0x10000 if x & 0x8000 else x
+        self.imu_sample(s[0], s[1], s[2], s[3], s[4], s[5], now_ms)
+
+    def imu_sample(
+        self, ax: int, ay: int, az: int, wx: int, wy: int, wz: int, now_ms: int
+    ) -> None:
+        dt = 10 if self._last_ms < 0 else time.ticks_diff(now_ms, self._last_ms)  # type: ignore
+        self._last_ms = now_ms
+        dt = 0 if dt < 0 else _MAX_DT_MS if dt > _MAX_DT_MS else dt
+        fresh = self.has_fix and time.ticks_diff(now_ms, self._fix_ms) < _FRESH_MS  # type: ignore
+
+        g = self._g
+        if not self.has_fix:  # At rest after boot; afterwards fix() updates gravity
+            g[0] += ax - (g[0] >> _G_SHIFT)
+            g[1] += ay - (g[1] >> _G_SHIFT)
+            g[2] += az - (g[2] >> _G_SHIFT)
+        gx = g[0] >> _G_SHIFT
+        gy = g[1] >> _G_SHIFT
+        gz = g[2] >> _G_SHIFT
+        hx = _clamp(ax - gx, _H_CLAMP)
+        hy = _clamp(ay - gy, _H_CLAMP)
+        hz = _clamp(az - gz, _H_CLAMP)
+        if self._hn < 30000:
+            self._hsum[0] += hx
+            self._hsum[1] += hy
+            self._hsum[2] += hz
+            self._hn += 1
+        self._act += abs(hx) + abs(hy) + abs(hz) - (self._act >> _ACT_SHIFT)
+
+        yaw = 0
+        if self.use_gyro:
+            # Rotation rate about gravity (gravity is ~1 in Q14 counts)
+            yaw = (
+                _clamp(wx, _W_CLAMP) * gx + _clamp(wy, _W_CLAMP) * gy + _clamp(wz, _W_CLAMP) * gz
+            ) >> 14
+            if fresh and self._fix_v < _STILL_MM_S:
+                self._bias += yaw - (self._bias >> _G_SHIFT)
+            yaw = _clamp(yaw - (self._bias >> _G_SHIFT), _W_CLAMP)
+        if self.has_fix:
+            self._propagate(hx, hy, hz, yaw, dt)
+
+    def _propagate(self, hx: int, hy: int, hz: int, yaw: int, dt: int) -> None:
+        v = self.v
+        # Speed: forward accel (mm/s^2) plus a leak towards the last GPS speed, in mm/s * 1000
+        rv = self._rv + (self._fix_v - v) * dt // _V_TAU_S
+        if self.learned >= _LEARNED:
+            f = self._f
+            along = (hx * f[0] + hy * f[1] + hz * f[2]) >> 14
+            rv += along * _MM_S2_PER_G // LSB_PER_G * dt
+        dv = rv // 1000
+        self._rv = rv - dv * 1000
+        v += dv
+        if self._act < self._still and -LSB_PER_DPS < yaw < LSB_PER_DPS:
+            v -= (v >> 5) + 1  # Parked or stuck in traffic: no vibration, no turning
+        v = 0 if v < 0 else _V_MAX if v > _V_MAX else v
+        self.v = v
+
+        if yaw:
+            self._rh += yaw * dt * _YAW_SCALE
+            dh = self._rh // 1000000
+            self._rh -= dh * 1000000
+            self.heading = (self.heading - dh) & 0xFFFF  # Counter-clockwise yaw lowers heading
+        ve = (v * sin_q14(self.heading)) >> 14
+        vn = (v * sin_q14(self.heading + 16384)) >> 14
+        self._re += ve * dt
+        d = self._re // 1000
+        self._re -= d * 1000
+        self.east += d
+        self._rn += vn * dt
+        d = self._rn // 1000
+        self._rn -= d * 1000
+        self.north += d
+        self._rd += v * dt
+        d = self._rd // 1000
+        self._rd -= d * 1000
+        self.dist += d
+
+    def fix(self, lat: float, lon: float, speed_kmh: float, course: float, now_ms: int) -> None:
+        """One new GPS fix (call once per fix, not per sensor read)"""
+        v = min(int(speed_kmh * 1000 / 3.6), _V_MAX)
+        hdg = int(course * 65536 / 360) & 0xFFFF
+        turn = ((hdg - self._fix_hdg + 32768) & 0xFFFF) - 32768  # Course change since last fix
+        dt = time.ticks_diff(now_ms, self._fix_ms)  # type: ignore
+        recent = self.has_fix and 0 < dt <= 2 * _FRESH_MS
+        if recent and self._hn:
+            acc = (v - self._fix_v) * 1000 // dt
+            turning = v >= _HEADING_MIN_MM_S and abs(turn) > _STEADY_TURN
+            if abs(acc) < _STEADY_MM_S2 and not turning:
+                self._update_gravity()
+            elif not turning:
+                self._learn(acc)
+        self._hsum[0] = self._hsum[1] = self._hsum[2] = 0
+        self._hn = 0
+
+        self.has_fix = True
+        self._fix_ms = now_ms
+        self._fix_lat = lat
+        self._fix_lon = lon
+        self._kx = M_PER_DEG * math.cos(math.radians(lat))
+        self._fix_v = v
+        self._fix_hdg = hdg
+        self.v = v
+        if v >= _HEADING_MIN_MM_S:
+            # Complementary: GPS course corrects the propagated heading without copying its noise
+            if self.use_gyro and recent:
+                err = ((hdg - self.heading + 32768) & 0xFFFF) - 32768
+                self.heading = (self.heading + (err >> 2)) & 0xFFFF
+            else:
+                self.heading = hdg
+        self.east = self.north = self.dist = 0
+        self._rv = self._rh = self._re = self._rn = self._rd = 0
+
+    def _update_gravity(self) -> None:
+        """The second since the last fix was steady: its mean accel is gravity"""
+        n = self._hn
+        h = self._hsum
+        g = self._g
+        for k in range(3):
+            g[k] += ((h[k] // n) << _G_SHIFT) >> 1
+
+    def _learn(self, acc: int) -> None:
+        """Pull the forward axis towards the mean horizontal accel seen while the GPS sped up"""
+        n = self._hn
+        if abs(acc) < _LEARN_MIN_MM_S2 or not n:
+            return
+        h = self._hsum
+        m0 = h[0] // n
+        m1 = h[1] // n
+        m2 = h[2] // n
+        norm = isqrt(m0 * m0 + m1 * m1 + m2 * m2)
+        if norm < _LEARN_MIN_COUNTS:
+            return
+        if acc < 0:
+            norm = -norm
+        f = self._f
+        f[0] += (m0 * LSB_PER_G // norm - f[0]) >> 1
+        f[1] += (m1 * LSB_PER_G // norm - f[1]) >> 1
+        f[2] += (m2 * LSB_PER_G // norm - f[2]) >> 1
+        nf = isqrt(f[0] * f[0] + f[1] * f[1] + f[2] * f[2])
+        if nf:
+            f[0] = f[0] * LSB_PER_G // nf
+            f[1] = f[1] * LSB_PER_G // nf
+            f[2] = f[2] * LSB_PER_G // nf
+        self.learned += 1
+
+    def estimate(self, now_ms: int) -> bool:
+        """Fill lat/lon/radius_m/speed_kmh; False before the first fix or after max outage"""
+        if not self.has_fix:
+            return False
+        t_ms = time.ticks_diff(now_ms, self._fix_ms)  # type: ignore
+        if t_ms > self._max_outage_ms:
+            return False
+        self.lat = self._fix_lat + self.north / 1000 / M_PER_DEG
+        self.lon = self._fix_lon + self.east / 1000 / self._kx
+        self.speed_kmh = self.v * 3.6 / 1000
+        dist_m = self.dist // 1000
+        t_s = t_ms // 1000
+        rate = _HEAD_RATE_GYRO if self.use_gyro else _HEAD_RATE_HOLD
+        r = _R_FIX_MM + dist_m * (_HEAD_ERR0 + rate * t_s)
+        if self.learned >= _LEARNED:
+            t_ds = t_ms // 100
+            r += _ACC_ERR * t_ds * t_ds // 200  # 1/2 a t^2
+        else:
+            r += dist_m * _HOLD_ERR
+        self.radius_m = r // 1000
+        return True
@@ -0,0 +1,214 @@
+# deadband.py - Per-field deadband policy deciding when live telemetry is worth uploading
+#
+# A rule table (config "upload_deadband", None = built-in) lists the fields
+# that matter and how far each must move from the last uploaded value:
+#
+#   {"field": "pos", "m": 10}                lat/lon moved more than 10 m (haversine)
+#   {"field": "temp", "abs": 0.5, "rel": 0}  |change| > max(abs, rel * |last sent|)
+#   {"field": "all_temps", "abs": 0.5}       the same for each key of a dict of readings
+#   {"field": "shock", "above": 500}         level: any value above the limit
+#   {"field": "battery_mv", "max_s": 1800}   no threshold, only a maximum silence
+#
+# Any rule may add "max_s": upload at least that often while the field is
+# present. upload_heartbeat_sec forces an upload regardless of the table.
+# Last-sent values are kept in a preallocated array (dict fields: one dict
+# updated in place), so a check copies nothing. Rules are evaluated in table
+# order and the first to fire is reported as the trigger. Haversine only runs
+# near the position threshold: |dlat| + |dlon| in degrees bounds the distance
+# from above and |dlat| alone from below.
+import time
+from array import array
+from micropython import const
+from lib.geofence import M_PER_DEG
+from lib.trip_detector import haversine_m
+from typing import Any, Dict, List, Optional
+
+TRIG_NONE = const(0)
+TRIG_FIRST = const(1)
+TRIG_HEARTBEAT = const(2)
+TRIG_CHANGE = const(3)
+TRIG_LEVEL = const(4)
+TRIG_SILENCE = const(5)
+
+REASONS = ("none", "first", "heartbeat", "change", "level", "silence")
+
+MAX_SILENCE_S = const(432000)  # 5 days: ticks_diff stays well inside its wrap
+
+_KIND_VALUE = const(0)  # abs/rel threshold, numbers or dicts of numbers
+_KIND_POS = const(1)  # lat/lon distance in metres
+_KIND_LEVEL = const(2)  # above a limit
+_KIND_WATCH = const(3)  # max_s only
+
+
+def default_rules(shock_threshold: int) -> List[Dict[str, Any]]:
+    """Built-in table: 10 m of movement, 0.5 degC on any probe, shocks over the threshold"""
+    return [
+        {"field": "pos", "m": 10},
+        {"field": "temp", "abs": 0.5},
+        {"field": "all_temps", "abs": 0.5},
+        {"field": "shock", "above": shock_threshold},
+    ]
+
+
+def _number(rule: Dict[str, Any], key: str) -> float:
+    v = rule.get(key) or 0
+    if not isinstance(v, (int, float)) or v < 0:
+        raise ValueError("Deadband %s for %s must be a non-negative number" % (key, rule["field"]))
+    return v
+
+
+class Deadband:
+    """Upload decision for a stream of samples; `check()` then `commit()` once sent"""
+
+    def __init__(self, rules: List[Dict[str, Any]], heartbeat_s: int = 3600) -> None:
+        if not 0 <= heartbeat_s <= MAX_SILENCE_S:
+            raise ValueError("Heartbeat must be 0 (off) to %d s" % MAX_SILENCE_S)
+        n = len(rules)
+        self.fields: List[str] = []
+        self._kind = bytearray(n)
+        self._abs = array("f", bytes(4 * n))  # Also the pos distance and the level limit
+        self._rel = array("f", bytes(4 * n))  # pos: degrees below which no haversine is needed
+        self._max_ms = array("i", bytes(4 * n))  # 0 = no silence bound
+        self._last = array("d", bytes(16 * n))  # Two slots per rule (lat, lon for pos)
+        self._have = bytearray(n)  # Field was present in the last upload
+        self._maps: List[Optional[Dict[str, Any]]] = [None] * n
+        for i, rule in enumerate(rules):
+            if not isinstance(rule, dict) or not rule.get("field"):
+                raise ValueError("Deadband rule %d has no field" % i)
+            name = rule["field"]
+            if name == "pos":
+                self._kind[i] = _KIND_POS
+                self._abs[i] = _number(rule, "m")
+                self._rel[i] = self._abs[i] / M_PER_DEG / 1.01  # Degree box that cannot reach m
+            elif "above" in rule:
+                if not isinstance(rule["above"], (int, float)):
+                    raise ValueError("Deadband limit for %s must be a number" % name)
+                self._kind[i] = _KIND_LEVEL
+                self._abs[i] = rule["above"]
+            elif "abs" in rule or "rel" in rule:
+                self._kind[i] = _KIND_VALUE
+                self._abs[i] = _number(rule, "abs")
+                self._rel[i] = _number(rule, "rel")
+            elif "max_s" in rule:
+                self._kind[i] = _KIND_WATCH
+            else:
+                raise ValueError("Deadband rule for %s has no threshold" % name)
+            max_s = _number(rule, "max_s")
+            if max_s > MAX_SILENCE_S:
+                raise ValueError("Deadband max_s for %s above %d s" % (name, MAX_SILENCE_S))
+            self._max_ms[i] = int(max_s * 1000)
+            self.fields.append(name)
+        self._heartbeat_ms = heartbeat_s * 1000
+        self._sent_ms: Optional[int] = None  # ticks_ms of the last upload
+        self.reason: int = TRIG_NONE  # Outcome of the last check
+        self.field: Optional[str] = None  # Rule field that fired, if any
+        self.counts = [0] * len(REASONS)  # Checks per outcome; [TRIG_NONE] = suppressed
+
+    def check(self, data: Dict[str, Any], now_ms: int) -> int:
+        """TRIG_* reason an upload is due for this sample, or TRIG_NONE"""
+        reason: int = TRIG_NONE
+        field = None
+        if self._sent_ms is None:
+            reason = TRIG_FIRST
+        else:
+            quiet = time.ticks_diff(now_ms, self._sent_ms)  # type: ignore[attr-defined]
+            if self._heartbeat_ms and quiet >= self._heartbeat_ms:
+                reason = TRIG_HEARTBEAT
+            else:
+                for i in range(len(self.fields)):
+                    reason = self._rule(i, data, quiet)
+                    if reason:
+                        field = self.fields[i]
+                        break
+        self.reason = reason
+        self.field = field
+        self.counts[reason] += 1
+        return reason
+
+    def commit(self, data: Dict[str, Any], now_ms: int) -> None:
+        """Sample was uploaded: it becomes the reference for the next checks"""
+        last = self._last
+        for i, name in enumerate(self.fields):
+            kind = self._kind[i]
+            if kind == _KIND_POS:
+                lat = data.get("lat")
+                lon = data.get("lon")
+                if lat is None or lon is None:
+                    self._have[i] = 0
+                    continue
+                last[2 * i] = lat
+                last[2 * i + 1] = lon
+                self._have[i] = 1
+                continue
+            v = data.get(name)
+            if v is None:
+                self._have[i] = 0
+            elif kind == _KIND_VALUE:
+                if isinstance(v, dict):
+                    m = self._maps[i]
+                    if m is None:
+                        m = self._maps[i] = {}
+                    for k, x in v.items():
+                        m[k] = x
+                else:
+                    last[2 * i] = v
+                self._have[i] = 1
+            else:
+                self._have[i] = 1
+        self._sent_ms = now_ms
+
+    def trigger_text(self) -> str:
+        """Last check's reason for the upload payload, e.g. "change:temp" or "heartbeat" """
+        name = REASONS[self.reason]
+        return "%s:%s" % (name, self.field) if self.field else name
+
+    def _rule(self, i: int, data: Dict[str, Any], quiet: int) -> int:
+        kind = self._kind[i]
+        if kind == _KIND_POS:
+            lat = data.get("lat")
+            lon = data.get("lon")
+            if lat is None or lon is None:
+                return TRIG_NONE
+            if not self._have[i]:
+                return TRIG_CHANGE
+            last_lat = self._last[2 * i]
+            last_lon = self._last[2 * i + 1]
+            d_lat = abs(lat - last_lat)
+            if d_lat + abs(lon - last_lon) >= self._rel[i]:
+                m = self._abs[i]
+                if d_lat * M_PER_DEG > m or haversine_m(last_lat, last_lon, lat, lon) > m:
+                    return TRIG_CHANGE
+        else:
+            v = data.get(self.fields[i])
+            if v is None:
+                return TRIG_NONE
+            if kind == _KIND_LEVEL:
+                if v > self._abs[i]:
+                    return TRIG_LEVEL
+            elif kind == _KIND_VALUE:
+                if not self._have[i]:
+                    return TRIG_CHANGE  # Appeared since the last upload
+                if isinstance(v, dict):
+                    if self._map_moved(i, v):
+                        return TRIG_CHANGE
+                elif self._moved(i, v, self._last[2 * i]):
+                    return TRIG_CHANGE
+        max_ms = self._max_ms[i]
+        if max_ms and quiet >= max_ms:
+            return TRIG_SILENCE
+        return TRIG_NONE
+
+    def _moved(self, i: int, v: float, last: float) -> bool:
+        limit = self._abs[i]
+        rel = self._rel[i] * abs(last)
+        return abs(v - last) > (rel if rel > limit else limit)
+
+    def _map_moved(self, i: int, values: Dict[str, Any]) -> bool:
+        m = self._maps[i]
+        if m is None:
+            return True
+        for k, v in values.items():
+            last = m.get(k)
+            if last is None or self._moved(i, v, last):
+                return True  # A new probe counts as a change
+        return False
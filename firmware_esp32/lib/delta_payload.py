@@ -0,0 +1,83 @@
+# delta_payload.py - Field-level delta payloads against the last acknowledged upload
+#
+# With upload_delta on, a live upload carries only the fields that differ
+# from the state the server last acknowledged, plus sequence numbers:
+#
+#   {"seq": 42, "base": 40, "data": {"temp": 4.6}}     fields changed since 40
+#   {"seq": 43, "base": 0, "data": {...}}              keyframe: every field
+#
+# The server applies the delta to its copy of state `base` and answers
+# {"ack": 42}; only then does 42 become the device's base. A lost request or
+# reply therefore just makes the next delta a little larger, relative to an
+# older base the server still holds. A server that does not have `base` (it
+# restarted, or too many acks were lost) answers {"key": 1} and the next
+# upload is a keyframe, as is the first one of each boot and one every
+# upload_keyframe_sec. Removed fields are sent as null. Dict fields
+# (all_temps) are compared and sent whole. Reference server side in
+# tools/delta_server.py.
+import time
+from typing import Any, Dict, Optional
+
+
+class DeltaEncoder:
+    def __init__(self, keyframe_s: int = 3600) -> None:
+        if keyframe_s < 0:
+            raise ValueError("Keyframe interval must not be negative")
+        self._keyframe_ms = keyframe_s * 1000  # 0 = only on request
+        self.seq = 0  # Of the last encoded upload
+        self.base = 0  # Acknowledged seq the last upload is relative to (0 = keyframe)
+        self._base: Dict[str, Any] = {}  # Fields as of the last acknowledged upload
+        self._base_seq = 0
+        self._out: Dict[str, Any] = {}  # Last encoded fields, applied to _base on its ack
+        self._key_due = True
+        self._key_ms: Optional[int] = None  # ticks_ms of the last acknowledged keyframe
+        self._sent_ms = 0
+        self.keyframes = 0
+        self.fields_sent = 0
+        self.fields_total = 0  # Fields a full payload would have carried
+
+    def encode(self, data: Dict[str, Any], now_ms: int) -> Dict[str, Any]:
+        """Fields to send for this sample; reuses one dict, serialize it before the next call"""
+        self.seq += 1
+        self._sent_ms = now_ms
+        key = self._key_due or not self._base_seq
+        if not key and self._keyframe_ms and self._key_ms is not None:
+            key = time.ticks_diff(now_ms, self._key_ms) >= self._keyframe_ms  # type: ignore
+        out = self._out
+        out.clear()
+        base = self._base
+        for k, v in data.items():
+            if key or k not in base or base[k] != v:
+                out[k] = v.copy() if isinstance(v, dict) else v  # Sensors update dicts in place
+        if key:
+            self.base = 0
+            self.keyframes += 1
+        else:
+            self.base = self._base_seq
+            for k in base:
+                if k not in data:
+                    out[k] = None
+        self.fields_sent += len(out)
+        self.fields_total += len(data)
+        return out
+
+    def acked(self, reply: Any) -> bool:
+        """Reply to the last upload; True if the server acknowledged it"""
+        if not isinstance(reply, dict):
+            return False
+        if reply.get("key"):
+            self._key_due = True  # Server is missing our base
+        if reply.get("ack") != self.seq or self.seq == self._base_seq:
+            return False
+        base = self._base
+        if not self.base:
+            base.clear()
+            self._key_due = False
+            self._key_ms = self._sent_ms
+        for k, v in self._out.items():
+            if v is None:
+                base.pop(k, None)
+            else:
+                base[k] = v
+        self._base_seq = self.seq
+        return True
@@ -1,4 +1,37 @@
-from typing import Any, Dict
+from typing import Any, Dict, Sequence
+
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+
+class Histogram:
+    """Fixed upper-bound buckets plus an overflow bucket; count, sum and max"""
+
+    def __init__(self, bounds: Sequence[int]) -> None:
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.n = 0
+        self.total = 0
+        self.max = 0
+
+    def observe(self, value: int) -> None:
+        i = 0
+        for b in self.bounds:
+            if value <= b:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.n += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def report(self, name: str, out: Dict[str, int]) -> None:
+        for i, b in enumerate(self.bounds):
+            out["%s_le_%d" % (name, b)] = self.counts[i]
+        out["%s_gt_%d" % (name, self.bounds[-1])] = self.counts[-1]
+        out[name + "_n"] = self.n
+        out[name + "_mean"] = self.total // self.n if self.n else 0
+        out[name + "_max"] = self.max
 
 
 class Diagnostics:
@@ -18,6 +51,9 @@ class Diagnostics:
             "sd_write_fail": 0,
             "exceptions": 0,
         }
+        # Point-in-time values (not persisted): mode timers, latencies, ...
+        self.gauges: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}  # Not persisted either
         self._unsaved_count = 0
         self._load()
 
@@ -47,5 +83,19 @@ class Diagnostics:
         if self._unsaved_count >= self.SAVE_THRESHOLD:
             self.flush()
 
+    def set_gauge(self, metric: str, value: int) -> None:
+        self.gauges[metric] = value
+
+    def observe(self, metric: str, value: int, bounds: Sequence[int] = LATENCY_BUCKETS_MS) -> None:
+        """Add a sample (e.g. a latency in ms) to a histogram, created on first use"""
+        h = self.histograms.get(metric)
+        if h is None:
+            h = self.histograms[metric] = Histogram(bounds)
+        h.observe(value)
+
     def get_report(self) -> Dict[str, int]:
-        return self.counters
+        report = self.counters.copy()
+        report.update(self.gauges)
+        for name, h in self.histograms.items():
+            h.report(name, report)
+        return report
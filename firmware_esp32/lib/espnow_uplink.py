@@ -0,0 +1,375 @@
+# espnow_uplink.py - Store-and-forward telemetry relay between trackers over ESP-NOW
+import json
+import os
+import struct
+import time
+import uasyncio as asyncio
+from micropython import const
+from lib.logger import Logger
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Frame layout: magic(1), type(1), seq(2), frag_idx(1), frag_count(1), payload(...)
+_MAGIC = const(0x4C)
+_HDR_FMT = "<BBHBB"
+_HDR_SIZE = const(6)
+_MAX_FRAME = const(250)  # ESP-NOW v1 payload limit
+_MAX_CHUNK = const(244)  # _MAX_FRAME - _HDR_SIZE
+_MAX_FRAGS = const(4)
+MAX_MESSAGE = const(976)  # _MAX_FRAGS * _MAX_CHUNK
+
+_T_BEACON = const(1)
+_T_DATA = const(2)
+_T_ACK = const(3)
+
+_BEACON_UPLINK = const(0x01)
+
+# ACK status codes
+ACK_OK = const(0)
+ACK_FAIL = const(1)  # Relay tried but its own upload failed
+ACK_BUSY = const(2)  # Per-peer rate limit hit, retry later
+ACK_BAD = const(3)  # Message could not be decoded
+ACK_TIMEOUT = const(0xFF)  # Local only: no ACK received
+
+BROADCAST = b"\xff\xff\xff\xff\xff\xff"
+
+_MAX_PEERS = const(8)
+_DUP_WINDOW = const(8)  # Completed sequence numbers remembered per sender
+
+
+def _oldest(ticks: Iterable[Tuple[bytes, int]]) -> bytes:
+    """MAC with the oldest ticks_ms stamp"""
+    oldest = b""
+    oldest_tick = 0
+    for mac, tick in ticks:
+        if not oldest or time.ticks_diff(tick, oldest_tick) < 0:  # type: ignore[attr-defined]
+            oldest, oldest_tick = mac, tick
+    return oldest
+
+
+class EspNowRadio:
+    """Thin adapter over MicroPython's `espnow.ESPNow` (imported lazily)."""
+
+    def __init__(self, wlan: Any, channel: int = 0) -> None:
+        import espnow
+
+        # ESP-NOW rides on the STA interface; it must be active but need not be associated
+        wlan.active(True)
+        if channel and not wlan.isconnected():
+            try:
+                wlan.config(channel=channel)
+            except Exception as e:
+                Logger.log(f"ESP-NOW: Channel set failed: {e}")
+        self._esp = espnow.ESPNow()
+        self._esp.active(True)
+        self._known: List[bytes] = []
+        self.add_peer(BROADCAST)
+
+    def add_peer(self, mac: bytes) -> None:
+        if mac in self._known:
+            return
+        try:
+            self._esp.add_peer(mac)
+        except OSError:
+            pass  # ESP_ERR_ESPNOW_EXIST or table full; send() reports the latter
+        self._known.append(mac)
+
+    def send(self, mac: bytes, msg: bytes) -> bool:
+        self.add_peer(mac)
+        try:
+            return bool(self._esp.send(mac, msg, mac != BROADCAST))
+        except OSError:
+            return False
+
+    def recv(self) -> Tuple[Optional[bytes], Optional[bytes]]:
+        """Non-blocking receive: (mac, msg) or (None, None)"""
+        if not self._esp.any():
+            return None, None
+        mac, msg = self._esp.irecv(0)
+        if msg is None:
+            return None, None
+        return bytes(mac), bytes(msg)
+
+
+class EspNowUplink:
+    """Hand queued telemetry to a peer tracker that has working WiFi.
+
+    Every tracker runs both roles. A tracker whose `has_uplink()` is true
+    broadcasts beacons and relays DATA messages through `upload`; the rest
+    forward their retry buffer to the freshest relay. A record may be
+    dropped by the caller only once `forward()` counts it as confirmed.
+    """
+
+    def __init__(
+        self,
+        radio: Any,
+        device_id: str,
+        has_uplink: Callable[[], bool],
+        upload: Optional[Callable[[str, List[Dict[str, Any]]], Awaitable[bool]]] = None,
+        rate_per_min: int = 12,
+        ack_timeout_ms: int = 1500,
+        retries: int = 3,
+        beacon_interval_ms: int = 5000,
+    ) -> None:
+        if rate_per_min < 1 or ack_timeout_ms < 1 or retries < 1:
+            raise ValueError("Invalid ESP-NOW uplink parameters")
+        self._radio = radio
+        self._device_id = device_id
+        self._has_uplink = has_uplink
+        self._upload = upload
+        self._rate_per_min = rate_per_min
+        self._ack_timeout_ms = ack_timeout_ms
+        self._retries = retries
+        self._beacon_interval_ms = beacon_interval_ms
+
+        self._tx_buf = bytearray(_MAX_FRAME)
+        # Random start so a rebooted sender never collides with the relay's duplicate window
+        self._seq = struct.unpack("<H", os.urandom(2))[0]
+        self._last_beacon = time.ticks_ms() - beacon_interval_ms  # type: ignore[attr-defined]
+        self._advertised = False
+
+        # Sender state
+        self._peers: Dict[bytes, int] = {}  # relay MAC -> last beacon tick
+        self._wait_seq = -1
+        self._wait_status: int = ACK_TIMEOUT
+
+        # Relay state (all bounded by _MAX_PEERS)
+        self._rx: Dict[bytes, List[Any]] = {}  # MAC -> [seq, count, got_mask, buf, length]
+        self._done: Dict[bytes, List[Tuple[int, int]]] = {}  # MAC -> [(seq, status), ...]
+        self._inflight: Dict[bytes, int] = {}  # MAC -> seq being uploaded
+        self._window: Dict[bytes, List[int]] = {}  # MAC -> [window_start_tick, count]
+
+        self.stats: Dict[str, int] = {
+            "fwd_ok": 0,
+            "fwd_fail": 0,
+            "relay_ok": 0,
+            "relay_fail": 0,
+            "relay_dup": 0,
+            "relay_busy": 0,
+        }
+
+    # --- Framing ---
+
+    def _send_frame(
+        self, mac: bytes, ftype: int, seq: int, idx: int, count: int, payload: Any
+    ) -> bool:
+        n = len(payload)
+        struct.pack_into(_HDR_FMT, self._tx_buf, 0, _MAGIC, ftype, seq, idx, count)
+        self._tx_buf[_HDR_SIZE : _HDR_SIZE + n] = payload
+        return bool(self._radio.send(mac, bytes(memoryview(self._tx_buf)[: _HDR_SIZE + n])))
+
+    def _send_ack(self, mac: bytes, seq: int, status: int) -> None:
+        self._send_frame(mac, _T_ACK, seq, 0, 1, bytes((status,)))
+
+    # --- Receive path ---
+
+    def poll(self) -> int:
+        """Drain and dispatch all pending frames. Returns frames handled."""
+        handled = 0
+        while True:
+            mac, msg = self._radio.recv()
+            if msg is None or mac is None:
+                return handled
+            self.handle_frame(mac, msg)
+            handled += 1
+
+    def handle_frame(self, mac: bytes, frame: bytes) -> None:
+        if len(frame) < _HDR_SIZE or frame[0] != _MAGIC:
+            return
+        _, ftype, seq, idx, count = struct.unpack_from(_HDR_FMT, frame, 0)
+        payload = memoryview(frame)[_HDR_SIZE:]
+
+        if ftype == _T_BEACON:
+            self._on_beacon(mac, payload)
+        elif ftype == _T_ACK:
+            if seq == self._wait_seq and len(payload) >= 1:
+                self._wait_status = payload[0]
+        elif ftype == _T_DATA:
+            self._on_data(mac, seq, idx, count, payload)
+
+    def _on_beacon(self, mac: bytes, payload: Any) -> None:
+        if len(payload) >= 1 and payload[0] & _BEACON_UPLINK:
+            if mac not in self._peers and len(self._peers) >= _MAX_PEERS:
+                self._peers.pop(_oldest(self._peers.items()))
+            self._peers[mac] = time.ticks_ms()  # type: ignore[attr-defined]
+        else:
+            self._peers.pop(mac, None)
+
+    def _on_data(self, mac: bytes, seq: int, idx: int, count: int, payload: Any) -> None:
+        if self._upload is None or not self._has_uplink():
+            return  # Not a relay right now; sender will time out and move on
+        if count < 1 or count > _MAX_FRAGS or idx >= count:
+            return
+
+        # Duplicate suppression: re-ACK completed messages without re-uploading
+        for done_seq, status in self._done.get(mac, ()):
+            if done_seq == seq:
+                self.stats["relay_dup"] += 1
+                self._send_ack(mac, seq, status)
+                return
+        if self._inflight.get(mac) == seq:
+            return  # Upload still running; ACK follows when it finishes
+
+        slot = self._rx.get(mac)
+        if slot is None or slot[0] != seq:
+            if slot is None and len(self._rx) >= _MAX_PEERS:
+                return
+            slot = [seq, count, 0, bytearray(count * _MAX_CHUNK), 0]
+            self._rx[mac] = slot
+        buf = slot[3]
+        start = idx * _MAX_CHUNK
+        buf[start : start + len(payload)] = payload
+        slot[2] |= 1 << idx
+        if idx == count - 1:
+            slot[4] = start + len(payload)  # Last fragment fixes the true length
+        if slot[2] != (1 << count) - 1:
+            return
+
+        del self._rx[mac]
+        if not self._take_token(mac):
+            self.stats["relay_busy"] += 1
+            self._send_ack(mac, seq, ACK_BUSY)
+            return
+        self._inflight[mac] = seq
+        asyncio.create_task(self._relay(mac, seq, bytes(memoryview(buf)[: slot[4]])))
+
+    def _take_token(self, mac: bytes) -> bool:
+        now = time.ticks_ms()  # type: ignore[attr-defined]
+        window = self._window.get(mac)
+        if window is None or time.ticks_diff(now, window[0]) >= 60000:  # type: ignore[attr-defined]
+            if window is None and len(self._window) >= _MAX_PEERS:
+                # Only the oldest window: fresh MACs must not reset the other peers' limits
+                self._window.pop(_oldest((m, w[0]) for m, w in self._window.items()))
+            window = [now, 0]
+            self._window[mac] = window
+        if window[1] >= self._rate_per_min:
+            return False
+        window[1] += 1
+        return True
+
+    async def _relay(self, mac: bytes, seq: int, message: bytes) -> None:
+        status = ACK_BAD
+        try:
+            decoded = json.loads(message)
+            origin = str(decoded["id"])
+            records = decoded["r"]
+        except Exception:
+            decoded = None
+        if decoded is not None and self._upload is not None:
+            try:
+                ok = await self._upload(origin, records)
+            except Exception as e:
+                Logger.log(f"ESP-NOW: Relay upload error: {e}")
+                ok = False
+            status = ACK_OK if ok else ACK_FAIL
+        self.stats["relay_ok" if status == ACK_OK else "relay_fail"] += 1
+
+        # Only successful uploads are final; failures must be retried by the sender
+        if status == ACK_OK:
+            done = self._done.setdefault(mac, [])
+            done.append((seq, status))
+            if len(done) > _DUP_WINDOW:
+                done.pop(0)
+        self._inflight.pop(mac, None)
+        self._send_ack(mac, seq, status)
+
+    # --- Send path ---
+
+    def best_peer(self) -> Optional[bytes]:
+        """Most recently heard relay that is still within its beacon TTL"""
+        now = time.ticks_ms()  # type: ignore[attr-defined]
+        ttl = self._beacon_interval_ms * 3
+        best: Optional[bytes] = None
+        best_age = ttl
+        for mac, tick in self._peers.items():
+            age = time.ticks_diff(now, tick)  # type: ignore[attr-defined]
+            if age < best_age:
+                best, best_age = mac, age
+        return best
+
+    def _encode_batch(self, records: List[Dict[str, Any]], start: int) -> Tuple[int, bytes]:
+        """Pack as many records from `start` as fit in one message"""
+        head = b'{"id":' + json.dumps(self._device_id).encode() + b',"r":['
+        parts: List[bytes] = []
+        size = len(head) + 2
+        for rec in records[start:]:
+            enc = json.dumps(rec).encode()
+            extra = len(enc) + (1 if parts else 0)
+            if size + extra > MAX_MESSAGE:
+                break
+            parts.append(enc)
+            size += extra
+        if not parts:
+            return 0, b""
+        return len(parts), head + b",".join(parts) + b"]}"
+
+    async def _send_message(self, peer: bytes, message: bytes) -> int:
+        self._seq = (self._seq + 1) & 0xFFFF
+        seq = self._seq
+        count = (len(message) + _MAX_CHUNK - 1) // _MAX_CHUNK
+        mv = memoryview(message)
+        self._wait_seq = seq
+
+        for _ in range(self._retries):
+            self._wait_status = ACK_TIMEOUT
+            for idx in range(count):
+                chunk = mv[idx * _MAX_CHUNK : (idx + 1) * _MAX_CHUNK]
+                self._send_frame(peer, _T_DATA, seq, idx, count, chunk)
+                await asyncio.sleep_ms(0)  # type: ignore[attr-defined]
+
+            deadline = time.ticks_add(time.ticks_ms(), self._ack_timeout_ms)  # type: ignore[attr-defined]
+            while self._wait_status == ACK_TIMEOUT:
+                if time.ticks_diff(deadline, time.ticks_ms()) <= 0:  # type: ignore[attr-defined]
+                    break
+                await asyncio.sleep_ms(10)  # type: ignore[attr-defined]
+            if self._wait_status != ACK_TIMEOUT:
+                break  # Any answer is final for this attempt; only silence is retried
+
+        self._wait_seq = -1
+        return self._wait_status
+
+    async def forward(self, records: List[Dict[str, Any]]) -> int:
+        """Relay records through a peer. Returns how many leading records were confirmed."""
+        peer = self.best_peer()
+        if peer is None or not records:
+            return 0
+
+        confirmed = 0
+        while confirmed < len(records):
+            n, message = self._encode_batch(records, confirmed)
+            if n == 0:
+                Logger.log("ESP-NOW: Record too large to relay")
+                break
+            status = await self._send_message(peer, message)
+            if status != ACK_OK:
+                self.stats["fwd_fail"] += 1
+                if status == ACK_TIMEOUT:
+                    self._peers.pop(peer, None)  # Let the next beacon re-admit it
+                break
+            self.stats["fwd_ok"] += 1
+            confirmed += n
+        return confirmed
+
+    # --- Task ---
+
+    def _maybe_beacon(self) -> None:
+        now = time.ticks_ms()  # type: ignore[attr-defined]
+        if time.ticks_diff(now, self._last_beacon) < self._beacon_interval_ms:  # type: ignore[attr-defined]
+            return
+        self._last_beacon = now
+        uplink = self._upload is not None and self._has_uplink()
+        if not uplink and not self._advertised:
+            return  # Plain senders stay silent
+        # One final beacon without the flag tells senders to drop us
+        self._advertised = uplink
+        self._send_frame(BROADCAST, _T_BEACON, 0, 0, 1, bytes((_BEACON_UPLINK if uplink else 0,)))
+
+    async def run(self, poll_ms: int = 20) -> None:
+        """Background task: receive frames and advertise relay capability"""
+        Logger.log("Task: ESP-NOW uplink started.")
+        while True:
+            try:
+                self.poll()
+                self._maybe_beacon()
+            except Exception as e:
+                Logger.log(f"ESP-NOW: Loop error: {e}")
+            await asyncio.sleep_ms(poll_ms)  # type: ignore[attr-defined]
@@ -0,0 +1,305 @@
+# geofence.py - On-device geofences (circles and polygons) with a coarse grid index
+#
+# Fences come from config "geofences", a list of
+#   {"id": "depot", "lat": 52.52, "lon": 13.40, "radius_m": 150, "dwell_s": 300}
+#   {"id": "cust-17", "points": [[lat, lon], [lat, lon], ...]}
+# Each fence is stored in local metres around its bounding-box centre
+# (equirectangular, fine for fences up to a few km; antimeridian not handled).
+#
+# Fences are bucketed by the grid cells their bounding box covers, so a
+# position check only tests the fences in its cell plus those it is already
+# inside. Entering needs `confirm_s` of consecutive inside samples. Exiting
+# needs `confirm_s` of samples more than `margin_m` outside the boundary, so
+# GPS noise at the edge does not flap. A dwell event fires once per visit.
+import math
+import time
+from array import array
+from micropython import const
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+GF_ENTER = const(1)
+GF_EXIT = const(2)
+GF_DWELL = const(3)
+EVENT_NAMES = ("", "enter", "exit", "dwell")
+
+M_PER_DEG = 111195.0  # Metres per degree of latitude
+MIN_CELL_DEG = 0.01  # Keeps grid keys below 2^30 (small ints on MicroPython)
+_MAX_CELLS_PER_FENCE = const(64)  # Larger fences are tested on every check
+
+_NO_FENCES: List[int] = []
+
+_OUT = const(0)
+_ENTERING = const(1)
+_IN = const(2)
+_EXITING = const(3)
+
+
+class Fence:
+    __slots__ = ("id", "lat0", "lon0", "kx", "radius", "poly", "ext_x", "ext_y", "dwell_ms")
+
+    def __init__(self, spec: Dict[str, Any], dwell_s: int) -> None:
+        self.id = str(spec.get("id", ""))
+        self.dwell_ms = int(spec.get("dwell_s", dwell_s)) * 1000
+        self.poly: Optional[Any] = None
+        if "points" in spec:
+            self._init_polygon(spec["points"])
+        else:
+            lat = float(spec["lat"])
+            lon = float(spec["lon"])
+            self.radius = float(spec["radius_m"])
+            if self.radius <= 0:
+                raise ValueError("Fence %s: radius_m must be > 0" % self.id)
+            self._set_origin(lat, lon)
+            self.ext_x = self.ext_y = self.radius
+
+    def _set_origin(self, lat: float, lon: float) -> None:
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError("Fence %s: position out of range" % self.id)
+        self.lat0 = lat
+        self.lon0 = lon
+        self.kx = M_PER_DEG * math.cos(math.radians(lat))
+
+    def _init_polygon(self, points: Sequence[Sequence[float]]) -> None:
+        if len(points) < 3:
+            raise ValueError("Fence %s: polygon needs at least 3 points" % self.id)
+        lats = [float(p[0]) for p in points]
+        lons = [float(p[1]) for p in points]
+        self._set_origin((min(lats) + max(lats)) / 2, (min(lons) + max(lons)) / 2)
+        poly = array("f", bytes(8 * len(points)))  # Interleaved x, y metres
+        for i in range(len(points)):
+            poly[2 * i] = (lons[i] - self.lon0) * self.kx
+            poly[2 * i + 1] = (lats[i] - self.lat0) * M_PER_DEG
+        self.poly = poly
+        self.radius = 0.0
+        self.ext_x = (max(lons) - min(lons)) / 2 * self.kx
+        self.ext_y = (max(lats) - min(lats)) / 2 * M_PER_DEG
+
+    def contains(self, x: float, y: float) -> bool:
+        if abs(x) > self.ext_x or abs(y) > self.ext_y:
+            return False
+        poly = self.poly
+        if poly is None:
+            return x * x + y * y <= self.radius * self.radius
+        inside = False
+        n = len(poly)
+        jx = poly[n - 2]
+        jy = poly[n - 1]
+        for k in range(0, n, 2):  # Ray casting
+            ix = poly[k]
+            iy = poly[k + 1]
+            if (iy > y) != (jy > y) and x < (jx - ix) * (y - iy) / (jy - iy) + ix:
+                inside = not inside
+            jx = ix
+            jy = iy
+        return inside
+
+    def outside_by(self, x: float, y: float, margin: float) -> bool:
+        """True if (x, y) is more than `margin` metres outside the boundary"""
+        if abs(x) > self.ext_x + margin or abs(y) > self.ext_y + margin:
+            return True
+        poly = self.poly
+        if poly is None:
+            r = self.radius + margin
+            return x * x + y * y > r * r
+        if self.contains(x, y):
+            return False
+        m2 = margin * margin
+        n = len(poly)
+        jx = poly[n - 2]
+        jy = poly[n - 1]
+        for k in range(0, n, 2):  # Distance to each edge
+            ix = poly[k]
+            iy = poly[k + 1]
+            ex = ix - jx
+            ey = iy - jy
+            len2 = ex * ex + ey * ey
+            t = ((x - jx) * ex + (y - jy) * ey) / len2 if len2 else 0.0
+            t = 0.0 if t < 0 else 1.0 if t > 1 else t
+            dx = x - jx - t * ex
+            dy = y - jy - t * ey
+            if dx * dx + dy * dy <= m2:
+                return False
+            jx = ix
+            jy = iy
+        return True
+
+
+class GeofenceEngine:
+    """Feed fixes to `check()`; returns the (GF_*, Fence) transitions for that fix"""
+
+    def __init__(
+        self,
+        margin_m: float = 20.0,
+        confirm_s: int = 5,
+        dwell_s: int = 300,
+        cell_deg: float = 0.01,
+        max_fences: int = 300,
+    ) -> None:
+        if margin_m < 0 or confirm_s < 0 or dwell_s <= 0 or max_fences <= 0:
+            raise ValueError("Invalid geofence parameters")
+        if cell_deg < MIN_CELL_DEG:
+            raise ValueError("Geofence cell_deg must be >= %s" % MIN_CELL_DEG)
+        self._margin = margin_m
+        self._confirm_ms = confirm_s * 1000
+        self._dwell_s = dwell_s
+        self._cell = cell_deg
+        self._nx = int(360 / cell_deg) + 2
+        self._max = max_fences
+        self.fences: List[Fence] = []
+        self._grid: Dict[int, List[int]] = {}
+        self._wide: List[int] = []
+        self._state = bytearray(0)
+        self._since: List[int] = []
+        self._entered: List[int] = []
+        self._dwelt = bytearray(0)
+        self._stamp = array("i")
+        self._gen = 0
+        self._active: List[int] = []  # Fences not in _OUT state
+        self.events: List[Tuple[int, Fence]] = []
+        self.tested = 0  # Fences tested by the last check
+
+    def load(self, specs: Optional[Sequence[Dict[str, Any]]]) -> int:
+        """Replace all fences; raises ValueError (keeping the old set) on a bad spec.
+
+        Fences whose id is in both sets keep their inside/dwell state, so
+        reloading after an unrelated config change fires no spurious ENTER.
+        """
+        specs = specs or []
+        if len(specs) > self._max:
+            raise ValueError("Too many geofences (%d > %d)" % (len(specs), self._max))
+        fences = []
+        for i, spec in enumerate(specs):
+            try:
+                fences.append(Fence(spec, self._dwell_s))
+            except (AttributeError, KeyError, TypeError, IndexError) as e:
+                raise ValueError("Geofence %d: bad spec (%s)" % (i, e))
+        n = len(fences)
+        old: Dict[str, int] = {}
+        for i in self._active:
+            if self.fences[i].id:  # Unnamed fences cannot be matched up
+                old[self.fences[i].id] = i
+        state = bytearray(n)
+        since = [0] * n
+        entered = [0] * n
+        dwelt = bytearray(n)
+        active: List[int] = []
+        for i, f in enumerate(fences):
+            j = old.pop(f.id, None)  # Once: a duplicate id starts outside
+            if j is not None:
+                state[i] = self._state[j]
+                since[i] = self._since[j]
+                entered[i] = self._entered[j]
+                dwelt[i] = self._dwelt[j]
+                active.append(i)
+        self.fences = fences
+        self._state = state
+        self._since = since
+        self._entered = entered
+        self._dwelt = dwelt
+        self._stamp = array("i", bytes(4 * n))
+        self._gen = 0
+        self._active = active
+        self._build_grid()
+        return n
+
+    def _cell_key(self, lat: float, lon: float) -> int:
+        return int((lat + 90) / self._cell) * self._nx + int((lon + 180) / self._cell)
+
+    def _build_grid(self) -> None:
+        grid: Dict[int, List[int]] = {}
+        wide = []
+        cell = self._cell
+        for i, f in enumerate(self.fences):
+            dlat = f.ext_y / M_PER_DEG
+            dlon = f.ext_x / f.kx if f.kx > 0 else 360.0
+            y0 = int((f.lat0 - dlat + 90) / cell)
+            y1 = int((f.lat0 + dlat + 90) / cell)
+            x0 = int((f.lon0 - dlon + 180) / cell)
+            x1 = int((f.lon0 + dlon + 180) / cell)
+            if (y1 - y0 + 1) * (x1 - x0 + 1) > _MAX_CELLS_PER_FENCE:
+                wide.append(i)
+                continue
+            for y in range(y0, y1 + 1):
+                for x in range(x0, x1 + 1):
+                    grid.setdefault(y * self._nx + x, []).append(i)
+        self._grid = grid
+        self._wide = wide
+
+    def check(self, lat: float, lon: float, now_ms: int) -> List[Tuple[int, Fence]]:
+        """Test one fix; the returned list is reused by the next call"""
+        events = self.events
+        events.clear()
+        if not self.fences:
+            return events
+        stamp = self._stamp
+        self._gen += 1
+        if self._gen > 0x3FFFFFFF:  # Stay a small int; old stamps must not match
+            self._gen = 1
+            for i in range(len(stamp)):
+                stamp[i] = 0
+        gen = self._gen
+        tested = self._scan(self._grid.get(self._cell_key(lat, lon), _NO_FENCES), lat, lon, now_ms)
+        if self._wide:
+            tested += self._scan(self._wide, lat, lon, now_ms)
+        active = self._active
+        for i in active:
+            if stamp[i] != gen:  # Already inside / pending but no longer in this cell
+                self._step(i, lat, lon, now_ms)
+                tested += 1
+        j = 0
+        state = self._state
+        for i in active:
+            if state[i] != _OUT:
+                active[j] = i
+                j += 1
+        del active[j:]
+        self.tested = tested
+        return events
+
+    def _scan(self, bucket: List[int], lat: float, lon: float, now_ms: int) -> int:
+        gen = self._gen
+        stamp = self._stamp
+        n = 0
+        for i in bucket:
+            if stamp[i] != gen:
+                stamp[i] = gen
+                self._step(i, lat, lon, now_ms)
+                n += 1
+        return n
+
+    def _step(self, i: int, lat: float, lon: float, now_ms: int) -> None:
+        f = self.fences[i]
+        st = self._state[i]
+        y = (lat - f.lat0) * M_PER_DEG
+        x = (lon - f.lon0) * f.kx
+        if st == _OUT or st == _ENTERING:
+            if not f.contains(x, y):
+                self._state[i] = _OUT
+                return
+            if st == _OUT:
+                self._state[i] = _ENTERING
+                self._since[i] = now_ms
+                self._active.append(i)
+            if time.ticks_diff(now_ms, self._since[i]) >= self._confirm_ms:  # type: ignore
+                self._state[i] = _IN
+                self._entered[i] = self._since[i]
+                self._dwelt[i] = 0
+                self.events.append((GF_ENTER, f))
+            return
+        if not f.outside_by(x, y, self._margin):
+            self._state[i] = _IN
+            if not self._dwelt[i]:
+                if time.ticks_diff(now_ms, self._entered[i]) >= f.dwell_ms:  # type: ignore
+                    self._dwelt[i] = 1
+                    self.events.append((GF_DWELL, f))
+            return
+        if st == _IN:
+            self._state[i] = _EXITING
+            self._since[i] = now_ms
+        if time.ticks_diff(now_ms, self._since[i]) >= self._confirm_ms:  # type: ignore
+            self._state[i] = _OUT
+            self.events.append((GF_EXIT, f))
+
+    def inside(self) -> List[str]:
+        """Ids of fences currently inside (allocates; for status/upload)"""
+        return [self.fences[i].id for i in self._active if self._state[i] >= _IN]
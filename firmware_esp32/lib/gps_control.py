@@ -0,0 +1,242 @@
+# gps_control.py - u-blox NEO-6M output, rate and power management over UBX
+#
+# The receiver's default output (GGA, GLL, GSA, GSV x3, RMC, VTG at 1 Hz) is
+# cut to RMC only, the one sentence the firmware parses. The navigation rate
+# and power mode then follow the motion state:
+#   GPS_FULL    moving (trip moving or IMU motion): continuous, rate_moving_ms
+#   GPS_ECO     stopped, or parked but not yet long: power save, rate_stopped_ms
+#   GPS_BACKUP  parked with no IMU motion for backup_after_s: backup mode, no
+#               output; the held fix stands in for the position
+# Backup is requested for at most backup_max_s and re-armed while parked, so the
+# receiver also comes back on its own timer if UART wake-up is not honoured.
+# On wake the configuration is re-sent and the last position and time are
+# passed as AID-INI, so the receiver hot-starts instead of searching the sky.
+import struct
+import time
+from micropython import const
+from typing import Any, Dict, List, Optional
+
+from lib.trip_detector import TRIP_MOVING, TRIP_STOPPED
+
+GPS_FULL = const(0)
+GPS_ECO = const(1)
+GPS_BACKUP = const(2)
+MODE_NAMES = ("full", "eco", "backup")
+
+UBX_CFG = const(0x06)
+UBX_CFG_MSG = const(0x01)
+UBX_CFG_RATE = const(0x08)
+UBX_CFG_RXM = const(0x11)
+UBX_RXM = const(0x02)
+UBX_RXM_PMREQ = const(0x41)
+UBX_AID = const(0x0B)
+UBX_AID_INI = const(0x01)
+
+NMEA_CLASS = const(0xF0)
+NMEA_RMC = const(0x04)
+NMEA_UNUSED = (0x00, 0x01, 0x02, 0x03, 0x05)  # GGA, GLL, GSA, GSV, VTG
+
+_LP_CONTINUOUS = const(0)
+_LP_POWER_SAVE = const(1)
+_PMREQ_BACKUP = const(0x02)
+_AID_POS = const(0x01)
+_AID_TIME = const(0x02)
+_AID_LLA = const(0x20)
+_AID_ALT_INV = const(0x40)
+_WAKE = b"\xff" * 8  # Any RX activity wakes the receiver; these bytes are lost
+
+GPS_EPOCH = 315964800  # 1980-01-06 in Unix seconds
+GPS_LEAP_S = const(18)  # GPS - UTC
+_MIN_VALID_TS = 1704067200  # Same "clock is set" test as NTPClient
+_POS_ACC_HELD_CM = const(10000)  # Fix held this boot while parked
+_POS_ACC_SAVED_CM = const(1000000)  # Fix restored from config: the vehicle may have been moved
+_TIME_ACC_MS = const(5000)  # The RTC drifts while the receiver sleeps
+
+
+def ubx_frame(cls: int, msg_id: int, payload: bytes) -> bytes:
+    """Sync chars, class, id, little-endian length, payload, 8-bit Fletcher checksum"""
+    body = bytes((cls, msg_id, len(payload) & 0xFF, len(payload) >> 8)) + payload
+    ck_a = ck_b = 0
+    for b in body:
+        ck_a = (ck_a + b) & 0xFF
+        ck_b = (ck_b + ck_a) & 0xFF
+    return b"\xb5\x62" + body + bytes((ck_a, ck_b))
+
+
+def _coord(value: str, direction: str) -> float:
+    if not value or "." not in value:
+        return 0.0
+    try:
+        dot_idx = value.find(".")
+        degrees = float(value[: dot_idx - 2])
+        minutes = float(value[dot_idx - 2 :])
+        decimal = degrees + minutes / 60
+        if direction in ("S", "W"):
+            decimal = -decimal
+        return decimal
+    except ValueError:
+        return 0.0
+
+
+def parse_rmc(line: bytes, gps: Dict[str, Any]) -> int:
+    """Update `gps` from an RMC sentence: 1 = fix, 0 = RMC without fix, -1 = other line"""
+    i = line.find(b"$GPRMC")  # UBX acknowledgements may precede it on the same line
+    if i < 0:
+        return -1
+    parts = line[i:].decode().split(",")
+    if len(parts) < 8 or parts[2] != "A":
+        gps["fix"] = False
+        return 0
+    gps["fix"] = True
+    gps["lat"] = _coord(parts[3], parts[4])
+    gps["lon"] = _coord(parts[5], parts[6])
+    try:
+        gps["speed"] = float(parts[7]) * 1.852
+    except ValueError:
+        gps["speed"] = 0.0
+    try:
+        gps["course"] = float(parts[8])
+    except (ValueError, IndexError):
+        pass  # Empty while stationary: keep the last course
+    return 1
+
+
+class GpsController:
+    """Call `configure()` once, then `update()` from the sensor loop"""
+
+    def __init__(
+        self,
+        uart: Any,
+        rate_moving_ms: int = 1000,
+        rate_stopped_ms: int = 5000,
+        backup_after_s: int = 300,
+        backup_max_s: int = 3600,
+    ) -> None:
+        if not (100 <= rate_moving_ms <= rate_stopped_ms <= 10000):
+            raise ValueError("GPS rates must satisfy 100 <= moving <= stopped <= 10000 ms")
+        if backup_after_s < 0 or backup_max_s <= 0:
+            raise ValueError("Invalid GPS backup parameters")
+        self._uart = uart
+        self._rates = (rate_moving_ms, rate_stopped_ms)
+        self._backup_after_ms = backup_after_s * 1000
+        self._backup_max_ms = backup_max_s * 1000
+        self.mode = GPS_FULL
+        self._still_since: Optional[int] = None
+        self._asleep_ms = 0
+        self._wake_pending = False
+        self.frames = 0  # UBX frames sent
+        self.last_lat = 0.0
+        self.last_lon = 0.0
+        self.last_ts = 0
+        self._held = False  # last_* is from a fix this boot
+
+    @property
+    def asleep(self) -> bool:
+        return self.mode == GPS_BACKUP
+
+    def restore(self, saved: Any) -> None:
+        """Last fix [lat, lon, unix ts] from config; ignored if malformed"""
+        try:
+            lat, lon, ts = float(saved[0]), float(saved[1]), int(saved[2])
+        except (TypeError, ValueError, IndexError, KeyError):
+            return
+        if -90 <= lat <= 90 and -180 <= lon <= 180:
+            self.last_lat, self.last_lon, self.last_ts = lat, lon, ts
+            self._held = False
+
+    def saved(self) -> List[Any]:
+        return [self.last_lat, self.last_lon, self.last_ts]
+
+    def note_fix(self, lat: float, lon: float, ts: int) -> None:
+        self.last_lat = lat
+        self.last_lon = lon
+        self.last_ts = ts
+        self._held = True
+
+    def configure(self) -> None:
+        """RMC only, then the full-power mode"""
+        self._send_outputs()
+        self.mode = GPS_FULL
+        self._send_mode(GPS_FULL)
+
+    def update(self, trip_state: int, moving: bool, now_ms: int) -> bool:
+        """Follow the motion state; True when the mode changed"""
+        if self._wake_pending:  # Woken by the previous call; the receiver is listening now
+            self._wake_pending = False
+            self._send_outputs()
+            self._send_mode(self.mode)
+            self._send_aid()
+        if moving or trip_state == TRIP_MOVING:
+            self._still_since = None
+            target = GPS_FULL
+        elif trip_state == TRIP_STOPPED:
+            self._still_since = None
+            target = GPS_ECO
+        else:
+            if self._still_since is None:
+                self._still_since = now_ms
+            still_ms = time.ticks_diff(now_ms, self._still_since)  # type: ignore[attr-defined]
+            target = GPS_BACKUP if still_ms >= self._backup_after_ms else GPS_ECO
+
+        if target == self.mode:
+            if target == GPS_BACKUP:
+                if time.ticks_diff(now_ms, self._asleep_ms) >= self._backup_max_ms:  # type: ignore
+                    self.sleep(now_ms)  # Its own timer woke it; still parked
+            return False
+        prev = self.mode
+        self.mode = target
+        if target == GPS_BACKUP:
+            self.sleep(now_ms)
+        elif prev == GPS_BACKUP:
+            self._uart.write(_WAKE)
+            self._wake_pending = True
+        else:
+            self._send_mode(target)
+        return True
+
+    def sleep(self, now_ms: int, duration_ms: int = 0) -> None:
+        """Backup mode for duration_ms (default backup_max_s); also used before deep sleep"""
+        self.mode = GPS_BACKUP
+        self._asleep_ms = now_ms
+        payload = struct.pack("<II", duration_ms or self._backup_max_ms, _PMREQ_BACKUP)
+        self._send(UBX_RXM, UBX_RXM_PMREQ, payload)
+
+    def _send(self, cls: int, msg_id: int, payload: bytes) -> None:
+        self._uart.write(ubx_frame(cls, msg_id, payload))
+        self.frames += 1
+
+    def _send_outputs(self) -> None:
+        for msg_id in NMEA_UNUSED:
+            self._send(UBX_CFG, UBX_CFG_MSG, bytes((NMEA_CLASS, msg_id, 0)))
+        self._send(UBX_CFG, UBX_CFG_MSG, bytes((NMEA_CLASS, NMEA_RMC, 1)))
+
+    def _send_mode(self, mode: int) -> None:
+        rate = self._rates[0] if mode == GPS_FULL else self._rates[1]
+        self._send(UBX_CFG, UBX_CFG_RATE, struct.pack("<HHH", rate, 1, 1))  # GPS time
+        lp = _LP_CONTINUOUS if mode == GPS_FULL else _LP_POWER_SAVE
+        self._send(UBX_CFG, UBX_CFG_RXM, bytes((8, lp)))
+
+    def _send_aid(self) -> None:
+        """AID-INI with the last fix and the current time, if both are known"""
+        now = int(time.time())
+        if not self.last_ts or now < _MIN_VALID_TS:
+            return
+        gps_s = now - GPS_EPOCH + GPS_LEAP_S
+        pos_acc = _POS_ACC_HELD_CM if self._held else _POS_ACC_SAVED_CM
+        payload = struct.pack(
+            "<iiiIHHIiIIiII",
+            int(self.last_lat * 1e7),
+            int(self.last_lon * 1e7),
+            0,  # Altitude unknown (flagged invalid)
+            pos_acc,
+            0,
+            gps_s // 604800,  # Week
+            gps_s % 604800 * 1000,  # Time of week, ms
+            0,
+            _TIME_ACC_MS,
+            0,
+            0,
+            0,
+            _AID_POS | _AID_TIME | _AID_LLA | _AID_ALT_INV,
+        )
+        self._send(UBX_AID, UBX_AID_INI, payload)
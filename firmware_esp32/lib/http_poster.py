@@ -1,59 +1,81 @@
 # http_poster.py - Lightweight cloud ingest client
+import json
 import urequests
 import time
-from typing import Any
+from lib.deadband import REASONS, TRIG_NONE, Deadband, default_rules
+from lib.delta_payload import DeltaEncoder
+from lib.payload_writer import PayloadWriter
+from typing import Any, Callable, Optional
 
 
 class HttpPoster:
-    def __init__(self, config: Any, diagnostics: Any = None) -> None:
+    def __init__(self, config: Any, diagnostics: Any = None, timebase: Any = None) -> None:
         self.config = config
         self.diagnostics = diagnostics
-        self._last_sent_data: dict[str, Any] | None = None
-        self._last_sent_time = 0.0
+        self.timebase = timebase  # lib/timebase.py: corrects queued records before upload
+        self.deadband = self._load_deadband()  # Which live samples are worth uploading
+        self.delta: Optional[DeltaEncoder] = None  # Live uploads carry only changed fields
+        if config.get("upload_delta"):
+            self.delta = DeltaEncoder(max(0, config.get("upload_keyframe_sec") or 0))
+        self.writer = self._load_writer()  # Request bodies, deflated above a size threshold
+        self.bytes_sent = 0  # Request bodies that reached the server
+        self.reply: Any = None  # JSON body of the last successful POST, if any
+        self.on_reply: Optional[Callable[[Any], Any]] = None  # Every JSON reply (downlink)
+        self.mqtt: Any = None  # lib/mqtt_uplink.py MqttUplink, replaces the POSTs when set
+        self._topic = ""
+
+    def use_mqtt(self, uplink: Any, topic: str) -> None:
+        """Send the same bodies as QoS 1 publishes to `topic` (deflated ones to topic/z)"""
+        self.mqtt = uplink
+        self._topic = topic
+        uplink.on_message = self._on_downlink
+
+    def has_uplink(self) -> bool:
+        return bool(self.mqtt or self.config.get("ingest_url"))
+
+    def _load_deadband(self) -> Deadband:
+        heartbeat = self.config.get("upload_heartbeat_sec")
+        heartbeat = 3600 if heartbeat is None else heartbeat
+        builtin = default_rules(self.config.get("shock_threshold") or 500)
+        try:
+            return Deadband(self.config.get("upload_deadband") or builtin, heartbeat)
+        except ValueError as e:
+            print(f"Config: Invalid upload deadband ({e}), using built-in rules")
+            return Deadband(builtin)
+
+    def _load_writer(self) -> PayloadWriter:
+        enabled = bool(self.config.get("upload_deflate"))
+        try:
+            return PayloadWriter(
+                self.config.get("upload_deflate_min_bytes") or 0,
+                self.config.get("upload_deflate_wbits") or 10,
+                enabled,
+            )
+        except ValueError as e:
+            print(f"Config: Invalid deflate settings ({e}), using defaults")
+            return PayloadWriter(enabled=enabled)
 
     def _should_send(self, data: dict[str, Any]) -> bool:
         """Check if data has changed enough to warrant an upload (Bandwidth Optimization)"""
-        if self._last_sent_data is None:
-            return True
-
-        now = time.time()
-        # Force a heartbeat every 1 hour regardless of change
-        if now - self._last_sent_time > 3600:
-            return True
-
-        # 1. Check movement (Lat/Lon) - threshold ~10m
-        d_lat = abs(data["lat"] - self._last_sent_data["lat"])
-        d_lon = abs(data["lon"] - self._last_sent_data["lon"])
-        if d_lat > 0.0001 or d_lon > 0.0001:
-            return True
-
-        # 2. Check major sensors (Primary)
-        d_temp = abs(data.get("temp", 0) - self._last_sent_data.get("temp", 0))
-        if d_temp > 0.5:
-            return True
-
-        # 2b. Check all other temps (V2)
-        current_temps = data.get("all_temps", {})
-        last_temps = self._last_sent_data.get("all_temps", {})
-        for rom, val in current_temps.items():
-            if abs(val - last_temps.get(rom, -999)) > 0.5:
-                return True
-
-        if data.get("shock", 0) > self.config.get("shock_threshold"):
-            return True
-
-        # No significant change
-        return False
+        db = self.deadband
+        reason = db.check(data, time.ticks_ms())  # type: ignore[attr-defined]
+        if self.diagnostics:
+            self.diagnostics.set_gauge("upload_suppressed", db.counts[TRIG_NONE])
+            if reason:
+                name = "upload_trig_" + REASONS[reason]
+                self.diagnostics.set_gauge(name, db.counts[reason])
+        return reason != TRIG_NONE
 
     async def post_telemetry(self, data: dict[str, Any]) -> bool:
-        if not self._should_send(data):
+        # Buffered readings (stamped with their boot) passed the deadband when they were taken
+        live = "boot" not in data
+        if live and not self._should_send(data):
             # Quietly skip to save bandwidth
             return True  # Pretend success as no action was needed
 
         url = self.config.get("ingest_url")
-        token = self.config.get("ingest_token")
 
-        if not url:
+        if not self.has_uplink():
             return False
 
         # Timestamp validity check
@@ -68,22 +90,98 @@ class HttpPoster:
             "ts_synced": is_synced,
             "data": data,
         }
+        delta = self.delta if live else None
+        if live:
+            payload["trigger"] = self.deadband.trigger_text()
+        if delta:
+            payload["data"] = delta.encode(data, time.ticks_ms())  # type: ignore[attr-defined]
+            payload["seq"] = delta.seq
+            payload["base"] = delta.base
+        tb = self.timebase
+        if tb is not None and not live and tb.correct(data):
+            payload["timestamp"] = data["ts"]  # Buffered reading: when it was taken
+
+        # Over MQTT live uploads are pipelined: the window resends them after a lost link
+        if await self._post(url, payload, wait=not live):
+            if live:
+                self.deadband.commit(data, time.ticks_ms())  # type: ignore[attr-defined]
+            if delta:
+                delta.acked(self.reply)
+                if self.diagnostics:
+                    self.diagnostics.set_gauge("upload_keyframes", delta.keyframes)
+            return True
+        return False
+
+    async def post_records(self, records: list[dict[str, Any]]) -> bool:
+        """Upload a batch of this tracker's own queued records in one request"""
+        url = self.config.get("ingest_url")
+        if not self.has_uplink() or not records:
+            return False
 
+        ts = time.time()
+        payload = {
+            "device_id": self.config.get("device_id"),
+            "provisioned_id": self.config.get("provisioned_id"),
+            "tenant_id": self.config.get("tenant_id"),
+            "timestamp": ts,
+            "ts_synced": ts > 1704067200,
+            "batch": records,
+        }
+        tb = self.timebase
+        if tb is not None:
+            for rec in records:
+                tb.correct(rec)
+            # Records still without "ts" are placed by the server from these
+            payload["boot"] = tb.boot
+            payload["mono"] = tb.mono()
+        return await self._post(url, payload)
+
+    async def post_batch(self, origin_id: str, records: list[dict[str, Any]]) -> bool:
+        """Upload records on behalf of another tracker (ESP-NOW relay)"""
+        url = self.config.get("ingest_url")
+        if not self.has_uplink() or not records:
+            return False
+
+        ts = time.time()
+        payload = {
+            "device_id": origin_id,
+            "relayed_by": self.config.get("device_id"),
+            "tenant_id": self.config.get("tenant_id"),
+            "timestamp": ts,
+            "ts_synced": ts > 1704067200,
+            "batch": records,
+        }
+        return await self._post(url, payload)
+
+    async def _post(self, url: str, payload: dict[str, Any], wait: bool = True) -> bool:
+        if self.mqtt is not None:
+            return await self._publish(payload, wait)
+        token = self.config.get("ingest_token")
         headers = {"Content-Type": "application/json"}
         if token:
             headers["Authorization"] = f"Bearer {token}"
 
+        self.reply = None
         try:
-            # Simple urequests POST
-            response = urequests.post(url, json=payload, headers=headers)
+            # Serialized here so the body size can be accounted per upload window
+            body, encoding = self.writer.encode(payload)
+            if encoding:
+                headers["Content-Encoding"] = encoding
+                if self.diagnostics:
+                    saved = self.writer.plain_bytes - self.writer.body_bytes
+                    self.diagnostics.set_gauge("upload_deflate_saved", saved)
+            response = urequests.post(url, data=body, headers=headers)
             status = response.status_code
+            if 200 <= status < 300:
+                self.reply = self._read_reply(response)
             response.close()
+            if self.reply is not None and self.on_reply:
+                self.on_reply(self.reply)
+            self.bytes_sent += len(body)
 
             if 200 <= status < 300:
                 if self.diagnostics:
                     self.diagnostics.increment("http_post_ok")
-                self._last_sent_data = data.copy()
-                self._last_sent_time = time.time()
                 return True
             else:
                 if self.diagnostics:
@@ -94,3 +192,38 @@ class HttpPoster:
             if self.diagnostics:
                 self.diagnostics.increment("http_post_fail")
             return False
+
+    async def _publish(self, payload: dict[str, Any], wait: bool) -> bool:
+        """MQTT transport; replies arrive later on the down topic (_on_downlink)"""
+        self.reply = None
+        try:
+            body, encoding = self.writer.encode(payload)
+            topic = self._topic + "/z" if encoding else self._topic
+            ok: bool = await self.mqtt.publish(topic, body, wait)
+        except Exception as e:
+            print(f"MQTT Publish Error: {e}")
+            ok = False
+        if ok:
+            self.bytes_sent += len(body)
+        if self.diagnostics:
+            self.diagnostics.increment("mqtt_pub_ok" if ok else "mqtt_pub_fail")
+            self.diagnostics.set_gauge("mqtt_inflight", self.mqtt.pending())
+        return ok
+
+    def _on_downlink(self, topic: str, payload: bytes) -> None:
+        """A message on the MQTT down topic: what an HTTP ingest reply would carry"""
+        try:
+            msg = json.loads(payload)
+        except ValueError:
+            return
+        if self.delta:
+            self.delta.acked(msg)
+        if self.on_reply:
+            self.on_reply(msg)
+
+    def _read_reply(self, response: Any) -> Any:
+        """Optional JSON reply (e.g. a WiFi position); most ingest replies are empty"""
+        try:
+            return response.json()
+        except Exception:
+            return None
@@ -0,0 +1,145 @@
+# known_networks.py - Bounded table of WiFi networks the tracker may join
+#
+# Each entry is {"ssid", "pass", "prio", "ok_ts", "fails"}, persisted in config
+# as "wifi_networks". The legacy wifi_ssid / wifi_pass pair (set over BLE with
+# SSID:PASS or OP_WIFI_SET) is kept in the table as an ordinary entry.
+#
+# Selection takes the visible known networks from a scan, highest priority
+# first and then strongest signal. A network that fails to connect is held
+# back for 60 s, doubling per consecutive failure up to an hour; the backoff
+# deadlines live in RAM, so a reboot allows one early retry.
+import time
+from micropython import const
+from typing import Any, Dict, List, Optional, Sequence
+
+MAX_NETWORKS = const(8)
+DEFAULT_PRIORITY = const(1)
+BACKOFF_MIN_S = const(60)
+BACKOFF_MAX_S = const(3600)
+_OK_SAVE_S = const(3600)  # ok_ts resolution: successes alone rewrite config this rarely
+
+Entry = Dict[str, Any]
+
+
+class KnownNetworks:
+    def __init__(self, config: Any, max_networks: int = MAX_NETWORKS) -> None:
+        if max_networks < 1:
+            raise ValueError("Known network table needs at least one slot")
+        self.config = config
+        self.max_networks = max_networks
+        self._retry_at: Dict[str, int] = {}  # ssid -> ticks_ms when the backoff ends
+
+    @property
+    def networks(self) -> List[Entry]:
+        table = self.config.get("wifi_networks")
+        return table if isinstance(table, list) else []
+
+    def find(self, ssid: str) -> Optional[Entry]:
+        for e in self.networks:
+            if e.get("ssid") == ssid:
+                return e
+        return None
+
+    def refresh(self) -> None:
+        """Mirror wifi_ssid / wifi_pass into the table (config is written only on change)"""
+        ssid = self.config.get("wifi_ssid")
+        if not ssid:
+            return
+        password = self.config.get("wifi_pass") or ""
+        e = self.find(ssid)
+        if e is None or e.get("pass") != password:
+            try:
+                self.add(ssid, password, e["prio"] if e else DEFAULT_PRIORITY)
+            except ValueError:
+                pass  # Table full of app-added networks; the primary is not forced in
+
+    def add(self, ssid: str, password: str = "", prio: int = DEFAULT_PRIORITY) -> None:
+        """Insert or update; ValueError on bad credentials or a full table"""
+        if not 0 < len(ssid.encode()) <= 32:
+            raise ValueError("SSID must be 1-32 bytes")
+        if len(password) > 64:
+            raise ValueError("Passphrase must be at most 64 characters")
+        if not 0 <= prio <= 255:
+            raise ValueError("Priority must be 0-255")
+        table = list(self.networks)
+        entry = {"ssid": ssid, "pass": password, "prio": prio, "ok_ts": 0, "fails": 0}
+        e = self.find(ssid)
+        if e is None:
+            if len(table) >= self.max_networks:
+                raise ValueError("Known network table full")
+            table.append(entry)
+        else:
+            entry["ok_ts"] = e.get("ok_ts", 0)
+            table[table.index(e)] = entry
+            self._retry_at.pop(ssid, None)  # New credentials deserve a prompt try
+        self.config.set("wifi_networks", table)
+
+    def remove(self, ssid: str) -> bool:
+        table = [e for e in self.networks if e.get("ssid") != ssid]
+        if len(table) == len(self.networks):
+            return False
+        self.config.set("wifi_networks", table)
+        self._retry_at.pop(ssid, None)
+        if self.config.get("wifi_ssid") == ssid:
+            self.config.set("wifi_ssid", "")  # Otherwise refresh() would add it back
+            self.config.set("wifi_pass", "")
+        return True
+
+    def clear(self) -> None:
+        self.config.set("wifi_networks", [])
+        self._retry_at = {}
+
+    # --- Backoff ---
+
+    def backed_off(self, ssid: str, now_ms: int) -> bool:
+        at = self._retry_at.get(ssid)
+        return at is not None and time.ticks_diff(at, now_ms) > 0  # type: ignore[attr-defined]
+
+    def eligible(self, now_ms: int) -> List[Entry]:
+        return [e for e in self.networks if not self.backed_off(e["ssid"], now_ms)]
+
+    def retry_in_s(self, now_ms: int) -> int:
+        """Seconds until some network may be tried again, within the backoff bounds"""
+        wait = BACKOFF_MAX_S
+        for e in self.networks:
+            at = self._retry_at.get(e["ssid"])
+            left = 0 if at is None else time.ticks_diff(at, now_ms)  # type: ignore[attr-defined]
+            wait = min(wait, max(0, left) // 1000)
+        wait_s: int = max(BACKOFF_MIN_S, wait)
+        return wait_s
+
+    def record(self, ssid: str, ok: bool, now_ms: int, ts: int) -> None:
+        """Connect outcome: success clears the backoff, failure doubles it"""
+        e = self.find(ssid)
+        if e is None:
+            return
+        fails = e.get("fails", 0)
+        if ok:
+            self._retry_at.pop(ssid, None)
+            save = fails or ts - e.get("ok_ts", 0) >= _OK_SAVE_S
+            e["fails"] = 0
+            if save:
+                e["ok_ts"] = ts
+        else:
+            fails += 1
+            delay_s = min(BACKOFF_MIN_S << min(fails - 1, 6), BACKOFF_MAX_S)
+            self._retry_at[ssid] = time.ticks_add(now_ms, delay_s * 1000)  # type: ignore
+            e["fails"] = fails
+            save = True
+        if save:
+            self.config.set("wifi_networks", self.networks)
+
+    # --- Selection ---
+
+    def select(self, scan: Sequence[Any], now_ms: int) -> Optional[Entry]:
+        """Best known network in a scan_networks() result: priority, then RSSI"""
+        best: Optional[Entry] = None
+        best_key = (-1, -1000)
+        for n in scan:  # (ssid, rssi, channel, authmode, bssid)
+            e = self.find(n[0])
+            if e is None or self.backed_off(n[0], now_ms):
+                continue
+            key = (e.get("prio", DEFAULT_PRIORITY), n[1])
+            if key > best_key:
+                best, best_key = e, key
+        return best
@@ -0,0 +1,340 @@
+# mqtt_uplink.py - MQTT 3.1.1 ingest transport: QoS 1, persistent session, downlink topic
+#
+# An alternative to one HTTPS POST per upload: a single connection (CONNECT
+# once per link, no headers or bearer token per message) carries every upload
+# as a QoS 1 PUBLISH. The session is persistent (clean session = 0), so the
+# broker keeps our subscription and queues messages for the downlink topic
+# (config hints, commands) while the radio is off, delivering them on the
+# next CONNECT.
+#
+# Up to `inflight` publishes may await their PUBACK at once. A publish made
+# with wait=False stays in the window across a dropped connection and is
+# resent with the DUP flag after reconnecting; wait=True returns whether it
+# was acknowledged and leaves retries to the caller, like an HTTP POST. A
+# ping keeps the link alive when idle, and a missing PINGRESP closes it.
+#
+# Only the packets needed here are implemented: CONNECT/CONNACK, PUBLISH
+# (QoS 0/1 in, QoS 1 out), PUBACK, SUBSCRIBE/SUBACK, PINGREQ/PINGRESP and
+# DISCONNECT.
+import struct
+import time
+import uasyncio as asyncio
+from micropython import const
+from lib.logger import Logger
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+CONNECT = const(0x10)
+CONNACK = const(0x20)
+PUBLISH = const(0x30)
+PUBACK = const(0x40)
+SUBSCRIBE = const(0x82)  # Reserved flag bits 0010
+SUBACK = const(0x90)
+PINGREQ = const(0xC0)
+PINGRESP = const(0xD0)
+DISCONNECT = const(0xE0)
+
+_DUP = const(0x08)
+MAX_INFLIGHT = const(64)
+ACK_TIMEOUT_MS = const(5000)
+CONNECT_TIMEOUT_MS = const(10000)
+
+
+def encode_length(n: int) -> bytes:
+    """MQTT remaining length: 7 bits per byte, high bit = more"""
+    out = bytearray()
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        out.append(b | 0x80 if n else b)
+        if not n:
+            return bytes(out)
+
+
+def _str(s: bytes) -> bytes:
+    return struct.pack("!H", len(s)) + s
+
+
+def packet(first: int, body: bytes) -> bytes:
+    return bytes((first,)) + encode_length(len(body)) + body
+
+
+def connect_packet(
+    client_id: bytes, keepalive_s: int, username: bytes = b"", password: bytes = b""
+) -> bytes:
+    """CONNECT with clean session off: the broker keeps our session between links"""
+    flags = 0
+    payload = _str(client_id)
+    if username:
+        flags |= 0x80
+        payload += _str(username)
+        if password:
+            flags |= 0x40
+            payload += _str(password)
+    head = _str(b"MQTT") + struct.pack("!BBH", 4, flags, keepalive_s)
+    return packet(CONNECT, head + payload)
+
+
+def publish_packet(topic: bytes, payload: bytes, pid: int, qos: int = 1) -> bytes:
+    head = _str(topic) + (struct.pack("!H", pid) if qos else b"")
+    return packet(PUBLISH | qos << 1, head + payload)
+
+
+async def read_packet(reader: Any) -> Tuple[int, bytes]:
+    """(first byte, body) of the next packet"""
+    first = (await reader.readexactly(1))[0]
+    n = 0
+    shift = 0
+    while True:
+        b = (await reader.readexactly(1))[0]
+        n |= (b & 0x7F) << shift
+        if not b & 0x80:
+            break
+        shift += 7
+        if shift > 21:
+            raise ValueError("Bad remaining length")
+    return first, (await reader.readexactly(n) if n else b"")
+
+
+class MqttUplink:
+    def __init__(
+        self,
+        host: str,
+        client_id: str,
+        port: int = 1883,
+        keepalive_s: int = 60,
+        inflight: int = 4,
+        username: str = "",
+        password: str = "",
+        tls: bool = False,
+        down_topic: str = "",
+    ) -> None:
+        if not host or not client_id:
+            raise ValueError("MQTT needs a host and a client ID")
+        if not 1 <= inflight <= MAX_INFLIGHT or not 0 <= keepalive_s <= 65535:
+            raise ValueError("MQTT in-flight window 1-%d, keepalive 0-65535 s" % MAX_INFLIGHT)
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.keepalive_s = keepalive_s
+        self.window = inflight
+        self.tls = tls
+        self.down_topic = down_topic
+        self._user = username.encode()
+        self._password = password.encode()
+        self.ack_timeout_ms = ACK_TIMEOUT_MS
+        self.on_message: Optional[Callable[[str, bytes], None]] = None  # Downlink deliveries
+        self._reader: Any = None
+        self._writer: Any = None
+        self._tasks: List[Any] = []
+        self._inflight: Dict[int, bytes] = {}  # Packet ID -> PUBLISH awaiting its PUBACK
+        self._acked = asyncio.Event()  # Set on every PUBACK (and on disconnect)
+        self._pid = 0
+        self._last_tx_ms = 0
+        self._ping_ms: Optional[int] = None  # ticks_ms of an unanswered PINGREQ
+        self.session_present = False
+        self.connects = 0
+        self.published = 0
+        self.resent = 0
+        self.received = 0
+        self.bytes_out = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None
+
+    async def connect(self) -> bool:
+        """Open the link (resumes the session and resends unacknowledged publishes)"""
+        if self._writer is not None:
+            return True
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=True if self.tls else None),
+                CONNECT_TIMEOUT_MS / 1000,
+            )
+            pkt = connect_packet(
+                self.client_id.encode(), self.keepalive_s, self._user, self._password
+            )
+            await self._send(pkt)
+            first, body = await asyncio.wait_for(
+                read_packet(self._reader), CONNECT_TIMEOUT_MS / 1000
+            )
+            if first != CONNACK or len(body) != 2 or body[1]:
+                raise OSError("CONNACK refused (%d)" % (body[1] if len(body) == 2 else -1))
+        except Exception as e:
+            Logger.log(f"MQTT: Connect to {self.host}:{self.port} failed: {e}")
+            await self._drop()
+            return False
+        self.connects += 1
+        self.session_present = bool(body[0] & 1)
+        self._ping_ms = None
+        self._tasks = [asyncio.create_task(self._read_loop())]
+        if self.keepalive_s:
+            self._tasks.append(asyncio.create_task(self._keepalive()))
+        try:
+            if self.down_topic and not self.session_present:
+                pid = self._next_pid()
+                sub = struct.pack("!H", pid) + _str(self.down_topic.encode()) + b"\x01"
+                await self._send(packet(SUBSCRIBE, sub))
+            for pid in sorted(self._inflight):  # Oldest first
+                pkt = self._inflight[pid]
+                pkt = bytes((pkt[0] | _DUP,)) + pkt[1:]
+                self._inflight[pid] = pkt
+                await self._send(pkt)
+                self.resent += 1
+        except OSError:
+            await self._drop()
+            return False
+        return True
+
+    async def publish(self, topic: str, payload: bytes, wait: bool = True) -> bool:
+        """QoS 1 publish; with wait, True once the broker acknowledged it.
+
+        Without wait, True once the packet is in the window: from then on the
+        window owns delivery and resends it with DUP after a reconnect.
+        """
+        if not await self.connect():
+            return False
+        while len(self._inflight) >= self.window:
+            if not await self._wait_ack():
+                return False  # Window stuck: the link was dropped
+        pid = self._next_pid()
+        pkt = publish_packet(topic.encode(), payload, pid)
+        self._inflight[pid] = pkt
+        try:
+            await self._send(pkt)
+        except OSError:
+            await self._drop()
+            if wait:
+                del self._inflight[pid]
+                return False
+        self.published += 1
+        if not wait:
+            return True
+        while pid in self._inflight:
+            if not await self._wait_ack():
+                self._inflight.pop(pid, None)  # The caller keeps the data and retries
+                return False
+        return True
+
+    async def flush(self) -> bool:
+        """Wait until every publish in the window is acknowledged"""
+        while self._inflight:
+            if not await self._wait_ack():
+                return False
+        return True
+
+    async def close(self) -> None:
+        """Clean DISCONNECT; the broker keeps the session for the next connect"""
+        if self._writer is None:
+            return
+        try:
+            await self._send(packet(DISCONNECT, b""))
+        except OSError:
+            pass
+        await self._drop()
+
+    def pending(self) -> int:
+        return len(self._inflight)
+
+    def _next_pid(self) -> int:
+        pid = self._pid
+        while True:
+            pid = pid % 65535 + 1
+            if pid not in self._inflight:
+                self._pid = pid
+                return pid
+
+    async def _wait_ack(self) -> bool:
+        """Until the next PUBACK; False on timeout (the link is dropped) or disconnect"""
+        if self._writer is None:
+            return False
+        self._acked.clear()
+        try:
+            await asyncio.wait_for(self._acked.wait(), self.ack_timeout_ms / 1000)
+        except asyncio.TimeoutError:
+            Logger.log("MQTT: No PUBACK, dropping the link")
+            await self._drop()
+            return False
+        return self._writer is not None
+
+    async def _send(self, pkt: bytes) -> None:
+        w = self._writer
+        if w is None:
+            raise OSError("not connected")
+        w.write(pkt)
+        await w.drain()
+        self.bytes_out += len(pkt)
+        self._last_tx_ms = time.ticks_ms()  # type: ignore[attr-defined]
+
+    async def _read_loop(self) -> None:
+        reader = self._reader
+        try:
+            while True:
+                first, body = await read_packet(reader)
+                kind = first & 0xF0
+                if kind == PUBACK:
+                    self._inflight.pop(struct.unpack("!H", body)[0], None)
+                    self._acked.set()
+                elif kind == PUBLISH:
+                    await self._deliver(first, body)
+                elif kind == PINGRESP:
+                    self._ping_ms = None
+        except Exception as e:
+            if self._reader is reader:
+                Logger.log(f"MQTT: Link lost: {e}")
+                await self._drop()
+
+    async def _deliver(self, first: int, body: bytes) -> None:
+        n = struct.unpack_from("!H", body)[0]
+        topic = body[2 : 2 + n].decode()
+        pos = 2 + n
+        qos = (first >> 1) & 3
+        if qos:
+            pid = struct.unpack_from("!H", body, pos)[0]
+            pos += 2
+        self.received += 1
+        if self.on_message:
+            try:
+                self.on_message(topic, body[pos:])
+            except Exception as e:
+                Logger.log(f"MQTT: Downlink handler failed: {e}")
+        if qos:
+            await self._send(packet(PUBACK, struct.pack("!H", pid)))  # After handling
+
+    async def _keepalive(self) -> None:
+        period_ms = self.keepalive_s * 500  # Ping at half the keepalive when idle
+        try:
+            while self._writer is not None:
+                await asyncio.sleep_ms(period_ms // 4)  # type: ignore[attr-defined]
+                now = time.ticks_ms()  # type: ignore[attr-defined]
+                ping = self._ping_ms
+                if ping is not None:
+                    late = time.ticks_diff(now, ping)  # type: ignore[attr-defined]
+                    if late > self.keepalive_s * 1000:
+                        Logger.log("MQTT: No PINGRESP, dropping the link")
+                        await self._drop()
+                        return
+                    continue
+                idle = time.ticks_diff(now, self._last_tx_ms)  # type: ignore[attr-defined]
+                if idle >= period_ms:
+                    self._ping_ms = now
+                    await self._send(packet(PINGREQ, b""))
+        except OSError:
+            await self._drop()
+
+    async def _drop(self) -> None:
+        """Close the socket; the window is kept for the next connect"""
+        w = self._writer
+        self._reader = self._writer = None
+        self._acked.set()  # Wake publishers: they see the link is gone
+        current = asyncio.current_task()
+        for t in self._tasks:
+            if t is not current:
+                t.cancel()
+        self._tasks = []
+        if w is not None:
+            try:
+                w.close()
+                await w.wait_closed()
+            except Exception:
+                pass
@@ -1,35 +1,205 @@
-import ntptime
+# ntp_time.py - Asynchronous SNTP client with drift estimation and adaptive resync
+#
+# One request is a 48-byte SNTP client packet on a non-blocking UDP socket,
+# polled from the event loop, so an unreachable server costs `timeout_ms` of
+# waiting without stalling the other tasks. From the four timestamps (t1 sent,
+# t2 server receive, t3 server transmit, t4 reply received):
+#
+#   offset = ((t2 - t1) + (t3 - t4)) / 2      delay = (t4 - t1) - (t3 - t2)
+#
+# Between syncs, local time is the last server time plus the elapsed ticks_ms,
+# so each new offset is the error the local clock gathered since then; over
+# successive syncs that is its drift in ppm. The next sync is due when the
+# expected error (drift x elapsed + delay / 2) reaches ntp_max_error_ms, within
+# [ntp_min_interval_sec, ntp_max_interval_sec] and at most double the previous
+# interval, so a stable crystal is asked about rarely and a poor one often.
+import socket
+import struct
 import time
-from machine import RTC
+import uasyncio as asyncio
+from micropython import const
 from lib.logger import Logger
-from typing import Any
+from typing import Any, Optional, Tuple
+
+NTP_PORT = const(123)
+POLL_MS = const(5)  # Reply poll; also bounds the added delay measurement error
+TIMEOUT_MS = const(1000)
+RETRY_S = const(60)  # After a failed request
+MAX_INTERVAL_S = const(172800)  # Two days: elapsed ticks_ms stays far inside its wrap
+MIN_DRIFT_SPAN_S = const(600)  # Shorter spans are dominated by delay jitter
+DRIFT_FLOOR_PPM = 0.5  # Never trust the drift estimate beyond this
+_NTP_1970 = 2208988800  # NTP era (1900) to Unix epoch seconds
+_NTP_2000 = 3155673600  # NTP era to the MicroPython embedded epoch
+
+
+def _epoch_delta() -> int:
+    """NTP-to-local epoch seconds; older ports count time.time() from 2000"""
+    return _NTP_2000 if time.gmtime(0)[0] == 2000 else _NTP_1970
+
+
+def ntp_to_ms(buf: Any, offset: int, delta: int) -> int:
+    """64-bit NTP timestamp at buf[offset:] to local-epoch milliseconds"""
+    sec, frac = struct.unpack_from("!II", buf, offset)
+    ms: int = (sec - delta) * 1000 + ((frac * 1000) >> 32)
+    return ms
 
 
 class NTPClient:
-    def __init__(self, config: Any) -> None:
+    def __init__(self, config: Any, timebase: Any = None, port: int = NTP_PORT) -> None:
         self.config = config
-        self.rtc = RTC()
-        self.last_sync = 0.0
-        self.sync_interval = 3600 * 24  # Sync daily
+        self.timebase = timebase  # lib/timebase.py: records this boot's UTC offset
+        self.port = port
+        self.timeout_ms = TIMEOUT_MS
+        self.max_error_ms = config.get("ntp_max_error_ms") or 1000
+        self.min_interval_s: int = config.get("ntp_min_interval_sec") or 900
+        max_s = config.get("ntp_max_interval_sec") or MAX_INTERVAL_S
+        self.max_interval_s: int = min(max_s, MAX_INTERVAL_S)
+        if self.max_error_ms <= 0 or not 0 < self.min_interval_s <= self.max_interval_s:
+            raise ValueError("NTP error bound and resync intervals must be positive and ordered")
+        self.last_sync = 0.0  # UTC seconds of the last successful sync
+        self.offset_ms = 0  # Local clock error found by the last sync
+        self.delay_ms = 0  # Round trip of the last sync
+        self.drift_ppm: Optional[float] = None  # Positive: the local clock runs slow
+        self.drift_err_ppm = 0.0
+        self.interval_s = self.min_interval_s  # Current resync interval
+        self.syncs = 0
+        self.failures = 0
+        self._ref_ms: Optional[int] = None  # ticks_ms at the last sync
+        self._ref_utc_ms = 0  # Server time at _ref_ms
+        self._next_ms: Optional[int] = None  # ticks_ms when the next request is due
+        self._host = ""
+        self._addr: Any = None
+        self._nonce = 0
 
-    def sync(self) -> bool:
-        """Synchronize time with NTP server"""
-        try:
-            # Set host from config or default
-            ntptime.host = self.config.get("ntp_server") or "pool.ntp.org"
-
-            Logger.log(f"NTP: Syncing with {ntptime.host}...")
-            ntptime.settime()  # Sets internal RTC to UTC
+    def now_ms(self) -> Optional[int]:
+        """Local estimate of UTC in milliseconds; None before the first sync"""
+        if self._ref_ms is None:
+            return None
+        elapsed: int = time.ticks_diff(time.ticks_ms(), self._ref_ms)  # type: ignore[attr-defined]
+        return self._ref_utc_ms + elapsed
 
-            self.last_sync = time.time()
-            now = time.localtime()
-            Logger.log(
-                f"NTP: Time synced: {now[0]}-{now[1]:02d}-{now[2]:02d} {now[3]:02d}:{now[4]:02d}:{now[5]:02d} UTC"
-            )
+    def due(self) -> bool:
+        """A request is worth making now (first sync, or the interval has run out)"""
+        if self._next_ms is None:
             return True
+        late: int = time.ticks_diff(time.ticks_ms(), self._next_ms)  # type: ignore[attr-defined]
+        return late >= 0
+
+    def expected_error_ms(self) -> int:
+        """Bound on the local clock error right now, from the drift estimate"""
+        if self._ref_ms is None or self.drift_ppm is None:
+            return -1
+        elapsed = time.ticks_diff(time.ticks_ms(), self._ref_ms)  # type: ignore[attr-defined]
+        rate = abs(self.drift_ppm) + self.drift_err_ppm
+        return int(self.delay_ms / 2 + rate * elapsed / 1000000)
+
+    async def sync(self) -> bool:
+        """One SNTP exchange; sets the RTC and reschedules. Never raises."""
+        host = self.config.get("ntp_server") or "pool.ntp.org"
+        try:
+            sample = await self._query(host)
         except Exception as e:
-            Logger.log(f"NTP: Sync failed: {e}")
+            self.failures += 1
+            self._next_ms = time.ticks_add(time.ticks_ms(), RETRY_S * 1000)  # type: ignore
+            Logger.log(f"NTP: Sync with {host} failed: {e}")
             return False
+        self._apply(*sample)
+        self._set_rtc(self._ref_utc_ms)
+        self.last_sync = self._ref_utc_ms / 1000
+        if self.timebase:
+            self.timebase.synced(self._ref_utc_ms // 1000)
+        now = time.gmtime(self._ref_utc_ms // 1000)
+        drift = "?" if self.drift_ppm is None else "%.1f" % self.drift_ppm
+        Logger.log(
+            f"NTP: {now[0]}-{now[1]:02d}-{now[2]:02d} {now[3]:02d}:{now[4]:02d}:{now[5]:02d}"
+            f" UTC, offset {self.offset_ms} ms, delay {self.delay_ms} ms,"
+            f" drift {drift} ppm, next in {self.interval_s} s"
+        )
+        return True
+
+    async def _query(self, host: str) -> Tuple[int, int, int, int]:
+        """(t1 ticks, t4 ticks, t2 ms, t3 ms) for one request"""
+        if host != self._host or self._addr is None:
+            self._addr = socket.getaddrinfo(host, self.port)[0][-1]  # DNS once per server
+            self._host = host
+        pkt = bytearray(48)
+        pkt[0] = 0x23  # LI 0, version 4, mode 3 (client)
+        self._nonce = (self._nonce + 1) & 0xFFFFFFFF
+        # Our transmit field comes back as the reply's originate field: matches stale replies out
+        struct.pack_into("!II", pkt, 40, time.ticks_ms() & 0xFFFFFFFF, self._nonce)  # type: ignore
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            s.setblocking(False)
+            t1 = time.ticks_ms()  # type: ignore[attr-defined]
+            s.sendto(pkt, self._addr)
+            while True:
+                try:
+                    data = s.recv(48)
+                    t4 = time.ticks_ms()  # type: ignore[attr-defined]
+                    if len(data) == 48 and data[24:32] == pkt[40:48]:
+                        break
+                except OSError:
+                    pass  # EAGAIN: nothing yet
+                if time.ticks_diff(time.ticks_ms(), t1) > self.timeout_ms:  # type: ignore
+                    raise OSError("timeout")
+                await asyncio.sleep_ms(POLL_MS)  # type: ignore[attr-defined]
+        finally:
+            s.close()
+        if data[0] & 0x07 != 4 or data[1] == 0:
+            raise ValueError("Not a server reply (stratum %d)" % data[1])  # 0: kiss-o'-death
+        delta = _epoch_delta()
+        return t1, t4, ntp_to_ms(data, 32, delta), ntp_to_ms(data, 40, delta)
+
+    def _apply(self, t1: int, t4: int, t2: int, t3: int) -> None:
+        """Offset, delay and drift from one exchange; moves the reference to t4"""
+        rtt = time.ticks_diff(t4, t1)  # type: ignore[attr-defined]
+        delay = max(0, rtt - (t3 - t2))
+        prev_delay = self.delay_ms
+        ref = self._ref_ms
+        if ref is None:
+            server_t4 = t3 + delay // 2
+            self.offset_ms = 0
+        else:
+            local1 = self._ref_utc_ms + time.ticks_diff(t1, ref)  # type: ignore[attr-defined]
+            local4 = local1 + rtt
+            self.offset_ms = ((t2 - local1) + (t3 - local4)) // 2
+            server_t4 = local4 + self.offset_ms
+            span = time.ticks_diff(t4, ref)  # type: ignore[attr-defined]
+            if span >= MIN_DRIFT_SPAN_S * 1000:
+                self._update_drift(self.offset_ms, span, (delay + prev_delay) / 2)
+        self.delay_ms = delay
+        self._ref_ms = t4
+        self._ref_utc_ms = server_t4
+        self.syncs += 1
+        self.interval_s = self._next_interval()
+        self._next_ms = time.ticks_add(t4, self.interval_s * 1000)  # type: ignore[attr-defined]
+
+    def _update_drift(self, offset_ms: int, span_ms: int, noise_ms: float) -> None:
+        sample = offset_ms * 1000000 / span_ms
+        noise = noise_ms * 1000000 / span_ms  # Path asymmetry is at most the delay
+        old = self.drift_ppm
+        if old is None:
+            self.drift_ppm = sample
+            self.drift_err_ppm = max(DRIFT_FLOOR_PPM, noise)
+        else:
+            self.drift_ppm = (old + sample) / 2
+            # Temperature moves the crystal: disagreement widens the error bar
+            self.drift_err_ppm = max(DRIFT_FLOOR_PPM, noise, abs(sample - old) / 2)
+
+    def _next_interval(self) -> int:
+        if self.drift_ppm is None:
+            return self.min_interval_s
+        budget_ms = self.max_error_ms - self.delay_ms / 2
+        rate = abs(self.drift_ppm) + self.drift_err_ppm
+        interval = int(budget_ms * 1000 / rate) if budget_ms > 0 else 0
+        interval = min(interval, 2 * self.interval_s, self.max_interval_s)
+        return max(self.min_interval_s, interval)
+
+    def _set_rtc(self, utc_ms: int) -> None:
+        from machine import RTC
+
+        tm = time.gmtime(utc_ms // 1000)
+        RTC().datetime((tm[0], tm[1], tm[2], tm[6] + 1, tm[3], tm[4], tm[5], utc_ms % 1000 * 1000))
 
     def get_timestamp(self) -> float:
         """Return current timestamp (UTC) or 0 if not synced"""
@@ -40,4 +210,8 @@ class NTPClient:
         return now
 
     def is_synced(self) -> bool:
+        if self.timebase:
+            # An RTC carried over a deep sleep looks valid but is not this boot's sync
+            exact: bool = self.timebase.exact(self.timebase.boot)
+            return exact
         return self.get_timestamp() > 0
@@ -0,0 +1,94 @@
+# payload_writer.py - Piecewise JSON serialization with deflate above a size threshold
+#
+# An upload payload is written key by key and its "batch" list one record at
+# a time, so the plain JSON of a whole batch never exists at once. Pieces are
+# held until `min_bytes` of plain JSON have been produced; below that the body
+# goes out uncompressed, since zlib's framing and the CPU time do not pay for
+# a single record. Past it, the held pieces and everything after are streamed
+# through `deflate.DeflateIO` in ZLIB format (HTTP `Content-Encoding:
+# deflate`), whose LZ77 window is 2**wbits bytes: only the window and the
+# compressed output stay in RAM. Firmware built without deflate compression
+# sends everything plain.
+import io
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+ENCODING = "deflate"
+
+
+class PayloadWriter:
+    def __init__(self, min_bytes: int = 1024, wbits: int = 10, enabled: bool = True) -> None:
+        if min_bytes < 0 or not 8 <= wbits <= 15:
+            raise ValueError("Deflate threshold must be >= 0 and wbits 8-15")
+        self.min_bytes = min_bytes
+        self.wbits = wbits
+        self.enabled = enabled
+        self._parts: List[bytes] = []
+        self._out: Any = None
+        self._z: Any = None
+        self._plain = 0
+        self.plain_bytes = 0  # Totals over all bodies written, before and after deflate
+        self.body_bytes = 0
+        self.compressed = 0  # Bodies sent deflated
+
+    def encode(self, payload: Dict[str, Any]) -> Tuple[bytes, Optional[str]]:
+        """(body, Content-Encoding or None); a "batch" list is written last, record by record"""
+        self._plain = 0
+        records = payload.get("batch")
+        w = self._write
+        w("{")
+        sep = ""
+        for k, v in payload.items():
+            if k != "batch":
+                w(sep + json.dumps(k) + ": " + json.dumps(v))
+                sep = ", "
+        if records is not None:
+            w(sep + '"batch": [')
+            for i, rec in enumerate(records):
+                w(", " + json.dumps(rec) if i else json.dumps(rec))
+            w("]")
+        w("}")
+        return self._finish()
+
+    def _write(self, s: str) -> None:
+        b = s.encode()
+        self._plain += len(b)
+        if self._z is not None:
+            self._z.write(b)
+            return
+        self._parts.append(b)
+        if self.enabled and self._plain >= self.min_bytes:
+            self._start()
+
+    def _start(self) -> None:
+        try:
+            import deflate
+        except ImportError:
+            self.enabled = False  # Port without the module: plain from now on
+            return
+        self._out = io.BytesIO()
+        try:
+            self._z = deflate.DeflateIO(self._out, deflate.ZLIB, self.wbits)
+        except Exception:
+            self.enabled = False  # Built with decompression only
+            self._out = None
+            return
+        for part in self._parts:
+            self._z.write(part)
+        self._parts.clear()
+
+    def _finish(self) -> Tuple[bytes, Optional[str]]:
+        z = self._z
+        if z is not None:
+            z.close()  # Flushes the final block; the BytesIO stays open
+            body = self._out.getvalue()
+            self._z = self._out = None
+            self.compressed += 1
+            encoding: Optional[str] = ENCODING
+        else:
+            body = b"".join(self._parts)
+            self._parts.clear()
+            encoding = None
+        self.plain_bytes += self._plain
+        self.body_bytes += len(body)
+        return body, encoding
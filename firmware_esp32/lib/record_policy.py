@@ -0,0 +1,155 @@
+# record_policy.py - Decide which sensor samples become stored/uploaded records
+#
+# Samples arrive at the sensor rate (10 Hz). A RecordPolicy aggregates them and
+# emits one record per interval: the latest position/speed/battery plus
+# min/max/mean of the temperatures and shock over the interval. Events (shock
+# above threshold, GPS fix gained/lost, geofence crossing, trip start/end) emit
+# immediately and switch to a faster burst interval for a while. A daily byte
+# budget paces interval records across the UTC day and keeps a reserve for events.
+import time
+from micropython import const
+from typing import Any, Dict, Optional
+
+EVT_NONE = const(0)
+EVT_SHOCK = const(1)
+EVT_FIX = const(2)
+EVT_GEOFENCE = const(3)
+EVT_TRIP = const(4)
+
+REASONS = ("interval", "shock", "fix", "geofence", "trip")
+
+JSON_RECORD_BYTES = const(200)  # Typical size of one record in an upload batch
+
+_AGG_FIELDS = ("temp", "internal_temp", "shock")
+_DAY_SECONDS = const(86400)
+_PACING_SLACK_S = const(3600)  # Allowance runs an hour ahead so bursts are not starved
+
+
+class RecordPolicy:
+    """Rate, event-burst and budget policy shared by the SD archive and upload queue.
+
+    `offer()` returns the same dict on every emit; copy it before queueing.
+    """
+
+    def __init__(
+        self,
+        interval_s: int = 10,
+        burst_interval_s: int = 1,
+        burst_s: int = 30,
+        shock_threshold: int = 500,
+        daily_budget_bytes: int = 0,
+        record_bytes: int = 24,
+        event_reserve_pct: int = 10,
+    ) -> None:
+        if interval_s <= 0 or burst_interval_s <= 0 or burst_s < 0 or record_bytes <= 0:
+            raise ValueError("Invalid record policy timing")
+        if daily_budget_bytes < 0 or not 0 <= event_reserve_pct < 100:
+            raise ValueError("Invalid record policy budget")
+        self._interval_ms = interval_s * 1000
+        self._burst_interval_ms = burst_interval_s * 1000
+        self._burst_ms = burst_s * 1000
+        self._shock_threshold = shock_threshold
+        # 0 budget = unlimited
+        self._max_records = daily_budget_bytes // record_bytes if daily_budget_bytes else 0
+        self._interval_quota = self._max_records * (100 - event_reserve_pct) // 100
+
+        n = len(_AGG_FIELDS)
+        self._min = [0.0] * n
+        self._max = [0.0] * n
+        self._sum = [0.0] * n
+        self._count = 0
+
+        self._last_emit_ms: Optional[int] = None
+        self._bursting = False
+        self._burst_until = 0
+        self._pending = EVT_NONE
+        self._last_fix: Optional[bool] = None
+        self._shock_high = False
+        self._day = -1
+        self.day_records = 0
+        self.throttled = False  # A record was dropped for budget today
+        self._out: Dict[str, Any] = {}
+        self.stats = {"emitted": 0, "events": 0, "over_budget": 0}
+
+    def trigger(self, event: int, now_ms: int) -> None:
+        """Force a record on the next sample and start a burst (e.g. geofence crossing)"""
+        self._pending = event
+        self._bursting = True
+        self._burst_until = time.ticks_add(now_ms, self._burst_ms)  # type: ignore[attr-defined]
+        self.stats["events"] += 1
+
+    def offer(self, data: Dict[str, Any], now_ms: int, ts: int) -> Optional[Dict[str, Any]]:
+        """Feed one sample (ticks_ms, UTC seconds); returns a record when one is due"""
+        self._accumulate(data)
+        shock_high = data.get("shock", 0) > self._shock_threshold
+        if shock_high and not self._shock_high:  # Rising edge only
+            self.trigger(EVT_SHOCK, now_ms)
+        self._shock_high = shock_high
+        fix = bool(data.get("gps_fix"))
+        if self._last_fix is not None and fix != self._last_fix:
+            self.trigger(EVT_FIX, now_ms)
+        self._last_fix = fix
+
+        day = ts // _DAY_SECONDS
+        if day != self._day:
+            self._day = day
+            self.day_records = 0
+            self.throttled = False
+
+        if self._bursting and time.ticks_diff(now_ms, self._burst_until) >= 0:  # type: ignore
+            self._bursting = False
+        event = self._pending
+        if not event and self._last_emit_ms is not None:
+            interval = self._burst_interval_ms if self._bursting else self._interval_ms
+            if time.ticks_diff(now_ms, self._last_emit_ms) < interval:  # type: ignore
+                return None
+
+        self._pending = EVT_NONE
+        if not self._budget_allows(event, ts):
+            # Keep aggregating: the next record's min/max/mean covers the gap
+            self.stats["over_budget"] += 1
+            self.throttled = True
+            self._last_emit_ms = now_ms
+            return None
+        self._last_emit_ms = now_ms
+        return self._emit(data, event)
+
+    def _accumulate(self, data: Dict[str, Any]) -> None:
+        first = self._count == 0
+        for i, key in enumerate(_AGG_FIELDS):
+            v = data.get(key, 0)
+            if first or v < self._min[i]:
+                self._min[i] = v
+            if first or v > self._max[i]:
+                self._max[i] = v
+            self._sum[i] = v if first else self._sum[i] + v
+        self._count += 1
+
+    def _budget_allows(self, event: int, ts: int) -> bool:
+        if not self._max_records:
+            return True
+        if event:
+            return self.day_records < self._max_records
+        # Pro-rata pacing: the interval quota is spread over the day
+        elapsed = ts % _DAY_SECONDS + _PACING_SLACK_S
+        allowance: int = self._interval_quota * min(elapsed, _DAY_SECONDS) // _DAY_SECONDS
+        return self.day_records < allowance
+
+    def _emit(self, data: Dict[str, Any], event: int) -> Dict[str, Any]:
+        out = self._out
+        out.clear()
+        out.update(data)
+        n = self._count
+        out["temp"] = self._sum[0] / n
+        out["temp_min"] = self._min[0]
+        out["temp_max"] = self._max[0]
+        out["internal_temp"] = self._sum[1] / n
+        out["shock"] = self._max[2]  # Peak shock is what the archive and alerts need
+        out["shock_min"] = self._min[2]
+        out["shock_mean"] = self._sum[2] / n
+        out["samples"] = n
+        out["reason"] = REASONS[event]
+        self._count = 0
+        self.day_records += 1
+        self.stats["emitted"] += 1
+        return out
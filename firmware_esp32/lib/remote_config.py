@@ -0,0 +1,108 @@
+# remote_config.py - Conditional remote config fetch and downlink hints in ingest replies
+#
+# config_url is fetched with If-None-Match and the ETag of the last applied
+# document ("config_etag", persisted), so an unchanged config costs a 304 and
+# no body. The ingest server can also push: the JSON reply to any upload may
+# carry
+#
+#   {"cfg": "<ETag of the current config>", "cmd": 1}
+#
+# A "cfg" that differs from the applied ETag makes a fetch due while the link
+# is still up; "cmd" (commands pending) asks for the full remote checks, config
+# and OTA, at once. Changes land with the next upload instead of the next
+# daily check (ota_check_interval), which remains as a fallback poll.
+from micropython import const
+from lib.logger import Logger
+from typing import Any, Optional
+
+FETCH_FAILED = const(0)
+FETCH_APPLIED = const(1)
+FETCH_UNCHANGED = const(2)
+
+
+def header(response: Any, name: str) -> Optional[str]:
+    """Case-insensitive response header (urequests keeps the server's spelling)"""
+    name = name.lower()
+    for k, v in (getattr(response, "headers", None) or {}).items():
+        if k.lower() == name:
+            return str(v)
+    return None
+
+
+class RemoteConfig:
+    def __init__(self, config: Any, diagnostics: Any = None) -> None:
+        self.config = config
+        self.diagnostics = diagnostics
+        self.fetch_due = False  # Server announced another config version
+        self.checks_due = False  # Server has commands pending: config and OTA checks
+        self._hint: Optional[str] = None  # Last "cfg" seen, for servers that send no ETag
+        self.fetches = 0
+        self.not_modified = 0
+        self.bytes = 0  # Config bodies downloaded
+
+    def note_reply(self, reply: Any) -> bool:
+        """Downlink hints in an ingest reply; True if this makes a fetch newly due"""
+        if not isinstance(reply, dict):
+            return False
+        was_due = self.fetch_due or self.checks_due
+        cfg = reply.get("cfg")
+        if cfg is not None:
+            self._hint = str(cfg)
+            if self._hint != (self.config.get("config_etag") or ""):
+                self.fetch_due = True
+        if reply.get("cmd"):
+            self.checks_due = True
+        return not was_due and (self.fetch_due or self.checks_due)
+
+    def fetch(self) -> int:
+        """One conditional GET of config_url; FETCH_* result"""
+        import json
+        import urequests
+
+        url = self.config.get("config_url")
+        if not url:
+            self.fetch_due = False
+            return FETCH_FAILED
+        headers = {}
+        etag = self.config.get("config_etag")
+        if etag:
+            headers["If-None-Match"] = etag
+        self.fetches += 1
+        try:
+            res = urequests.get(url, headers=headers)
+            try:
+                status = res.status_code
+                body = res.content if status == 200 else b""
+                new_etag = header(res, "ETag")
+            finally:
+                res.close()
+            if status == 304:
+                self.not_modified += 1
+                self.fetch_due = False
+                self._count("config_not_modified")
+                return FETCH_UNCHANGED
+            if status != 200:
+                raise OSError("HTTP %d" % status)
+            self.bytes += len(body)
+            data = json.loads(body)
+        except Exception as e:
+            Logger.log(f"WiFi: Remote config check failed: {e}")
+            self._count("config_fetch_fail")
+            return FETCH_FAILED
+        self.fetch_due = False
+        if not isinstance(data, dict):
+            return FETCH_FAILED
+        changed = self.config.merge_config(data)
+        # Rejected documents (bad signature) keep the old ETag, so they are fetched again
+        applied = all(self.config.get(k) == v for k, v in data.items() if k != "_sig")
+        tag = new_etag or self._hint
+        if applied and tag and tag != etag:
+            self.config.set("config_etag", tag)
+        if not changed:
+            return FETCH_UNCHANGED
+        self._count("config_applied")
+        return FETCH_APPLIED
+
+    def _count(self, name: str) -> None:
+        if self.diagnostics:
+            self.diagnostics.increment(name)
@@ -0,0 +1,71 @@
+# scan_packer.py - Pack WiFi scan results into MTU-sized BLE notifications
+#
+# Page:    0xB3, seq(1), count(1), entry[count]
+# Entry:   ssid_len(1), ssid(ssid_len), rssi(int8), channel(1), authmode(1), bssid(6)
+# Trailer: b"SCAN:END:<total>" (UTF-8 text) after the last page
+#
+# The phone-side reference decoder lives in tools/scan_decoder.py.
+import struct
+from micropython import const
+from typing import Any, List, Tuple
+
+PAGE_MAGIC = const(0xB3)
+_PAGE_HDR = const(3)
+_ENTRY_FIXED = const(10)  # ssid_len + rssi + channel + authmode + bssid
+_ATT_OVERHEAD = const(3)
+MAX_PAGE = const(244)  # Also bounded by the 256-byte characteristic buffer
+
+# (ssid, rssi, channel, authmode, bssid) as returned by WiFiManager.scan_networks
+ScanEntry = Tuple[str, int, int, int, bytes]
+
+
+def page_limit(mtu: int) -> int:
+    """Largest page that fits one notification at the negotiated MTU"""
+    limit: int = max(_PAGE_HDR + _ENTRY_FIXED + 1, min(mtu - _ATT_OVERHEAD, MAX_PAGE))
+    return limit
+
+
+class ScanPacker:
+    """Fill pages into one preallocated buffer; each page is a memoryview into it."""
+
+    def __init__(self) -> None:
+        self._buf = bytearray(MAX_PAGE)
+        self._seq = 0
+
+    def reset(self) -> None:
+        self._seq = 0
+
+    def pack(self, entries: List[ScanEntry], start: int, mtu: int) -> Tuple[int, Any]:
+        """Pack entries[start:] into one page. Returns (next_start, page)."""
+        limit = page_limit(mtu)
+        buf = self._buf
+        buf[0] = PAGE_MAGIC
+        buf[1] = self._seq & 0xFF
+        off = _PAGE_HDR
+        count = 0
+        i = start
+        while i < len(entries) and count < 255:
+            ssid, rssi, channel, auth, bssid = entries[i]
+            name = ssid.encode()
+            # SSIDs are at most 32 bytes, but never let one entry exceed a page
+            max_name = limit - _PAGE_HDR - _ENTRY_FIXED
+            if len(name) > max_name:
+                name = name[:max_name]
+            size = _ENTRY_FIXED + len(name)
+            if off + size > limit:
+                break
+            buf[off] = len(name)
+            buf[off + 1 : off + 1 + len(name)] = name
+            off += 1 + len(name)
+            struct.pack_into("<bBB", buf, off, max(-128, min(127, rssi)), channel, auth)
+            buf[off + 3 : off + 9] = bssid[:6] + bytes(6 - len(bssid[:6]))
+            off += 9
+            count += 1
+            i += 1
+        buf[2] = count
+        self._seq += 1
+        return i, memoryview(buf)[:off]
+
+
+def trailer(total: int) -> bytes:
+    return b"SCAN:END:%d" % total
@@ -0,0 +1,398 @@
+# sd_archive.py - Fixed-record binary sensor archive, one file per UTC day
+#
+# File layout (little-endian):
+#   header  16 B: magic "LMTA", schema u16, slot_size u16, index_every u16, reserved u16, day u32
+#   then groups of 1 index slot + `index_every` record slots, every slot SLOT_SIZE bytes.
+#
+#   index slot:  "IX", group u16, first_ts u32, zero padding, crc8
+#   record slot: ts u32, lat_e7 i32, lon_e7 i32, speed_cKmh u16, temp_cC i16,
+#                shock u16, battery_mv u16, int_temp_cC i16, flags u8, crc8
+#                (flags: 0x01 GPS fix, 0x02 dead-reckoned position, 0x04 estimated time)
+#
+# Every slot sits at a computable offset, so a time lookup is a binary search
+# over the index slots (one small seek + read each) followed by a sequential
+# read inside one group. Power loss mid-write leaves a short tail; the writer
+# pads it to a slot boundary on reopen and readers skip slots whose CRC fails.
+#
+# Records taken before the clock is known go to a per-boot directory
+# (pending_root) in the same format, with seconds since boot as ts and day
+# files counted from the epoch; rebase() moves them into the UTC archive once
+# the boot's offset is known (see lib/timebase.py).
+import os
+import struct
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from lib.sd_logger import BufferedFileWriter
+
+MAGIC = b"LMTA"
+SCHEMA_VERSION = 1
+HEADER_SIZE = 16
+SLOT_SIZE = 24
+DAY_SECONDS = 86400
+
+_HEADER_FMT = "<4sHHHHI"
+_INDEX_FMT = "<2sHI"
+_INDEX_MAGIC = b"IX"
+_RECORD_FMT = "<IiiHhHHhB"  # 23 bytes + crc8
+_FLAG_GPS_FIX = 0x01
+_FLAG_POS_EST = 0x02  # Position is a dead-reckoning estimate
+_FLAG_TS_EST = 0x04  # Time derived across a deep sleep, not from this boot's own sync
+
+_CRC8_TABLE = bytearray(256)
+for _i in range(256):
+    _c = _i
+    for _ in range(8):
+        _c = ((_c << 1) ^ 0x07) & 0xFF if _c & 0x80 else (_c << 1) & 0xFF
+    _CRC8_TABLE[_i] = _c
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def crc8(buf: Any, n: int) -> int:
+    """CRC-8 (poly 0x07, init 0xFF so an all-zero slot never validates) over buf[:n]"""
+    table = _CRC8_TABLE
+    c = 0xFF
+    for i in range(n):
+        c = table[c ^ buf[i]]
+    return c
+
+
+def day_path(root: str, day: int) -> str:
+    """/sd/arch/YYYYMMDD.lma for a day number (days since the epoch, UTC)"""
+    t = time.gmtime(day * DAY_SECONDS)
+    return "%s/%04d%02d%02d.lma" % (root, t[0], t[1], t[2])
+
+
+def pending_root(root: str, boot: int) -> str:
+    """Directory for a boot's records while its clock is unknown (ts = seconds since boot)"""
+    return "%s/b%d" % (root, boot)
+
+
+def pending_boots(root: str) -> List[int]:
+    """Boot IDs with records still waiting for a UTC offset, oldest first"""
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return []
+    return sorted(int(n[1:]) for n in names if n[:1] == "b" and n[1:].isdigit())
+
+
+def _clamp(v: float, lo: int, hi: int) -> int:
+    v = int(round(v))
+    return lo if v < lo else hi if v > hi else v
+
+
+def pack_record(buf: bytearray, ts: int, data: Dict[str, Any]) -> None:
+    """Encode one reading into a SLOT_SIZE buffer, in place"""
+    struct.pack_into(
+        _RECORD_FMT,
+        buf,
+        0,
+        ts,
+        _clamp(data.get("lat", 0.0) * 1e7, -(1 << 31), (1 << 31) - 1),
+        _clamp(data.get("lon", 0.0) * 1e7, -(1 << 31), (1 << 31) - 1),
+        _clamp(data.get("speed", 0.0) * 100, 0, 0xFFFF),
+        _clamp(data.get("temp", 0.0) * 100, -32768, 32767),
+        _clamp(data.get("shock", 0), 0, 0xFFFF),
+        _clamp(data.get("battery_mv", 0), 0, 0xFFFF),
+        _clamp(data.get("internal_temp", 0.0) * 100, -32768, 32767),
+        (_FLAG_GPS_FIX if data.get("gps_fix") else 0)
+        | (_FLAG_POS_EST if data.get("pos_est") else 0)
+        | (_FLAG_TS_EST if data.get("ts_est") else 0),
+    )
+    buf[SLOT_SIZE - 1] = crc8(buf, SLOT_SIZE - 1)
+
+
+def unpack_record(buf: Any) -> Optional[Dict[str, Any]]:
+    """Decode a record slot; None if its CRC does not match"""
+    if crc8(buf, SLOT_SIZE - 1) != buf[SLOT_SIZE - 1]:
+        return None
+    ts, lat, lon, speed, temp, shock, bat, itemp, flags = struct.unpack_from(_RECORD_FMT, buf, 0)
+    return {
+        "ts": ts,
+        "lat": lat / 1e7,
+        "lon": lon / 1e7,
+        "speed": speed / 100,
+        "temp": temp / 100,
+        "shock": shock,
+        "battery_mv": bat,
+        "internal_temp": itemp / 100,
+        "gps_fix": bool(flags & _FLAG_GPS_FIX),
+        "pos_est": bool(flags & _FLAG_POS_EST),
+        "ts_est": bool(flags & _FLAG_TS_EST),
+    }
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.stat(path)[6]
+    except OSError:
+        return -1
+
+
+class ArchiveWriter:
+    """Append readings to the archive, rotating to a new file at each UTC midnight"""
+
+    def __init__(
+        self,
+        root: str = "/sd/arch",
+        diagnostics: Any = None,
+        index_every: int = 64,
+        flush_interval_ms: int = 30000,
+        opener: Callable[[str, str], Any] = open,
+    ) -> None:
+        if not 0 < index_every <= 0xFFFF:
+            raise ValueError("Index interval out of range")
+        self._root = root
+        self._diagnostics = diagnostics
+        self._index_every = index_every
+        self._flush_interval_ms = flush_interval_ms
+        self._opener = opener
+        self._day = -1
+        self._slots = 0  # Slots after the header in the current file
+        self._body = 0  # Bytes after the header when the file was opened
+        self._group_len = index_every + 1
+        self._writer: Optional[BufferedFileWriter] = None
+        self._slot = bytearray(SLOT_SIZE)
+        self.repaired = 0  # Partial slots padded on reopen
+        try:
+            os.mkdir(root)
+        except OSError:
+            pass  # Exists
+
+    @property
+    def path(self) -> Optional[str]:
+        return day_path(self._root, self._day) if self._day >= 0 else None
+
+    def append(self, ts: int, data: Dict[str, Any]) -> None:
+        day = ts // DAY_SECONDS
+        if day != self._day:
+            self._open_day(day)
+        writer = self._writer
+        if writer is None:
+            return
+        if not writer.make_room(2 * SLOT_SIZE):
+            self._realign(writer)  # Unflushed slots were dropped: the file is shorter
+        group_len = self._group_len
+        if self._slots % group_len == 0:
+            self._pack_index(self._slots // group_len, ts)
+            writer.append_bytes(self._slot)
+            self._slots += 1
+        pack_record(self._slot, ts, data)
+        writer.append_bytes(self._slot)
+        self._slots += 1
+
+    def tick(self) -> None:
+        if self._writer is not None:
+            self._writer.tick()
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._day = -1
+
+    def _realign(self, writer: BufferedFileWriter) -> None:
+        """Count slots from what is on the card, so index slots stay at group boundaries"""
+        size = _file_size(day_path(self._root, self._day))
+        body = size - HEADER_SIZE if size >= HEADER_SIZE else self._body + writer.written
+        self._slots = (body + SLOT_SIZE - 1) // SLOT_SIZE
+        pad = self._slots * SLOT_SIZE - body
+        if pad:
+            writer.append_bytes(b"\xff" * pad)  # Partly written slot: fails its CRC
+
+    def _pack_index(self, group: int, first_ts: int) -> None:
+        slot = self._slot
+        for i in range(SLOT_SIZE):
+            slot[i] = 0
+        struct.pack_into(_INDEX_FMT, slot, 0, _INDEX_MAGIC, group & 0xFFFF, first_ts)
+        slot[SLOT_SIZE - 1] = crc8(slot, SLOT_SIZE - 1)
+
+    def _open_day(self, day: int) -> None:
+        self.close()
+        path = day_path(self._root, day)
+        size = _file_size(path)
+        try:
+            every = self._existing_index_every(path) if size >= HEADER_SIZE else 0
+            if every:
+                self._group_len = every + 1
+                self._body = size - HEADER_SIZE
+                self._slots = (self._body + SLOT_SIZE - 1) // SLOT_SIZE
+                pad = self._slots * SLOT_SIZE - self._body
+            else:
+                if size >= 0:
+                    os.rename(path, path + ".bad")  # Keep unreadable data for inspection
+                header = struct.pack(
+                    _HEADER_FMT, MAGIC, SCHEMA_VERSION, SLOT_SIZE, self._index_every, 0, day
+                )
+                with self._opener(path, "wb") as f:
+                    f.write(header)
+                self._group_len = self._index_every + 1
+                self._slots = 0
+                self._body = 0
+                pad = 0
+        except Exception as e:
+            print(f"Archive open failed: {e}")
+            if self._diagnostics:
+                self._diagnostics.increment("sd_write_fail")
+            return
+
+        self._day = day
+        self._writer = BufferedFileWriter(
+            path, self._diagnostics, flush_interval_ms=self._flush_interval_ms, opener=self._opener
+        )
+        if pad:
+            # Torn write from a power cut: realign; the completed slot fails its CRC
+            self._writer.append_bytes(b"\xff" * pad)
+            self.repaired += 1
+
+    def _existing_index_every(self, path: str) -> int:
+        """Index interval of a file we can keep appending to, else 0"""
+        with self._opener(path, "rb") as f:
+            head = f.read(HEADER_SIZE)
+        if len(head) != HEADER_SIZE:
+            return 0
+        magic, schema, slot, every, _, _ = struct.unpack(_HEADER_FMT, head)
+        if magic != MAGIC or schema != SCHEMA_VERSION or slot != SLOT_SIZE:
+            return 0
+        # A file started with another interval (config change mid-day) keeps its grouping
+        return int(every)
+
+
+class ArchiveReader:
+    """Time-range queries over one day file"""
+
+    def __init__(self, path: str, opener: Callable[[str, str], Any] = open) -> None:
+        self._f = opener(path, "rb")
+        head = self._f.read(HEADER_SIZE)
+        if len(head) != HEADER_SIZE:
+            self._f.close()
+            raise ArchiveError("Truncated header")
+        magic, schema, slot, every, _, day = struct.unpack(_HEADER_FMT, head)
+        if magic != MAGIC or slot != SLOT_SIZE or every == 0:
+            self._f.close()
+            raise ArchiveError("Not an archive file")
+        if schema > SCHEMA_VERSION:
+            self._f.close()
+            raise ArchiveError("Unsupported schema %d" % schema)
+        self.day = day
+        self.index_every = every
+        self._f.seek(0, 2)
+        self.slots = (self._f.tell() - HEADER_SIZE) // SLOT_SIZE
+        self._group_len = every + 1
+        self.groups = (self.slots + self._group_len - 1) // self._group_len
+        self._slot = bytearray(SLOT_SIZE)
+        self._group_buf = bytearray(self._group_len * SLOT_SIZE)
+        self.seeks = 0
+
+    def close(self) -> None:
+        self._f.close()
+
+    def __enter__(self) -> "ArchiveReader":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def _read_group(self, group: int) -> int:
+        """Load one group into the group buffer; returns the number of slots read"""
+        self.seeks += 1
+        self._f.seek(HEADER_SIZE + group * self._group_len * SLOT_SIZE)
+        n = self._f.readinto(self._group_buf)
+        return (n or 0) // SLOT_SIZE
+
+    def _group_start(self, group: int) -> Optional[int]:
+        """First timestamp in a group, from its index slot (or first good record)"""
+        self.seeks += 1
+        self._f.seek(HEADER_SIZE + group * self._group_len * SLOT_SIZE)
+        slot = self._slot
+        if self._f.readinto(slot) == SLOT_SIZE and crc8(slot, SLOT_SIZE - 1) == slot[-1]:
+            magic, _, first_ts = struct.unpack_from(_INDEX_FMT, slot, 0)
+            if magic == _INDEX_MAGIC:
+                return int(first_ts)
+        # Damaged index slot: fall back to the group's records
+        mv = memoryview(self._group_buf)
+        for i in range(1, self._read_group(group)):
+            rec = unpack_record(mv[i * SLOT_SIZE : (i + 1) * SLOT_SIZE])
+            if rec is not None:
+                return int(rec["ts"])
+        return None
+
+    def _find_group(self, t0: int) -> int:
+        """Last group whose first timestamp is <= t0 (0 if none); O(log groups) seeks"""
+        lo, hi = 0, self.groups - 1
+        found = 0
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            probe = mid
+            start = self._group_start(probe)
+            while start is None and probe < hi:  # Wholly corrupt group: look right
+                probe += 1
+                start = self._group_start(probe)
+            if start is None or start > t0:
+                hi = mid - 1
+            else:
+                found = probe
+                lo = probe + 1
+        return found
+
+    def read_range(self, t0: int, t1: int) -> Iterator[Dict[str, Any]]:
+        """Yield records with t0 <= ts <= t1, skipping slots that fail their CRC"""
+        if self.groups == 0 or t1 < t0:
+            return
+        mv = memoryview(self._group_buf)
+        for group in range(self._find_group(t0), self.groups):
+            n = self._read_group(group)
+            for i in range(1, n):
+                rec = unpack_record(mv[i * SLOT_SIZE : (i + 1) * SLOT_SIZE])
+                if rec is None:
+                    continue
+                if rec["ts"] > t1:
+                    return
+                if rec["ts"] >= t0:
+                    yield rec
+
+
+def read_range(root: str, t0: int, t1: int) -> List[Dict[str, Any]]:
+    """Records in [t0, t1] across day files; missing or unreadable days are skipped"""
+    out: List[Dict[str, Any]] = []
+    for day in range(t0 // DAY_SECONDS, t1 // DAY_SECONDS + 1):
+        try:
+            with ArchiveReader(day_path(root, day)) as reader:
+                out.extend(reader.read_range(t0, t1))
+        except (OSError, ArchiveError):
+            continue
+    return out
+
+
+def rebase(
+    src: str,
+    writer: ArchiveWriter,
+    offset: int,
+    exact: bool = True,
+    opener: Callable[[str, str], Any] = open,
+) -> int:
+    """Move a pending boot directory into the UTC archive; returns the records moved"""
+    moved = 0
+    for name in sorted(os.listdir(src)):
+        path = src + "/" + name
+        if not name.endswith(".lma"):
+            continue
+        try:
+            with ArchiveReader(path, opener) as reader:
+                for rec in reader.read_range(0, 0xFFFFFFFF):
+                    rec["ts_est"] = rec["ts_est"] or not exact
+                    writer.append(rec["ts"] + offset, rec)
+                    moved += 1
+        except (OSError, ArchiveError):
+            os.rename(path, path + ".bad")  # Keep unreadable data for inspection
+            continue
+        os.remove(path)
+    try:
+        os.rmdir(src)
+    except OSError:
+        pass  # .bad files left behind
+    return moved
@@ -1,12 +1,126 @@
 # SD Card Logger for offline data backup
-from typing import Any, Dict
-from machine import Pin, SPI
+from typing import Any, Callable, Dict, List
 import os
 import time
 
 
+class BufferedFileWriter:
+    """Append-only writer that batches lines in a preallocated buffer.
+
+    The file stays open between flushes, so each flush costs one write of
+    the batched bytes plus one FAT/directory sync instead of an
+    open/append/close per line.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        diagnostics: Any = None,
+        buf_size: int = 2048,
+        flush_bytes: int = 1536,
+        flush_interval_ms: int = 30000,
+        opener: Callable[[str, str], Any] = open,
+    ) -> None:
+        if not 0 < flush_bytes <= buf_size or flush_interval_ms <= 0:
+            raise ValueError("Invalid SD buffer thresholds")
+        self._path = path
+        self._diagnostics = diagnostics
+        self._opener = opener
+        self._buf = bytearray(buf_size)
+        self._mv = memoryview(self._buf)
+        self._len = 0
+        self._flush_bytes = flush_bytes
+        self._flush_interval_ms = flush_interval_ms
+        self._oldest = 0  # ticks_ms of the first unflushed line
+        self._file: Any = None
+        self.flushes = 0
+        self.dropped_bytes = 0
+        self.written = 0  # Bytes that reached the file
+        self.last_flush_ms = 0
+        self.max_flush_ms = 0
+
+    @property
+    def pending(self) -> int:
+        return self._len
+
+    def append(self, line: str) -> None:
+        self.append_bytes(line.encode())
+
+    def make_room(self, n: int) -> bool:
+        """Flush if n more bytes do not fit; False if buffered data had to be dropped"""
+        if self._len + n <= len(self._buf) or self.flush():
+            return True
+        # Flush failed: drop oldest data rather than blocking the sensor loop or growing the heap
+        self.dropped_bytes += self._len
+        self._len = 0
+        return False
+
+    def append_bytes(self, data: Any) -> None:
+        n = len(data)
+        self.make_room(n)
+        if n > len(self._buf):
+            self.dropped_bytes += n  # Larger than the buffer
+            return
+        if self._len == 0:
+            self._oldest = time.ticks_ms()  # type: ignore[attr-defined]
+        self._buf[self._len : self._len + n] = data
+        self._len += n
+        if self._len >= self._flush_bytes:
+            self.flush()
+
+    def tick(self) -> None:
+        """Flush if the oldest buffered line has waited longer than the interval"""
+        if self._len and (
+            time.ticks_diff(time.ticks_ms(), self._oldest)  # type: ignore[attr-defined]
+            >= self._flush_interval_ms
+        ):
+            self.flush()
+
+    def flush(self) -> bool:
+        if not self._len:
+            return True
+        start = time.ticks_ms()  # type: ignore[attr-defined]
+        try:
+            if self._file is None:
+                self._file = self._opener(self._path, "ab")
+            self._file.write(self._mv[: self._len])
+            self._file.flush()  # f_sync: one FAT/dir update per batch
+        except Exception as e:
+            print(f"SD write error: {e}")
+            self._reset_file()
+            if self._diagnostics:
+                self._diagnostics.increment("sd_write_fail")
+            return False
+
+        self.written += self._len
+        self._len = 0
+        self.flushes += 1
+        self.last_flush_ms = time.ticks_diff(time.ticks_ms(), start)  # type: ignore[attr-defined]
+        if self.last_flush_ms > self.max_flush_ms:
+            self.max_flush_ms = self.last_flush_ms
+        if self._diagnostics:
+            self._diagnostics.set_gauge("sd_flush_ms", self.last_flush_ms)
+            self._diagnostics.set_gauge("sd_flush_max_ms", self.max_flush_ms)
+            self._diagnostics.set_gauge("sd_flushes", self.flushes)
+        return True
+
+    def _reset_file(self) -> None:
+        # Card removed or FS error: reopen on the next flush
+        try:
+            if self._file is not None:
+                self._file.close()
+        except Exception:
+            pass
+        self._file = None
+
+    def close(self) -> None:
+        """Flush and release the handle (shutdown / deep sleep)"""
+        self.flush()
+        self._reset_file()
+
+
 class SDLogger:
-    """Log sensor data to SD card as CSV backup"""
+    """Log sensor data to the SD card archive (see lib/sd_archive.py)"""
 
     # ESP32-C6 SPI pins for SD card (SPI 2)
     # Check your board docs! Often:
@@ -15,12 +129,22 @@ class SDLogger:
     PIN_MOSI = 3
     PIN_MISO = 4
 
-    def __init__(self) -> None:
+    ARCHIVE_ROOT = "/sd/arch"
+
+    def __init__(self, diagnostics: Any = None, timebase: Any = None) -> None:
         self._mounted = False
+        self._archive: Any = None
+        self._diagnostics = diagnostics
+        self._timebase = timebase  # lib/timebase.py; None = trust time.time()
+        self._pending: Any = None  # This boot's writer while the clock is unknown
+        self._pending_boots: List[int] = []
+        self._rebase_rev = -1
         try:
             # Requires 'sdcard.py' driver to be present in lib/
             # We assume it's there or user has frozen bytecode
             import sdcard
+            from machine import Pin, SPI
+            from lib.sd_archive import ArchiveWriter
 
             self._spi = SPI(
                 2,
@@ -37,32 +161,89 @@ class SDLogger:
                 os.mount(self._sd, "/sd")  # type: ignore
 
             self._mounted = True
-            self._ensure_log_file()
+            self._archive = ArchiveWriter(self.ARCHIVE_ROOT, diagnostics)
+            if timebase is not None:
+                from lib.sd_archive import pending_boots
+
+                self._pending_boots = pending_boots(self.ARCHIVE_ROOT)
         except Exception as e:
             print(f"SD card init failed (missing sdcard.py?): {e}")
 
-    def _ensure_log_file(self) -> None:
-        if not self._mounted:
-            return
-        try:
-            os.stat("/sd/sensor_log.csv")
-        except OSError:
-            with open("/sd/sensor_log.csv", "w") as f:
-                # Version 2 Header
-                f.write("timestamp,lat,lon,speed,temp,shock,battery_mv,int_temp\n")
-
     def log(self, data: Dict[str, Any]) -> None:
-        """Append sensor reading to CSV"""
-        if not self._mounted:
+        """Buffer one sensor reading as a fixed-size archive record"""
+        if self._archive is None:
             return
-        try:
-            ts = time.time()
-            line = f"{ts},{data['lat']},{data['lon']},{data['speed']},{data['temp']},{data['shock']},{data.get('battery_mv', 0)},{data.get('internal_temp', 0)}\n"
-            with open("/sd/sensor_log.csv", "a") as f:
-                f.write(line)
-        except Exception as e:
-            print(f"SD write error: {e}")
+        tb = self._timebase
+        if tb is None:
+            self._archive.append(int(time.time()), data)
+            return
+        ts = tb.now()
+        if not ts:
+            self._pending_writer(tb.boot).append(tb.mono(), data)
+            return
+        if self._rebase_rev != tb.revision:
+            self._rebase(tb)  # Older records first, so day files stay in time order
+        data["ts_est"] = not tb.exact(tb.boot)
+        self._archive.append(ts, data)
+
+    def _pending_writer(self, boot: int) -> Any:
+        if self._pending is None:
+            from lib.sd_archive import ArchiveWriter, pending_root
+
+            self._pending = ArchiveWriter(pending_root(self.ARCHIVE_ROOT, boot), self._diagnostics)
+            if boot not in self._pending_boots:
+                self._pending_boots.append(boot)
+        return self._pending
+
+    def _rebase(self, tb: Any) -> None:
+        """Move pending boots whose UTC offset is now known into the archive"""
+        from lib.sd_archive import pending_root, rebase
+
+        self._rebase_rev = tb.revision
+        if self._pending is not None and tb.offset(tb.boot) is not None:
+            self._pending.close()
+            self._pending = None
+        for boot in list(self._pending_boots):
+            offset = tb.offset(boot)
+            if offset is None:
+                continue
+            try:
+                src = pending_root(self.ARCHIVE_ROOT, boot)
+                n = rebase(src, self._archive, offset, tb.exact(boot))
+            except OSError as e:
+                print(f"Archive rebase failed: {e}")
+                continue
+            self._pending_boots.remove(boot)
+            print(f"Archive: {n} records of boot {boot} moved to UTC")
+
+    def tick(self) -> None:
+        """Time-based flush; call periodically from a maintenance loop"""
+        if self._archive is not None:
+            self._archive.tick()
+        if self._pending is not None:
+            self._pending.tick()
+
+    def close(self) -> None:
+        """Flush pending records before shutdown or deep sleep"""
+        if self._pending is not None:
+            self._pending.close()
+        if self._archive is not None:
+            self._archive.close()
 
     @property
     def is_mounted(self) -> bool:
         return self._mounted
+
+
+def format_csv_line(ts: int, data: Dict[str, Any]) -> str:
+    """Legacy CSV row (pre-archive format); kept for exports and the SD benchmark"""
+    return "%d,%.6f,%.6f,%.2f,%.2f,%d,%d,%.1f\n" % (
+        ts,
+        data["lat"],
+        data["lon"],
+        data["speed"],
+        data["temp"],
+        data["shock"],
+        data.get("battery_mv", 0),
+        data.get("internal_temp", 0),
+    )
@@ -6,6 +6,8 @@ import ds18x20
 import time
 import esp32
 
+from lib.gps_control import parse_rmc
+
 
 class MPU6050:
     """MPU-6050 6-axis Accelerometer/Gyroscope driver"""
@@ -32,6 +34,14 @@ class MPU6050:
         except OSError:
             return (0.0, 0.0, 1.0)
 
+    def read_motion_into(self, buf: bytearray) -> bool:
+        """Accel, temperature and gyro (14 big-endian bytes from ACCEL_XOUT_H) in one read"""
+        try:
+            self._i2c.readfrom_mem_into(self.MPU_ADDR, self.ACCEL_XOUT_H, buf)
+            return True
+        except OSError:
+            return False
+
     def get_shock_value(self) -> int:
         """Calculate shock magnitude (0-1000 scale) - Optimized"""
         ax, ay, az = self.read_accel()
@@ -80,7 +90,15 @@ class SensorHub:
                 self.diagnostics.increment("onewire_errors")
 
         self._gps_uart = UART(1, baudrate=115200, tx=21, rx=20)
-        self._last_gps: Dict[str, Any] = {"lat": 0.0, "lon": 0.0, "speed": 0.0, "fix": False}
+        self.gps_uart = self._gps_uart  # UBX commands from GpsController
+        self._last_gps: Dict[str, Any] = {
+            "lat": 0.0,
+            "lon": 0.0,
+            "speed": 0.0,
+            "course": 0.0,
+            "fix": False,
+        }
+        self.fix_seq = 0  # Incremented per valid RMC sentence (one per GPS fix)
         self._last_temps: Dict[str, float] = {}  # ROM ID: Value
         self._last_temp_read = 0
 
@@ -89,6 +107,7 @@ class SensorHub:
             "lat": 0.0,
             "lon": 0.0,
             "speed": 0.0,
+            "course": 0.0,
             "gps_fix": False,
             "temp": 0.0,
             "all_temps": self._last_temps,
@@ -130,6 +149,11 @@ class SensorHub:
         except Exception:
             return 0
 
+    def read_motion_raw(self, buf: bytearray) -> bool:
+        """14-byte accel + gyro sample for the IMU task (no allocation)"""
+        # Not counted in diagnostics: at the IMU rate that would hammer the config flash
+        return self._mpu is not None and self._mpu.read_motion_into(buf)
+
     def read_internal_c(self) -> float:
         try:
             f = esp32.raw_temperature()
@@ -174,6 +198,7 @@ class SensorHub:
         self._read_result["lat"] = self._last_gps["lat"]
         self._read_result["lon"] = self._last_gps["lon"]
         self._read_result["speed"] = self._last_gps["speed"]
+        self._read_result["course"] = self._last_gps["course"]
         self._read_result["gps_fix"] = self._last_gps["fix"]
         self._read_result["temp"] = primary_temp
         self._read_result["shock"] = shock
@@ -198,34 +223,9 @@ class SensorHub:
         while self._gps_uart.any():
             try:
                 line = self._gps_uart.readline()
-                if line and b"$GPRMC" in line:
-                    parts = line.decode().split(",")
-                    if len(parts) >= 8 and parts[2] == "A":
-                        self._last_gps["fix"] = True
-                        self._last_gps["lat"] = self._parse_coord(parts[3], parts[4])
-                        self._last_gps["lon"] = self._parse_coord(parts[5], parts[6])
-                        try:
-                            knots = float(parts[7])
-                            self._last_gps["speed"] = knots * 1.852
-                        except ValueError:
-                            self._last_gps["speed"] = 0.0
-                    else:
-                        self._last_gps["fix"] = False
+                if line and parse_rmc(line, self._last_gps) > 0:
+                    self.fix_seq += 1
             except Exception as e:
                 print(f"GPS parse error: {e}")
                 if self.diagnostics:
                     self.diagnostics.increment("gps_parse_errors")
-
-    def _parse_coord(self, value: str, direction: str) -> float:
-        if not value or "." not in value:
-            return 0.0
-        try:
-            dot_idx = value.find(".")
-            degrees = float(value[: dot_idx - 2])
-            minutes = float(value[dot_idx - 2 :])
-            decimal = degrees + minutes / 60
-            if direction in ("S", "W"):
-                decimal = -decimal
-            return decimal
-        except ValueError:
-            return 0.0
@@ -1,33 +1,240 @@
+# shock_buffer.py - Continuous accelerometer ring with pre/post-trigger event capture
+#
+# Samples (raw int16 x, y, z at +/-2 g) go into an array-backed ring at the IMU
+# rate. When |a| leaves the band 1 g +/- threshold, capture runs for `post_ms`
+# and the ring (which then holds `pre_ms` before the trigger plus `post_ms`
+# after it) is copied into the next preallocated event slot.
+#
+# BLE frames on the config characteristic (little-endian):
+#   Summary:  0xB4, seq, ts u32, peak u16, duration_ms u16, peak_x/y/z mg i16,
+#             rate_hz u16, pre_samples u16, total_samples u16, class u8
+#   Waveform: 0xB5, seq, offset u16, count u8, count * (x, y, z) i16 raw
+import math
+import struct
+from array import array
+from micropython import const
+from typing import Any, Dict, List, Optional, Tuple
+
+LSB_PER_G = const(16384)  # MPU6050 default full scale (+/-2 g)
+# Magnitudes use counts >> 2 so |a|^2 stays a small int (< 2^30) on MicroPython
+Q_SHIFT = const(2)
+Q_PER_G = const(4096)
+SUMMARY_MAGIC = const(0xB4)
+WAVE_MAGIC = const(0xB5)
+SUMMARY_FMT = "<BBIHHhhhHHHB"
+SUMMARY_SIZE = const(23)
+_WAVE_HDR = const(5)
+_ATT_OVERHEAD = const(3)
+MAX_FRAME = const(244)
+
+
+class ShockEvent:
+    """One captured event; slots are allocated once and reused"""
+
+    __slots__ = ("seq", "ticks", "ts", "peak", "duration_ms", "axis_peak", "kind", "wave")
+
+    def __init__(self, window: int) -> None:
+        self.seq = 0
+        self.ticks = 0  # ticks_ms at trigger
+        self.ts = 0  # UTC seconds at trigger
+        self.peak = 0  # 0-1000 shock scale, same as SensorHub shock values
+        self.duration_ms = 0  # Time outside the threshold band within the window
+        self.axis_peak = [0, 0, 0]  # Signed per-axis peak, mg
+        self.kind = 0  # Class from lib/shock_classifier.py (0 = bump / unclassified)
+        self.wave = array("h", bytes(6 * window))  # Interleaved x, y, z, oldest first
+
+
 class ShockBuffer:
-    def __init__(self, size: int = 100) -> None:
-        self.size = size
-        self.buffer: list[tuple[int, float] | None] = [None] * size
-        self.head = 0
-        self.count = 0
+    def __init__(
+        self,
+        rate_hz: int = 100,
+        pre_ms: int = 200,
+        post_ms: int = 300,
+        threshold: int = 500,
+        slots: int = 4,
+    ) -> None:
+        if rate_hz <= 0 or pre_ms < 0 or post_ms <= 0 or slots <= 0:
+            raise ValueError("Invalid shock capture parameters")
+        if not 0 < threshold <= 1000:
+            raise ValueError("Shock threshold must be 1-1000")
+        self.rate_hz = rate_hz
+        self._period_ms = 1000 // rate_hz
+        self.pre = pre_ms * rate_hz // 1000
+        self._post = max(1, post_ms * rate_hz // 1000)
+        self.window = self.pre + self._post
+
+        # Band 1 g +/- threshold/500 g, compared on |a|^2 in scaled counts to stay integer
+        dev = threshold / 500
+        self._hi2 = int(((1 + dev) * Q_PER_G) ** 2)
+        self._lo2 = int(((1 - dev) * Q_PER_G) ** 2) if dev < 1 else -1
+
+        self._ring = array("h", bytes(6 * self.window))
+        for i in range(2, 3 * self.window, 3):
+            self._ring[i] = LSB_PER_G  # Start at rest (1 g on z) so early events are not skewed
+        self._head = 0
+        self._post_left = 0  # > 0 while capturing
+        self._armed = True  # Re-armed once a sample is back inside the band
+        self._trig_ticks = 0
+        self._trig_ts = 0
 
-    def add(self, shock_value: float, timestamp: int) -> None:
-        """Add a shock event (value, timestamp_ms)"""
-        self.buffer[self.head] = (timestamp, shock_value)
-        self.head = (self.head + 1) % self.size
-        # Correctly increment count
-        if self.count < self.size:
-            self.count += 1
-
-    def get_latest(self, n: int = -1) -> list[tuple[int, float]]:
-        """Get latest n events, newest first"""
-        if n == -1 or n > self.count:
-            n = self.count
-
-        result: list[tuple[int, float]] = []
-        idx = (self.head - 1 + self.size) % self.size
+        self._slots = [ShockEvent(self.window) for _ in range(slots)]
+        self._next_slot = 0
+        self.count = 0  # Events captured since boot
+        self._frame = bytearray(MAX_FRAME)
+
+    def add_raw(self, raw: Any, now_ms: int, ts: int = 0) -> Optional[ShockEvent]:
+        """Feed 6 big-endian bytes as read from ACCEL_XOUT_H"""
+        x = (raw[0] << 8) | raw[1]
+        y = (raw[2] << 8) | raw[3]
+        z = (raw[4] << 8) | raw[5]
+        return self.add_sample(
+            x - 0x10000 if x & 0x8000 else x,
+            y - 0x10000 if y & 0x8000 else y,
+            z - 0x10000 if z & 0x8000 else z,
+            now_ms,
+            ts,
+        )
+
+    def add_sample(self, x: int, y: int, z: int, now_ms: int, ts: int = 0) -> Optional[ShockEvent]:
+        """Store one sample; returns the event when a capture window completes"""
+        ring = self._ring
+        i = self._head * 3
+        ring[i] = x
+        ring[i + 1] = y
+        ring[i + 2] = z
+        self._head += 1
+        if self._head == self.window:
+            self._head = 0
+
+        x >>= Q_SHIFT
+        y >>= Q_SHIFT
+        z >>= Q_SHIFT
+        m2 = x * x + y * y + z * z
+        outside = m2 > self._hi2 or m2 < self._lo2
+        if self._post_left:
+            self._post_left -= 1
+            return self._finish() if self._post_left == 0 else None
+        if not outside:
+            self._armed = True
+            return None
+        if not self._armed:
+            return None
+        # Trigger: this sample is the first post-trigger sample
+        self._armed = False
+        self._trig_ticks = now_ms
+        self._trig_ts = ts
+        self._post_left = self._post - 1
+        return self._finish() if self._post_left == 0 else None
+
+    def _finish(self) -> ShockEvent:
+        ev = self._slots[self._next_slot]
+        self._next_slot = (self._next_slot + 1) % len(self._slots)
+        self.count += 1
+        ev.seq = self.count
+        ev.ticks = self._trig_ticks
+        ev.ts = self._trig_ts
+        ev.kind = 0
+
+        ring = self._ring
+        wave = ev.wave
+        peaks = ev.axis_peak
+        peaks[0] = peaks[1] = peaks[2] = 0
+        max2 = min2 = Q_PER_G * Q_PER_G
+        outside = 0
+        j = self._head * 3  # Oldest sample
+        n = self.window * 3
+        for i in range(0, n, 3):
+            x = ring[j]
+            y = ring[j + 1]
+            z = ring[j + 2]
+            wave[i] = x
+            wave[i + 1] = y
+            wave[i + 2] = z
+            if abs(x) > abs(peaks[0]):
+                peaks[0] = x
+            if abs(y) > abs(peaks[1]):
+                peaks[1] = y
+            if abs(z) > abs(peaks[2]):
+                peaks[2] = z
+            m2 = (x >> Q_SHIFT) ** 2 + (y >> Q_SHIFT) ** 2 + (z >> Q_SHIFT) ** 2
+            if m2 > max2:
+                max2 = m2
+            if m2 < min2:
+                min2 = m2
+            if m2 > self._hi2 or m2 < self._lo2:
+                outside += 1
+            j += 3
+            if j == n:
+                j = 0
+        for k in range(3):
+            peaks[k] = peaks[k] * 1000 // LSB_PER_G
+        dev = max(math.sqrt(max2) - Q_PER_G, Q_PER_G - math.sqrt(min2)) / Q_PER_G
+        ev.peak = min(int(dev * 500), 1000)
+        ev.duration_ms = outside * self._period_ms
+        return ev
+
+    def latest(self, n: int = -1) -> List[ShockEvent]:
+        """Captured events still held in slots, newest first"""
+        held = min(self.count, len(self._slots))
+        if n < 0 or n > held:
+            n = held
+        out = []
+        idx = self._next_slot
         for _ in range(n):
-            item = self.buffer[idx]
-            if item is not None:
-                result.append(item)
-            idx = (idx - 1 + self.size) % self.size
-        return result
+            idx = (idx - 1) % len(self._slots)
+            out.append(self._slots[idx])
+        return out
 
     def clear(self) -> None:
-        self.head = 0
+        self._post_left = 0
+        self._armed = True
+        self._next_slot = 0
         self.count = 0
-        self.buffer = [None] * self.size
+
+    # --- Export ---
+
+    def summary(self, ev: ShockEvent) -> Dict[str, Any]:
+        """Upload record fields for one event"""
+        return {
+            "event": "shock",
+            "shock": ev.peak,
+            "shock_ts": ev.ts,
+            "shock_duration_ms": ev.duration_ms,
+            "shock_axes_mg": list(ev.axis_peak),
+        }
+
+    def pack_summary(self, ev: ShockEvent) -> Any:
+        buf = self._frame
+        struct.pack_into(
+            SUMMARY_FMT,
+            buf,
+            0,
+            SUMMARY_MAGIC,
+            ev.seq & 0xFF,
+            ev.ts,
+            ev.peak,
+            min(ev.duration_ms, 0xFFFF),
+            ev.axis_peak[0],
+            ev.axis_peak[1],
+            ev.axis_peak[2],
+            self.rate_hz,
+            self.pre,
+            self.window,
+            ev.kind,
+        )
+        return memoryview(buf)[:SUMMARY_SIZE]
+
+    def pack_wave(self, ev: ShockEvent, start: int, mtu: int) -> Tuple[int, Any]:
+        """Pack samples from `start` into one frame. Returns (next_start, frame)."""
+        limit = max(_WAVE_HDR + 6, min(mtu - _ATT_OVERHEAD, MAX_FRAME))
+        count = min((limit - _WAVE_HDR) // 6, 255, self.window - start)
+        buf = self._frame
+        buf[0] = WAVE_MAGIC
+        buf[1] = ev.seq & 0xFF
+        struct.pack_into("<HB", buf, 2, start, count)
+        wave = ev.wave
+        off = _WAVE_HDR
+        for i in range(start * 3, (start + count) * 3):
+            struct.pack_into("<h", buf, off, wave[i])
+            off += 2
+        return start + count, memoryview(buf)[:off]
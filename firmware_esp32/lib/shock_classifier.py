@@ -0,0 +1,178 @@
+# shock_classifier.py - Shock event features and a fixed-point decision tree
+#
+# Features are integers computed in one pass over a captured ShockEvent window
+# (raw int16 x, y, z, oldest first):
+#   F_FREEFALL_MS  longest run with |a| < 0.3 g before the peak
+#   F_PEAK_MG      peak |a|
+#   F_JERK         peak |da/dt| in g/s
+#   F_TILT_DEG     angle between the gravity vector at the start and end of the window
+#   F_VIB          mean squared sample-to-sample change, mg^2 (vibration energy)
+#
+# The tree is a flat list of nodes [feature, threshold, if_ge, if_lt]. A child
+# >= 0 is a node index (always greater than the parent, so evaluation is bounded
+# by the node count); a child < 0 is a leaf for class -child - 1.
+import math
+from array import array
+from micropython import const
+from typing import Any, Dict, List, Optional, Sequence
+
+from lib.shock_buffer import Q_PER_G, Q_SHIFT
+
+F_FREEFALL_MS = const(0)
+F_PEAK_MG = const(1)
+F_JERK = const(2)
+F_TILT_DEG = const(3)
+F_VIB = const(4)
+FEATURE_NAMES = ("freefall_ms", "peak_mg", "jerk_gps", "tilt_deg", "vib_mg2")
+
+CLASS_BUMP = const(0)
+CLASS_DROP = const(1)
+CLASS_IMPACT = const(2)
+CLASS_VIBRATION = const(3)
+CLASS_TIP_OVER = const(4)
+CLASS_NAMES = ("bump", "drop", "impact", "vibration", "tip_over")
+
+_FREEFALL2 = (3 * Q_PER_G // 10) ** 2  # (0.3 g)^2 in scaled counts
+_GRAVITY_SAMPLES = const(8)  # Samples averaged for the start/end gravity vector
+
+
+def _leaf(cls: int) -> int:
+    return -cls - 1
+
+
+# Hand-tuned on the synthetic set in tools/shock_eval.py; override with config "shock_tree"
+DEFAULT_TREE: List[List[int]] = [
+    [F_FREEFALL_MS, 60, 1, 2],  # 0: fell for >= 60 ms before the peak?
+    [F_PEAK_MG, 1500, _leaf(CLASS_DROP), 2],  # 1: ...and landed hard
+    [F_TILT_DEG, 45, _leaf(CLASS_TIP_OVER), 3],  # 2: ended up on another face
+    [F_PEAK_MG, 2500, 4, 5],  # 3: several axes saturated?
+    [F_JERK, 200, _leaf(CLASS_IMPACT), 5],  # 4: ...with a sharp onset
+    [F_VIB, 200000, _leaf(CLASS_VIBRATION), _leaf(CLASS_BUMP)],  # 5: sustained rattle?
+]
+
+
+def isqrt(n: int) -> int:
+    """Integer square root (Newton); avoids soft-float on the FPU-less C6"""
+    if n <= 0:
+        return 0
+    x = n
+    y = (x + 1) >> 1
+    while y < x:
+        x = y
+        y = (x + n // x) >> 1
+    return x
+
+
+class ShockClassifier:
+    def __init__(self, tree: Optional[Sequence[Sequence[int]]] = None) -> None:
+        nodes = tree if tree else DEFAULT_TREE
+        if not isinstance(nodes, (list, tuple)):
+            raise ValueError("Tree must be a list of nodes")  # e.g. a remote config typo
+        n = len(nodes)
+        flat = array("i", bytes(4 * 4 * n))
+        for i, node in enumerate(nodes):
+            if not isinstance(node, (list, tuple)) or len(node) != 4:
+                raise ValueError("Tree node %d must be [feature, threshold, if_ge, if_lt]" % i)
+            if not all(isinstance(v, int) and -(1 << 31) <= v < 1 << 31 for v in node):
+                raise ValueError("Tree node %d: values must be 32-bit integers" % i)
+            feature, threshold, ge, lt = node
+            if not 0 <= feature < len(FEATURE_NAMES):
+                raise ValueError("Tree node %d: unknown feature %d" % (i, feature))
+            for child in (ge, lt):
+                if child >= 0 and not i < child < n:
+                    raise ValueError("Tree node %d: child %d must point forward" % (i, child))
+                if child < 0 and -child - 1 >= len(CLASS_NAMES):
+                    raise ValueError("Tree node %d: unknown class %d" % (i, -child - 1))
+            flat[4 * i] = feature
+            flat[4 * i + 1] = threshold
+            flat[4 * i + 2] = ge
+            flat[4 * i + 3] = lt
+        self._tree = flat
+        self.features = array("i", bytes(4 * len(FEATURE_NAMES)))
+
+    def extract(self, wave: Any, n: int, pre: int, rate_hz: int) -> Any:
+        """Fill self.features from n interleaved samples; returns the features array"""
+        f = self.features
+        peak2 = 0
+        jerk2 = 0
+        vib = 0  # Sum of d^2 >> 8, kept below 2^30 for windows up to ~300 samples
+        run = 0
+        best_run = 0
+        best_ff = 0
+        px = wave[0] >> Q_SHIFT
+        py = wave[1] >> Q_SHIFT
+        pz = wave[2] >> Q_SHIFT
+        for i in range(0, 3 * n, 3):
+            x = wave[i] >> Q_SHIFT
+            y = wave[i + 1] >> Q_SHIFT
+            z = wave[i + 2] >> Q_SHIFT
+            m2 = x * x + y * y + z * z
+            if m2 > peak2:
+                peak2 = m2
+                best_ff = best_run  # Free fall only counts if it precedes the peak
+            if m2 < _FREEFALL2:
+                run += 1
+                if run > best_run:
+                    best_run = run
+            else:
+                run = 0
+            dx = x - px
+            dy = y - py
+            dz = z - pz
+            d2 = dx * dx + dy * dy + dz * dz
+            vib += d2 >> 8
+            if d2 > jerk2:
+                jerk2 = d2
+            px = x
+            py = y
+            pz = z
+
+        f[F_FREEFALL_MS] = best_ff * 1000 // rate_hz
+        f[F_PEAK_MG] = isqrt(peak2) * 1000 // Q_PER_G
+        f[F_JERK] = isqrt(jerk2) * rate_hz // Q_PER_G
+        # (d2 << 8) * (1000 / Q_PER_G)^2 == d2 * 15625 / 1024 mg^2
+        f[F_VIB] = vib * 15625 // 1024 // max(1, n - 1)
+        f[F_TILT_DEG] = self._tilt_deg(wave, n, pre)
+        return f
+
+    def _tilt_deg(self, wave: Any, n: int, pre: int) -> int:
+        k = min(_GRAVITY_SAMPLES, max(1, pre), n)
+        ax = ay = az = bx = by = bz = 0
+        for i in range(k):
+            ax += wave[3 * i] >> Q_SHIFT
+            ay += wave[3 * i + 1] >> Q_SHIFT
+            az += wave[3 * i + 2] >> Q_SHIFT
+            j = 3 * (n - k + i)
+            bx += wave[j] >> Q_SHIFT
+            by += wave[j + 1] >> Q_SHIFT
+            bz += wave[j + 2] >> Q_SHIFT
+        ax //= k
+        ay //= k
+        az //= k
+        bx //= k
+        by //= k
+        bz //= k
+        dot = ax * bx + ay * by + az * bz
+        norm = isqrt(ax * ax + ay * ay + az * az) * isqrt(bx * bx + by * by + bz * bz) // 1000
+        if not norm:
+            return 0
+        cos_milli = max(-1000, min(1000, dot // norm))
+        # One acos per event; the per-sample loop above stays integer-only
+        return int(math.degrees(math.acos(cos_milli / 1000)) + 0.5)
+
+    def classify_features(self, f: Any) -> int:
+        tree = self._tree
+        node = 0
+        while True:
+            base = 4 * node
+            child = tree[base + 2] if f[tree[base]] >= tree[base + 1] else tree[base + 3]
+            if child < 0:
+                return -child - 1
+            node = child
+
+    def classify(self, wave: Any, n: int, pre: int, rate_hz: int) -> int:
+        return self.classify_features(self.extract(wave, n, pre, rate_hz))
+
+    def feature_dict(self) -> Dict[str, int]:
+        """Last extracted features by name (upload / diagnostics; allocates)"""
+        return {name: self.features[i] for i, name in enumerate(FEATURE_NAMES)}
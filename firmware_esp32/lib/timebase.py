@@ -0,0 +1,135 @@
+# timebase.py - Boot-relative timestamps, corrected to UTC once the clock is known
+#
+# Until NTP sets the RTC, time.time() is meaningless (the RTC restarts at the
+# epoch on power-up, and may come back from deep sleep wrong). Records are
+# therefore stamped with "boot", a counter persisted in config and bumped at
+# every power-up or wake, and "mono", seconds since that boot from the
+# wrap-extended ticks_ms. A successful sync stores utc - mono for the current
+# boot in a small offset table ("time_offsets": [[boot, offset_s, exact]],
+# last MAX_BOOTS boots), so any record of a boot in the table becomes
+# ts = mono + offset, however long after it was recorded.
+#
+# Before deep sleep the tracker leaves a handoff ("time_handoff": [boot,
+# mono_s, sleep_s]). The next boot derives a provisional offset from it if the
+# sleeping boot had one; if not, this boot's own sync is carried back to the
+# sleeping boot. Derived offsets are not exact (the sleep timer runs on the
+# RC oscillator) and the records they correct are marked "ts_est".
+import time
+from micropython import const
+from typing import Any, Dict, List, Optional
+
+MAX_BOOTS = const(8)
+MIN_VALID_TS = 1704067200  # 2024-01-01, the same "clock is set" test as NTPClient
+_REWRITE_S = const(2)  # Re-sync moved the offset this far: persist it again
+
+
+class Timebase:
+    def __init__(self, config: Any, max_boots: int = MAX_BOOTS) -> None:
+        if max_boots < 1:
+            raise ValueError("Offset table needs at least one boot")
+        self.config = config
+        self.max_boots = max_boots
+        self.boot = (config.get("boot_id") or 0) + 1
+        config.set("boot_id", self.boot)
+        self._last_ticks = time.ticks_ms()  # type: ignore[attr-defined]
+        self._mono_ms: int = self._last_ticks  # ticks_ms starts at boot
+        self._offsets: Dict[int, List[int]] = {}  # boot -> [offset_s, exact]
+        self.revision = 0  # Bumped whenever an offset is added or moves
+        self._handoff: Optional[List[int]] = None
+        self._load()
+
+    # --- Clock ---
+
+    def mono_ms(self) -> int:
+        """Milliseconds since boot; must be called more often than ticks_ms wraps"""
+        now = time.ticks_ms()  # type: ignore[attr-defined]
+        self._mono_ms += time.ticks_diff(now, self._last_ticks)  # type: ignore[attr-defined]
+        self._last_ticks = now
+        return self._mono_ms
+
+    def mono(self) -> int:
+        return self.mono_ms() // 1000
+
+    def offset(self, boot: int) -> Optional[int]:
+        e = self._offsets.get(boot)
+        return e[0] if e else None
+
+    def exact(self, boot: int) -> bool:
+        e = self._offsets.get(boot)
+        return bool(e and e[1])
+
+    def now(self) -> int:
+        """UTC seconds, or 0 while this boot has no offset"""
+        off = self.offset(self.boot)
+        return self.mono() + off if off is not None else 0
+
+    # --- Records ---
+
+    def stamp(self, rec: Dict[str, Any]) -> Dict[str, Any]:
+        """Tag a record with this boot and its monotonic time; "ts" if already known"""
+        rec["boot"] = self.boot
+        rec["mono"] = self.mono()
+        rec.pop("ts_est", None)
+        rec["ts"] = self.now()
+        return rec
+
+    def correct(self, rec: Dict[str, Any]) -> bool:
+        """Fill in "ts" from the offset table; False if the record's boot is unknown"""
+        boot = rec.get("boot")
+        if boot is None:
+            return (rec.get("ts") or 0) >= MIN_VALID_TS  # Not stamped: as good as it gets
+        e = self._offsets.get(boot)
+        if e is None:
+            return False
+        rec["ts"] = rec["mono"] + e[0]
+        if e[1]:
+            rec.pop("ts_est", None)
+        else:
+            rec["ts_est"] = True
+        return True
+
+    # --- Offset table ---
+
+    def synced(self, utc: int) -> None:
+        """The RTC was just set to UTC (NTP); record this boot's offset"""
+        if utc < MIN_VALID_TS:
+            return
+        offset = int(utc) - self.mono()
+        e = self._offsets.get(self.boot)
+        if e and e[1] and abs(e[0] - offset) < _REWRITE_S:
+            return  # Daily re-sync within the drift: no config write
+        self._offsets[self.boot] = [offset, 1]
+        h = self._handoff
+        if h and h[0] not in self._offsets:
+            # The boot before our deep sleep never synced: carry this sync back
+            self._offsets[h[0]] = [offset - h[1] - h[2], 0]
+        self._save()
+
+    def before_sleep(self, sleep_ms: int) -> None:
+        """Leave the next boot enough to continue the timeline"""
+        self.config.set("time_handoff", [self.boot, self.mono(), sleep_ms // 1000])
+
+    def _load(self) -> None:
+        saved = self.config.get("time_offsets")
+        for row in saved if isinstance(saved, list) else ():
+            try:
+                self._offsets[int(row[0])] = [int(row[1]), 1 if row[2] else 0]
+            except (TypeError, ValueError, IndexError):
+                continue
+        h = self.config.get("time_handoff")
+        if not isinstance(h, list) or len(h) != 3:
+            return
+        self.config.set("time_handoff", None)  # One wake per handoff
+        if h[0] != self.boot - 1:
+            return
+        self._handoff = h
+        prev = self._offsets.get(h[0])
+        if prev is not None:
+            self._offsets[self.boot] = [prev[0] + h[1] + h[2], 0]
+            self._save()
+
+    def _save(self) -> None:
+        boots = sorted(self._offsets)[-self.max_boots :]
+        self._offsets = {b: self._offsets[b] for b in boots}
+        self.config.set("time_offsets", [[b] + self._offsets[b] for b in boots])
+        self.revision += 1
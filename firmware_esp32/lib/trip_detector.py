@@ -0,0 +1,242 @@
+# trip_detector.py - Trip segmentation from GPS speed, fix status and IMU motion
+#
+# States (published as data_store["trip_state"]; 0 means idle):
+#   TRIP_IDLE     parked, no trip open
+#   TRIP_MOVING   in a trip and moving
+#   TRIP_STOPPED  in a trip but stationary (delivery stop); the trip ends once
+#                 the stop lasts `end_s`
+#
+# Hysteresis: a trip starts or resumes after `start_s` of continuous movement
+# (speed >= start_kmh with a fix, IMU motion without one) and a stop begins
+# after `stop_s` below stop_kmh. Speeds between the two thresholds never change
+# state, so GPS jitter at rest and crawling in traffic do not flap.
+import math
+import time
+from micropython import const
+from typing import Any, Dict, Optional
+
+TRIP_IDLE = const(0)
+TRIP_MOVING = const(1)
+TRIP_STOPPED = const(2)
+
+TRIP_EVT_NONE = const(0)
+TRIP_EVT_START = const(1)
+TRIP_EVT_END = const(2)
+
+EARTH_RADIUS_M = 6371008.8
+_MAX_SEGMENT_KMH = const(250)  # Faster implied speed between fixes = GPS glitch
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in metres"""
+    p1 = math.radians(lat1)
+    p2 = math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class TripDetector:
+    """Feed every sensor sample to `update()`; read `summary` after TRIP_EVT_END"""
+
+    def __init__(
+        self,
+        start_kmh: float = 8.0,
+        stop_kmh: float = 3.0,
+        start_s: int = 10,
+        stop_s: int = 30,
+        end_s: int = 600,
+        motion_threshold: int = 15,
+    ) -> None:
+        if not 0 <= stop_kmh < start_kmh:
+            raise ValueError("Trip stop speed must be below start speed")
+        if start_s < 0 or stop_s < 0 or end_s < stop_s:
+            raise ValueError("Invalid trip timing")
+        self._start_kmh = start_kmh
+        self._stop_kmh = stop_kmh
+        self._start_ms = start_s * 1000
+        self._stop_ms = stop_s * 1000
+        self._end_ms = end_s * 1000
+        self._motion_threshold = motion_threshold
+
+        self.state: int = TRIP_IDLE
+        self.count = 0  # Trips completed since boot
+        self.motion = 0  # IMU motion energy: EMA of the 0-1000 shock scale
+        self._motion8 = 0  # EMA state, scaled by 8 to stay integer
+        self._cand_ms: Optional[int] = None  # Movement seen since (start / resume)
+        self._cand_ts = 0
+        self._still_ms: Optional[int] = None  # Stationary since
+        self._still_ts = 0
+        self.summary: Dict[str, Any] = {}
+        # Per-trip statistics, reset by _reset_trip()
+        self.temp_min: Optional[float] = None
+        self.temp_max: Optional[float] = None
+        self.start_lat: Optional[float] = None
+        self.start_lon: Optional[float] = None
+        self.end_lat: Optional[float] = None
+        self.end_lon: Optional[float] = None
+        self.max_speed = 0.0
+        self._last_lat: Optional[float] = None
+        self._reset_trip()
+
+    @property
+    def active(self) -> bool:
+        return self.state != TRIP_IDLE
+
+    def note_shock(self) -> None:
+        """Count a captured shock event against the open trip"""
+        if self.state != TRIP_IDLE:
+            self.shocks += 1
+
+    def update(self, data: Dict[str, Any], now_ms: int, ts: int) -> int:
+        """Feed one sample (ticks_ms, UTC seconds); returns a TRIP_EVT_* code"""
+        self._motion8 += data.get("shock", 0) - (self._motion8 >> 3)
+        self.motion = self._motion8 >> 3
+        fix = bool(data.get("gps_fix"))
+        speed = data.get("speed", 0.0) if fix else 0.0
+        if fix:
+            moving = speed >= self._start_kmh
+            still = speed < self._stop_kmh
+        else:
+            moving = self.motion >= self._motion_threshold
+            still = not moving
+
+        if self.state == TRIP_IDLE:
+            return self._idle(data, moving, now_ms, ts)
+        self._track(data, fix, speed, now_ms)
+        if self.state == TRIP_MOVING:
+            self._moving(still, now_ms, ts)
+            return TRIP_EVT_NONE
+        return self._stopped(data, moving, now_ms)
+
+    def _idle(self, data: Dict[str, Any], moving: bool, now_ms: int, ts: int) -> int:
+        if not moving:
+            self._cand_ms = None
+            self._last_lat = None
+            return TRIP_EVT_NONE
+        if self._cand_ms is None:
+            # Trip is backdated to the first moving sample, distance counts from here
+            self._cand_ms = now_ms
+            self._cand_ts = ts
+            if data.get("gps_fix"):
+                self._last_lat = data["lat"]
+                self._last_lon = data["lon"]
+                self._last_ms = now_ms
+            return TRIP_EVT_NONE
+        if time.ticks_diff(now_ms, self._cand_ms) < self._start_ms:  # type: ignore
+            return TRIP_EVT_NONE
+
+        self._reset_trip()
+        self.state = TRIP_MOVING
+        self._trip_ms = self._cand_ms
+        self.start_ts = self._cand_ts
+        self._cand_ms = None
+        self._still_ms = None
+        self._track(data, bool(data.get("gps_fix")), data.get("speed", 0.0), now_ms)
+        return TRIP_EVT_START
+
+    def _moving(self, still: bool, now_ms: int, ts: int) -> None:
+        if not still:
+            self._still_ms = None
+            return
+        if self._still_ms is None:
+            self._still_ms = now_ms
+            self._still_ts = ts
+        elif time.ticks_diff(now_ms, self._still_ms) >= self._stop_ms:  # type: ignore
+            self.state = TRIP_STOPPED
+            self._cand_ms = None
+
+    def _stopped(self, data: Dict[str, Any], moving: bool, now_ms: int) -> int:
+        still_ms = self._still_ms if self._still_ms is not None else now_ms
+        if moving:
+            if self._cand_ms is None:
+                self._cand_ms = now_ms
+            elif time.ticks_diff(now_ms, self._cand_ms) >= self._start_ms:  # type: ignore
+                # Delivery stop over: the stop lasted until movement began
+                self.idle_ms += time.ticks_diff(self._cand_ms, still_ms)  # type: ignore
+                self.stops += 1
+                self.state = TRIP_MOVING
+                self._cand_ms = None
+                self._still_ms = None
+            return TRIP_EVT_NONE
+        self._cand_ms = None
+        if time.ticks_diff(now_ms, still_ms) < self._end_ms:  # type: ignore
+            return TRIP_EVT_NONE
+        self._finish(still_ms)
+        return TRIP_EVT_END
+
+    def _track(self, data: Dict[str, Any], fix: bool, speed: float, now_ms: int) -> None:
+        """Per-sample trip statistics while a trip is open"""
+        temp = data.get("temp")
+        if temp is not None:
+            if self.temp_min is None or temp < self.temp_min:
+                self.temp_min = temp
+            if self.temp_max is None or temp > self.temp_max:
+                self.temp_max = temp
+        if not fix:
+            return
+        if speed > self.max_speed:
+            self.max_speed = speed
+        lat = data["lat"]
+        lon = data["lon"]
+        if self.start_lat is None:
+            self.start_lat = lat
+            self.start_lon = lon
+        self.end_lat = lat
+        self.end_lon = lon
+        if speed < self._stop_kmh:
+            return  # Stationary: position jitter is not distance
+        if self._last_lat is not None:
+            d = haversine_m(self._last_lat, self._last_lon, lat, lon)
+            dt = time.ticks_diff(now_ms, self._last_ms)  # type: ignore
+            if d * 3600 <= _MAX_SEGMENT_KMH * max(dt, 1):
+                self.distance_m += d
+        self._last_lat = lat
+        self._last_lon = lon
+        self._last_ms = now_ms
+
+    def _reset_trip(self) -> None:
+        self.start_ts = 0
+        self._trip_ms = 0
+        self.distance_m = 0.0
+        self.max_speed = 0.0
+        self.idle_ms = 0
+        self.stops = 0
+        self.shocks = 0
+        self.temp_min = None
+        self.temp_max = None
+        self.start_lat = None
+        self.start_lon = None
+        self.end_lat = None
+        self.end_lon = None
+        if self.state == TRIP_IDLE and self._cand_ms is not None:
+            return  # Keep the candidate start point
+        self._last_lat = None
+        self._last_lon = 0.0
+        self._last_ms = 0
+
+    def _finish(self, end_ms: int) -> None:
+        """Close the trip at the moment the final stop began"""
+        self.count += 1
+        self.state = TRIP_IDLE
+        self._still_ms = None
+        self._cand_ms = None
+        self.summary = {
+            "event": "trip",
+            "trip": self.count,
+            "start_ts": self.start_ts,
+            "end_ts": self._still_ts,
+            "duration_s": time.ticks_diff(end_ms, self._trip_ms) // 1000,  # type: ignore
+            "distance_m": int(self.distance_m + 0.5),
+            "max_speed": round(self.max_speed, 1),
+            "idle_s": self.idle_ms // 1000,
+            "stops": self.stops,
+            "shocks": self.shocks,
+            "temp_min": self.temp_min,
+            "temp_max": self.temp_max,
+            "start_lat": self.start_lat,
+            "start_lon": self.start_lon,
+            "end_lat": self.end_lat,
+            "end_lon": self.end_lon,
+        }
@@ -0,0 +1,80 @@
+# upload_window.py - Duty-cycled WiFi: radio on only while an upload batch is due
+#
+# Instead of keeping the station associated, the cloud task opens a window:
+# power up and connect, drain the upload queue in batches, run the pending
+# jobs (live snapshot, remote config / OTA checks), then disconnect and power
+# the interface down. Each window's radio-on time and bytes sent are recorded.
+import time
+from micropython import const
+from typing import Any, Awaitable, Callable, List, Sequence
+
+WIN_OFF = const(0)
+WIN_CONNECTING = const(1)
+WIN_OPEN = const(2)
+WIN_CLOSING = const(3)
+STATE_NAMES = ("off", "connecting", "open", "closing")
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class UploadWindow:
+    def __init__(self, wifi: Any, poster: Any, batch_size: int = 10, diagnostics: Any = None):
+        if batch_size <= 0:
+            raise ValueError("Upload batch size must be > 0")
+        self.wifi = wifi
+        self.poster = poster
+        self.batch_size = batch_size
+        self.diagnostics = diagnostics
+        self.state = WIN_OFF
+        self.windows = 0
+        self.last_on_ms = 0
+        self.last_bytes = 0
+        self.last_records = 0
+        self.total_on_ms = 0
+        self.total_bytes = 0
+
+    async def run(self, queue: List[Any], jobs: Sequence[Job] = ()) -> bool:
+        """One window; False if the link could not be brought up (the queue is kept)"""
+        start = time.ticks_ms()  # type: ignore[attr-defined]
+        bytes0 = self.poster.bytes_sent
+        self.last_records = 0
+        self.state = WIN_CONNECTING
+        online: bool = False
+        try:
+            online = await self.wifi.connect()
+            if online:
+                self.state = WIN_OPEN
+                self.last_records = await self._drain(queue)
+                for job in jobs:
+                    await job()
+        finally:
+            self.state = WIN_CLOSING
+            await self.wifi.disconnect()  # Also powers the interface down
+            self.state = WIN_OFF
+            self._account(start, self.poster.bytes_sent - bytes0)
+        return online
+
+    async def _drain(self, queue: List[Any]) -> int:
+        """Oldest first, batch_size records per request; stops at the first failure"""
+        sent = 0
+        while queue:
+            batch = queue[: self.batch_size]
+            if not await self.poster.post_records(batch):
+                break
+            del queue[: len(batch)]
+            sent += len(batch)
+        return sent
+
+    def _account(self, start_ms: int, nbytes: int) -> None:
+        ms = time.ticks_diff(time.ticks_ms(), start_ms)  # type: ignore[attr-defined]
+        self.windows += 1
+        self.last_on_ms = ms
+        self.last_bytes = nbytes
+        self.total_on_ms += ms
+        self.total_bytes += nbytes
+        d = self.diagnostics
+        if d:
+            d.observe("wifi_window_ms", ms)
+            d.set_gauge("wifi_windows", self.windows)
+            d.set_gauge("wifi_window_bytes", nbytes)
+            d.set_gauge("wifi_radio_on_s", self.total_on_ms // 1000)
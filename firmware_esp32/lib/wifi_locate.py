@@ -0,0 +1,147 @@
+# wifi_locate.py - WiFi positioning fallback: scan fingerprints and a BSSID location cache
+#
+# Without a GPS fix, the access points from a scan are condensed into a
+# fingerprint, strongest first: [["<bssid hex>", rssi], ...]. If enough of its
+# BSSIDs are in the cache, the position is their RSSI-weighted centroid and no
+# request is needed. Otherwise the fingerprint is uploaded, and the server's
+# reply fills the cache:
+#
+#   {"wifi_loc": {"lat": .., "lon": .., "acc": ..,
+#                 "aps": {"<bssid hex>": [lat, lon, acc], ...}}}   ("aps" optional)
+#
+# Without "aps", the fingerprint's strongest BSSIDs take the device position.
+# The cache is an LRU of `capacity` BSSIDs, persisted in config as "wifi_loc_cache".
+import time
+import ubinascii
+from micropython import const
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+MAX_APS = const(8)  # Fingerprint size, strongest first
+LEARN_APS = const(3)  # BSSIDs that take the device position when the server gives no "aps"
+MIN_ACC_M = const(20)
+
+Fingerprint = List[List[Any]]
+
+
+def fingerprint(networks: Sequence[Any], max_aps: int = MAX_APS) -> Fingerprint:
+    """Raw wlan.scan() tuples (ssid, bssid, channel, rssi, ...) to [[bssid hex, rssi]]"""
+    aps = []
+    for n in networks:
+        if n[0].endswith(b"_nomap"):
+            continue  # Owner opted out of location services
+        aps.append([ubinascii.hexlify(bytes(n[1])).decode(), n[3]])
+    aps.sort(key=lambda a: a[1], reverse=True)
+    return aps[:max_aps]
+
+
+class WifiLocator:
+    def __init__(self, config: Any, capacity: int = 32, min_hits: int = 1) -> None:
+        if capacity < 1 or min_hits < 1:
+            raise ValueError("Cache capacity and min_hits must be >= 1")
+        self.config = config
+        self.capacity = capacity
+        self.min_hits = min_hits
+        self._cache: Dict[str, List[float]] = {}  # bssid -> [lat, lon, acc_m, last use]
+        self._clock = 0  # LRU use counter
+        self.pending: Optional[Fingerprint] = None  # Awaiting a server answer
+        self.lat = 0.0
+        self.lon = 0.0
+        self.acc_m = 0
+        self.fix_ms: Optional[int] = None  # ticks_ms of the last resolved position
+        self.lookups = 0
+        self.hits = 0
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def observe(self, networks: Sequence[Any], now_ms: int) -> bool:
+        """A scan while GPS has no fix; True if the cache resolved it locally"""
+        fp = fingerprint(networks)
+        if not fp:
+            return False
+        self.lookups += 1
+        pos = self.resolve(fp)
+        if pos is None:
+            self.pending = fp
+            return False
+        self.hits += 1
+        self.pending = None
+        self._set(pos, now_ms)
+        return True
+
+    def resolve(self, fp: Fingerprint) -> Optional[Tuple[float, float, int]]:
+        """RSSI-weighted centroid of the cached BSSIDs in a fingerprint"""
+        w_sum = lat = lon = acc = 0.0
+        hits = 0
+        for bssid, rssi in fp:
+            e = self._cache.get(bssid)
+            if e is None:
+                continue
+            self._clock += 1
+            e[3] = self._clock
+            w = max(1, rssi + 100)  # -40 dBm counts 6x more than -90 dBm
+            lat += e[0] * w
+            lon += e[1] * w
+            acc += e[2] * w
+            w_sum += w
+            hits += 1
+        if hits < self.min_hits:
+            return None
+        return lat / w_sum, lon / w_sum, max(MIN_ACC_M, int(acc / w_sum))
+
+    def learn(self, fp: Fingerprint, reply: Any, now_ms: int) -> bool:
+        """Cache the server's answer for an uploaded fingerprint"""
+        loc = reply.get("wifi_loc") if isinstance(reply, dict) else None
+        if not isinstance(loc, dict):
+            return False
+        try:
+            acc = max(MIN_ACC_M, int(loc.get("acc", 50)))
+            pos = (float(loc["lat"]), float(loc["lon"]), acc)
+            aps = loc.get("aps")
+            if isinstance(aps, dict):
+                for bssid, ap in aps.items():
+                    ap_acc = int(ap[2]) if len(ap) > 2 else acc
+                    self._put(bssid, float(ap[0]), float(ap[1]), ap_acc)
+            else:
+                for bssid, _ in fp[:LEARN_APS]:
+                    self._put(bssid, pos[0], pos[1], pos[2])
+        except (KeyError, TypeError, ValueError, IndexError):
+            return False
+        if self.pending is fp:
+            self.pending = None
+        self._set(pos, now_ms)
+        lru = sorted(self._cache.items(), key=lambda kv: kv[1][3])  # Reloads in LRU order
+        self.config.set("wifi_loc_cache", [[b] + e[:3] for b, e in lru])
+        return True
+
+    def age_ms(self, now_ms: int) -> Optional[int]:
+        if self.fix_ms is None:
+            return None
+        age: int = time.ticks_diff(now_ms, self.fix_ms)  # type: ignore[attr-defined]
+        return age
+
+    def _set(self, pos: Tuple[float, float, int], now_ms: int) -> None:
+        self.lat, self.lon, self.acc_m = pos
+        self.fix_ms = now_ms
+
+    def _put(self, bssid: str, lat: float, lon: float, acc: int) -> None:
+        if bssid not in self._cache and len(self._cache) >= self.capacity:
+            oldest = min(self._cache, key=lambda b: self._cache[b][3])
+            del self._cache[oldest]
+        self._clock += 1
+        self._cache[bssid] = [lat, lon, acc, self._clock]
+
+    def _load(self) -> None:
+        saved = self.config.get("wifi_loc_cache")
+        if not isinstance(saved, list):
+            return
+        for row in saved[-self.capacity :]:
+            try:
+                self._put(str(row[0]), float(row[1]), float(row[2]), int(row[3]))
+            except (TypeError, ValueError, IndexError):
+                continue
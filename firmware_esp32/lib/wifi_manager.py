@@ -1,7 +1,15 @@
 import network
+import time
+import ubinascii
 import uasyncio as asyncio
+from lib.known_networks import BACKOFF_MIN_S, KnownNetworks
 from lib.logger import Logger
-from typing import Any, Callable, Optional, Tuple, List
+from typing import Any, Callable, Dict, Optional, Tuple, List
+
+POLL_MS = 50  # Link status poll while connecting
+FAST_TIMEOUT_MS = 4000  # Cached-link attempt before falling back to a full connect
+FULL_TIMEOUT_MS = 15000
+SCAN_POLL_MS = 20  # Scan completion poll; the event loop runs in between
 
 
 class WiFiManager:
@@ -11,6 +19,7 @@ class WiFiManager:
         status_led_callback: Optional[Callable[[Tuple[int, int, int]], None]] = None,
         ntp_client: Any = None,
         ble_connected_check: Optional[Callable[[], bool]] = None,
+        diagnostics: Any = None,
     ) -> None:
         self.config = config
         self.wlan = network.WLAN(network.STA_IF)
@@ -19,42 +28,182 @@ class WiFiManager:
         self.ntp_client = ntp_client
         self._connecting = False
         self._ble_connected_check = ble_connected_check
+        self.diagnostics = diagnostics
+        self.last_connect_ms = 0
+        self.last_status = 0  # wlan.status() when the last attempt ended
+        # Last scan_networks() result, for the BSSID of the AP we connect to
+        self._last_scan: List[Tuple[str, int, int, int, bytes]] = []
+        self._scan_ms: Optional[int] = None  # ticks_ms of the last successful scan
+        self._scanning = False
+        self.on_scan: Optional[Callable[[List[Any]], None]] = None  # Raw results, every scan
+        self.known = KnownNetworks(config)
+        self.ssid = ""  # Network of the current / last link
 
-    async def connect(self, on_status_change: Optional[Callable[[str, str], None]] = None) -> bool:
-        """Attempt to connect to WiFi using configured credentials"""
+    async def connect(
+        self,
+        on_status_change: Optional[Callable[[str, str], None]] = None,
+        ssid: Optional[str] = None,
+    ) -> bool:
+        """Connect to the best known network, or to `ssid` regardless of its backoff"""
         if self._connecting:
             Logger.log("WiFi: Connection already in progress. Skipping.")
             return False
 
-        ssid = self.config.get("wifi_ssid")
-        password = self.config.get("wifi_pass")
-
-        if not ssid:
+        self.known.refresh()
+        if not self.known.networks:
             Logger.log("WiFi: No SSID configured.")
             if on_status_change:
                 on_status_change("FAILED", "No SSID")
             return False
 
         if self.wlan.isconnected():
-            Logger.log(f"WiFi: Already connected to {ssid}")
+            Logger.log(f"WiFi: Already connected to {self.ssid}")
             if on_status_change:
-                on_status_change("CONNECTED", ssid)
+                on_status_change("CONNECTED", self.ssid)
             # Ensure time is synced even if already connected
-            if self.ntp_client and not self.ntp_client.is_synced():
-                self.ntp_client.sync()
+            if self.ntp_client and self.ntp_client.due():
+                await self.ntp_client.sync()
             return True
 
-        Logger.log(f"WiFi: Connecting to {ssid}...")
         self._connecting = True
+        target = None
+        ok = False
         try:
             if not self.wlan.active():
                 self.wlan.active(True)
+            target = self.known.find(ssid) if ssid else await self._choose()
+            if target is not None:
+                ssid = target["ssid"]
+                Logger.log(f"WiFi: Connecting to {ssid}...")
+                ok = await self._connect_to(ssid, target["pass"])
+        finally:
+            self._connecting = False
+
+        if target is None or ssid is None:
+            Logger.log("WiFi: No known network in range")
+            if on_status_change:
+                on_status_change("FAILED", "No Known Network")
+            return False
+        self.known.record(ssid, ok, time.ticks_ms(), int(time.time()))  # type: ignore
+
+        if ok:
+            Logger.log(f"WiFi: Connected! IP: {self.wlan.ifconfig()[0]}")
+            if self._set_led:
+                self._set_led((0, 10, 0))  # Green success flash
+
+            # Sync time when the drift estimate says the clock needs it
+            if self.ntp_client and self.ntp_client.due():
+                await self.ntp_client.sync()
+
+            self.ssid = ssid
+            if on_status_change:
+                on_status_change("CONNECTED", ssid)
+            return True
+
+        Logger.log(f"WiFi: Connection failed. Status: {self.last_status}")
+        if self._set_led:
+            self._set_led((10, 0, 0))  # Red failure flash
+            await asyncio.sleep_ms(500)
+            self._set_led((0, 0, 0))
+
+        if on_status_change:
+            err = "Timeout"
+            status = self.last_status  # Read before the link was torn down
+            if status == network.STAT_WRONG_PASSWORD:  # type: ignore
+                err = "Wrong Password"
+            elif status == network.STAT_NO_AP_FOUND:  # type: ignore
+                err = "AP Not Found"
+            elif status == network.STAT_CONNECT_FAIL:  # type: ignore
+                err = "Connect Fail"
+            on_status_change("FAILED", err)
+
+        return False
+
+    async def _choose(self) -> Optional[Dict[str, Any]]:
+        """Known network to try: without a fresh scan, the only candidate or the cached
+        link's network (keeps the fast path scan-free); otherwise ranked from a scan"""
+        now = time.ticks_ms()  # type: ignore[attr-defined]
+        ttl_ms = (self.config.get("wifi_scan_ttl_sec") or 0) * 1000
+        scan_ms = self._scan_ms
+        fresh = scan_ms is not None and time.ticks_diff(now, scan_ms) < ttl_ms  # type: ignore
+        if not fresh:
+            eligible = self.known.eligible(now)
+            if len(eligible) == 1:
+                return eligible[0]
+            cache = self.config.get("wifi_link_cache")
+            for e in eligible:
+                if isinstance(cache, dict) and e["ssid"] == cache.get("ssid"):
+                    return e
+            if not eligible:
+                return None
+        return self.known.select(await self.scan_networks(), now)
+
+    async def _connect_to(self, ssid: str, password: str) -> bool:
+        cache = self._cached_link(ssid)
+        ok = cache is not None and await self._connect_fast(ssid, password, cache)
+        return ok or await self._connect_full(ssid, password)
+
+    def _cached_link(self, ssid: str) -> Optional[Dict[str, Any]]:
+        cache = self.config.get("wifi_link_cache")
+        if not isinstance(cache, dict) or cache.get("ssid") != ssid:
+            return None
+        return cache
+
+    async def _connect_fast(self, ssid: str, password: str, cache: Dict[str, Any]) -> bool:
+        """Targeted reconnect to the cached AP, reusing the DHCP lease while it is fresh"""
+        start = time.ticks_ms()  # type: ignore[attr-defined]
+        ttl = self.config.get("wifi_lease_ttl_sec") or 0
+        age = int(time.time()) - int(cache.get("dhcp_ts") or 0)
+        static = 0 <= age < ttl and len(cache.get("ip") or ()) == 4
+        ok = False
+        try:
+            if static:
+                self.wlan.ifconfig(tuple(cache["ip"]))  # No DHCP round trips
+            else:
+                self.wlan.ifconfig("dhcp")  # Drop a static lease left by an earlier fast reconnect
+            if cache.get("channel"):
+                self.wlan.config(channel=cache["channel"])
+            if cache.get("bssid"):
+                self.wlan.connect(ssid, password, bssid=ubinascii.unhexlify(cache["bssid"]))
+            else:
+                self.wlan.connect(ssid, password)
+            ok = await self._wait_connected(FAST_TIMEOUT_MS)
+        except Exception as e:
+            Logger.log(f"WiFi: Fast reconnect error: {e}")
+        if ok:
+            self._observe("wifi_fast_ms", start)
+            self._remember(ssid, dhcp=not static)
+            return True
+
+        Logger.log("WiFi: Fast reconnect failed, dropping cached link")
+        if self.diagnostics:
+            self.diagnostics.increment("wifi_fast_fail")
+        self.config.set("wifi_link_cache", None)
+        self._abort()
+        if static:
+            try:
+                self.wlan.ifconfig("dhcp")
+            except Exception as e:
+                Logger.log(f"WiFi: DHCP restore failed: {e}")
+        return False
+
+    async def _connect_full(self, ssid: str, password: str) -> bool:
+        """Scan, associate and DHCP"""
+        start = time.ticks_ms()  # type: ignore[attr-defined]
+        try:
             self.wlan.connect(ssid, password)
         except Exception as e:
             Logger.log(f"WiFi: Immediate connect error: {e}")
-            self._connecting = False
             return False
+        if await self._wait_connected(FULL_TIMEOUT_MS):
+            self._observe("wifi_full_ms", start)
+            self._remember(ssid, dhcp=True)
+            return True
+        self._abort()
+        return False
 
+    async def _wait_connected(self, timeout_ms: int) -> bool:
+        """Poll the link every POLL_MS; stops early on a definite failure"""
         # Status mapping for MicroPython network.WLAN
         # 1000: STAT_IDLE
         # 1001: STAT_CONNECTING
@@ -63,67 +212,68 @@ class WiFiManager:
         # 202:  STAT_WRONG_PASSWORD
         # 203:  STAT_BEACON_TIMEOUT
         # 204:  STAT_ASSOC_FAIL
-
-        # Wait for connection with timeout
-        for i in range(30):  # 30 attempts * 0.5s = 15s timeout
-            status = self.wlan.status()
+        start = time.ticks_ms()  # type: ignore[attr-defined]
+        polls = 0
+        while True:
             if self.wlan.isconnected():
-                Logger.log(f"WiFi: Connected! IP: {self.wlan.ifconfig()[0]}")
-                self._connecting = False
-                if self._set_led:
-                    self._set_led((0, 10, 0))  # Green success flash
-
-                # Sync Time
-                if self.ntp_client:
-                    self.ntp_client.sync()
-
-                if on_status_change:
-                    on_status_change("CONNECTED", ssid)
                 return True
-
+            status = self.last_status = self.wlan.status()
             if status == network.STAT_WRONG_PASSWORD:  # type: ignore
                 Logger.log("WiFi: Error - Wrong Password")
-                break
+                return False
             elif status == network.STAT_NO_AP_FOUND:  # type: ignore
                 Logger.log("WiFi: Error - AP Not Found")
-                break
+                return False
             elif status == network.STAT_CONNECT_FAIL:  # type: ignore
                 Logger.log("WiFi: Error - Connect Fail")
-                break
-
-            if i % 4 == 0:
+                return False
+            elapsed = time.ticks_diff(time.ticks_ms(), start)  # type: ignore[attr-defined]
+            if elapsed >= timeout_ms:
+                return False
+            if polls % 40 == 0:
                 Logger.log(f"WiFi: Status={status}...")
-
-            if self._set_led:
-                self._set_led((0, 0, 10))  # Blue working flash
-            await asyncio.sleep_ms(250)
             if self._set_led:
-                self._set_led((0, 0, 0))
-            await asyncio.sleep_ms(250)
+                # Blue working flash, 250 ms on / 250 ms off
+                self._set_led((0, 0, 10) if (elapsed // 250) % 2 == 0 else (0, 0, 0))
+            polls += 1
+            await asyncio.sleep_ms(POLL_MS)  # type: ignore
 
-        Logger.log(f"WiFi: Connection failed. Status: {self.wlan.status()}")
+    def _abort(self) -> None:
         try:
             self.wlan.disconnect()
         except Exception as e:
             Logger.log(f"WiFi: Disconnect failed to execute: {e}")
-        self._connecting = False
-        if self._set_led:
-            self._set_led((10, 0, 0))  # Red failure flash
-            await asyncio.sleep_ms(500)
-            self._set_led((0, 0, 0))
 
-        if on_status_change:
-            err = "Timeout"
-            status = self.wlan.status()
-            if status == network.STAT_WRONG_PASSWORD:  # type: ignore
-                err = "Wrong Password"
-            elif status == network.STAT_NO_AP_FOUND:  # type: ignore
-                err = "AP Not Found"
-            elif status == network.STAT_CONNECT_FAIL:  # type: ignore
-                err = "Connect Fail"
-            on_status_change("FAILED", err)
+    def _observe(self, metric: str, start_ms: int) -> None:
+        ms = time.ticks_diff(time.ticks_ms(), start_ms)  # type: ignore[attr-defined]
+        self.last_connect_ms = ms
+        if self.diagnostics:
+            self.diagnostics.observe(metric, ms)
 
-        return False
+    def _remember(self, ssid: str, dhcp: bool) -> None:
+        """Cache the AP, channel and (after DHCP) the lease; config is written only on change"""
+        old = self._cached_link(ssid) or {}
+        channel = old.get("channel", 0)
+        try:
+            channel = int(self.wlan.config("channel"))
+        except Exception:
+            pass  # Not reported by every port
+        cache: Dict[str, Any] = {
+            "ssid": ssid,
+            "bssid": old.get("bssid", "") if channel == old.get("channel") else "",
+            "channel": channel,
+            "ip": old.get("ip", []),
+            "dhcp_ts": old.get("dhcp_ts", 0),
+        }
+        for n in self._last_scan:  # Strongest first
+            if n[0] == ssid and (not channel or n[2] == channel):
+                cache["bssid"] = ubinascii.hexlify(n[4]).decode()
+                break
+        if dhcp:
+            cache["ip"] = list(self.wlan.ifconfig())
+            cache["dhcp_ts"] = int(time.time())
+        if cache != old:
+            self.config.set("wifi_link_cache", cache)
 
     async def disconnect(self) -> bool:
         """Disconnect from WiFi and de-activate interface"""
@@ -137,10 +287,7 @@ class WiFiManager:
         return bool(self.wlan.isconnected())
 
     async def manage_connection(self) -> None:
-        """Background task to keep WiFi alive with exponential backoff"""
-        retry_interval = 60  # Initial retry interval in seconds
-        max_retry_interval = 3600  # Max retry interval in seconds (1 hour)
-
+        """Background task to keep WiFi alive; retries follow each network's backoff"""
         while True:
             # Check BLE connection status before attempting to reconnect WiFi
             # We want to avoid active WiFi connect attempts interfering with BLE
@@ -151,47 +298,93 @@ class WiFiManager:
                 except Exception as e:
                     Logger.log(f"WiFi: BLE check error: {e}")
 
+            wait = BACKOFF_MIN_S
             if not ble_connected and not self.wlan.isconnected() and not self._connecting:
-                ssid = self.config.get("wifi_ssid")
-                if ssid:  # Only try if we have config
-                    success = await self.connect()
-                    if success:
-                        retry_interval = 60  # Reset on successful connection
-                    else:
-                        # Double retry interval on failure
-                        retry_interval = min(retry_interval * 2, max_retry_interval)
-                        Logger.log(
-                            f"WiFi: Connection failed, backoff active. Next retry in {retry_interval}s"
-                        )
-            else:
-                if self.wlan.isconnected():
-                    retry_interval = 60  # Reset if currently connected
+                self.known.refresh()
+                if self.known.networks and not await self.connect():
+                    wait = self.known.retry_in_s(time.ticks_ms())  # type: ignore[attr-defined]
+                    Logger.log(f"WiFi: Connection failed, backoff active. Next retry in {wait}s")
+
+            await asyncio.sleep(wait)
+
+    async def scan_networks(
+        self, max_age_s: Optional[int] = None
+    ) -> List[Tuple[str, int, int, int, bytes]]:
+        """Scan for available WiFi networks.
 
-            await asyncio.sleep(retry_interval)
+        Returns (ssid, rssi, channel, authmode, bssid) per SSID, strongest first.
+        A result younger than max_age_s (default wifi_scan_ttl_sec, 0 forces a
+        scan) is reused, and callers arriving mid-scan share the one in flight.
+        """
+        if max_age_s is None:
+            max_age_s = self.config.get("wifi_scan_ttl_sec") or 0
+        if self._scan_ms is not None:
+            age = time.ticks_diff(time.ticks_ms(), self._scan_ms)  # type: ignore[attr-defined]
+            if age < max_age_s * 1000:
+                return self._last_scan
+        if self._scanning:
+            while self._scanning:
+                await asyncio.sleep_ms(SCAN_POLL_MS)  # type: ignore
+            return self._last_scan
 
-    async def scan_networks(self) -> List[Tuple[str, int]]:
-        """Scan for available WiFi networks"""
         Logger.log("WiFi: Scanning networks...")
+        self._scanning = True
+        was_active = self.wlan.active()
         self.wlan.active(True)
         try:
             # scan() returns list of tuples: (ssid, bssid, channel, RSSI, authmode, hidden)
-            networks = self.wlan.scan()
+            networks = await self._scan_async()
+            if self.on_scan:
+                self.on_scan(networks)
 
             # Filter empty SSIDs and sort by RSSI (signal strength)
             # Tuple index 0 is SSID, 3 is RSSI
             valid_networks = [n for n in networks if n[0]]
             valid_networks.sort(key=lambda x: x[3], reverse=True)
 
-            unique_ssids: List[Tuple[str, int]] = []
+            unique_ssids: List[Tuple[str, int, int, int, bytes]] = []
             seen = set()
             for n in valid_networks:
                 ssid = n[0].decode("utf-8")
                 if ssid not in seen:
-                    unique_ssids.append((ssid, n[3]))
+                    unique_ssids.append((ssid, n[3], n[2], n[4], bytes(n[1])))
                     seen.add(ssid)
 
+            self._last_scan = unique_ssids
+            self._scan_ms = time.ticks_ms()  # type: ignore[attr-defined]
             Logger.log(f"WiFi: Found {len(unique_ssids)} networks")
             return unique_ssids
         except Exception as e:
             Logger.log(f"WiFi: Scan error: {e}")
             return []
+        finally:
+            self._scanning = False
+            if not was_active and not self._connecting:
+                self.wlan.active(False)  # Upload windows keep the radio off
+
+    async def _scan_async(self) -> List[Any]:
+        """wlan.scan() on a worker thread, polled so sensor/BLE tasks keep running.
+
+        The ESP32 port releases the GIL while the IDF scan blocks. Ports without
+        _thread fall back to the blocking call.
+        """
+        try:
+            import _thread
+        except ImportError:
+            found: List[Any] = self.wlan.scan()
+            return found
+        box: List[Any] = []
+
+        def worker() -> None:
+            try:
+                box.append(self.wlan.scan())
+            except Exception as e:
+                box.append(e)  # Re-raised on the event loop side
+
+        _thread.start_new_thread(worker, ())
+        while not box:
+            await asyncio.sleep_ms(SCAN_POLL_MS)  # type: ignore
+        if isinstance(box[0], Exception):
+            raise box[0]
+        found = box[0]
+        return found
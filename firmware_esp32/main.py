@@ -7,26 +7,75 @@ import ubinascii
 import uasyncio as asyncio
 from machine import Pin, WDT
 from lib.ble_advertising import BLEAdvertiser
+from lib.ble_link import MODE_BULK, MODE_IDLE
 from lib.sensors import SensorHub
 from typing import Any, Dict, Optional, Tuple, List
 
 # from lib.st7789_display import Display
 from lib.config import Config
 from lib.diagnostics import Diagnostics
-from lib.shock_buffer import ShockBuffer
+from lib.shock_buffer import ShockBuffer, ShockEvent
+from lib.shock_classifier import CLASS_NAMES, ShockClassifier
 from lib.ble_ota import BleOta
 from lib.logger import Logger
 from lib.sd_logger import SDLogger
+from lib.sd_archive import SLOT_SIZE
+from lib.timebase import Timebase
+from lib.record_policy import EVT_GEOFENCE, EVT_TRIP, JSON_RECORD_BYTES, RecordPolicy
+from lib.dead_reckoning import DeadReckoner
+from lib.gps_control import MODE_NAMES as GPS_MODES, GpsController
+from lib.geofence import EVENT_NAMES as GEOFENCE_EVENTS, GeofenceEngine
+from lib.trip_detector import TRIP_EVT_END, TRIP_EVT_START, TRIP_MOVING, TripDetector
 from lib.buzzer import Buzzer
 from lib.http_poster import HttpPoster
+from lib.mqtt_uplink import MqttUplink
 from lib.ntp_time import NTPClient
 from lib.wifi_manager import WiFiManager
+from lib.known_networks import DEFAULT_PRIORITY
+from lib.upload_window import UploadWindow
+from lib.remote_config import FETCH_APPLIED, RemoteConfig
+from lib.wifi_locate import WifiLocator
+from lib.espnow_uplink import EspNowRadio, EspNowUplink
+from lib.ble_commands import (
+    OP_IDENTIFY,
+    OP_OTA_CONFIG,
+    OP_REBOOT,
+    OP_RESET_WIFI,
+    OP_SCAN,
+    OP_SHOCK_EVENTS,
+    OP_WIFI_ADD,
+    OP_WIFI_REMOVE,
+    OP_WIFI_SET,
+    ST_ACCEPTED,
+    ST_BAD_ARGS,
+    ST_FAILED,
+    ST_OK,
+    TAG_COUNT,
+    TAG_DETAIL,
+    TAG_FORMAT,
+    TAG_INTERVAL,
+    TAG_OWNER,
+    TAG_PASS,
+    TAG_PRIORITY,
+    TAG_REPO,
+    TAG_SSID,
+    CommandRouter,
+    Request,
+    pack_tlv,
+    parse_ota_text,
+    parse_scan_text,
+    parse_wifi_add_text,
+    parse_wifi_remove_text,
+    parse_wifi_text,
+)
+from lib.scan_packer import ScanPacker, trailer as scan_trailer
 
 
 # Constants
 NEOPIXEL_PIN = 8
 NUM_LEDS = 1
 SERVICE_UUID = "181A"
+UPLOAD_QUEUE_MAX = 50  # Offline records held in RAM
 
 
 class LastMileTracker:
@@ -42,6 +91,7 @@ class LastMileTracker:
             "sensor": time.ticks_ms(),  # type: ignore
             "update": time.ticks_ms(),  # type: ignore
             "cloud": time.ticks_ms(),  # type: ignore
+            "imu": time.ticks_ms(),  # type: ignore
         }
 
         # Rule 5: Critical startup invariant assertions
@@ -83,22 +133,86 @@ class LastMileTracker:
         except Exception:
             self.sensors = None
 
-        self.sd_logger = SDLogger()
-        self.http_poster = HttpPoster(self.config, self.diagnostics)
-        self.shock_buffer = ShockBuffer()
+        # Records carry boot ID + seconds since boot until NTP gives the offset to UTC
+        self.timebase = Timebase(self.config)
+        self.sd_logger = SDLogger(self.diagnostics, self.timebase)
+        self.http_poster = HttpPoster(self.config, self.diagnostics, self.timebase)
+        self.remote = RemoteConfig(self.config, self.diagnostics)
+        self.http_poster.on_reply = self._on_ingest_reply  # Downlink hints
+        self.mqtt: Optional[MqttUplink] = None
+        if self.config.get("ingest_transport") == "mqtt":
+            self._init_mqtt()
+        try:
+            self.shock_buffer = ShockBuffer(
+                rate_hz=self.config.get("shock_rate_hz") or 100,
+                pre_ms=self.config.get("shock_pre_ms") or 200,
+                post_ms=self.config.get("shock_post_ms") or 300,
+                threshold=self.config.get("shock_threshold") or 500,
+            )
+        except ValueError as e:
+            Logger.log(f"Config: Invalid shock capture settings ({e}), using defaults")
+            self.shock_buffer = ShockBuffer()
+        try:
+            self.shock_classifier = ShockClassifier(self.config.get("shock_tree"))
+        except ValueError as e:
+            Logger.log(f"Config: Invalid shock_tree ({e}), using built-in")
+            self.shock_classifier = ShockClassifier()
+        self._init_record_policies()
+        self._upload_now = asyncio.Event()  # Wakes the cloud task for event records
+        try:
+            self.geofence = GeofenceEngine(
+                margin_m=self.config.get("geofence_margin_m") or 20,
+                confirm_s=self.config.get("geofence_confirm_sec") or 5,
+                dwell_s=self.config.get("geofence_dwell_sec") or 300,
+                cell_deg=self.config.get("geofence_cell_deg") or 0.01,
+            )
+        except ValueError as e:
+            Logger.log(f"Config: Invalid geofence settings ({e}), using defaults")
+            self.geofence = GeofenceEngine()
+        self._load_geofences()
+        self.dr: Optional[DeadReckoner] = None
+        if self.config.get("dr_enabled"):
+            try:
+                self.dr = DeadReckoner(
+                    max_outage_s=self.config.get("dr_max_outage_sec") or 120,
+                    still_counts=self.config.get("dr_still_counts") or 200,
+                )
+            except ValueError as e:
+                Logger.log(f"Config: Invalid dead reckoning settings ({e}), disabled")
+        self.wifi_loc: Optional[WifiLocator] = None
+        if self.config.get("wifi_locate"):
+            self.wifi_loc = WifiLocator(
+                self.config, capacity=self.config.get("wifi_loc_cache_size") or 32
+            )
+        self._wifi_loc_hold_ms = (self.config.get("wifi_loc_hold_sec") or 900) * 1000
+        self._wifi_loc_try_ms: Optional[int] = None  # Last fingerprint scan
+        self._fix_seq = -1
+        self.gps: Optional[GpsController] = None
+        if self.sensors and self.config.get("gps_power_mgmt"):
+            self._init_gps(self.sensors)
 
         # Initialized later
         self.ntp: Optional[NTPClient] = None
         self.wifi: Optional[WiFiManager] = None
+        self.mesh: Optional[EspNowUplink] = None
+        self.upload_window: Optional[UploadWindow] = None
+        self._remote_due = False  # Remote checks waiting for the next upload window
 
         # Buzzer Init
         buzzer_pin = self.config.get("buzzer_pin")
         self.buzzer = Buzzer(buzzer_pin)
         self.buzzer.beep(100)  # Boot beep
 
-        self.ble = BLEAdvertiser(name=self.device_id, service_uuid=SERVICE_UUID)
+        self.ble = BLEAdvertiser(
+            name=self.device_id,
+            service_uuid=SERVICE_UUID,
+            adv_interval_ms=self.config.get("adv_interval") or 100,
+        )
         self.ble.set_connect_callbacks(self.handle_ble_connect, self.handle_ble_disconnect)
         self.ota = BleOta(config=self.config, ble=self.ble)
+        self.commands = CommandRouter(self._notify_config)
+        self._scan_packer = ScanPacker()
+        self._register_commands()
         self.ble.set_write_callback(self.handle_ble_write)
 
         # Report firmware version via BLE
@@ -114,8 +228,27 @@ class LastMileTracker:
             "temp": 0.0,
             "shock": 0,
             "gps_fix": False,
+            "pos_est": False,
+            "pos_err_m": 0,
+            "trip_state": 0,
         }
 
+    def _init_gps(self, sensors: SensorHub) -> None:
+        try:
+            self.gps = GpsController(
+                sensors.gps_uart,
+                rate_moving_ms=self.config.get("gps_rate_moving_ms") or 1000,
+                rate_stopped_ms=self.config.get("gps_rate_stopped_ms") or 5000,
+                backup_after_s=self.config.get("gps_backup_after_sec") or 300,
+                backup_max_s=self.config.get("gps_backup_max_sec") or 3600,
+            )
+        except ValueError as e:
+            Logger.log(f"Config: Invalid GPS power settings ({e}), receiver left at defaults")
+            return
+        self.gps.restore(self.config.get("gps_last_fix"))
+        self.gps.configure()
+        self._gps_motion = self.config.get("trip_motion_threshold") or 15
+
     def _init_device_id(self) -> str:
         # 1. Check for provisioned ID first (for fleet scale)
         p_id = self.config.get("provisioned_id")
@@ -181,6 +314,204 @@ class LastMileTracker:
         self._v2_length = offset
         return memoryview(self._v2_buf)[: self._v2_length]
 
+    def _init_record_policies(self) -> None:
+        """SD archive and offline upload queue share the policy with different rates"""
+        try:
+            self._build_record_policies(self.config)
+        except ValueError as e:
+            Logger.log(f"Config: Invalid recording policy ({e}), using defaults")
+            self._build_record_policies(Config.DEFAULTS)
+        cfg = self.config
+        self.upload_queue: List[Dict[str, Any]] = []  # Offline records awaiting upload
+        try:
+            self.trip = TripDetector(
+                start_kmh=cfg.get("trip_start_kmh") or 8,
+                stop_kmh=cfg.get("trip_stop_kmh") or 3,
+                start_s=cfg.get("trip_start_sec") or 10,
+                stop_s=cfg.get("trip_stop_sec") or 30,
+                end_s=cfg.get("trip_end_sec") or 600,
+                motion_threshold=cfg.get("trip_motion_threshold") or 15,
+            )
+        except ValueError as e:
+            Logger.log(f"Config: Invalid trip settings ({e}), using defaults")
+            self.trip = TripDetector()
+
+    def _build_record_policies(self, cfg: Any) -> None:
+        """`cfg` is the Config, or Config.DEFAULTS when the configured values are rejected"""
+        shock_threshold = cfg.get("shock_threshold") or 500
+        burst_s = cfg.get("log_burst_sec") or 30
+        self.sd_policy = RecordPolicy(
+            interval_s=cfg.get("log_interval_sec") or 10,
+            burst_interval_s=cfg.get("log_burst_interval_sec") or 1,
+            burst_s=burst_s,
+            shock_threshold=shock_threshold,
+            daily_budget_bytes=(cfg.get("log_daily_budget_kb") or 0) * 1024,
+            record_bytes=SLOT_SIZE,
+        )
+        self.upload_policy = RecordPolicy(
+            interval_s=cfg.get("ingest_interval_sec") or 60,
+            burst_interval_s=cfg.get("upload_burst_interval_sec") or 10,
+            burst_s=burst_s,
+            shock_threshold=shock_threshold,
+            daily_budget_bytes=(cfg.get("upload_daily_budget_kb") or 0) * 1024,
+            record_bytes=JSON_RECORD_BYTES,
+        )
+
+    def _record(self, data: Dict[str, Any]) -> None:
+        """Run one sample through trip detection and the SD and upload recording policies"""
+        now = time.ticks_ms()  # type: ignore[attr-defined]
+        ts = int(time.time())
+        self._update_trip(data, now, ts)
+        self._check_geofences(data, now)
+        rec = self.sd_policy.offer(data, now, ts)
+        if rec is not None:
+            self.sd_logger.log(rec)
+        rec = self.upload_policy.offer(data, now, ts)
+        # While online the cloud task posts live data; queue only what would be lost
+        if rec is None or (self.wifi and self.wifi.is_connected()):
+            return
+        # Constrained: the trip summary stands in for the trip's interval points
+        if rec["reason"] == "interval" and self.trip.active and self._upload_constrained():
+            return
+        self._queue_upload(rec.copy())
+
+    def _load_geofences(self) -> None:
+        try:
+            n = self.geofence.load(self.config.get("geofences"))
+            Logger.log(f"Geofence: {n} fences loaded")
+        except ValueError as e:
+            Logger.log(f"Config: Invalid geofences ({e}), keeping previous set")
+
+    def _check_geofences(self, data: Dict[str, Any], now: int) -> None:
+        if not data.get("gps_fix"):
+            return
+        for kind, fence in self.geofence.check(data["lat"], data["lon"], now):
+            name = GEOFENCE_EVENTS[kind]
+            Logger.log(f"Geofence: {name} {fence.id}")
+            self.sd_policy.trigger(EVT_GEOFENCE, now)
+            self.upload_policy.trigger(EVT_GEOFENCE, now)
+            rec = self.data_store.copy()
+            rec["event"] = "geofence"
+            rec["fence"] = fence.id
+            rec["transition"] = name
+            self._queue_upload(rec)
+            self._upload_now.set()
+
+    def _update_trip(self, data: Dict[str, Any], now: int, ts: int) -> None:
+        evt = self.trip.update(data, now, ts)
+        self.data_store["trip_state"] = self.trip.state
+        if evt == TRIP_EVT_START:
+            Logger.log("Trip: Started")
+        elif evt == TRIP_EVT_END:
+            s = self.trip.summary
+            Logger.log(
+                f"Trip #{s['trip']}: {s['distance_m']} m in {s['duration_s']} s, "
+                f"{s['stops']} stops, {s['shocks']} shocks"
+            )
+            rec = self.data_store.copy()
+            rec.update(s)
+            self._queue_upload(rec)
+        else:
+            return
+        self.sd_policy.trigger(EVT_TRIP, now)
+        self.upload_policy.trigger(EVT_TRIP, now)
+
+    def _upload_constrained(self) -> bool:
+        """Daily upload budget hit or the offline backlog filling up"""
+        return self.upload_policy.throttled or len(self.upload_queue) >= UPLOAD_QUEUE_MAX // 2
+
+    def _queue_upload(self, rec: Dict[str, Any]) -> None:
+        if len(self.upload_queue) >= UPLOAD_QUEUE_MAX:
+            self.upload_queue.pop(0)
+        self.upload_queue.append(self.timebase.stamp(rec))
+
+    async def imu_task(self) -> None:
+        """Feed the shock waveform ring and dead reckoning at the IMU rate"""
+        Logger.log("Task: IMU shock capture started.")
+        raw = bytearray(14)  # Accel, temperature, gyro; the shock ring uses the accel bytes
+        period_ms = 1000 // self.shock_buffer.rate_hz
+
+        while True:
+            if self.sensors and self.sensors.read_motion_raw(raw):
+                now = time.ticks_ms()  # type: ignore[attr-defined]
+                ev = self.shock_buffer.add_raw(raw, now, int(time.time()))
+                if ev is not None:
+                    self._on_shock_event(ev)
+                if self.dr:
+                    self.dr.imu(raw, now)
+                delay = period_ms
+            else:
+                delay = 1000  # No IMU: don't spin at the sample rate
+
+            self._task_ticks["imu"] = time.ticks_ms()  # type: ignore
+            await asyncio.sleep_ms(delay)  # type: ignore
+
+    def _on_shock_event(self, ev: ShockEvent) -> None:
+        """Captured waveform: classify, log and queue the summary for upload"""
+        buf = self.shock_buffer
+        ev.kind = self.shock_classifier.classify(ev.wave, buf.window, buf.pre, buf.rate_hz)
+        name = CLASS_NAMES[ev.kind]
+        Logger.log(f"Shock Event #{ev.seq}: {name}, peak {ev.peak}, {ev.duration_ms} ms")
+        self.trip.note_shock()
+        rec = self.data_store.copy()
+        rec.update(buf.summary(ev))
+        rec["shock_class"] = name
+        rec.update(self.shock_classifier.feature_dict())
+        self._queue_upload(rec)
+
+    def _track_position(self, sensors: SensorHub, data: Dict[str, Any]) -> None:
+        """GPS receiver power mode and dead reckoning for one sensor read"""
+        now = time.ticks_ms()  # type: ignore[attr-defined]
+        seq = sensors.fix_seq
+        new_fix = data["gps_fix"] and seq != self._fix_seq
+        self._fix_seq = seq
+        if self.gps:
+            self._update_gps(self.gps, data, new_fix, now)
+        self._dead_reckon(data, new_fix, now)
+
+    def _update_gps(
+        self, gps: GpsController, data: Dict[str, Any], new_fix: bool, now: int
+    ) -> None:
+        if new_fix:
+            gps.note_fix(data["lat"], data["lon"], int(time.time()))
+        if gps.update(self.trip.state, self.trip.motion >= self._gps_motion, now):
+            Logger.log(f"GPS: {GPS_MODES[gps.mode]} mode")
+            if gps.asleep and gps.last_ts:
+                self.config.set("gps_last_fix", gps.saved())  # Hot start after a reboot
+        if gps.asleep:
+            data["speed"] = 0.0  # Parked with no motion: the held fix stands
+
+    def _dead_reckon(self, data: Dict[str, Any], new_fix: bool, now: int) -> None:
+        """Feed new GPS fixes to dead reckoning; without a fix, report its estimate
+        or else a recent WiFi position"""
+        dr = self.dr
+        data["pos_est"] = False
+        data["pos_err_m"] = 0
+        if dr is not None and data["gps_fix"]:
+            if new_fix:
+                dr.fix(data["lat"], data["lon"], data["speed"], data["course"], now)
+        elif dr is not None and dr.estimate(now):
+            data["lat"] = dr.lat
+            data["lon"] = dr.lon
+            data["speed"] = dr.speed_kmh
+            data["pos_est"] = True
+            data["pos_err_m"] = dr.radius_m
+        elif not data["gps_fix"]:
+            self._wifi_position(data, now)
+
+    def _wifi_position(self, data: Dict[str, Any], now: int) -> None:
+        """No fix and no dead reckoning: a recent WiFi position, unless driving away from it"""
+        loc = self.wifi_loc
+        age = loc.age_ms(now) if loc else None
+        if loc is None or age is None or age > self._wifi_loc_hold_ms:
+            return
+        if self.trip.state == TRIP_MOVING:
+            return
+        data["lat"] = loc.lat
+        data["lon"] = loc.lon
+        data["pos_est"] = True
+        data["pos_err_m"] = loc.acc_m
+
     async def sensor_task(self) -> None:
         """High-frequency sensor monitoring"""
         Logger.log("Task: Sensor monitor started.")
@@ -190,6 +521,7 @@ class LastMileTracker:
             if self.sensors:
                 try:
                     new_data = await self.sensors.read_all()
+                    self._track_position(self.sensors, new_data)
                     self.data_store.update(new_data)
 
                     # Activity check
@@ -199,7 +531,6 @@ class LastMileTracker:
                     # Shock handling
                     if new_data["shock"] > shock_threshold:
                         Logger.log(f"Shock Alert: {new_data['shock']}")
-                        self.shock_buffer.add(new_data["shock"], time.ticks_ms())  # type: ignore
 
                         async def shock_visual_alarm() -> None:
                             asyncio.create_task(self.buzzer.alarm())
@@ -216,10 +547,8 @@ class LastMileTracker:
 
                         asyncio.create_task(shock_visual_alarm())
 
-                    # SD Logging (Local backup)
-                    # For now, log if we have a fix or every 10 samples to save SD life
-                    if new_data["gps_fix"] or (int(time.time()) % 10 == 0):
-                        self.sd_logger.log(new_data)
+                    # SD archive and offline queue (rate, bursts, daily budget)
+                    self._record(new_data)
 
                 except Exception:
                     self.diagnostics.increment("sensor_read_fails")
@@ -265,7 +594,11 @@ class LastMileTracker:
                     self.data_store["gps_fix"],
                 )
 
-            # 3. BLE Notify
+            # 3. Link upkeep: connection parameter hints, advertising interval
+            moving = self.data_store["speed"] > 1.0 or (time.time() - self._last_activity) < 60
+            self.ble.tick_link(bat_mv, moving)
+
+            # 4. BLE Notify
             if self.ble.is_connected():
                 # V1 Legacy Data
                 packed_v1 = self._pack_sensor_data(self.data_store)
@@ -298,7 +631,12 @@ class LastMileTracker:
             if all_healthy:
                 self.wdt.feed()
 
+            # BLE link mode timers (seconds per mode since boot)
+            for mode, ms in self.ble.link_times().items():
+                self.diagnostics.set_gauge("ble_" + mode + "_s", ms // 1000)
+
             # Flush buffers
+            self.sd_logger.tick()
             Logger.flush()
             self.diagnostics.flush()
 
@@ -310,12 +648,18 @@ class LastMileTracker:
             # Deep Sleep check
             if (time.time() - self._last_activity) > sleep_timeout:
                 Logger.log("Entering Deep Sleep...")
+                self.sd_logger.close()
                 Logger.flush()
                 self.diagnostics.flush()
                 if self.display:
                     self.display.clear()
                     self.display.backlight(False)
                 self._set_led((0, 0, 0))
+                if self.gps:
+                    if self.gps.last_ts:
+                        self.config.set("gps_last_fix", self.gps.saved())
+                    self.gps.sleep(time.ticks_ms(), 3600 * 1000)  # type: ignore[attr-defined]
+                self.timebase.before_sleep(3600 * 1000)  # Next boot continues the timeline
                 machine.deepsleep(3600 * 1000)
 
             # Low battery check (every 5 minutes)
@@ -340,145 +684,246 @@ class LastMileTracker:
         asyncio.create_task(self.buzzer.play_melody([(2000, 100), (1500, 150)]))
 
     def handle_ble_write(self, conn_handle: int, value_handle: int, value: bytes) -> None:
-        """Callback for when a central writes to a characteristic"""
-        Logger.log(
-            f"BLE: Write received on handle={value_handle} len={len(value)} (ota_ctrl={self.ble.ota_ctrl_handle}, ota_data={self.ble.ota_data_handle}, wifi={self.ble.wifi_config_handle})"
-        )
+        """Callback for when a central writes to a characteristic (IRQ context)"""
         if value_handle == self.ble.wifi_config_handle:
-            try:
-                command = value.decode().strip()
-                Logger.log(f"BLE: WiFi Config Write: {command}")
-
-                if command == "CMD:SCAN":
-                    Logger.log("BLE: Received Scan Command - Starting WiFi Scan")
-
-                    async def perform_scan() -> None:
-                        # Allow BLE write response to complete before scanning WiFi
-                        await asyncio.sleep_ms(800)
-                        if self.wifi is None:
-                            return
-                        try:
-                            networks = await self.wifi.scan_networks()
-                            Logger.log(
-                                f"BLE: Scan found {len(networks)} networks. Sending notifications..."
-                            )
-                            for ssid, rssi in networks:
-                                # Send "SSID,RSSI" notification
-                                payload = f"{ssid},{rssi}".encode()
-                                self.ble.notify(payload, self.ble.wifi_config_handle)
-                                await asyncio.sleep_ms(150)  # Stable delay  # type: ignore
-
-                            # Signal end of scan
-                            Logger.log("BLE: Scan notified ALL - Sending SCAN:END")
-                            self.ble.notify(b"SCAN:END", self.ble.wifi_config_handle)
-                        except Exception as e:
-                            Logger.log(f"BLE: Scan task error: {e}")
-
-                    asyncio.create_task(perform_scan())
-                    return
-
-                if command == "CMD:IDENTIFY":
-                    Logger.log("BLE: Received Identify Command")
-
-                    async def identify() -> None:
-                        for _ in range(10):
-                            self._set_led((10, 10, 10))  # White
-                            await asyncio.sleep_ms(100)
-                            self._set_led((0, 0, 0))
-                            await asyncio.sleep_ms(100)
-
-                    asyncio.create_task(identify())
-                    return
-
-                if command == "CMD:REBOOT":
-                    Logger.log("BLE: Received Reboot Command")
-
-                    async def reboot() -> None:
-                        await asyncio.sleep(1)
-                        machine.reset()
-
-                    asyncio.create_task(reboot())
-                    return
-
-                if command == "CMD:RESET_WIFI":
-                    Logger.log("BLE: Received Reset WiFi Command")
-                    self.config.set("wifi_ssid", "")
-                    self.config.set("wifi_pass", "")
-
-                    async def reset_wifi() -> None:
-                        # Allow BLE write response to complete before disconnect
-                        await asyncio.sleep_ms(800)
-                        if self.wifi:
-                            await self.wifi.disconnect()
-                        Logger.log("WiFi: Config cleared and disconnected.")
-
-                    asyncio.create_task(reset_wifi())
-                    return
-
-                # Format: "OTA:OWNER:REPO:INTERVAL"
-                if command.startswith("OTA:"):
-                    parts = command.split(":")
-                    if len(parts) >= 3:
-                        owner = parts[1]
-                        repo = parts[2]
-                        self.config.set("ota_github_owner", owner)
-                        self.config.set("ota_github_repo", repo)
-                        if len(parts) >= 4:
-                            try:
-                                interval = int(parts[3])
-                                self.config.set("ota_check_interval", interval)
-                            except (ValueError, Exception):
-                                pass
-                        Logger.log(f"BLE: Updated OTA Config: {owner}/{repo}")
-                        self.ble.notify(b"OTA:CONFIG:OK", self.ble.wifi_config_handle)
-                        return
-
-                # Support both JSON payload and legacy SSID:PASSWORD formats
-                ssid = None
-                password = None
-
-                if command.startswith("{") and command.endswith("}"):
-                    try:
-                        import json
-
-                        cfg = json.loads(command)
-                        ssid = cfg.get("ssid")
-                        password = cfg.get("pass")
-                    except Exception as e:
-                        Logger.log(f"BLE: WiFi Config JSON parse error: {e}")
-                elif ":" in command:
-                    parts = command.split(":", 1)
-                    if len(parts) == 2:
-                        ssid, password = parts
-
-                if ssid:
-                    Logger.log(f"BLE: Received WiFi Config: {ssid}")
-                    self.config.set("wifi_ssid", ssid)
-                    self.config.set("wifi_pass", password or "")
-
-                    def on_wifi_status(status: str, detail: str) -> None:
-                        # Send "WIFI:CONNECTED:SSID" or "WIFI:FAILED:Reason"
-                        payload = f"WIFI:{status}:{detail}".encode()
-                        self.ble.notify(payload, self.ble.wifi_config_handle)
-                        Logger.log(f"BLE: Notified WiFi Status: {status} ({detail})")
-
-                    # Trigger connection attempt with a delay (async) to allow BLE write response to complete
-                    async def connect_with_delay() -> None:
-                        await asyncio.sleep_ms(800)
-                        if self.wifi:
-                            await self.wifi.connect(on_status_change=on_wifi_status)
-
-                    asyncio.create_task(connect_with_delay())
-            except Exception as e:
-                Logger.log(f"BLE: WiFi Config Error: {e}")
+            # Parsing and execution happen in the command task, not here
+            if not self.commands.submit(value):
+                Logger.log("BLE: Command queue full, write dropped")
         elif value_handle in (self.ble.ota_ctrl_handle, self.ble.ota_data_handle):
             # Route OTA writes explicitly
             self.ota.handle_command(value)
 
+    def _notify_config(self, payload: bytes) -> None:
+        self.ble.notify(payload, self.ble.wifi_config_handle)
+
+    def _register_commands(self) -> None:
+        """Opcode table for the WiFi/config characteristic, with legacy text aliases"""
+        cmds = self.commands
+        cmds.register(OP_SCAN, self._cmd_scan, alias="CMD:SCAN")
+        cmds.register_prefix("CMD:SCAN:", OP_SCAN, parse_scan_text)
+        cmds.register(OP_IDENTIFY, self._cmd_identify, alias="CMD:IDENTIFY")
+        cmds.register(OP_REBOOT, self._cmd_reboot, alias="CMD:REBOOT")
+        cmds.register(OP_RESET_WIFI, self._cmd_reset_wifi, alias="CMD:RESET_WIFI")
+        cmds.register(OP_OTA_CONFIG, self._cmd_ota_config)
+        # Short "OTA:x" writes were an SSID:PASS before the router; they still are
+        cmds.register_prefix("OTA:", OP_OTA_CONFIG, parse_ota_text, fallthrough=True)
+        cmds.register(OP_WIFI_SET, self._cmd_wifi_set)
+        cmds.register(OP_SHOCK_EVENTS, self._cmd_shock_events, alias="CMD:SHOCKS")
+        cmds.register(OP_WIFI_ADD, self._cmd_wifi_add)
+        cmds.register_prefix("CMD:WIFI_ADD:", OP_WIFI_ADD, parse_wifi_add_text)
+        cmds.register(OP_WIFI_REMOVE, self._cmd_wifi_remove)
+        cmds.register_prefix("CMD:WIFI_DEL:", OP_WIFI_REMOVE, parse_wifi_remove_text)
+        cmds.set_text_fallback(OP_WIFI_SET, parse_wifi_text)
+
+    def _cmd_scan(self, req: Request) -> None:
+        Logger.log("BLE: Received Scan Command - Starting WiFi Scan")
+        # Binary requests always get packed pages; text apps opt in with CMD:SCAN:PACKED
+        packed = req.binary or req.uint(TAG_FORMAT) == 1
+
+        async def perform_scan() -> None:
+            # Allow BLE write response to complete before scanning WiFi
+            await asyncio.sleep_ms(800)
+            if self.wifi is None:
+                self.commands.reply(req, ST_FAILED)
+                return
+            try:
+                networks = await self.wifi.scan_networks()
+                Logger.log(f"BLE: Scan found {len(networks)} networks. Sending notifications...")
+                if packed:
+                    sent = await self._send_scan_pages(networks)
+                    self._notify_config(scan_trailer(sent))
+                else:
+                    sent = await self._send_scan_lines(networks)
+                    self._notify_config(b"SCAN:END")
+                Logger.log(f"BLE: Scan notified {sent}/{len(networks)}")
+                count = pack_tlv(TAG_COUNT, sent.to_bytes(2, "little"))
+                self.commands.reply(req, ST_OK if sent == len(networks) else ST_FAILED, count)
+            except Exception as e:
+                Logger.log(f"BLE: Scan task error: {e}")
+                self.commands.reply(req, ST_FAILED)
+
+        self.commands.reply(req, ST_ACCEPTED)
+        asyncio.create_task(perform_scan())
+
+    async def _send_scan_pages(self, networks: List[Tuple[str, int, int, int, bytes]]) -> int:
+        """Pack as many networks per notification as the MTU allows; pace by confirmation"""
+        handle = self.ble.wifi_config_handle
+        self._scan_packer.reset()
+        idx = 0
+        self.ble.set_link_mode(MODE_BULK)
+        try:
+            while idx < len(networks):
+                nxt, page = self._scan_packer.pack(networks, idx, self.ble.mtu)
+                if not await self.ble.send_acked(bytes(page), handle):
+                    break
+                idx = nxt
+        finally:
+            self.ble.set_link_mode(MODE_IDLE)
+        return idx
+
+    async def _send_scan_lines(self, networks: List[Tuple[str, int, int, int, bytes]]) -> int:
+        """Legacy "SSID,RSSI" notifications, one per network"""
+        handle = self.ble.wifi_config_handle
+        sent = 0
+        self.ble.set_link_mode(MODE_BULK)
+        try:
+            for ssid, rssi, _, _, _ in networks:
+                if not await self.ble.send_acked(f"{ssid},{rssi}".encode(), handle):
+                    break
+                sent += 1
+        finally:
+            self.ble.set_link_mode(MODE_IDLE)
+        return sent
+
+    def _cmd_identify(self, req: Request) -> None:
+        Logger.log("BLE: Received Identify Command")
+
+        async def identify() -> None:
+            for _ in range(10):
+                self._set_led((10, 10, 10))  # White
+                await asyncio.sleep_ms(100)
+                self._set_led((0, 0, 0))
+                await asyncio.sleep_ms(100)
+
+        asyncio.create_task(identify())
+        self.commands.reply(req, ST_OK)
+
+    def _cmd_shock_events(self, req: Request) -> None:
+        """Send summary + waveform frames for the most recent shock events"""
+        events = self.shock_buffer.latest(req.uint(TAG_COUNT, -1))
+
+        async def send_events() -> None:
+            sent = 0
+            self.ble.set_link_mode(MODE_BULK)
+            try:
+                for ev in events:
+                    if not await self._send_shock_event(ev):
+                        break
+                    sent += 1
+            finally:
+                self.ble.set_link_mode(MODE_IDLE)
+            count = pack_tlv(TAG_COUNT, sent.to_bytes(2, "little"))
+            text = b"SHOCKS:END:%d" % sent
+            self.commands.reply(req, ST_OK if sent == len(events) else ST_FAILED, count, text)
+
+        self.commands.reply(req, ST_ACCEPTED)
+        asyncio.create_task(send_events())
+
+    async def _send_shock_event(self, ev: ShockEvent) -> bool:
+        handle = self.ble.wifi_config_handle
+        if not await self.ble.send_acked(bytes(self.shock_buffer.pack_summary(ev)), handle):
+            return False
+        idx = 0
+        while idx < self.shock_buffer.window:
+            idx, frame = self.shock_buffer.pack_wave(ev, idx, self.ble.mtu)
+            if not await self.ble.send_acked(bytes(frame), handle):
+                return False
+        return True
+
+    def _cmd_reboot(self, req: Request) -> None:
+        Logger.log("BLE: Received Reboot Command")
+
+        async def reboot() -> None:
+            await asyncio.sleep(1)
+            machine.reset()
+
+        self.commands.reply(req, ST_OK)
+        asyncio.create_task(reboot())
+
+    def _cmd_reset_wifi(self, req: Request) -> None:
+        Logger.log("BLE: Received Reset WiFi Command")
+        self.config.set("wifi_ssid", "")
+        self.config.set("wifi_pass", "")
+        self.config.set("wifi_networks", [])
+        self.config.set("wifi_link_cache", None)
+
+        async def reset_wifi() -> None:
+            # Allow BLE write response to complete before disconnect
+            await asyncio.sleep_ms(800)
+            if self.wifi:
+                await self.wifi.disconnect()
+            Logger.log("WiFi: Config cleared and disconnected.")
+
+        self.commands.reply(req, ST_OK)
+        asyncio.create_task(reset_wifi())
+
+    def _cmd_ota_config(self, req: Request) -> None:
+        owner = req.text(TAG_OWNER)
+        repo = req.text(TAG_REPO)
+        if not owner or not repo:
+            self.commands.reply(req, ST_BAD_ARGS)
+            return
+        self.config.set("ota_github_owner", owner)
+        self.config.set("ota_github_repo", repo)
+        interval = req.uint(TAG_INTERVAL)
+        if interval > 0:
+            self.config.set("ota_check_interval", interval)
+        Logger.log(f"BLE: Updated OTA Config: {owner}/{repo}")
+        self.commands.reply(req, ST_OK, text=b"OTA:CONFIG:OK")
+
+    def _cmd_wifi_set(self, req: Request) -> None:
+        ssid = req.text(TAG_SSID)
+        if not ssid:
+            self.commands.reply(req, ST_BAD_ARGS)
+            return
+        Logger.log(f"BLE: Received WiFi Config: {ssid}")
+        self.config.set("wifi_ssid", ssid)
+        self.config.set("wifi_pass", req.text(TAG_PASS))
+
+        def on_wifi_status(status: str, detail: str) -> None:
+            # Send "WIFI:CONNECTED:SSID" or "WIFI:FAILED:Reason"
+            result = ST_OK if status == "CONNECTED" else ST_FAILED
+            self.commands.reply(
+                req,
+                result,
+                pack_tlv(TAG_DETAIL, detail.encode()),
+                text=f"WIFI:{status}:{detail}".encode(),
+            )
+            Logger.log(f"BLE: Notified WiFi Status: {status} ({detail})")
+
+        # Trigger connection attempt with a delay (async) to allow BLE write response to complete
+        async def connect_with_delay() -> None:
+            await asyncio.sleep_ms(800)
+            if self.wifi:
+                await self.wifi.connect(on_status_change=on_wifi_status, ssid=ssid)
+
+        self.commands.reply(req, ST_ACCEPTED)
+        asyncio.create_task(connect_with_delay())
+
+    def _cmd_wifi_add(self, req: Request) -> None:
+        ssid = req.text(TAG_SSID)
+        if not ssid or self.wifi is None:
+            self.commands.reply(req, ST_FAILED if ssid else ST_BAD_ARGS)
+            return
+        known = self.wifi.known
+        try:
+            known.add(ssid, req.text(TAG_PASS), req.uint(TAG_PRIORITY, DEFAULT_PRIORITY))
+        except ValueError as e:
+            Logger.log(f"BLE: Known network rejected: {e}")
+            detail = str(e).encode()
+            reason = pack_tlv(TAG_DETAIL, detail)
+            self.commands.reply(req, ST_FAILED, reason, text=b"WIFI:ADD:" + detail)
+            return
+        n = len(known.networks)
+        Logger.log(f"BLE: Known network {ssid} saved ({n} known)")
+        count = pack_tlv(TAG_COUNT, n.to_bytes(2, "little"))
+        self.commands.reply(req, ST_OK, count, text=f"WIFI:ADD:OK:{n}".encode())
+
+    def _cmd_wifi_remove(self, req: Request) -> None:
+        ssid = req.text(TAG_SSID)
+        if not ssid:
+            self.commands.reply(req, ST_BAD_ARGS)
+            return
+        if self.wifi is None or not self.wifi.known.remove(ssid):
+            self.commands.reply(req, ST_FAILED, text=b"WIFI:DEL:NOT_FOUND")
+            return
+        Logger.log(f"BLE: Known network {ssid} removed")
+        self.commands.reply(req, ST_OK, text=b"WIFI:DEL:OK")
+
     async def cloud_upload_task(self) -> None:
         """Periodic telemetry upload to cloud via WiFi with Adaptive Sampling"""
         Logger.log("Task: Cloud ingest started.")
-        retry_buffer: List[Dict[str, Any]] = []  # Simple in-memory retry buffer
+        retry_buffer = self.upload_queue  # Filled by the recording policy while offline
 
         while True:
             # Adaptive Sampling Logic
@@ -486,7 +931,7 @@ class LastMileTracker:
             ingest_int = self.config.get("ingest_interval_sec") or 60
             idle_int = self.config.get("ingest_interval_idle") or 900  # 15 min default idle
 
-            # Use data_store trip_state (1 if moving, 0 if idle)
+            # trip_state from TripDetector (0 idle, 1 moving, 2 at a stop within a trip)
             trip_state = self.data_store.get("trip_state", 0)
 
             # If idle for too long, switch to idle_int
@@ -496,20 +941,13 @@ class LastMileTracker:
             else:
                 interval = ingest_int
 
-            url = self.config.get("ingest_url")
-
-            if url and self.wifi and self.wifi.is_connected():
-                # Measure battery before upload for profiling
-                v_before = self.sensors.read_battery_mv() if self.sensors else 0
+            uplink = self.http_poster.has_uplink()
 
+            if uplink and self.upload_window:
+                await self._run_upload_window(self.upload_window)
+            elif uplink and self.wifi and self.wifi.is_connected():
                 # 1. Try to post current data
-                success = await self.http_poster.post_telemetry(self.data_store)
-
-                # Measure battery after upload
-                v_after = self.sensors.read_battery_mv() if self.sensors else 0
-                if success and v_before > 0:
-                    drop = v_before - v_after
-                    self.data_store["bat_drop"] = drop  # Store for next reporting cycle
+                success = await self._post_live()
 
                 # 2. If success, try to flush retry buffer
                 if success and retry_buffer:
@@ -519,52 +957,181 @@ class LastMileTracker:
                         if not await self.http_poster.post_telemetry(buffered):
                             retry_buffer.insert(0, buffered)  # Partial failure
                             break
-                elif not success:
-                    # Buffer current data on failure
-                    if len(retry_buffer) < 50:  # Limit buffer size
-                        retry_buffer.append(self.data_store.copy())
+                if success:
+                    await self._wifi_locate()
+                    await self._downlink()
+            elif self.mesh and retry_buffer:
+                # No WiFi: hand the backlog to a connected peer.
+                # Records leave the buffer only once the relay confirms upload.
+                for rec in retry_buffer:
+                    self.timebase.correct(rec)  # The relay cannot know our boot offsets
+                relayed = await self.mesh.forward(retry_buffer)
+                if relayed:
+                    Logger.log(f"ESP-NOW: Peer confirmed {relayed} buffered readings")
+                    del retry_buffer[:relayed]
 
             # Rule 2: Mark task as healthy
             self._task_ticks["cloud"] = time.ticks_ms()  # type: ignore
-            await asyncio.sleep(interval)
+            # Sleep until the next interval, or until an event record needs uploading
+            try:
+                await asyncio.wait_for(self._upload_now.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._upload_now.clear()
+
+    async def _post_live(self) -> bool:
+        """Post the current data_store; buffered for retry on failure"""
+        # Measure battery before upload for profiling
+        v_before = self.sensors.read_battery_mv() if self.sensors else 0
+
+        success = await self.http_poster.post_telemetry(self.data_store)
+
+        # Measure battery after upload
+        v_after = self.sensors.read_battery_mv() if self.sensors else 0
+        if success and v_before > 0:
+            drop = v_before - v_after
+            self.data_store["bat_drop"] = drop  # Store for next reporting cycle
+        elif not success:
+            # Buffer current data on failure
+            if len(self.upload_queue) < UPLOAD_QUEUE_MAX:
+                self.upload_queue.append(self.timebase.stamp(self.data_store.copy()))
+        return success
+
+    def _on_wifi_scan(self, networks: List[Any]) -> None:
+        """Every WiFi scan: without a GPS fix, try the BSSID cache for a position"""
+        loc = self.wifi_loc
+        if loc and not self.data_store.get("gps_fix"):
+            if loc.observe(networks, time.ticks_ms()):  # type: ignore[attr-defined]
+                Logger.log(f"WiFi: Position from BSSID cache (+/-{loc.acc_m} m)")
+            self.diagnostics.set_gauge("wifi_loc_lookups", loc.lookups)
+            self.diagnostics.set_gauge("wifi_loc_hits", loc.hits)
+
+    async def _wifi_locate(self) -> None:
+        """Link is up and GPS has no fix: scan, and ask the server about unknown APs"""
+        loc = self.wifi_loc
+        if loc is None or self.wifi is None or self.data_store.get("gps_fix"):
+            return
+        now = time.ticks_ms()  # type: ignore[attr-defined]
+        last = self._wifi_loc_try_ms
+        retry_ms = self._wifi_loc_hold_ms // 2
+        if last is not None and time.ticks_diff(now, last) < retry_ms:  # type: ignore
+            return
+        self._wifi_loc_try_ms = now
+        await self.wifi.scan_networks()  # Resolves through _on_wifi_scan on a cache hit
+        fp = loc.pending
+        if fp is None:
+            return
+        loc.pending = None  # One request per fingerprint, answered or not
+        if await self.http_poster.post_records([{"wifi_fp": fp, "ts": int(time.time())}]):
+            if loc.learn(fp, self.http_poster.reply, time.ticks_ms()):  # type: ignore
+                Logger.log(f"WiFi: Position from server (+/-{loc.acc_m} m), {len(loc)} APs cached")
+
+    async def _run_upload_window(self, window: UploadWindow) -> None:
+        """Radio up, queued records in batches, live data and due remote checks, radio down"""
+        remote_due = self._remote_due
+        self._remote_due = False
+        jobs = [self._post_live, self._wifi_locate]
+        if remote_due:
+            jobs.append(self._remote_checks)
+        jobs.append(self._downlink)  # Hints from this window's upload replies
+        if self.mqtt:
+            jobs.append(self._mqtt_close)
+        online = await window.run(self.upload_queue, jobs)
+        if not online:
+            self._remote_due = remote_due
+            Logger.log(f"WiFi: Upload window failed, {len(self.upload_queue)} records queued")
+            return
+        Logger.log(
+            f"WiFi: Window {window.windows}: {window.last_on_ms} ms radio on, "
+            f"{window.last_records} queued records, {window.last_bytes} B sent"
+        )
 
     async def remote_management_task(self) -> None:
         """Check for remote config and OTA updates monthly/daily"""
         Logger.log("Task: Remote management started.")
-        import urequests
 
         while True:
-            # 1. Remote Config
-            config_url = self.config.get("config_url")
-            if config_url and self.wifi and self.wifi.is_connected():
-                try:
-                    Logger.log("WiFi: Fetching remote config...")
-                    res = urequests.get(config_url)
-                    if res.status_code == 200:
-                        new_cfg = res.json()
-                        if self.config.merge_config(new_cfg):
-                            Logger.log("WiFi: Remote config applied.")
-                    res.close()
-                except Exception as e:
-                    Logger.log(f"WiFi: Remote config check failed: {e}")
-
-            # 2. WiFi OTA
-            if self.wifi and self.wifi.is_connected():
-                try:
-                    from lib.wifi_ota import WiFiOta
-
-                    ota = WiFiOta(self.config)
-                    ota.check_and_update()
-                except Exception as e:
-                    Logger.log(f"WiFi OTA Error: {e}")
+            if self.upload_window:
+                self._remote_due = True  # Runs inside the next upload window
+            else:
+                await self._remote_checks()
 
             # Sleep until next check (default 24h)
             interval = self.config.get("ota_check_interval") or 86400
             await asyncio.sleep(interval)
 
+    def _init_mqtt(self) -> None:
+        """MQTT ingest: one persistent session instead of a POST per upload"""
+        cfg = self.config
+        base = "%s/%s/" % (cfg.get("mqtt_topic_prefix") or "lmt", self.device_id)
+        try:
+            self.mqtt = MqttUplink(
+                cfg.get("mqtt_host") or "",
+                self.device_id,
+                port=cfg.get("mqtt_port") or 1883,
+                keepalive_s=cfg.get("mqtt_keepalive_sec") or 0,
+                inflight=cfg.get("mqtt_inflight") or 4,
+                username=self.device_id,
+                password=cfg.get("ingest_token") or "",
+                tls=bool(cfg.get("mqtt_tls")),
+                down_topic=base + "down",
+            )
+        except ValueError as e:
+            Logger.log(f"Config: Invalid MQTT settings ({e}), using HTTP ingest")
+            return
+        self.http_poster.use_mqtt(self.mqtt, base + "up")
+
+    async def _mqtt_close(self) -> None:
+        """End of an upload window: wait for the PUBACKs, then DISCONNECT"""
+        if self.mqtt:
+            await self.mqtt.flush()
+            await self.mqtt.close()
+
+    def _on_ingest_reply(self, reply: Any) -> None:
+        if self.remote.note_reply(reply):
+            Logger.log("WiFi: Server announced a config change or pending commands")
+
+    async def _downlink(self) -> None:
+        """Act on ingest reply hints while the link is still up"""
+        if self.remote.checks_due:
+            await self._remote_checks()
+        elif self.remote.fetch_due and self.wifi and self.wifi.is_connected():
+            self._fetch_config()
+
+    def _fetch_config(self) -> None:
+        if self.config.get("config_url"):
+            Logger.log("WiFi: Checking remote config...")
+        if self.remote.fetch() == FETCH_APPLIED:
+            Logger.log("WiFi: Remote config applied.")
+            self._load_geofences()
+
+    async def _remote_checks(self) -> None:
+        """Remote config fetch and WiFi OTA check (needs the link up)"""
+        if not (self.wifi and self.wifi.is_connected()):
+            return
+        self.remote.checks_due = False
+
+        # 1. Remote Config (conditional: a 304 when nothing changed)
+        self._fetch_config()
+
+        # 2. WiFi OTA
+        if self.wifi.is_connected():
+            try:
+                from lib.wifi_ota import WiFiOta
+
+                ota = WiFiOta(self.config)
+                ota.check_and_update()
+            except Exception as e:
+                Logger.log(f"WiFi OTA Error: {e}")
+
     async def main_loop(self) -> None:
         # Initialize NTP
-        self.ntp = NTPClient(self.config)
+        try:
+            self.ntp = NTPClient(self.config, self.timebase)
+        except ValueError as e:
+            Logger.log(f"Config: Invalid NTP settings ({e}), using defaults")
+            ntp_config = dict(Config.DEFAULTS, ntp_server=self.config.get("ntp_server"))
+            self.ntp = NTPClient(ntp_config, self.timebase)
 
         # Initialize WiFi
         # from lib.wifi_manager import WiFiManager # Imported at top now
@@ -574,21 +1141,72 @@ class LastMileTracker:
             self._set_led,
             ntp_client=self.ntp,
             ble_connected_check=self.ble.is_connected,
+            diagnostics=self.diagnostics,
         )
+        if self.wifi_loc:
+            self.wifi.on_scan = self._on_wifi_scan
+
+        if self.config.get("wifi_upload_window"):
+            await self._init_upload_window(self.wifi)
 
         # Handle BLE writes
         self.ble.set_write_callback(self.handle_ble_write)
         self.ble.start_advertising()
 
-        # Start tasks
-        await asyncio.gather(
+        tasks = [
             self.sensor_task(),
             self.update_task(),
             self.maintenance_task(),
-            self.wifi.manage_connection(),
             self.cloud_upload_task(),
             self.remote_management_task(),
-        )
+            self.commands.run(),
+            self.imu_task(),
+        ]
+
+        if self.upload_window is None:
+            tasks.append(self.wifi.manage_connection())  # Keep the link up between uploads
+        if self.config.get("espnow_enabled"):
+            self._init_mesh()
+            if self.mesh:
+                tasks.append(self.mesh.run())
+
+        # Start tasks
+        await asyncio.gather(*tasks)
+
+    async def _init_upload_window(self, wifi: WiFiManager) -> None:
+        """Duty-cycled WiFi: the station is only up while the cloud task uploads"""
+        if self.config.get("espnow_enabled"):
+            Logger.log("WiFi: Upload windows off, the ESP-NOW relay needs the radio up")
+            return
+        try:
+            self.upload_window = UploadWindow(
+                wifi,
+                self.http_poster,
+                batch_size=self.config.get("upload_batch_size") or 10,
+                diagnostics=self.diagnostics,
+            )
+        except ValueError as e:
+            Logger.log(f"Config: Invalid upload window settings ({e}), keeping WiFi up")
+            return
+        await wifi.disconnect()  # Radio off until the first window
+
+    def _init_mesh(self) -> None:
+        """Bring up the ESP-NOW relay alongside WiFi (optional hardware feature)"""
+        if self.wifi is None:
+            return
+        wifi = self.wifi
+        try:
+            radio = EspNowRadio(wifi.wlan, channel=self.config.get("espnow_channel") or 0)
+            self.mesh = EspNowUplink(
+                radio,
+                self.device_id,
+                has_uplink=lambda: self.http_poster.has_uplink() and wifi.is_connected(),
+                upload=self.http_poster.post_batch,
+                rate_per_min=self.config.get("espnow_rate_per_min") or 12,
+            )
+        except Exception as e:
+            Logger.log(f"ESP-NOW: Init failed: {e}")
+            self.mesh = None
 
 
 if __name__ == "__main__":
@@ -600,5 +1218,6 @@ if __name__ == "__main__":
 
         print(f"CRITICAL ERROR: {e}")  # Print to REPL
         Logger.log(f"CRITICAL: {e}")
+        tracker.sd_logger.close()
         time.sleep(5)  # Give time to read/flush
         machine.reset()
@@ -0,0 +1,29 @@
+# conftest.py - Make firmware modules importable under CPython
+import os
+import pathlib
+import sys
+import tempfile
+
+import pytest
+
+FIRMWARE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if FIRMWARE_ROOT not in sys.path:
+    sys.path.insert(0, FIRMWARE_ROOT)
+
+from tools.host_shims import install  # noqa: E402
+
+install()
+
+# Keep Logger output out of the working tree while tests run
+from lib.logger import Logger  # noqa: E402
+
+Logger.LOG_FILE = os.path.join(tempfile.gettempdir(), "lmt_test_log.txt")
+Logger.MAX_SIZE = 1 << 30  # Rotation renames into the cwd; never trigger it on the host
+
+
+@pytest.fixture(autouse=True)
+def _config_file(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Config saves go to a per-test file, never config.json in the working tree"""
+    from lib.config import Config
+
+    monkeypatch.setattr(Config, "CONFIG_FILE", str(tmp_path / "config.json"))
@@ -0,0 +1,147 @@
+import asyncio
+import unittest
+from typing import List
+
+from lib.ble_commands import (
+    OP_OTA_CONFIG,
+    OP_SCAN,
+    OP_WIFI_ADD,
+    OP_WIFI_REMOVE,
+    OP_WIFI_SET,
+    REQ_MAGIC,
+    RESP_MAGIC,
+    ST_BAD_ARGS,
+    ST_OK,
+    ST_UNKNOWN,
+    TAG_INTERVAL,
+    TAG_OWNER,
+    TAG_PASS,
+    TAG_PRIORITY,
+    TAG_REPO,
+    TAG_SSID,
+    CommandRouter,
+    Request,
+    pack_tlv,
+    parse_ota_text,
+    parse_scan_text,
+    parse_wifi_add_text,
+    parse_wifi_remove_text,
+    parse_wifi_text,
+)
+
+
+def binary(opcode: int, req_id: int, *tlvs: bytes) -> bytes:
+    body = b"".join(tlvs)
+    return bytes((REQ_MAGIC, opcode, req_id, len(body))) + body
+
+
+class TestCommandRouter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sent: List[bytes] = []
+        self.seen: List[Request] = []
+        self.router = CommandRouter(self.sent.append)
+
+        def ok(req: Request) -> None:
+            self.seen.append(req)
+            self.router.reply(req, ST_OK, text=b"LEGACY:OK")
+
+        self.router.register(OP_SCAN, ok, alias="CMD:SCAN")
+        self.router.register_prefix("CMD:SCAN:", OP_SCAN, parse_scan_text)
+        self.router.register(OP_OTA_CONFIG, ok)
+        self.router.register_prefix("OTA:", OP_OTA_CONFIG, parse_ota_text, fallthrough=True)
+        self.router.register(OP_WIFI_SET, ok)
+        self.router.register(OP_WIFI_ADD, ok)
+        self.router.register_prefix("CMD:WIFI_ADD:", OP_WIFI_ADD, parse_wifi_add_text)
+        self.router.register(OP_WIFI_REMOVE, ok)
+        self.router.register_prefix("CMD:WIFI_DEL:", OP_WIFI_REMOVE, parse_wifi_remove_text)
+        self.router.set_text_fallback(OP_WIFI_SET, parse_wifi_text)
+
+    def test_binary_request_gets_framed_response_with_request_id(self) -> None:
+        self.router.dispatch(binary(OP_SCAN, 42))
+        self.assertEqual(self.sent, [bytes((RESP_MAGIC, OP_SCAN, 42, ST_OK, 0))])
+
+    def test_binary_tlv_arguments(self) -> None:
+        frame = binary(
+            OP_OTA_CONFIG,
+            7,
+            pack_tlv(TAG_OWNER, b"acme"),
+            pack_tlv(TAG_REPO, b"fw"),
+            pack_tlv(TAG_INTERVAL, (3600).to_bytes(4, "little")),
+        )
+        self.router.dispatch(frame)
+        req = self.seen[0]
+        self.assertTrue(req.binary)
+        self.assertEqual(req.text(TAG_OWNER), "acme")
+        self.assertEqual(req.text(TAG_REPO), "fw")
+        self.assertEqual(req.uint(TAG_INTERVAL), 3600)
+
+    def test_truncated_tlv_is_rejected(self) -> None:
+        frame = bytes((REQ_MAGIC, OP_WIFI_SET, 3, 4, TAG_SSID, 9, 0x41, 0x42))
+        self.assertIsNone(self.router.dispatch(frame))
+        self.assertEqual(self.sent, [bytes((RESP_MAGIC, OP_WIFI_SET, 3, ST_BAD_ARGS, 0))])
+        self.assertEqual(self.seen, [])
+
+    def test_unknown_opcode(self) -> None:
+        self.router.dispatch(binary(0x7F, 9))
+        self.assertEqual(self.sent, [bytes((RESP_MAGIC, 0x7F, 9, ST_UNKNOWN, 0))])
+
+    def test_text_aliases_map_to_opcodes(self) -> None:
+        self.router.dispatch(b"CMD:SCAN\n")
+        self.router.dispatch(b"OTA:acme:fw:600")
+        self.router.dispatch(b'{"ssid": "Depot", "pass": "s3cret"}')
+        self.router.dispatch(b"Yard:pw:with:colons")
+        ops = [r.opcode for r in self.seen]
+        self.assertEqual(ops, [OP_SCAN, OP_OTA_CONFIG, OP_WIFI_SET, OP_WIFI_SET])
+        self.assertEqual(self.seen[1].uint(TAG_INTERVAL), 600)
+        self.assertEqual(self.seen[2].text(TAG_SSID), "Depot")
+        self.assertEqual(self.seen[3].text(TAG_PASS), "pw:with:colons")
+        # Text requests keep the legacy text notification
+        self.assertEqual(self.sent, [b"LEGACY:OK"] * 4)
+
+    def test_known_network_text_commands(self) -> None:
+        self.router.dispatch(b'CMD:WIFI_ADD:{"ssid": "Depot:2", "pass": "depotpass", "prio": 3}')
+        self.router.dispatch(b"CMD:WIFI_DEL:Depot:2")
+        add, remove = self.seen
+        self.assertEqual((add.opcode, add.text(TAG_SSID)), (OP_WIFI_ADD, "Depot:2"))
+        self.assertEqual((add.text(TAG_PASS), add.uint(TAG_PRIORITY)), ("depotpass", 3))
+        self.assertEqual((remove.opcode, remove.text(TAG_SSID)), (OP_WIFI_REMOVE, "Depot:2"))
+
+    def test_malformed_prefixed_commands_are_dropped(self) -> None:
+        for value in (
+            b"CMD:WIFI_ADD:not json",
+            b'CMD:WIFI_ADD:{"pass": "no ssid"}',
+            b'CMD:WIFI_ADD:{"ssid": "Depot", "prio": "high"}',
+            b"CMD:WIFI_DEL:",
+            b"CMD:SCAN:XYZ",
+        ):
+            self.assertIsNone(self.router.dispatch(value), value)
+        # None of them reached a handler as SSID "CMD" through the SSID:PASS fallback
+        self.assertEqual((self.seen, self.sent), ([], []))
+
+    def test_short_ota_text_falls_back_to_wifi_like_before(self) -> None:
+        self.router.dispatch(b"OTA:only")
+        self.assertEqual(self.seen[0].opcode, OP_WIFI_SET)
+        self.assertEqual(self.seen[0].text(TAG_SSID), "OTA")
+
+    def test_submit_queues_until_run(self) -> None:
+        self.assertTrue(self.router.submit(b"CMD:SCAN"))
+        self.assertEqual(self.seen, [])
+
+        async def scenario() -> None:
+            task = asyncio.create_task(self.router.run())
+            await asyncio.sleep(0.01)
+            task.cancel()
+
+        asyncio.run(scenario())
+        self.assertEqual(len(self.seen), 1)
+
+    def test_submit_drops_when_full(self) -> None:
+        for _ in range(4):
+            self.assertTrue(self.router.submit(b"CMD:SCAN"))
+        self.assertFalse(self.router.submit(b"CMD:SCAN"))
+        self.assertEqual(self.router.dropped, 1)
+        self.assertEqual(self.router.drain(), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import struct
+import time
+import unittest
+from unittest.mock import patch
+
+from lib.ble_link import (
+    CONN_PARAMS,
+    MODE_BULK,
+    MODE_IDLE,
+    MODE_OTA,
+    OP_LINK_PARAMS,
+    LinkPolicy,
+)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000
+
+    def __call__(self) -> int:
+        return self.now
+
+
+class TestLinkPolicy(unittest.TestCase):
+    def test_time_is_charged_to_each_mode(self) -> None:
+        clock = FakeClock()
+        with patch.object(time, "ticks_ms", clock):
+            policy = LinkPolicy()
+            clock.now += 5000  # advertising
+            policy.set_mode(MODE_IDLE)
+            clock.now += 60000
+            policy.set_mode(MODE_OTA)
+            clock.now += 20000
+            policy.set_mode(MODE_IDLE)
+            clock.now += 1000
+            times = policy.time_in_modes()
+        self.assertEqual(times, {"advertising": 5000, "idle": 61000, "bulk": 0, "ota": 20000})
+
+    def test_set_mode_reports_changes_only(self) -> None:
+        policy = LinkPolicy()
+        self.assertTrue(policy.set_mode(MODE_BULK))
+        self.assertFalse(policy.set_mode(MODE_BULK))
+
+    def test_conn_params_respect_supervision_bound(self) -> None:
+        for mode, (lo, hi, latency, timeout) in CONN_PARAMS.items():
+            self.assertLessEqual(lo, hi)
+            self.assertGreaterEqual(lo, 6)  # 7.5 ms spec minimum
+            # timeout(10ms units) > (1 + latency) * max_interval(1.25ms units) * 2
+            self.assertGreater(timeout * 10, (1 + latency) * hi * 1.25 * 2, mode)
+
+    def test_idle_is_slower_than_bulk_and_ota(self) -> None:
+        self.assertGreater(CONN_PARAMS[MODE_IDLE][0], CONN_PARAMS[MODE_BULK][1])
+        self.assertLessEqual(CONN_PARAMS[MODE_OTA][1], CONN_PARAMS[MODE_BULK][1])
+
+    def test_hint_frame_layout(self) -> None:
+        policy = LinkPolicy()
+        self.assertEqual(policy.hint_frame(), b"")  # Nothing to ask for while advertising
+        policy.set_mode(MODE_OTA)
+        frame = policy.hint_frame()
+        self.assertEqual(frame[:5], bytes((0xB2, OP_LINK_PARAMS, 0, 0, len(frame) - 5)))
+        self.assertEqual(frame[5:8], bytes((0x10, 1, MODE_OTA)))
+        self.assertEqual(frame[8:10], bytes((0x11, 8)))
+        self.assertEqual(struct.unpack("<HHHH", frame[10:]), CONN_PARAMS[MODE_OTA])
+
+    def test_advertising_interval_follows_battery_and_motion(self) -> None:
+        policy = LinkPolicy(base_adv_interval_ms=100)
+        self.assertEqual(policy.adv_interval_ms(500, False), 100)  # USB power
+        self.assertEqual(policy.adv_interval_ms(4000, True), 250)
+        self.assertEqual(policy.adv_interval_ms(4000, False), 1000)
+        self.assertEqual(policy.adv_interval_ms(3500, True), 2000)
+        self.assertEqual(policy.adv_interval_ms(3300, True), 4000)
+
+    def test_rejects_interval_below_spec(self) -> None:
+        with self.assertRaises(ValueError):
+            LinkPolicy(base_adv_interval_ms=10)
+
+
+if __name__ == "__main__":
+    unittest.main()
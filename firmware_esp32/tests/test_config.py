@@ -43,7 +43,7 @@ class TestConfig(unittest.TestCase):
             with patch("builtins.open", m):
                 cfg.save()
 
-            m.assert_called_with("config.json", "w")
+            m.assert_called_with(Config.CONFIG_FILE, "w")
             # We can't easily check the json.dump content with simple mock_open,
             # but we verified the file was opened for writing.
 
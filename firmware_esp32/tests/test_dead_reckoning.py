@@ -0,0 +1,64 @@
+import math
+import struct
+import unittest
+
+from lib.dead_reckoning import DeadReckoner, sin_q14
+from tools.dr_eval import LAT0, LON0, evaluate, simulate
+
+
+class TestDeadReckoning(unittest.TestCase):
+    def test_outages_beat_frozen_fix(self) -> None:
+        for seed, mount in ((1, 35.0), (2, -120.0), (3, 170.0)):
+            stats = evaluate(simulate(mount_deg=mount, seed=seed))
+            self.assertGreater(stats["points"], 70)
+            self.assertLess(stats["dr_max"], stats["frozen_max"] / 4, (seed, mount))
+            self.assertLess(stats["dr_mean"], stats["frozen_mean"] / 4, (seed, mount))
+            self.assertGreaterEqual(stats["contained"], 0.9, (seed, mount))
+
+    def test_straight_outage_without_gyro(self) -> None:
+        stats = evaluate(simulate(), outages=[(92, 128)], use_gyro=False)
+        self.assertLess(stats["dr_max"], 25)
+        self.assertLess(stats["dr_max"], stats["frozen_max"] / 10)
+        self.assertEqual(stats["contained"], 1.0)
+
+    def test_learns_forward_axis(self) -> None:
+        dr = DeadReckoner()
+        evaluate(simulate(mount_deg=35.0, tilt_deg=0.0), dr=dr)
+        self.assertGreaterEqual(dr.learned, 3)
+        f = dr._f
+        self.assertAlmostEqual(math.degrees(math.atan2(f[1], f[0])), 35.0, delta=8)
+
+    def test_sin_table(self) -> None:
+        for deg in range(0, 720, 7):
+            h = int(deg * 65536 / 360)
+            self.assertAlmostEqual(sin_q14(h) / 16384, math.sin(math.radians(deg)), delta=0.002)
+
+    def test_estimate_needs_recent_fix(self) -> None:
+        dr = DeadReckoner(max_outage_s=10)
+        self.assertFalse(dr.estimate(0))
+        dr.fix(LAT0, LON0, 0.0, 0.0, 1000)
+        self.assertTrue(dr.estimate(5000))
+        self.assertAlmostEqual(dr.lat, LAT0)
+        self.assertGreaterEqual(dr.radius_m, 5)
+        self.assertFalse(dr.estimate(12000))
+
+    def test_raw_decode_matches_samples(self) -> None:
+        sample = (-1200, 310, 16100, -45, 7, -2000)
+        a = DeadReckoner()
+        b = DeadReckoner()
+        raw = bytearray(struct.pack(">hhhhhhh", *sample[:3], 1234, *sample[3:]))
+        for t in range(0, 500, 10):
+            a.imu(raw, t)
+            b.imu_sample(*sample, t)
+        self.assertEqual(a._g, b._g)
+        self.assertEqual(a._act, b._act)
+
+    def test_invalid_parameters(self) -> None:
+        with self.assertRaises(ValueError):
+            DeadReckoner(max_outage_s=0)
+        with self.assertRaises(ValueError):
+            DeadReckoner(still_counts=-1)
+
+
+if __name__ == "__main__":
+    unittest.main()
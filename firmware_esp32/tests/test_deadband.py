@@ -0,0 +1,114 @@
+import asyncio
+import unittest
+from typing import Any, Dict
+
+from tools.config_server import ConfigServer, MemConfig
+
+from lib.deadband import (
+    TRIG_CHANGE,
+    TRIG_FIRST,
+    TRIG_HEARTBEAT,
+    TRIG_LEVEL,
+    TRIG_NONE,
+    TRIG_SILENCE,
+    Deadband,
+    default_rules,
+)
+from lib.http_poster import HttpPoster
+
+M_PER_DEG_LAT = 111195.0
+
+
+def sample(**changes: Any) -> Dict[str, Any]:
+    data = {"lat": 52.52, "lon": 13.405, "temp": 4.0, "shock": 10, "battery_mv": 3900}
+    data.update(changes)
+    return data
+
+
+class TestDeadband(unittest.TestCase):
+    def sent(self, db: Deadband, data: Dict[str, Any], now_ms: int = 0) -> None:
+        self.assertNotEqual(db.check(data, now_ms), TRIG_NONE)
+        db.commit(data, now_ms)
+
+    def test_position_is_metres_not_degrees(self) -> None:
+        db = Deadband([{"field": "pos", "m": 10}], heartbeat_s=0)
+        self.assertEqual(db.check(sample(), 0), TRIG_FIRST)
+        db.commit(sample(), 0)
+        # 0.0001 deg of longitude is 6.8 m at 52.5 N: the old check fired, 10 m does not
+        self.assertEqual(db.check(sample(lon=13.4051), 1000), TRIG_NONE)
+        self.assertEqual(db.check(sample(lat=52.52 + 9 / M_PER_DEG_LAT), 1000), TRIG_NONE)
+        self.assertEqual(db.check(sample(lat=52.52 + 12 / M_PER_DEG_LAT), 1000), TRIG_CHANGE)
+        self.assertEqual(db.trigger_text(), "change:pos")
+
+    def test_absolute_and_relative_thresholds(self) -> None:
+        db = Deadband([{"field": "temp", "abs": 0.5}, {"field": "battery_mv", "rel": 0.05}], 0)
+        self.sent(db, sample())
+        self.assertEqual(db.check(sample(temp=4.4), 1), TRIG_NONE)
+        self.assertEqual(db.check(sample(temp=3.4), 1), TRIG_CHANGE)
+        self.assertEqual(db.check(sample(battery_mv=3750), 1), TRIG_NONE)  # 3.8%
+        self.assertEqual(db.check(sample(battery_mv=3700), 1), TRIG_CHANGE)
+        self.assertEqual(db.field, "battery_mv")
+        # Drift is measured from the last upload, not the last check
+        self.assertEqual(db.check(sample(temp=4.4), 2), TRIG_NONE)
+        self.assertEqual(db.check(sample(temp=4.3), 3), TRIG_NONE)
+        self.assertEqual(db.check(sample(temp=4.6), 4), TRIG_CHANGE)
+
+    def test_dict_fields_compare_per_key(self) -> None:
+        db = Deadband([{"field": "all_temps", "abs": 0.5}], 0)
+        self.sent(db, {"all_temps": {"28aa": 4.0, "28bb": -18.0}})
+        self.assertEqual(db.check({"all_temps": {"28aa": 4.2, "28bb": -17.7}}, 1), TRIG_NONE)
+        self.assertEqual(db.check({"all_temps": {"28aa": 4.2, "28bb": -17.2}}, 1), TRIG_CHANGE)
+        self.assertEqual(db.check({"all_temps": {"28aa": 4.0, "28cc": 5.0}}, 1), TRIG_CHANGE)
+        self.assertEqual(db.check({}, 1), TRIG_NONE)  # Absent fields never trigger
+
+    def test_levels_silence_and_heartbeat(self) -> None:
+        rules = default_rules(500) + [{"field": "battery_mv", "max_s": 600}]
+        db = Deadband(rules, heartbeat_s=3600)
+        self.sent(db, sample())
+        self.assertEqual(db.check(sample(shock=501), 1000), TRIG_LEVEL)
+        self.assertEqual(db.trigger_text(), "level:shock")
+        self.assertEqual(db.check(sample(), 599000), TRIG_NONE)
+        self.assertEqual(db.check(sample(), 600000), TRIG_SILENCE)
+        self.assertEqual(db.field, "battery_mv")
+        db.commit(sample(), 600000)
+        db.check(sample(battery_mv=None), 1200000)
+        self.assertEqual(db.reason, TRIG_NONE)  # Silence only while the field is present
+        self.assertEqual(db.check(sample(battery_mv=None), 600000 + 3600000), TRIG_HEARTBEAT)
+        self.assertEqual(db.trigger_text(), "heartbeat")
+        self.assertEqual(db.counts[TRIG_NONE], 2)
+        self.assertEqual(db.counts[TRIG_FIRST], 1)
+
+    def test_invalid_rules(self) -> None:
+        for rules in (
+            [{"abs": 1}],
+            [{"field": "temp"}],
+            [{"field": "temp", "abs": -1}],
+            [{"field": "shock", "above": "high"}],
+            [{"field": "temp", "max_s": 10**7}],
+            ["temp"],
+        ):
+            with self.assertRaises(ValueError):
+                Deadband(rules)  # type: ignore[arg-type]
+        with self.assertRaises(ValueError):
+            Deadband([], heartbeat_s=-1)
+
+    def test_poster_reports_trigger_and_skips_unchanged(self) -> None:
+        with ConfigServer({}) as server:
+            config = MemConfig(ingest_url=server.url("/ingest"))
+            config.set("upload_deadband", [{"field": "temp", "abs": 0.5}])
+            poster = HttpPoster(config)
+            live = sample()
+            for temp in (4.0, 4.2, 4.9, 5.0):
+                live["temp"] = temp  # The same dict, updated in place like data_store
+                self.assertTrue(asyncio.run(poster.post_telemetry(live)))
+            buffered = sample(boot=3, mono=12.0)
+            self.assertTrue(asyncio.run(poster.post_telemetry(buffered)))
+            triggers = [p.get("trigger") for p in server.posts]
+            self.assertEqual(triggers, ["first", "change:temp", None])
+            self.assertEqual(server.posts[1]["data"]["temp"], 4.9)
+        config.set("upload_deadband", [{"field": "temp"}])
+        self.assertEqual(HttpPoster(config).deadband.fields, ["pos", "temp", "all_temps", "shock"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import asyncio
+import unittest
+from typing import Any, Dict
+
+from tools.config_server import ConfigServer, MemConfig
+from tools.delta_server import Reassembler, simulate
+
+from lib.delta_payload import DeltaEncoder
+from lib.http_poster import HttpPoster
+
+
+def sample(**changes: Any) -> Dict[str, Any]:
+    data = {"lat": 52.52, "lon": 13.405, "temp": 4.0, "gps_fix": True, "trip_state": 1}
+    data.update(changes)
+    return data
+
+
+class TestDeltaEncoder(unittest.TestCase):
+    def test_deltas_are_relative_to_the_acknowledged_state(self) -> None:
+        enc = DeltaEncoder(keyframe_s=0)
+        self.assertEqual(enc.encode(sample(), 0), sample())
+        self.assertEqual((enc.seq, enc.base), (1, 0))
+        self.assertTrue(enc.acked({"ack": 1}))
+        self.assertEqual(enc.encode(sample(temp=4.6), 1000), {"temp": 4.6})
+        self.assertEqual(enc.base, 1)
+        # No ack for 2: the next delta still goes against 1 and repeats temp
+        self.assertFalse(enc.acked(None))
+        delta = enc.encode(sample(temp=4.6, trip_state=2), 2000)
+        self.assertEqual(delta, {"temp": 4.6, "trip_state": 2})
+        self.assertTrue(enc.acked({"ack": 3}))
+        self.assertFalse(enc.acked({"ack": 3}))  # Duplicate
+        data = sample(temp=4.6, trip_state=2)
+        del data["gps_fix"]
+        self.assertEqual(enc.encode(data, 3000), {"gps_fix": None})
+        self.assertEqual(enc.base, 3)
+        self.assertFalse(enc.acked({"ack": 2}))  # Stale ack
+
+    def test_keyframes_on_request_and_on_schedule(self) -> None:
+        enc = DeltaEncoder(keyframe_s=60)
+        enc.encode(sample(), 0)
+        enc.acked({"ack": 1})
+        self.assertEqual(enc.encode(sample(), 1000), {})
+        enc.acked({"key": 1})  # Server lost our base
+        self.assertEqual(enc.encode(sample(), 2000), sample())
+        self.assertEqual(enc.base, 0)
+        enc.acked({"ack": 3})
+        self.assertEqual(enc.encode(sample(), 61000), {})
+        enc.acked({"ack": 4})
+        self.assertEqual(len(enc.encode(sample(), 62000)), 5)  # 60 s since keyframe 3
+        self.assertEqual(enc.keyframes, 3)
+        with self.assertRaises(ValueError):
+            DeltaEncoder(-1)
+
+    def test_dict_fields_are_snapshotted(self) -> None:
+        enc = DeltaEncoder()
+        probes = {"28aa": 4.0}
+        enc.encode({"all_temps": probes}, 0)
+        enc.acked({"ack": 1})
+        probes["28aa"] = 5.0  # Updated in place by the sensor task
+        self.assertEqual(enc.encode({"all_temps": probes}, 1000), {"all_temps": {"28aa": 5.0}})
+
+
+class TestReassembler(unittest.TestCase):
+    def test_gap_requests_a_keyframe(self) -> None:
+        server = Reassembler(history=2)
+        self.assertEqual(server.handle({"seq": 1, "base": 0, "data": sample()}), {"ack": 1})
+        server.handle({"seq": 2, "base": 1, "data": {"temp": 5.0}})
+        server.handle({"seq": 3, "base": 2, "data": {"temp": 6.0}})
+        self.assertEqual(server.handle({"seq": 4, "base": 1, "data": {}}), {"key": 1})
+        self.assertEqual(server.state(None), sample(temp=6.0))
+        reply = server.handle({"seq": 5, "base": 2, "data": {"gps_fix": None}})
+        self.assertEqual(reply, {"ack": 5})
+        self.assertNotIn("gps_fix", server.state(None) or {})
+
+    def test_lossy_round_trip(self) -> None:
+        for loss in (0.0, 0.2, 0.5):
+            r = simulate(loss, n=3600, seed=int(loss * 10))
+            self.assertEqual(r["mismatches"], 0)
+            self.assertGreater(r["delivered"], (1 - loss) * 0.8 * r["uploads"])
+        clean = simulate(0.0, n=3600)
+        full = simulate(0.0, n=3600, delta=False)
+        self.assertEqual(clean["keyframes"], 1)
+        self.assertLess(clean["bytes_per_upload"], 0.6 * full["bytes_per_upload"])
+        lossy = simulate(0.6, n=3600)
+        self.assertGreater(lossy["gaps"], 0)  # Recovered from through keyframes
+        self.assertEqual(lossy["mismatches"], 0)
+
+    def test_poster_delta_mode(self) -> None:
+        server = Reassembler()
+        with ConfigServer({}) as stand_in:
+            stand_in.ingest = server.handle
+            config = MemConfig(ingest_url=stand_in.url("/ingest"), device_id="trk-7")
+            config.set("upload_delta", True)
+            poster = HttpPoster(config)
+            live = sample()
+            for temp in (4.0, 4.7, 5.4):
+                live["temp"] = temp
+                self.assertTrue(asyncio.run(poster.post_telemetry(live)))
+            self.assertEqual(stand_in.posts[1]["data"], {"temp": 4.7})
+            self.assertEqual(stand_in.posts[2]["base"], 2)
+            self.assertEqual(server.state("trk-7"), live)
+
+
+if __name__ == "__main__":
+    unittest.main()
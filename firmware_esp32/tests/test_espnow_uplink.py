@@ -0,0 +1,147 @@
+import asyncio
+import unittest
+from typing import Any, Dict, List, Optional, Tuple
+
+from lib.espnow_uplink import BROADCAST, MAX_MESSAGE, EspNowUplink
+
+
+class SimAir:
+    """In-process ESP-NOW medium connecting any number of SimRadios"""
+
+    def __init__(self) -> None:
+        self.radios: Dict[bytes, "SimRadio"] = {}
+        self.drop_acks = 0  # Drop the next N unicast frames sent by relays
+
+    def deliver(self, src: bytes, dst: bytes, msg: bytes) -> bool:
+        if dst == BROADCAST:
+            for mac, radio in self.radios.items():
+                if mac != src:
+                    radio.inbox.append((src, msg))
+            return True
+        target = self.radios.get(dst)
+        if target is None:
+            return False
+        if self.drop_acks and msg[1] == 3:  # ACK frame
+            self.drop_acks -= 1
+            return True
+        target.inbox.append((src, msg))
+        return True
+
+
+class SimRadio:
+    def __init__(self, air: SimAir, mac: bytes) -> None:
+        self.air = air
+        self.mac = mac
+        self.inbox: List[Tuple[bytes, bytes]] = []
+        air.radios[mac] = self
+
+    def send(self, mac: bytes, msg: bytes) -> bool:
+        return self.air.deliver(self.mac, mac, msg)
+
+    def recv(self) -> Tuple[Optional[bytes], Optional[bytes]]:
+        if not self.inbox:
+            return None, None
+        return self.inbox.pop(0)
+
+
+def _records(n: int) -> List[Dict[str, Any]]:
+    return [{"lat": 52.5 + i * 1e-4, "lon": 13.4, "speed": 12.0, "shock": i} for i in range(n)]
+
+
+class TestEspNowUplink(unittest.TestCase):
+    def setUp(self) -> None:
+        self.air = SimAir()
+        self.uploads: List[Tuple[str, List[Dict[str, Any]]]] = []
+        self.upload_ok = True
+        self.relay_online = True
+
+        async def upload(origin: str, records: List[Dict[str, Any]]) -> bool:
+            self.uploads.append((origin, records))
+            return self.upload_ok
+
+        self.relay = EspNowUplink(
+            SimRadio(self.air, b"\x02\x00\x00\x00\x00\x01"),
+            "Last-Mile-RELAY",
+            has_uplink=lambda: self.relay_online,
+            upload=upload,
+            rate_per_min=4,
+            ack_timeout_ms=100,
+            beacon_interval_ms=50,
+        )
+        self.sender = EspNowUplink(
+            SimRadio(self.air, b"\x02\x00\x00\x00\x00\x02"),
+            "Last-Mile-SEND",
+            has_uplink=lambda: False,
+            ack_timeout_ms=100,
+            beacon_interval_ms=50,
+        )
+
+    def _run(self, records: List[Dict[str, Any]]) -> int:
+        async def scenario() -> int:
+            tasks = [
+                asyncio.create_task(self.relay.run(poll_ms=5)),
+                asyncio.create_task(self.sender.run(poll_ms=5)),
+            ]
+            await asyncio.sleep(0.03)  # Let the first beacon land
+            try:
+                return await self.sender.forward(records)
+            finally:
+                for t in tasks:
+                    t.cancel()
+
+        return asyncio.run(scenario())
+
+    def test_forward_confirms_all_records(self) -> None:
+        records = _records(20)
+        self.assertEqual(self._run(records), 20)
+        uploaded = [r for origin, batch in self.uploads for r in batch]
+        self.assertEqual(uploaded, records)
+        self.assertTrue(all(origin == "Last-Mile-SEND" for origin, _ in self.uploads))
+        # 20 records do not fit one message, so fragmentation and batching both ran
+        self.assertGreater(len(self.uploads), 1)
+
+    def test_lost_ack_is_retried_without_duplicate_upload(self) -> None:
+        self.air.drop_acks = 1
+        self.assertEqual(self._run(_records(2)), 2)
+        self.assertEqual(len(self.uploads), 1)
+        self.assertEqual(self.relay.stats["relay_dup"], 1)
+
+    def test_failed_relay_upload_keeps_records(self) -> None:
+        self.upload_ok = False
+        self.assertEqual(self._run(_records(3)), 0)
+        self.assertEqual(self.sender.stats["fwd_fail"], 1)
+
+    def test_rate_limit_stops_forwarding(self) -> None:
+        # ~60 bytes per record: 200 records need more messages than the 4/min budget
+        records = _records(200)
+        confirmed = self._run(records)
+        self.assertGreater(confirmed, 0)
+        self.assertLess(confirmed, 200)
+        self.assertEqual(self.relay.stats["relay_ok"], 4)
+        self.assertEqual(self.relay.stats["relay_busy"], 1)
+
+    def test_new_mac_does_not_reset_other_rate_windows(self) -> None:
+        macs = [bytes((2, 0, 0, 0, 1, i)) for i in range(9)]
+        for mac in macs[:7]:
+            self.assertTrue(self.relay._take_token(mac))
+        busy = macs[7]
+        for _ in range(4):
+            self.assertTrue(self.relay._take_token(busy))
+        self.assertFalse(self.relay._take_token(busy))
+        self.assertTrue(self.relay._take_token(macs[8]))  # 9th MAC evicts the oldest window
+        self.assertFalse(self.relay._take_token(busy))
+        self.assertNotIn(macs[0], self.relay._window)
+
+    def test_no_relay_forwards_nothing(self) -> None:
+        self.relay_online = False
+        self.assertEqual(self._run(_records(3)), 0)
+        self.assertEqual(self.uploads, [])
+
+    def test_oversized_record_is_not_dropped(self) -> None:
+        big = {"blob": "x" * MAX_MESSAGE}
+        self.assertEqual(self._run([big]), 0)
+        self.assertEqual(self.uploads, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
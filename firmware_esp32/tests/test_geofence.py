@@ -0,0 +1,154 @@
+import math
+import random
+import unittest
+from typing import Any, Dict, List, Tuple
+
+from lib.geofence import EVENT_NAMES, M_PER_DEG, GeofenceEngine
+
+LAT0, LON0 = 52.52, 13.405
+KX = M_PER_DEG * math.cos(math.radians(LAT0))
+
+
+def at(x_m: float, y_m: float) -> Tuple[float, float]:
+    """Position x metres east and y metres north of (LAT0, LON0)"""
+    return LAT0 + y_m / M_PER_DEG, LON0 + x_m / KX
+
+
+def depot(radius: float = 100.0, **extra: Any) -> Dict[str, Any]:
+    spec = {"id": "depot", "lat": LAT0, "lon": LON0, "radius_m": radius}
+    spec.update(extra)
+    return spec
+
+
+def drive(engine: GeofenceEngine, path: List[Tuple[float, float]]) -> List[Tuple[int, str, str]]:
+    """One fix per second along (x, y) metres; returns (t, event, fence id)"""
+    out = []
+    for t, (x, y) in enumerate(path):
+        lat, lon = at(x, y)
+        for kind, fence in engine.check(lat, lon, t * 1000):
+            out.append((t, EVENT_NAMES[kind], fence.id))
+    return out
+
+
+class TestGeofence(unittest.TestCase):
+    def test_circle_enter_exit_with_noise(self) -> None:
+        engine = GeofenceEngine(margin_m=20, confirm_s=5, dwell_s=600)
+        engine.load([depot()])
+        rng = random.Random(5)
+        path = [(x + rng.uniform(-8, 8), 0.0) for x in range(-300, 300, 5)]  # 5 m/s through
+        path = [(-300.0, 0.0)] * 10 + path + [(400.0, 0.0)] * 10
+        events = drive(engine, path)
+        self.assertEqual([e for _, e, _ in events], ["enter", "exit"])
+        # Inside from x=-100 (t=50) plus 5 s; exit needs > 120 m out (t=94) plus 5 s
+        self.assertAlmostEqual(events[0][0], 55, delta=2)
+        self.assertAlmostEqual(events[1][0], 99, delta=2)
+
+    def test_boundary_jitter_does_not_flap(self) -> None:
+        engine = GeofenceEngine(margin_m=20, confirm_s=5, dwell_s=3600)
+        engine.load([depot()])
+        rng = random.Random(9)
+        path = [(0.0, 0.0)] * 10 + [(95 + rng.uniform(-15, 15), 0.0) for _ in range(600)]
+        self.assertEqual([e for _, e, _ in drive(engine, path)], ["enter"])
+
+    def test_short_pass_through_is_not_an_entry(self) -> None:
+        engine = GeofenceEngine(confirm_s=5)
+        engine.load([depot(radius=20)])
+        path = [(float(x), 0.0) for x in range(-100, 100, 10)]  # 4 s inside
+        self.assertEqual(drive(engine, path), [])
+
+    def test_dwell_fires_once_per_visit(self) -> None:
+        engine = GeofenceEngine(confirm_s=5, dwell_s=300)
+        engine.load([depot(dwell_s=60)])
+        path = [(0.0, 0.0)] * 200 + [(1000.0, 0.0)] * 10 + [(0.0, 0.0)] * 70
+        kinds = [(t, e) for t, e, _ in drive(engine, path)]
+        self.assertEqual(
+            kinds, [(5, "enter"), (60, "dwell"), (205, "exit"), (215, "enter"), (270, "dwell")]
+        )
+
+    def test_reload_keeps_state_of_unchanged_fences(self) -> None:
+        engine = GeofenceEngine(confirm_s=5, dwell_s=300)
+        engine.load([depot(dwell_s=60)])
+        lat, lon = at(0, 0)
+        for t in range(30):
+            engine.check(lat, lon, t * 1000)
+        self.assertEqual(engine.inside(), ["depot"])
+        yard = {"id": "yard", "lat": LAT0, "lon": LON0, "radius_m": 50.0}
+        self.assertEqual(engine.load([yard, depot(dwell_s=60)]), 2)  # Unrelated change
+        self.assertEqual(engine.inside(), ["depot"])
+        events = []
+        for t in range(30, 70):
+            for kind, fence in engine.check(lat, lon, t * 1000):
+                events.append((t, EVENT_NAMES[kind], fence.id))
+        # No second ENTER for the depot, and its dwell timer kept running
+        self.assertEqual(events, [(35, "enter", "yard"), (60, "dwell", "depot")])
+        engine.load([yard])
+        self.assertEqual(engine.inside(), ["yard"])
+
+    def test_concave_polygon(self) -> None:
+        # L-shaped yard: the notch at the top right is outside
+        pts = [at(0, 0), at(200, 0), at(200, 100), at(100, 100), at(100, 200), at(0, 200)]
+        engine = GeofenceEngine(confirm_s=0)
+        engine.load([{"id": "yard", "points": [list(p) for p in pts]}])
+        fence = engine.fences[0]
+        for x, y, inside in ((50, 50, True), (150, 50, True), (50, 150, True), (150, 150, False)):
+            lat, lon = at(x, y)
+            local = ((lon - fence.lon0) * fence.kx, (lat - fence.lat0) * M_PER_DEG)
+            self.assertEqual(fence.contains(*local), inside, (x, y))
+        # 10 m into the notch is not far enough out to exit
+        self.assertEqual(drive(engine, [(150.0, 50.0), (150.0, 110.0)]), [(0, "enter", "yard")])
+        self.assertEqual(drive(engine, [(150.0, 150.0)]), [(0, "exit", "yard")])
+
+    def test_grid_limits_fences_tested(self) -> None:
+        rng = random.Random(1)
+        specs = [
+            depot(
+                radius=rng.uniform(50, 300),
+                id="f%d" % i,
+                lat=LAT0 + rng.uniform(-0.5, 0.5),
+                lon=LON0 + rng.uniform(-0.8, 0.8),
+            )
+            for i in range(300)
+        ]
+        engine = GeofenceEngine()
+        self.assertEqual(engine.load(specs), 300)
+        worst = 0
+        for _ in range(500):
+            engine.check(LAT0 + rng.uniform(-0.5, 0.5), LON0 + rng.uniform(-0.8, 0.8), 0)
+            worst = max(worst, engine.tested)
+        self.assertLessEqual(worst, 6)
+
+    def test_jump_out_of_cell_still_exits(self) -> None:
+        engine = GeofenceEngine(confirm_s=0)
+        engine.load([depot()])
+        self.assertEqual(drive(engine, [(0.0, 0.0)]), [(0, "enter", "depot")])
+        self.assertEqual(drive(engine, [(50000.0, 0.0)]), [(0, "exit", "depot")])
+        self.assertEqual(engine.inside(), [])
+
+    def test_wide_fence(self) -> None:
+        engine = GeofenceEngine(confirm_s=0, cell_deg=0.01)
+        engine.load([depot(radius=20000, id="city")])  # Covers far more than 64 cells
+        self.assertEqual(drive(engine, [(15000.0, 0.0)]), [(0, "enter", "city")])
+        self.assertEqual(engine.inside(), ["city"])
+
+    def test_invalid_specs_keep_previous_set(self) -> None:
+        engine = GeofenceEngine()
+        engine.load([depot()])
+        bad_specs: Tuple[List[Any], ...] = (
+            [{"id": "x", "lat": LAT0}],
+            [depot(radius=0)],
+            [{"points": [[0, 0], [1, 1]]}],
+            [depot(lat=95.0)],
+            ["depot"],
+        )
+        for bad in bad_specs:
+            with self.assertRaises(ValueError):
+                engine.load(bad)
+        with self.assertRaises(ValueError):
+            GeofenceEngine(max_fences=1).load([depot(), depot()])
+        with self.assertRaises(ValueError):
+            GeofenceEngine(cell_deg=0.001)
+        self.assertEqual([f.id for f in engine.fences], ["depot"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import time
+import unittest
+
+from lib.gps_control import (
+    GPS_BACKUP,
+    GPS_ECO,
+    GPS_EPOCH,
+    GPS_FULL,
+    GpsController,
+    parse_rmc,
+    ubx_frame,
+)
+from lib.trip_detector import TRIP_IDLE, TRIP_MOVING, TRIP_STOPPED
+from tools.gps_sim import FakeUblox, measure, nmea
+
+CONFIG = ["CFG-MSG"] * 6 + ["CFG-RATE", "CFG-RXM"]
+
+
+def run(fake: FakeUblox, ctrl: GpsController, state: int, moving: bool, seconds: int) -> None:
+    for _ in range(seconds * 10):
+        now = fake.now_ms + 100
+        fake.tick(now)
+        ctrl.update(state, moving, now)
+
+
+class TestGpsControl(unittest.TestCase):
+    def setUp(self) -> None:
+        self.fake = FakeUblox()
+        self.ctrl = GpsController(self.fake, backup_after_s=60, backup_max_s=600)
+        self.ctrl.configure()
+
+    def test_configure_sequence(self) -> None:
+        self.assertEqual(self.fake.names(), CONFIG)
+        self.assertEqual(self.fake.errors, [])
+        self.assertEqual([k for k, r in self.fake.rates.items() if r], [0x04])  # RMC only
+        self.assertEqual((self.fake.meas_ms, self.fake.lp_mode), (1000, 0))
+
+    def test_ubx_checksum(self) -> None:
+        # CFG-RATE 1 Hz as documented in the u-blox 6 protocol specification
+        frame = ubx_frame(0x06, 0x08, bytes((0xE8, 0x03, 0x01, 0x00, 0x01, 0x00)))
+        self.assertEqual(frame[-2:], bytes((0x01, 0x39)))
+
+    def test_modes_follow_motion(self) -> None:
+        run(self.fake, self.ctrl, TRIP_MOVING, False, 10)
+        self.assertEqual(self.ctrl.mode, GPS_FULL)
+        run(self.fake, self.ctrl, TRIP_STOPPED, False, 10)
+        self.assertEqual(self.ctrl.mode, GPS_ECO)
+        self.assertEqual((self.fake.meas_ms, self.fake.lp_mode), (5000, 1))
+        run(self.fake, self.ctrl, TRIP_IDLE, False, 59)
+        self.assertEqual(self.ctrl.mode, GPS_ECO)
+        run(self.fake, self.ctrl, TRIP_IDLE, False, 2)
+        self.assertEqual(self.ctrl.mode, GPS_BACKUP)
+        self.assertTrue(self.fake.asleep)
+        self.assertEqual(self.fake.names()[-1], "RXM-PMREQ")
+
+    def test_backup_rearmed_after_timer_wake(self) -> None:
+        run(self.fake, self.ctrl, TRIP_IDLE, False, 61)
+        sent = len(self.fake.commands)
+        run(self.fake, self.ctrl, TRIP_IDLE, False, 1200)
+        self.assertTrue(self.fake.asleep)
+        self.assertEqual(self.fake.names()[sent:], ["RXM-PMREQ"] * 2)
+
+    def test_motion_wakes_with_hot_start(self) -> None:
+        ts = int(time.time())
+        self.ctrl.note_fix(52.52, 13.405, ts)
+        run(self.fake, self.ctrl, TRIP_IDLE, False, 61)
+        sent = len(self.fake.commands)
+        run(self.fake, self.ctrl, TRIP_IDLE, True, 1)
+        self.assertEqual(self.ctrl.mode, GPS_FULL)
+        self.assertFalse(self.fake.asleep)
+        self.assertEqual(self.fake.names()[sent:], CONFIG + ["AID-INI"])
+        aid = self.fake.aid
+        assert aid is not None
+        self.assertAlmostEqual(aid["lat"], 52.52, places=6)
+        self.assertAlmostEqual(aid["lon"], 13.405, places=6)
+        self.assertEqual(aid["pos_acc_cm"], 10000)
+        gps_s = aid["wn"] * 604800 + aid["tow_ms"] // 1000
+        self.assertAlmostEqual(gps_s, ts - GPS_EPOCH + 18, delta=2)
+        self.assertEqual(self.fake.errors, [])
+
+    def test_no_hot_start_without_saved_fix(self) -> None:
+        run(self.fake, self.ctrl, TRIP_IDLE, False, 61)
+        run(self.fake, self.ctrl, TRIP_MOVING, False, 1)
+        self.assertNotIn("AID-INI", self.fake.names())
+        self.ctrl.restore(["x", 1, 2])
+        self.ctrl.restore(None)
+        self.assertEqual(self.ctrl.saved(), [0.0, 0.0, 0])
+        self.ctrl.restore([52.5, 13.4, 1718409600])
+        self.assertEqual(self.ctrl.saved(), [52.5, 13.4, 1718409600])
+
+    def test_parser_load_per_mode(self) -> None:
+        default = measure(FakeUblox(), 30)
+        moving = measure(self.fake, 30, self.ctrl, (TRIP_MOVING, False))
+        stopped = measure(self.fake, 30, self.ctrl, (TRIP_STOPPED, False))
+        measure(self.fake, 70, self.ctrl, (TRIP_IDLE, False))
+        parked = measure(self.fake, 30, self.ctrl, (TRIP_IDLE, False))
+        self.assertGreater(default["lines_s"], 7)
+        self.assertLess(moving["bytes_s"], default["bytes_s"] / 5)
+        self.assertLess(stopped["bytes_s"], moving["bytes_s"] / 3)
+        self.assertEqual(parked["bytes_s"], 0)
+
+    def test_parse_rmc(self) -> None:
+        gps = {"lat": 0.0, "lon": 0.0, "speed": 0.0, "course": 0.0, "fix": False}
+        line = ubx_frame(5, 1, b"\x06\x01") + nmea(
+            "GPRMC,120000.00,A,5231.20000,N,01324.30000,W,10.0,,150624,,,A"
+        )
+        self.assertEqual(parse_rmc(line, gps), 1)
+        self.assertAlmostEqual(gps["lat"], 52.52)
+        self.assertAlmostEqual(gps["lon"], -13.405)
+        self.assertAlmostEqual(gps["speed"], 18.52)
+        self.assertEqual(parse_rmc(nmea("GPRMC,120001.00,V,,,,,,,150624,,,N"), gps), 0)
+        self.assertFalse(gps["fix"])
+        self.assertEqual(parse_rmc(nmea("GPGGA,120000.00"), gps), -1)
+
+    def test_invalid_parameters(self) -> None:
+        with self.assertRaises(ValueError):
+            GpsController(self.fake, rate_moving_ms=5000, rate_stopped_ms=1000)
+        with self.assertRaises(ValueError):
+            GpsController(self.fake, backup_max_s=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
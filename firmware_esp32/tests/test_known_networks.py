@@ -0,0 +1,246 @@
+import asyncio
+import unittest
+from typing import Any, List, Tuple
+
+from lib.ble_commands import (
+    OP_WIFI_ADD,
+    OP_WIFI_REMOVE,
+    OP_WIFI_SET,
+    REQ_MAGIC,
+    RESP_MAGIC,
+    ST_BAD_ARGS,
+    ST_FAILED,
+    ST_OK,
+    TAG_PASS,
+    TAG_PRIORITY,
+    TAG_SSID,
+    CommandRouter,
+    Request,
+    pack_tlv,
+    parse_wifi_add_text,
+    parse_wifi_remove_text,
+    parse_wifi_text,
+)
+from lib.known_networks import BACKOFF_MAX_S, BACKOFF_MIN_S, KnownNetworks
+from tools.wifi_sim import DictConfig, FakeWLAN, VirtualClock
+
+from lib.wifi_manager import WiFiManager  # After tools.wifi_sim installs the fake network
+
+BSSID = b"\x24\x0a\xc4\x11\x22\x33"
+
+
+def scan(*nets: Tuple[str, int]) -> List[Tuple[str, int, int, int, bytes]]:
+    """scan_networks() shape: (ssid, rssi, channel, authmode, bssid), strongest first"""
+    rows = [(ssid, rssi, 6, 3, BSSID) for ssid, rssi in nets]
+    return sorted(rows, key=lambda r: r[1], reverse=True)
+
+
+class TestKnownNetworks(unittest.TestCase):
+    def setUp(self) -> None:
+        self.config = DictConfig(wifi_networks=[], wifi_ssid="", wifi_pass="")
+        self.known = KnownNetworks(self.config, max_networks=3)
+        self.known.add("Home", "homepass1", 5)
+        self.known.add("Depot-North", "depotpass", 1)
+        self.known.add("Depot-South", "depotpass", 1)
+
+    def ssid(self, nets: Any, now_ms: int = 0) -> Any:
+        e = self.known.select(nets, now_ms)
+        return e["ssid"] if e else None
+
+    def test_priority_beats_signal(self) -> None:
+        self.assertEqual(self.ssid(scan(("Depot-North", -45), ("Home", -80))), "Home")
+
+    def test_rssi_breaks_priority_ties(self) -> None:
+        nets = scan(("Depot-North", -78), ("Depot-South", -52), ("Cafe", -30))
+        self.assertEqual(self.ssid(nets), "Depot-South")
+
+    def test_nothing_known_in_range(self) -> None:
+        self.assertIsNone(self.ssid(scan(("Cafe", -30), ("Neighbour", -60))))
+        self.assertIsNone(self.ssid([]))
+
+    def test_backoff_doubles_per_network(self) -> None:
+        nets = scan(("Home", -70), ("Depot-North", -60))
+        self.known.record("Home", False, 0, 1000)
+        self.assertEqual(self.ssid(nets, 1000), "Depot-North")
+        self.assertEqual(self.ssid(nets, BACKOFF_MIN_S * 1000), "Home")
+        self.known.record("Home", False, 60000, 1060)
+        self.assertEqual(self.ssid(nets, 60000 + 119000), "Depot-North")
+        self.assertEqual(self.ssid(nets, 60000 + 120000), "Home")
+        self.assertEqual(self.known.find("Home")["fails"], 2)  # type: ignore[index]
+
+    def test_backoff_is_capped_and_success_resets(self) -> None:
+        for i in range(10):
+            self.known.record("Home", False, 0, 1000 + i)
+        self.assertTrue(self.known.backed_off("Home", BACKOFF_MAX_S * 1000 - 1))
+        self.assertFalse(self.known.backed_off("Home", BACKOFF_MAX_S * 1000))
+        self.known.record("Home", True, 0, 5000)
+        e = self.known.find("Home")
+        assert e is not None
+        self.assertEqual((e["fails"], e["ok_ts"]), (0, 5000))
+        self.assertFalse(self.known.backed_off("Home", 0))
+
+    def test_retry_in_follows_earliest_network(self) -> None:
+        self.assertEqual(self.known.retry_in_s(0), BACKOFF_MIN_S)
+        for ssid in ("Home", "Depot-North", "Depot-South"):
+            for _ in range(3):
+                self.known.record(ssid, False, 0, 1000)
+        self.known.record("Depot-South", True, 0, 1000)
+        self.known.record("Depot-South", False, 0, 1000)
+        self.assertEqual(self.known.retry_in_s(0), BACKOFF_MIN_S)
+        self.assertEqual(self.known.retry_in_s(-180000), 240)
+
+    def test_success_writes_config_sparingly(self) -> None:
+        writes = self.config.writes
+        self.known.record("Home", True, 0, 10000)
+        self.known.record("Home", True, 0, 10060)
+        self.known.record("Home", True, 0, 13599)
+        self.assertEqual(self.config.writes, writes + 1)
+        self.known.record("Home", True, 0, 13600)
+        self.assertEqual(self.config.writes, writes + 2)
+
+    def test_table_is_bounded_and_validated(self) -> None:
+        with self.assertRaises(ValueError):
+            self.known.add("Yard", "yardpass1")
+        self.known.add("Home", "newpass12", 9)  # Update in place is always allowed
+        self.assertEqual(self.known.find("Home")["prio"], 9)  # type: ignore[index]
+        for ssid, pw, prio in (("", "x", 1), ("x" * 33, "", 1), ("Yard", "", 256)):
+            with self.assertRaises(ValueError):
+                self.known.add(ssid, pw, prio)
+
+    def test_remove_and_primary_mirror(self) -> None:
+        self.assertTrue(self.known.remove("Depot-South"))
+        self.assertFalse(self.known.remove("Depot-South"))
+        self.config.set("wifi_ssid", "Yard")
+        self.config.set("wifi_pass", "yardpass1")
+        self.known.refresh()
+        self.assertEqual(self.known.find("Yard")["pass"], "yardpass1")  # type: ignore[index]
+        writes = self.config.writes
+        self.known.refresh()
+        self.assertEqual(self.config.writes, writes)
+        self.assertTrue(self.known.remove("Yard"))
+        self.assertEqual(self.config.get("wifi_ssid"), "")
+        self.known.refresh()
+        self.assertIsNone(self.known.find("Yard"))
+
+
+class TestWiFiSelection(unittest.TestCase):
+    """WiFiManager picks the depot that is actually in range"""
+
+    def setUp(self) -> None:
+        self.clock = VirtualClock()
+        self.clock.__enter__()
+        self.wlan = FakeWLAN(self.clock, ssid="Depot-North", key="depotpass")
+        self.config = DictConfig(wifi_ssid="Home", wifi_pass="homepass1", wifi_scan_ttl_sec=30)
+        self.wifi = WiFiManager(self.config)
+        self.wifi.known.add("Home", "homepass1", 5)
+        self.wifi.known.add("Depot-North", "depotpass", 1)
+
+    def tearDown(self) -> None:
+        self.clock.__exit__()
+
+    def test_connects_to_visible_network(self) -> None:
+        self.assertTrue(asyncio.run(self.wifi.connect()))
+        self.assertEqual(self.wifi.ssid, "Depot-North")
+        self.assertEqual(self.wlan.scans, 1)
+        self.assertEqual(self.config.get("wifi_link_cache")["ssid"], "Depot-North")
+
+    def test_cached_link_skips_scan(self) -> None:
+        asyncio.run(self.wifi.connect())
+        self.wlan.disconnect()
+        self.clock.advance(300000)  # Scan result stale
+        self.assertTrue(asyncio.run(self.wifi.connect()))
+        self.assertEqual(self.wlan.scans, 1)
+
+    def test_failure_backs_off_that_network_only(self) -> None:
+        self.wlan.key = "rotated!"
+        self.assertFalse(asyncio.run(self.wifi.connect()))
+        self.assertTrue(self.wifi.known.backed_off("Depot-North", self.clock.ms))
+        self.assertFalse(self.wifi.known.backed_off("Home", self.clock.ms))
+        status: List[Tuple[str, str]] = []
+        self.assertFalse(asyncio.run(self.wifi.connect(lambda s, d: status.append((s, d)))))
+        self.assertEqual(status, [("FAILED", "No Known Network")])  # Home not in range
+
+    def test_explicit_ssid_ignores_backoff(self) -> None:
+        self.wlan.key = "rotated!"
+        asyncio.run(self.wifi.connect())
+        self.wlan.key = "depotpass"
+        self.assertTrue(asyncio.run(self.wifi.connect(ssid="Depot-North")))
+        self.assertFalse(self.wifi.known.backed_off("Depot-North", self.clock.ms))
+
+
+class TestWiFiCommands(unittest.TestCase):
+    """CMD:WIFI_ADD / CMD:WIFI_DEL routed as in main.py, against a real table"""
+
+    def setUp(self) -> None:
+        self.config = DictConfig(wifi_networks=[], wifi_ssid="Home", wifi_pass="homepass1")
+        self.known = KnownNetworks(self.config, max_networks=2)
+        self.known.refresh()
+        self.sent: List[bytes] = []
+        self.router = CommandRouter(self.sent.append)
+        self.router.register(OP_WIFI_SET, self.wifi_set)
+        self.router.register(OP_WIFI_ADD, self.wifi_add)
+        self.router.register_prefix("CMD:WIFI_ADD:", OP_WIFI_ADD, parse_wifi_add_text)
+        self.router.register(OP_WIFI_REMOVE, self.wifi_remove)
+        self.router.register_prefix("CMD:WIFI_DEL:", OP_WIFI_REMOVE, parse_wifi_remove_text)
+        self.router.set_text_fallback(OP_WIFI_SET, parse_wifi_text)
+
+    def wifi_set(self, req: Request) -> None:
+        self.config.set("wifi_ssid", req.text(TAG_SSID))
+        self.config.set("wifi_pass", req.text(TAG_PASS))
+        self.router.reply(req, ST_OK, text=b"WIFI:SET")
+
+    def wifi_add(self, req: Request) -> None:
+        ssid = req.text(TAG_SSID)
+        if not ssid:
+            self.router.reply(req, ST_BAD_ARGS)
+            return
+        try:
+            self.known.add(ssid, req.text(TAG_PASS), req.uint(TAG_PRIORITY, 1))
+        except ValueError as e:
+            self.router.reply(req, ST_FAILED, text=b"WIFI:ADD:" + str(e).encode())
+            return
+        self.router.reply(req, ST_OK, text=b"WIFI:ADD:OK")
+
+    def wifi_remove(self, req: Request) -> None:
+        if not self.known.remove(req.text(TAG_SSID)):
+            self.router.reply(req, ST_FAILED, text=b"WIFI:DEL:NOT_FOUND")
+            return
+        self.router.reply(req, ST_OK, text=b"WIFI:DEL:OK")
+
+    def status(self) -> int:
+        resp = self.sent[-1]
+        self.assertEqual(resp[0], RESP_MAGIC)
+        return resp[3]
+
+    def test_malformed_text_leaves_networks_alone(self) -> None:
+        table = self.known.networks
+        for value in (
+            b"CMD:WIFI_ADD:not json",
+            b'CMD:WIFI_ADD:{"pass": "no ssid"}',
+            b'CMD:WIFI_ADD:{"ssid": "Yard", "prio": "high"}',
+            b"CMD:WIFI_ADD:",
+            b"CMD:WIFI_DEL:",
+        ):
+            self.assertIsNone(self.router.dispatch(value), value)
+        # Not reinterpreted as SSID "CMD" by the SSID:PASS fallback
+        self.assertEqual(self.config.get("wifi_ssid"), "Home")
+        self.assertEqual(self.config.get("wifi_pass"), "homepass1")
+        self.assertEqual(self.known.networks, table)
+        self.assertEqual(self.sent, [])
+
+    def test_rejected_entries_fail(self) -> None:
+        self.router.dispatch(b"CMD:WIFI_DEL:Nowhere")
+        self.assertEqual(self.sent, [b"WIFI:DEL:NOT_FOUND"])
+        ssid = pack_tlv(TAG_SSID, b"x" * 33)
+        self.router.dispatch(bytes((REQ_MAGIC, OP_WIFI_ADD, 7, len(ssid))) + ssid)
+        self.assertEqual(self.status(), ST_FAILED)
+        self.router.dispatch(b'CMD:WIFI_ADD:{"ssid": "Yard", "pass": "yardpass1", "prio": 9}')
+        self.assertEqual(self.sent[-1], b"WIFI:ADD:OK")
+        self.router.dispatch(b'CMD:WIFI_ADD:{"ssid": "Depot", "pass": "depotpass"}')
+        self.assertEqual(self.sent[-1], b"WIFI:ADD:Known network table full")
+        self.assertEqual([e["ssid"] for e in self.known.networks], ["Home", "Yard"])
+        self.assertEqual(self.config.get("wifi_ssid"), "Home")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import time
+import unittest
+import zlib
+from typing import Any, Dict, List, Tuple
+
+from tools.config_server import MemConfig
+from tools.mqtt_broker import Broker, topic_matches
+
+from lib.http_poster import HttpPoster
+from lib.mqtt_uplink import MqttUplink, encode_length
+
+
+def run(coro: Any) -> Any:
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+class TestMqttUplink(unittest.TestCase):
+    def test_encoding_helpers(self) -> None:
+        cases = {0: b"\x00", 127: b"\x7f", 128: b"\x80\x01", 16383: b"\xff\x7f"}
+        for n, want in cases.items():
+            self.assertEqual(encode_length(n), want)
+        self.assertEqual(encode_length(2097152), b"\x80\x80\x80\x01")
+        self.assertTrue(topic_matches("lmt/+/up/#", "lmt/trk-1/up/z"))
+        self.assertFalse(topic_matches("lmt/+/down", "lmt/trk-1/up"))
+        bad: List[Dict[str, Any]] = [{"inflight": 0}, {"inflight": 65}, {"keepalive_s": 70000}]
+        for kwargs in bad:
+            with self.assertRaises(ValueError):
+                MqttUplink("broker", "trk-1", **kwargs)
+        with self.assertRaises(ValueError):
+            MqttUplink("", "trk-1")
+
+    def test_publish_and_persistent_downlink(self) -> None:
+        async def scenario() -> Tuple[List[Tuple[str, bytes]], Broker, MqttUplink]:
+            broker = await Broker(password="s3cret").start()
+            got: List[Tuple[str, bytes]] = []
+            up = MqttUplink(
+                "127.0.0.1",
+                "trk-1",
+                port=broker.port,
+                username="trk-1",
+                password="s3cret",
+                down_topic="lmt/trk-1/down",
+            )
+            up.on_message = lambda t, p: got.append((t, p))
+            self.assertTrue(await up.publish("lmt/trk-1/up", b"hello"))
+            self.assertFalse(up.session_present)
+            await up.close()
+            # Queued by the broker while the radio is off, delivered on the next link
+            await broker.publish("lmt/trk-1/down", b'{"cfg": 2}')
+            self.assertTrue(await up.publish("lmt/trk-1/up", b"again"))
+            self.assertTrue(up.session_present)
+            await asyncio.sleep(0.05)
+            await up.close()
+            await broker.close()
+            return got, broker, up
+
+        got, broker, up = run(scenario())
+        self.assertEqual(broker.payloads(), [b"hello", b"again"])
+        self.assertEqual(got, [("lmt/trk-1/down", b'{"cfg": 2}')])
+        self.assertFalse(broker.sessions["trk-1"].outbox)  # The downlink was acknowledged
+        self.assertEqual((up.connects, up.received), (2, 1))
+
+        async def refused() -> bool:
+            broker = await Broker(password="s3cret").start()
+            up = MqttUplink("127.0.0.1", "trk-1", port=broker.port, username="trk-1")
+            ok = await up.publish("lmt/trk-1/up", b"x")
+            await broker.close()
+            return ok or up.connected
+
+        self.assertFalse(run(refused()))
+
+    def test_window_pipelines_publishes(self) -> None:
+        async def timed(window: int) -> float:
+            broker = await Broker(ack_delay_ms=20).start()
+            up = MqttUplink("127.0.0.1", "trk-1", port=broker.port, inflight=window)
+            await up.connect()
+            start = time.monotonic()
+            for i in range(20):
+                self.assertTrue(await up.publish("lmt/trk-1/up", b"%d" % i, wait=False))
+            self.assertTrue(await up.flush())
+            elapsed = time.monotonic() - start
+            self.assertEqual(len(broker.received), 20)
+            await up.close()
+            await broker.close()
+            return elapsed
+
+        serial = run(timed(1))
+        pipelined = run(timed(8))
+        self.assertGreater(serial, 0.38)  # One 20 ms round trip per publish
+        self.assertLess(pipelined, serial / 3)
+
+    def test_reconnect_resends_window(self) -> None:
+        async def scenario() -> Tuple[Broker, MqttUplink]:
+            broker = await Broker(ack_delay_ms=5).start()
+            up = MqttUplink("127.0.0.1", "trk-1", port=broker.port, inflight=8)
+            for i in range(40):
+                if i == 20:
+                    broker.kill("trk-1")
+                    await asyncio.sleep(0.02)
+                while not await up.publish("lmt/trk-1/up", b"%d" % i, wait=False):
+                    await asyncio.sleep(0.01)
+            self.assertTrue(await up.flush())
+            await up.close()
+            await broker.close()
+            return broker, up
+
+        broker, up = run(scenario())
+        fresh = [int(p) for _, _, p, dup in broker.received if not dup]
+        dups = [int(p) for _, _, p, dup in broker.received if dup]
+        self.assertEqual(len(fresh), len(set(fresh)))  # Nothing was published twice
+        self.assertEqual(sorted(set(fresh) | set(dups)), list(range(40)))
+        self.assertEqual(up.connects, 2)
+        self.assertGreater(up.resent, 0)
+        self.assertEqual(len(dups), up.resent)
+
+        async def no_ack() -> Tuple[bool, MqttUplink]:
+            broker = await Broker().start()
+            broker.drop_acks = 1
+            up = MqttUplink("127.0.0.1", "trk-1", port=broker.port)
+            up.ack_timeout_ms = 100
+            ok = await up.publish("lmt/trk-1/up", b"x")  # wait=True: the caller keeps it
+            await broker.close()
+            return ok, up
+
+        ok, up = run(no_ack())
+        self.assertFalse(ok)
+        self.assertEqual((up.pending(), up.connected), (0, False))
+
+    def test_send_failure_mid_publish(self) -> None:
+        async def scenario(wait: bool) -> Tuple[bool, int, List[bytes]]:
+            broker = await Broker().start()
+            up = MqttUplink("127.0.0.1", "trk-1", port=broker.port)
+            await up.connect()
+
+            def broken(pkt: bytes) -> None:
+                raise OSError("ECONNRESET")
+
+            up._writer.write = broken
+            ok = await up.publish("lmt/trk-1/up", b"7", wait=wait)
+            pending = up.pending()
+            self.assertTrue(await up.connect())
+            self.assertTrue(await up.flush())
+            await asyncio.sleep(0.02)
+            await up.close()
+            await broker.close()
+            return ok, pending, broker.payloads()
+
+        # In the window: delivered once by the resend, so the caller must not queue it
+        self.assertEqual(run(scenario(False)), (True, 1, [b"7"]))
+        # Waited for and failed: the caller keeps it, the window forgets it
+        self.assertEqual(run(scenario(True)), (False, 0, []))
+
+    def test_keepalive_ping(self) -> None:
+        async def scenario(mute: bool) -> Tuple[Broker, bool]:
+            broker = await Broker().start()
+            broker.mute_pings = mute
+            up = MqttUplink("127.0.0.1", "trk-1", port=broker.port, keepalive_s=1)
+            await up.connect()
+            await asyncio.sleep(2.2)
+            alive = up.connected
+            await up.close()
+            await broker.close()
+            return broker, alive
+
+        broker, alive = run(scenario(False))
+        self.assertTrue(alive)
+        self.assertGreaterEqual(broker.pings, 2)
+        broker, alive = run(scenario(True))
+        self.assertFalse(alive)  # No PINGRESP within the keepalive
+
+    def test_poster_over_mqtt(self) -> None:
+        async def scenario() -> Tuple[Broker, HttpPoster, List[Any]]:
+            broker = await Broker().start()
+            config = MemConfig(device_id="trk-1", upload_deflate=True, upload_delta=True)
+            config.set("upload_deflate_min_bytes", 512)
+            poster = HttpPoster(config)
+            replies: List[Any] = []
+            poster.on_reply = replies.append
+            up = MqttUplink("127.0.0.1", "trk-1", port=broker.port, down_topic="lmt/trk-1/down")
+            poster.use_mqtt(up, "lmt/trk-1/up")
+            self.assertTrue(poster.has_uplink())
+            self.assertTrue(await poster.post_telemetry({"lat": 52.5, "lon": 13.4, "temp": 4.0}))
+            batch = [{"lat": 52.5 + i * 1e-4, "lon": 13.4, "mono": i} for i in range(30)]
+            self.assertTrue(await poster.post_records(batch))
+            seq = poster.delta.seq  # type: ignore[union-attr]
+            await broker.publish("lmt/trk-1/down", json.dumps({"ack": seq, "cfg": 3}).encode())
+            await asyncio.sleep(0.05)
+            self.assertTrue(await poster.post_telemetry({"lat": 52.5, "lon": 13.4, "temp": 9.0}))
+            await up.flush()
+            await up.close()
+            await broker.close()
+            return broker, poster, replies
+
+        broker, poster, replies = run(scenario())
+        topics = [t for _, t, _, _ in broker.received]
+        self.assertEqual(topics, ["lmt/trk-1/up", "lmt/trk-1/up/z", "lmt/trk-1/up"])
+        first, second = [json.loads(p) for _, t, p, _ in broker.received if t == topics[0]]
+        self.assertEqual((first["data"]["lat"], first["seq"], first["base"]), (52.5, 1, 0))
+        batch = json.loads(zlib.decompress(broker.received[1][2]))
+        self.assertEqual(len(batch["batch"]), 30)
+        self.assertEqual(replies, [{"ack": 1, "cfg": 3}])
+        # The ack came on the down topic: the next upload is a delta against it
+        self.assertEqual((second["data"], second["base"]), ({"temp": 9.0}, 1))
+        self.assertEqual(poster.bytes_sent, poster.writer.body_bytes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import asyncio
+import time
+import unittest
+
+from tools.ntp_sim import DriftClock, SntpServer, _Config, rtc_sets, simulate
+from tools.wifi_sim import DictConfig
+
+from lib.ntp_time import NTPClient  # After tools.ntp_sim installs the fake RTC
+from lib.timebase import Timebase
+
+HOUR_MS = 3600 * 1000
+
+
+class TestSntp(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = DriftClock(ppm=25)  # Runs fast: 90 ms per hour
+        self.clock.__enter__()
+        self.server = SntpServer(self.clock.true_ms)
+        self.server.__enter__()
+        config = _Config(ntp_server="127.0.0.1", ntp_min_interval_sec=900)
+        self.ntp = NTPClient(config, port=self.server.port)
+
+    def tearDown(self) -> None:
+        self.server.__exit__()
+        self.clock.__exit__()
+
+    def sync(self) -> bool:
+        return asyncio.run(self.ntp.sync())
+
+    def test_first_sync_sets_rtc_and_schedules(self) -> None:
+        self.assertTrue(self.ntp.due())
+        self.assertTrue(self.sync())
+        self.assertLess(self.ntp.delay_ms, 100)
+        self.assertEqual(rtc_sets[-1][:3], (2024, 6, 15))
+        self.assertLess(abs(self.ntp.now_ms() - self.clock.true_ms()), 50)  # type: ignore
+        self.assertFalse(self.ntp.due())
+        self.clock.advance(900 * 1000)
+        self.assertTrue(self.ntp.due())
+
+    def test_offset_and_drift_from_successive_syncs(self) -> None:
+        self.sync()
+        self.clock.advance(HOUR_MS)
+        self.sync()
+        self.assertAlmostEqual(self.ntp.offset_ms, -90, delta=20)  # Local clock ahead
+        drift = self.ntp.drift_ppm
+        assert drift is not None
+        self.assertAlmostEqual(drift, -25, delta=5)
+        self.clock.advance(4 * HOUR_MS)
+        self.sync()
+        drift = self.ntp.drift_ppm
+        assert drift is not None
+        self.assertAlmostEqual(drift, -25, delta=2)
+        # Resynced: the local clock is back on server time
+        self.assertLess(abs(self.ntp.now_ms() - self.clock.true_ms()), 50)  # type: ignore
+
+    def test_unreachable_server_does_not_block_the_loop(self) -> None:
+        self.server.drop = True
+        self.ntp.timeout_ms = 300
+        ticks = []
+
+        async def run() -> bool:
+            async def ticker() -> None:
+                for _ in range(1000):
+                    ticks.append(time.monotonic())
+                    await asyncio.sleep(0.01)
+
+            task = asyncio.create_task(ticker())
+            ok = await self.ntp.sync()
+            task.cancel()
+            return ok
+
+        start = time.monotonic()
+        self.assertFalse(asyncio.run(run()))
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertGreater(len(ticks), 15)  # Other tasks ran while waiting
+        self.assertLess(max(b - a for a, b in zip(ticks, ticks[1:])), 0.1)
+        self.assertEqual(self.ntp.failures, 1)
+        self.assertFalse(self.ntp.due())  # Retry is held back
+        self.clock.advance(60 * 1000)
+        self.assertTrue(self.ntp.due())
+
+    def test_kiss_of_death_is_rejected(self) -> None:
+        self.server.stratum = 0
+        self.assertFalse(self.sync())
+        self.assertIsNone(self.ntp.now_ms())
+
+    def test_sync_records_timebase_offset(self) -> None:
+        tb = Timebase(DictConfig(boot_id=0, time_offsets=[], time_handoff=None))
+        self.ntp.timebase = tb
+        self.assertFalse(self.ntp.is_synced())
+        self.sync()
+        self.assertTrue(self.ntp.is_synced())
+        self.assertLess(abs(tb.now() - self.clock.true_ms() // 1000), 2)
+
+
+class TestAdaptiveResync(unittest.TestCase):
+    def test_stable_clock_syncs_less_and_error_stays_bounded(self) -> None:
+        stable = simulate(ppm=3, days=7)
+        poor = simulate(ppm=-60, days=7)
+        self.assertLess(stable["syncs_per_day"], 2)
+        self.assertGreater(poor["syncs_per_day"], 3 * stable["syncs_per_day"])
+        for r in (stable, poor):
+            self.assertLess(r["worst_ms"], 1000 + 60 * 0.06)  # Bound + one 60 s step of drift
+        self.assertAlmostEqual(poor["drift_ppm"], 60, delta=2)
+        daily = simulate(ppm=-60, days=3, daily=True)
+        self.assertGreater(daily["worst_ms"], 4000)
+
+    def test_invalid_bounds_rejected(self) -> None:
+        with self.assertRaises(ValueError):
+            NTPClient(_Config(ntp_min_interval_sec=7200, ntp_max_interval_sec=3600))
+        with self.assertRaises(ValueError):
+            NTPClient(_Config(ntp_max_error_ms=-5))
+
+
+if __name__ == "__main__":
+    unittest.main()
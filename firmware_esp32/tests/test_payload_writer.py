@@ -0,0 +1,71 @@
+import asyncio
+import json
+import sys
+import unittest
+import zlib
+from typing import Any, Dict, List
+
+from tools.config_server import ConfigServer, MemConfig
+
+from lib.http_poster import HttpPoster
+from lib.payload_writer import PayloadWriter
+
+
+def records(n: int) -> List[Dict[str, Any]]:
+    return [
+        {"lat": 52.52 + i * 1e-4, "lon": 13.405, "temp": 4.0 + i * 0.01, "shock": i % 7, "mono": i}
+        for i in range(n)
+    ]
+
+
+class TestPayloadWriter(unittest.TestCase):
+    def test_threshold_picks_plain_or_deflate(self) -> None:
+        w = PayloadWriter(min_bytes=1024)
+        small = {"device_id": "trk-1", "batch": records(2), "boot": 3}
+        body, enc = w.encode(small)
+        self.assertIsNone(enc)
+        self.assertEqual(json.loads(body), small)
+        large = {"device_id": "trk-1", "batch": records(40), "boot": 3}
+        body, enc = w.encode(large)
+        self.assertEqual(enc, "deflate")
+        self.assertEqual(json.loads(zlib.decompress(body)), large)
+        self.assertLess(len(body), len(json.dumps(large)) // 3)
+        self.assertEqual(w.compressed, 1)
+        self.assertEqual(w.plain_bytes, len(json.dumps(small)) + len(json.dumps(large)))
+        body, enc = w.encode({"batch": []})  # The writer is reusable after a deflated body
+        self.assertEqual((json.loads(body), enc), ({"batch": []}, None))
+
+    def test_disabled_or_unavailable(self) -> None:
+        big = {"batch": records(40)}
+        self.assertIsNone(PayloadWriter(enabled=False).encode(big)[1])
+        saved = sys.modules["deflate"]
+        sys.modules["deflate"] = None  # type: ignore[assignment]  # Port without the module
+        try:
+            w = PayloadWriter(min_bytes=0)
+            body, enc = w.encode(big)
+        finally:
+            sys.modules["deflate"] = saved
+        self.assertIsNone(enc)
+        self.assertEqual(json.loads(body), big)
+        self.assertFalse(w.enabled)
+        bad: List[Dict[str, Any]] = [{"min_bytes": -1}, {"wbits": 7}, {"wbits": 16}]
+        for kwargs in bad:
+            with self.assertRaises(ValueError):
+                PayloadWriter(**kwargs)
+
+    def test_poster_sends_deflated_batches(self) -> None:
+        with ConfigServer({}) as server:
+            config = MemConfig(ingest_url=server.url("/ingest"))
+            config.set("upload_deflate", True)
+            poster = HttpPoster(config)
+            batch = records(20)
+            self.assertTrue(asyncio.run(poster.post_records(batch)))
+            self.assertTrue(asyncio.run(poster.post_telemetry({"lat": 52.5, "lon": 13.4})))
+            self.assertEqual(server.encodings, ["deflate", None])
+            self.assertEqual(server.posts[0]["batch"], batch)
+            self.assertEqual(poster.bytes_sent, poster.writer.body_bytes)
+            self.assertLess(poster.bytes_sent, poster.writer.plain_bytes // 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+from typing import Any, Dict, List, Optional, Set
+
+from lib.record_policy import EVT_GEOFENCE, RecordPolicy
+
+DAY0 = 1718409600  # 2024-06-15 00:00:00 UTC
+
+
+def _simulate_day(
+    policy: RecordPolicy,
+    shocks: Optional[Set[int]] = None,
+    fix_lost: range = range(0),
+    geofence: Optional[Set[int]] = None,
+) -> List[Dict[str, Any]]:
+    """One sample per second for 24 h; returns copies of the emitted records"""
+    shocks = shocks or set()
+    geofence = geofence or set()
+    records = []
+    for t in range(86400):
+        if t in geofence:
+            policy.trigger(EVT_GEOFENCE, t * 1000)
+        sample = {
+            "lat": 52.5,
+            "lon": 13.4,
+            "speed": 30.0,
+            "temp": 4.0 + (t % 10) * 0.1,
+            "internal_temp": 30.0,
+            "shock": 900 if t in shocks else t % 7,
+            "battery_mv": 3900,
+            "gps_fix": t not in fix_lost,
+        }
+        rec = policy.offer(sample, t * 1000, DAY0 + t)
+        if rec is not None:
+            rec = rec.copy()
+            rec["t"] = t
+            records.append(rec)
+    return records
+
+
+class TestRecordPolicy(unittest.TestCase):
+    def test_base_rate_over_quiet_day(self) -> None:
+        records = _simulate_day(RecordPolicy(interval_s=10))
+        self.assertEqual(len(records), 8640)
+        self.assertTrue(all(r["reason"] == "interval" for r in records))
+        gaps = {b["t"] - a["t"] for a, b in zip(records, records[1:])}
+        self.assertEqual(gaps, {10})
+
+    def test_interval_aggregates(self) -> None:
+        records = _simulate_day(RecordPolicy(interval_s=10))
+        rec = records[5]  # Covers samples t=41..50
+        self.assertEqual(rec["samples"], 10)
+        self.assertAlmostEqual(rec["temp_min"], 4.0)
+        self.assertAlmostEqual(rec["temp_max"], 4.9)
+        self.assertAlmostEqual(rec["temp"], 4.45)
+        self.assertEqual(rec["shock"], 6)
+        self.assertEqual(rec["shock_min"], 0)
+
+    def test_events_emit_and_burst(self) -> None:
+        policy = RecordPolicy(interval_s=10, burst_interval_s=1, burst_s=30)
+        records = _simulate_day(
+            policy, shocks={1000}, fix_lost=range(20000, 20600), geofence={50000}
+        )
+        by_t = {r["t"]: r for r in records}
+        self.assertEqual(by_t[1000]["reason"], "shock")
+        self.assertEqual(by_t[1000]["shock"], 900)
+        self.assertEqual(by_t[20000]["reason"], "fix")
+        self.assertFalse(by_t[20000]["gps_fix"])
+        self.assertEqual(by_t[20600]["reason"], "fix")
+        self.assertEqual(by_t[50000]["reason"], "geofence")
+        # One record a second during each burst, base rate again afterwards
+        self.assertTrue(all(t in by_t for t in range(1000, 1030)))
+        self.assertEqual(sum(1 for t in range(1030, 1050) if t in by_t), 2)
+        self.assertEqual(policy.stats["events"], 4)
+
+    def test_sustained_shock_triggers_once(self) -> None:
+        policy = RecordPolicy(interval_s=10, burst_s=5)
+        records = _simulate_day(policy, shocks=set(range(300, 320)))
+        self.assertEqual([r["t"] for r in records if r["reason"] == "shock"], [300])
+
+    def test_daily_budget_is_paced_and_keeps_event_reserve(self) -> None:
+        # 1000 records/day: 900 for the base rate, 100 reserved for events
+        policy = RecordPolicy(interval_s=10, daily_budget_bytes=24000, record_bytes=24)
+        records = _simulate_day(policy, shocks={80000, 80500})
+        self.assertLessEqual(len(records), 1000)
+        self.assertGreater(policy.stats["over_budget"], 0)
+        interval = [r for r in records if r["reason"] == "interval"]
+        self.assertLessEqual(len(interval), 900)
+        # Pacing spreads records over the whole day instead of exhausting it by morning
+        self.assertGreater(sum(1 for r in interval if r["t"] >= 79200), 30)
+        self.assertEqual([r["t"] for r in records if r["reason"] == "shock"], [80000, 80500])
+        # Skipped intervals are folded into the next record, not lost
+        self.assertGreater(max(r["samples"] for r in interval), 10)
+
+    def test_budget_resets_at_utc_midnight(self) -> None:
+        policy = RecordPolicy(interval_s=10, daily_budget_bytes=2400, record_bytes=24)
+        _simulate_day(policy)
+        self.assertEqual(policy.day_records, 90)  # Interval quota used up
+        sample = {"shock": 0, "temp": 1.0, "gps_fix": True}
+        self.assertIsNotNone(policy.offer(sample, 86400 * 1000, DAY0 + 86400))
+        self.assertEqual(policy.day_records, 1)
+
+    def test_invalid_parameters(self) -> None:
+        with self.assertRaises(ValueError):
+            RecordPolicy(interval_s=0)
+        with self.assertRaises(ValueError):
+            RecordPolicy(event_reserve_pct=100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import asyncio
+import unittest
+
+from tools.config_server import ConfigServer, MemConfig, sample_document, simulate
+
+from lib.http_poster import HttpPoster
+from lib.remote_config import FETCH_APPLIED, FETCH_FAILED, FETCH_UNCHANGED, RemoteConfig
+
+
+class TestRemoteConfig(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = ConfigServer(sample_document())
+        self.server.__enter__()
+        self.config = MemConfig(
+            ingest_url=self.server.url("/ingest"), config_url=self.server.url("/config")
+        )
+        self.remote = RemoteConfig(self.config)
+        self.poster = HttpPoster(self.config)
+        self.poster.on_reply = self.remote.note_reply
+
+    def tearDown(self) -> None:
+        self.server.__exit__()
+
+    def upload(self) -> bool:
+        return asyncio.run(self.poster.post_records([{"speed": 1.0}]))
+
+    def test_conditional_fetch_and_persisted_etag(self) -> None:
+        self.assertEqual(self.remote.fetch(), FETCH_APPLIED)
+        self.assertEqual(len(self.config.get("geofences")), 8)
+        self.assertEqual(self.config.get("config_etag"), self.server.etag)
+        saves = self.config.saves
+        self.assertEqual(self.remote.fetch(), FETCH_UNCHANGED)
+        self.assertEqual(self.server.not_modified, 1)
+        self.assertEqual(self.config.saves, saves)  # A 304 writes nothing
+        # A reboot keeps the ETag: still no body
+        RemoteConfig(self.config).fetch()
+        self.assertEqual(self.server.not_modified, 2)
+
+    def test_upload_reply_hint_triggers_fetch(self) -> None:
+        self.remote.fetch()
+        self.assertTrue(self.upload())
+        self.assertFalse(self.remote.fetch_due)  # Hint matches the applied ETag
+        self.server.publish(log_interval_sec=5)
+        self.assertTrue(self.upload())
+        self.assertTrue(self.remote.fetch_due)
+        self.assertEqual(self.remote.fetch(), FETCH_APPLIED)
+        self.assertEqual(self.config.get("log_interval_sec"), 5)
+        self.assertFalse(self.remote.fetch_due)
+        self.upload()
+        self.assertFalse(self.remote.fetch_due)
+
+    def test_pending_commands_hint(self) -> None:
+        self.server.cmd_pending = True
+        self.assertTrue(self.remote.note_reply({"cmd": 1}))
+        self.assertFalse(self.remote.note_reply({"cmd": 1}))  # Already due: no new signal
+        self.assertTrue(self.remote.checks_due)
+        self.assertFalse(self.remote.note_reply(None))
+        self.assertFalse(self.remote.note_reply([1, 2]))
+
+    def test_failures_keep_the_etag(self) -> None:
+        self.remote.fetch()
+        etag = self.config.get("config_etag")
+        self.server.publish(ingest_interval_sec=30)
+        self.config.set("config_url", self.server.url("/missing"))
+        self.assertEqual(self.remote.fetch(), FETCH_FAILED)
+        self.assertEqual(self.config.get("config_etag"), etag)
+        self.config.set("config_url", "")
+        self.remote.fetch_due = True
+        self.assertEqual(self.remote.fetch(), FETCH_FAILED)
+        self.assertFalse(self.remote.fetch_due)  # Nothing to fetch from
+
+
+class TestDownlinkLatency(unittest.TestCase):
+    def test_hints_apply_changes_within_a_window(self) -> None:
+        daily = simulate("daily", days=2)
+        hints = simulate("hints", days=2)
+        self.assertLessEqual(hints["max_min"], 10)  # Next upload window
+        self.assertGreater(daily["mean_min"], 60)
+        self.assertEqual(hints["pending"], 0)
+        hourly = simulate("hourly", days=2)
+        self.assertGreater(hourly["not_modified"], 0.8 * hourly["gets"])
+
+
+if __name__ == "__main__":
+    unittest.main()
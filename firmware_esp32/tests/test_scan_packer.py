@@ -0,0 +1,94 @@
+import unittest
+from typing import List
+
+from lib.scan_packer import MAX_PAGE, ScanEntry, ScanPacker, page_limit, trailer
+from tools.scan_decoder import ScanAssembler, ScanDecodeError, decode_page
+
+
+def _depot(n: int) -> List[ScanEntry]:
+    return [
+        ("Depot-AP-%02d" % i, -40 - i, 1 + i % 13, 3, bytes((0x24, 0x0A, 0xC4, 0, 0, i)))
+        for i in range(n)
+    ]
+
+
+def _pages(entries: List[ScanEntry], mtu: int) -> List[bytes]:
+    packer = ScanPacker()
+    pages = []
+    idx = 0
+    while idx < len(entries):
+        idx, page = packer.pack(entries, idx, mtu)
+        pages.append(bytes(page))
+    return pages
+
+
+class TestScanPacker(unittest.TestCase):
+    def test_round_trip_through_reference_decoder(self) -> None:
+        entries = _depot(40)
+        asm = ScanAssembler()
+        for page in _pages(entries, mtu=185):
+            self.assertFalse(asm.feed(page))
+        self.assertTrue(asm.feed(trailer(len(entries))))
+        assert asm.result is not None
+        self.assertEqual([n["ssid"] for n in asm.result], [e[0] for e in entries])
+        first = asm.result[0]
+        self.assertEqual(first["rssi"], -40)
+        self.assertEqual(first["channel"], 1)
+        self.assertEqual(first["authmode"], 3)
+        self.assertEqual(first["bssid"], "24:0a:c4:00:00:00")
+
+    def test_pages_fill_the_mtu(self) -> None:
+        entries = _depot(40)  # 21 bytes per entry
+        for mtu in (64, 185, 247, 517):
+            pages = _pages(entries, mtu)
+            limit = page_limit(mtu)
+            self.assertTrue(all(len(p) <= limit for p in pages))
+            per_page = (limit - 3) // 21
+            expected = -(-len(entries) // per_page)
+            self.assertEqual(len(pages), expected, "mtu=%d" % mtu)
+        # 40 networks at a typical Android MTU take 4 notifications instead of 40
+        self.assertEqual(len(_pages(entries, 247)), 4)
+        self.assertEqual(page_limit(517), MAX_PAGE)
+
+    def test_default_mtu_truncates_rather_than_overflows(self) -> None:
+        pages = _pages(_depot(2), 23)
+        self.assertEqual(len(pages), 2)
+        self.assertTrue(all(len(p) <= 20 for p in pages))
+        self.assertEqual(decode_page(pages[0])[0]["ssid"], "Depot-A")
+
+    def test_unicode_and_long_ssid(self) -> None:
+        entries: List[ScanEntry] = [
+            ("Café-Lager", -70, 6, 4, b"\x01\x02\x03\x04\x05\x06"),
+            ("X" * 32, -90, 11, 0, b"\xaa" * 6),
+        ]
+        decoded = decode_page(_pages(entries, 247)[0])
+        self.assertEqual(decoded[0]["ssid"], "Café-Lager")
+        self.assertEqual(decoded[1]["ssid"], "X" * 32)
+        self.assertEqual(decoded[1]["rssi"], -90)
+
+    def test_lost_page_is_detected(self) -> None:
+        pages = _pages(_depot(40), 64)
+        asm = ScanAssembler()
+        asm.feed(pages[0])
+        with self.assertRaises(ScanDecodeError):
+            asm.feed(pages[2])
+
+    def test_trailer_count_mismatch_is_detected(self) -> None:
+        asm = ScanAssembler()
+        asm.feed(_pages(_depot(3), 247)[0])
+        with self.assertRaises(ScanDecodeError):
+            asm.feed(trailer(4))
+
+    def test_truncated_page_is_rejected(self) -> None:
+        page = _pages(_depot(3), 247)[0]
+        with self.assertRaises(ScanDecodeError):
+            decode_page(page[:-2])
+
+    def test_unrelated_notifications_are_ignored(self) -> None:
+        asm = ScanAssembler()
+        self.assertFalse(asm.feed(b"WIFI:CONNECTED:Depot"))
+        self.assertIsNone(asm.result)
+
+
+if __name__ == "__main__":
+    unittest.main()
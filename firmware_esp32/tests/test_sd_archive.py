@@ -0,0 +1,206 @@
+import os
+import struct
+import tempfile
+import unittest
+from typing import Any, Dict
+
+from lib.sd_archive import (
+    HEADER_SIZE,
+    SLOT_SIZE,
+    ArchiveError,
+    ArchiveReader,
+    ArchiveWriter,
+    day_path,
+    pending_boots,
+    pending_root,
+    read_range,
+    rebase,
+)
+
+T0 = 1718409600  # 2024-06-15 00:00:00 UTC
+
+
+def _sample(i: int) -> Dict[str, Any]:
+    return {
+        "lat": 52.52 + i * 1e-5,
+        "lon": 13.405,
+        "speed": 42.5,
+        "temp": -3.25,
+        "shock": i % 50,
+        "battery_mv": 3900,
+        "internal_temp": 31.5,
+        "gps_fix": i % 2 == 0,
+    }
+
+
+class _FlakyCard:
+    """Real files whose appends fail while the card is pulled"""
+
+    def __init__(self) -> None:
+        self.out = False
+
+    def open(self, path: str, mode: str) -> Any:
+        if self.out:
+            raise OSError(5, "EIO")
+        f = open(path, mode)
+        if "a" not in mode:
+            return f
+        card = self
+
+        class Appender:
+            def write(self, data: Any) -> int:
+                if card.out:
+                    raise OSError(5, "EIO")
+                return f.write(data)
+
+            def flush(self) -> None:
+                f.flush()
+
+            def close(self) -> None:
+                f.close()
+
+        return Appender()
+
+
+class TestSDArchive(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self._tmp.name, "arch")
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def _write(self, start: int, count: int, step: int = 1, index_every: int = 8) -> None:
+        writer = ArchiveWriter(self.root, index_every=index_every)
+        for i in range(count):
+            writer.append(start + i * step, _sample(i))
+        writer.close()
+
+    def test_round_trip(self) -> None:
+        self._write(T0, 100)
+        with ArchiveReader(day_path(self.root, T0 // 86400)) as reader:
+            self.assertEqual(reader.index_every, 8)
+            records = list(reader.read_range(T0, T0 + 99))
+        self.assertEqual(len(records), 100)
+        rec = records[37]
+        self.assertEqual(rec["ts"], T0 + 37)
+        self.assertAlmostEqual(rec["lat"], 52.52 + 37 * 1e-5, places=6)
+        self.assertEqual(rec["speed"], 42.5)
+        self.assertEqual(rec["temp"], -3.25)
+        self.assertEqual(rec["shock"], 37)
+        self.assertEqual(rec["internal_temp"], 31.5)
+        self.assertFalse(rec["gps_fix"])
+
+    def test_range_query_uses_logarithmic_seeks(self) -> None:
+        self._write(T0, 4000, index_every=16)
+        with ArchiveReader(day_path(self.root, T0 // 86400)) as reader:
+            records = list(reader.read_range(T0 + 3000, T0 + 3009))
+            seeks = reader.seeks
+            groups = reader.groups
+        self.assertEqual([r["ts"] for r in records], list(range(T0 + 3000, T0 + 3010)))
+        self.assertEqual(groups, 250)
+        self.assertLessEqual(seeks, 12)  # ~log2(250) index probes + 1-2 group reads
+
+    def test_daily_rotation(self) -> None:
+        # 20 minutes either side of midnight, one record a minute
+        self._write(T0 - 20 * 60, 40, step=60)
+        self.assertTrue(os.path.exists(day_path(self.root, T0 // 86400 - 1)))
+        self.assertTrue(os.path.exists(day_path(self.root, T0 // 86400)))
+        self.assertTrue(day_path(self.root, T0 // 86400).endswith("20240615.lma"))
+        records = read_range(self.root, T0 - 300, T0 + 299)
+        self.assertEqual([r["ts"] for r in records], list(range(T0 - 300, T0 + 300, 60)))
+
+    def test_torn_tail_is_repaired_on_reopen(self) -> None:
+        self._write(T0, 20)
+        path = day_path(self.root, T0 // 86400)
+        size = os.path.getsize(path)
+        with open(path, "r+b") as f:
+            f.truncate(size - 10)  # Power cut mid-record
+
+        writer = ArchiveWriter(self.root, index_every=8)
+        for i in range(20, 30):
+            writer.append(T0 + i, _sample(i))
+        writer.close()
+        self.assertEqual(writer.repaired, 1)
+        self.assertEqual((os.path.getsize(path) - HEADER_SIZE) % SLOT_SIZE, 0)
+
+        ts = [r["ts"] for r in read_range(self.root, T0, T0 + 29)]
+        self.assertEqual(ts, [T0 + i for i in range(30) if i != 19])
+
+    def test_corrupt_slots_are_skipped(self) -> None:
+        self._write(T0, 50)
+        path = day_path(self.root, T0 // 86400)
+        with open(path, "r+b") as f:
+            f.seek(HEADER_SIZE + 3 * SLOT_SIZE + 5)  # Record 2 (slot 0 is the index)
+            f.write(b"\x99")
+            f.seek(HEADER_SIZE + 18 * SLOT_SIZE)  # Index slot of group 2
+            f.write(b"\x00\x00")
+
+        with ArchiveReader(path) as reader:
+            ts = [r["ts"] for r in reader.read_range(T0, T0 + 49)]
+            self.assertEqual(ts, [T0 + i for i in range(50) if i != 2])
+            # Lookup through the damaged index still lands on the right record
+            self.assertEqual([r["ts"] for r in reader.read_range(T0 + 17, T0 + 17)], [T0 + 17])
+
+    def test_dropped_buffer_keeps_groups_aligned(self) -> None:
+        card = _FlakyCard()
+        writer = ArchiveWriter(self.root, index_every=8, opener=card.open)
+        for i in range(70):  # The first flush (64 slots) ends mid-group
+            writer.append(T0 + i, _sample(i))
+        card.out = True  # Failed flushes: the writer drops its buffer, more than once
+        for i in range(70, 300):
+            writer.append(T0 + i, _sample(i))
+        card.out = False
+        for i in range(300, 340):
+            writer.append(T0 + i, _sample(i))
+        writer.close()
+
+        path = day_path(self.root, T0 // 86400)
+        with open(path, "rb") as f:
+            body = f.read()[HEADER_SIZE:]
+        self.assertEqual(len(body) % SLOT_SIZE, 0)
+        for group, pos in enumerate(range(0, len(body), 9 * SLOT_SIZE)):
+            self.assertEqual(struct.unpack_from("<2sH", body, pos), (b"IX", group))
+        ts = [r["ts"] - T0 for r in read_range(self.root, T0, T0 + 400)]
+        self.assertEqual(ts, sorted(set(ts)))  # No index slot decoded as a record
+        self.assertEqual(ts[:56], list(range(56)))  # Flushed before the card was pulled
+        self.assertEqual(ts[-40:], list(range(300, 340)))
+        self.assertLess(len(ts), 340)
+
+    def test_bad_header_is_rejected(self) -> None:
+        os.makedirs(self.root)
+        path = day_path(self.root, T0 // 86400)
+        with open(path, "wb") as f:
+            f.write(b"timestamp,lat,lon\n")
+        with self.assertRaises(ArchiveError):
+            ArchiveReader(path)
+
+        # The writer sets the unreadable file aside and starts a fresh one
+        self._write(T0, 3)
+        self.assertTrue(os.path.exists(path + ".bad"))
+        self.assertEqual(len(read_range(self.root, T0, T0 + 10)), 3)
+
+    def test_pending_boot_is_rebased_to_utc(self) -> None:
+        # Boot 3 logged for two hours before its clock was known: ts is seconds since boot
+        src = pending_root(self.root, 3)
+        os.makedirs(self.root)
+        pending = ArchiveWriter(src, index_every=8)
+        for i in range(120):
+            pending.append(i * 60, _sample(i))
+        pending.close()
+        self.assertEqual(pending_boots(self.root), [3])
+
+        writer = ArchiveWriter(self.root, index_every=8)
+        offset = T0 - 3600  # Booted an hour before midnight
+        self.assertEqual(rebase(src, writer, offset, exact=False), 120)
+        writer.close()
+        self.assertFalse(os.path.exists(src))
+        self.assertEqual(pending_boots(self.root), [])
+        records = read_range(self.root, T0 - 3600, T0 + 3600)
+        self.assertEqual([r["ts"] for r in records], [offset + i * 60 for i in range(120)])
+        self.assertEqual(records[60]["shock"], 10)
+        self.assertTrue(all(r["ts_est"] for r in records))
+
+
+if __name__ == "__main__":
+    unittest.main()
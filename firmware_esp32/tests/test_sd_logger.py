@@ -0,0 +1,129 @@
+import time
+import unittest
+from typing import Any, Dict, List
+from unittest.mock import patch
+
+from lib.sd_logger import BufferedFileWriter, format_csv_line
+
+
+class FakeFile:
+    def __init__(self, sink: "FakeCard") -> None:
+        self.sink = sink
+
+    def write(self, data: Any) -> int:
+        if self.sink.fail:
+            raise OSError(5)
+        self.sink.data += bytes(data)
+        self.sink.writes += 1
+        return len(data)
+
+    def flush(self) -> None:
+        self.sink.syncs += 1
+
+    def close(self) -> None:
+        self.sink.closes += 1
+
+
+class FakeCard:
+    def __init__(self) -> None:
+        self.data = b""
+        self.opens = 0
+        self.writes = 0
+        self.syncs = 0
+        self.closes = 0
+        self.fail = False
+
+    def open(self, path: str, mode: str) -> FakeFile:
+        self.opens += 1
+        return FakeFile(self)
+
+
+class FakeDiagnostics:
+    def __init__(self) -> None:
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, int] = {}
+
+    def increment(self, metric: str) -> None:
+        self.counters[metric] = self.counters.get(metric, 0) + 1
+
+    def set_gauge(self, metric: str, value: int) -> None:
+        self.gauges[metric] = value
+
+
+SAMPLE = {"lat": 52.52, "lon": 13.405, "speed": 11.0, "temp": 4.5, "shock": 12}
+
+
+class TestBufferedFileWriter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.card = FakeCard()
+        self.diag = FakeDiagnostics()
+
+    def _writer(self, **kw: Any) -> BufferedFileWriter:
+        return BufferedFileWriter("/sd/x.csv", self.diag, opener=self.card.open, **kw)
+
+    def test_batches_until_size_threshold(self) -> None:
+        w = self._writer(buf_size=256, flush_bytes=200)
+        line = format_csv_line(1700000000, SAMPLE)
+        lines: List[str] = []
+        while w.flushes == 0:
+            w.append(line)
+            lines.append(line)
+        self.assertEqual(self.card.opens, 1)
+        self.assertEqual(self.card.writes, 1)
+        self.assertEqual(self.card.data, "".join(lines).encode())
+        self.assertEqual(self.diag.gauges["sd_flushes"], 1)
+
+    def test_handle_stays_open_across_flushes(self) -> None:
+        w = self._writer(buf_size=128, flush_bytes=64)
+        for _ in range(20):
+            w.append(format_csv_line(1, SAMPLE))
+        self.assertGreater(w.flushes, 3)
+        self.assertEqual(self.card.opens, 1)
+        self.assertEqual(self.card.closes, 0)
+
+    def test_time_threshold_and_close(self) -> None:
+        now = [0]
+        with patch.object(time, "ticks_ms", lambda: now[0]):
+            w = self._writer(flush_interval_ms=1000)
+            w.append("a\n")
+            now[0] = 999
+            w.tick()
+            self.assertEqual(self.card.writes, 0)
+            now[0] = 1000
+            w.tick()
+            self.assertEqual(self.card.data, b"a\n")
+            w.append("b\n")
+            w.close()
+        self.assertEqual(self.card.data, b"a\nb\n")
+        self.assertEqual(self.card.closes, 1)
+
+    def test_failure_counts_and_keeps_data(self) -> None:
+        w = self._writer()
+        w.append("a\n")
+        self.card.fail = True
+        self.assertFalse(w.flush())
+        self.assertEqual(self.diag.counters["sd_write_fail"], 1)
+        self.assertEqual(w.pending, 2)
+        self.card.fail = False
+        self.assertTrue(w.flush())
+        self.assertEqual(self.card.data, b"a\n")
+        self.assertEqual(w.written, 2)
+        self.assertEqual(self.card.opens, 2)  # Reopened after the failure
+
+    def test_full_buffer_with_dead_card_drops_oldest(self) -> None:
+        self.card.fail = True
+        w = self._writer(buf_size=16, flush_bytes=16)
+        for _ in range(5):
+            w.append("0123456\n")
+        self.assertLessEqual(w.pending, 16)
+        self.assertGreater(w.dropped_bytes, 0)
+        self.assertEqual(w.written, 0)
+        self.assertFalse(w.make_room(16))  # Full and the card still dead: dropped
+
+    def test_csv_columns(self) -> None:
+        line = format_csv_line(1700000000, dict(SAMPLE, battery_mv=3900, internal_temp=31.25))
+        self.assertEqual(line, "1700000000,52.520000,13.405000,11.00,4.50,12,3900,31.2\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import math
+import struct
+import unittest
+from typing import List, Tuple
+
+from lib.shock_buffer import (
+    LSB_PER_G,
+    SUMMARY_FMT,
+    SUMMARY_MAGIC,
+    SUMMARY_SIZE,
+    WAVE_MAGIC,
+    ShockBuffer,
+    ShockEvent,
+)
+
+Sample = Tuple[int, int, int]
+
+
+def impact_trace(n: int = 1000, impacts: Tuple[int, ...] = (500,)) -> List[Sample]:
+    """100 Hz trace: device at rest on z, each impact a 3 g x-axis pulse with decaying ringing.
+
+    Values clip at +/-2 g like the sensor at its default full scale.
+    """
+    trace = []
+    for i in range(n):
+        x, y, z = (i * 7) % 41 - 20, (i * 13) % 37 - 18, LSB_PER_G  # Sensor noise
+        for t0 in impacts:
+            k = i - t0
+            if 0 <= k < 3:
+                x += int(3 * LSB_PER_G * math.sin(math.pi * (k + 1) / 4))
+                y -= LSB_PER_G // 2
+            elif 3 <= k < 20:
+                x += int(0.6 * LSB_PER_G * math.exp(-(k - 3) / 4) * (1 if k % 2 else -1))
+        trace.append((max(-32768, min(32767, x)), y, z))
+    return trace
+
+
+Capture = Tuple[int, ShockEvent, int, List[int]]
+
+
+def replay(buf: ShockBuffer, trace: List[Sample]) -> List[Capture]:
+    """(completion index, event slot, seq, waveform copy) per captured event.
+
+    Slots are reused, so seq and waveform are copied when the event completes.
+    """
+    events = []
+    for i, (x, y, z) in enumerate(trace):
+        ev = buf.add_sample(x, y, z, i * 10, 1718409600 + i // 100)
+        if ev is not None:
+            events.append((i, ev, ev.seq, list(ev.wave)))
+    return events
+
+
+class TestShockBuffer(unittest.TestCase):
+    def setUp(self) -> None:
+        self.buf = ShockBuffer(rate_hz=100, pre_ms=200, post_ms=300, threshold=500)
+        self.trace = impact_trace()
+
+    def test_captured_window(self) -> None:
+        events = replay(self.buf, self.trace)
+        self.assertEqual(len(events), 1)
+        done_at, ev, _, wave = events[0]
+        self.assertEqual(done_at, 500 + 30 - 1)
+        self.assertEqual(self.buf.window, 50)
+        expected = [v for s in self.trace[480:530] for v in s]
+        self.assertEqual(wave, expected)
+        self.assertEqual(ev.ticks, 5000)
+        self.assertEqual(ev.ts, 1718409605)
+
+    def test_event_metrics(self) -> None:
+        _, ev, _, _ = replay(self.buf, self.trace)[0]
+        self.assertEqual(ev.seq, 1)
+        # x clips at 2 g: |a| peaks near sqrt(2^2 + 0.5^2 + 1^2) = 2.29 g
+        self.assertAlmostEqual(ev.peak, 645, delta=5)
+        self.assertEqual(ev.axis_peak[0], 1999)
+        self.assertLess(ev.axis_peak[1], -450)
+        self.assertAlmostEqual(ev.axis_peak[2], 1000, delta=5)
+        self.assertGreaterEqual(ev.duration_ms, 30)
+        self.assertLess(ev.duration_ms, 100)
+
+    def test_slots_are_reused(self) -> None:
+        buf = ShockBuffer(rate_hz=100, pre_ms=200, post_ms=300, slots=2)
+        trace = impact_trace(2000, impacts=(200, 600, 1000, 1400))
+        events = replay(buf, trace)
+        self.assertEqual([seq for _, _, seq, _ in events], [1, 2, 3, 4])
+        self.assertEqual(buf.count, 4)
+        self.assertEqual([ev.seq for ev in buf.latest()], [4, 3])
+        self.assertIs(events[0][1], events[2][1])  # Preallocated slot overwritten
+
+    def test_raw_bytes_decode(self) -> None:
+        buf = ShockBuffer(rate_hz=100, pre_ms=0, post_ms=10, threshold=200)
+        raw = struct.pack(">hhh", -3 * LSB_PER_G // 2, 100, LSB_PER_G)
+        ev = buf.add_raw(raw, 0)
+        self.assertIsNotNone(ev)
+        assert ev is not None
+        self.assertEqual(list(ev.wave), [-3 * LSB_PER_G // 2, 100, LSB_PER_G])
+
+    def test_ble_frames_round_trip(self) -> None:
+        _, ev, _, wave = replay(self.buf, self.trace)[0]
+        summary = bytes(self.buf.pack_summary(ev))
+        self.assertEqual(len(summary), SUMMARY_SIZE)
+        fields = struct.unpack(SUMMARY_FMT, summary)
+        self.assertEqual(fields[0], SUMMARY_MAGIC)
+        self.assertEqual(fields[3], ev.peak)
+        self.assertEqual(fields[8:], (100, 20, 50, 0))
+
+        samples: List[int] = []
+        idx = 0
+        frames = 0
+        while idx < self.buf.window:
+            idx, frame = self.buf.pack_wave(ev, idx, 64)
+            frame = bytes(frame)
+            self.assertLessEqual(len(frame), 61)
+            self.assertEqual(frame[0], WAVE_MAGIC)
+            offset, count = struct.unpack_from("<HB", frame, 2)
+            self.assertEqual(offset, len(samples) // 3)
+            samples.extend(struct.unpack_from("<%dh" % (count * 3), frame, 5))
+            frames += 1
+        self.assertEqual(samples, wave)
+        self.assertEqual(frames, 6)  # 9 samples per 61-byte frame
+
+    def test_invalid_parameters(self) -> None:
+        with self.assertRaises(ValueError):
+            ShockBuffer(rate_hz=0)
+        with self.assertRaises(ValueError):
+            ShockBuffer(threshold=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from typing import Any, List, Tuple
+
+from lib.shock_buffer import LSB_PER_G, ShockBuffer
+from lib.shock_classifier import (
+    CLASS_BUMP,
+    CLASS_DROP,
+    CLASS_IMPACT,
+    F_FREEFALL_MS,
+    F_PEAK_MG,
+    F_TILT_DEG,
+    ShockClassifier,
+    isqrt,
+)
+from tools.shock_eval import evaluate, synthetic_events
+
+G = LSB_PER_G
+
+
+def _capture(samples: List[Tuple[int, int, int]]) -> Tuple[ShockBuffer, Any]:
+    buf = ShockBuffer(rate_hz=100, pre_ms=200, post_ms=300)
+    for i, (x, y, z) in enumerate(samples):
+        ev = buf.add_sample(x, y, z, i * 10)
+        if ev is not None:
+            return buf, ev
+    raise AssertionError("trace did not trigger")
+
+
+class TestShockClassifier(unittest.TestCase):
+    def test_synthetic_set_accuracy(self) -> None:
+        confusion, accuracy = evaluate(synthetic_events(per_class=20, seed=7))
+        self.assertGreaterEqual(accuracy, 0.95, confusion)
+        self.assertEqual(sorted(confusion), ["bump", "drop", "impact", "tip_over", "vibration"])
+
+    def test_drop_features(self) -> None:
+        trace = [(0, 0, G)] * 40 + [(0, 0, 500)] * 12 + [(8000, 0, 32767)] * 2 + [(0, 0, G)] * 40
+        buf, ev = _capture(trace)
+        clf = ShockClassifier()
+        f = clf.extract(ev.wave, buf.window, buf.pre, buf.rate_hz)
+        self.assertEqual(f[F_FREEFALL_MS], 120)
+        self.assertAlmostEqual(f[F_PEAK_MG], 2058, delta=3)  # |(0.49, 0, 2.0)| g
+        self.assertEqual(f[F_TILT_DEG], 0)
+        self.assertEqual(clf.classify_features(f), CLASS_DROP)
+
+    def test_free_fall_after_peak_is_ignored(self) -> None:
+        trace = [(0, 0, G)] * 40 + [(8000, 0, 32767)] * 2 + [(0, 0, 500)] * 12 + [(0, 0, G)] * 40
+        buf, ev = _capture(trace)
+        f = ShockClassifier().extract(ev.wave, buf.window, buf.pre, buf.rate_hz)
+        self.assertEqual(f[F_FREEFALL_MS], 0)
+
+    def test_tilt(self) -> None:
+        trace = [(0, 0, G)] * 40 + [(32767, 0, 8000)] * 2 + [(G, 0, 0)] * 40
+        buf, ev = _capture(trace)
+        f = ShockClassifier().extract(ev.wave, buf.window, buf.pre, buf.rate_hz)
+        self.assertAlmostEqual(f[F_TILT_DEG], 90, delta=1)
+
+    def test_tree_from_config(self) -> None:
+        # Everything with a peak >= 1 g is an impact
+        clf = ShockClassifier([[F_PEAK_MG, 1000, -CLASS_IMPACT - 1, -CLASS_BUMP - 1]])
+        trace = [(0, 0, G)] * 40 + [(32767, 0, G)] + [(0, 0, G)] * 40
+        buf, ev = _capture(trace)
+        self.assertEqual(clf.classify(ev.wave, buf.window, buf.pre, buf.rate_hz), CLASS_IMPACT)
+        self.assertEqual(clf.feature_dict()["peak_mg"], clf.features[F_PEAK_MG])
+
+    def test_invalid_tree(self) -> None:
+        with self.assertRaises(ValueError):
+            ShockClassifier([[9, 0, -1, -1]])  # Unknown feature
+        with self.assertRaises(ValueError):
+            ShockClassifier([[0, 0, 0, -1]])  # Self loop
+        with self.assertRaises(ValueError):
+            ShockClassifier([[0, 0, -1, -99]])  # Unknown class
+        with self.assertRaises(ValueError):
+            ShockClassifier([[0, 0, -1]])
+        # Malformed remote config: ValueError too, so main falls back to the built-in tree
+        bad: Any
+        for bad in ({"0": [0, 0, -1, -1]}, [None], [[0, None, -1, -1]], [[0, "5", -1, -1]]):
+            with self.assertRaises(ValueError):
+                ShockClassifier(bad)
+        with self.assertRaises(ValueError):
+            ShockClassifier([[0, 1 << 40, -1, -1]])  # Does not fit the int32 table
+
+    def test_isqrt(self) -> None:
+        for n in (0, 1, 2, 15, 16, 17, 4096 * 4096, 3 * 8191 * 8191):
+            r = isqrt(n)
+            self.assertTrue(r * r <= n < (r + 1) * (r + 1), n)
+
+
+if __name__ == "__main__":
+    unittest.main()
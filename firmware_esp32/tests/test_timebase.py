@@ -0,0 +1,122 @@
+import time
+import unittest
+from typing import Any, Dict, List
+from unittest.mock import patch
+
+from lib.timebase import Timebase
+from tools.wifi_sim import DictConfig, VirtualClock
+
+T0 = 1718409600  # True UTC at the first boot: 2024-06-15 00:00:00
+HOUR_MS = 3600 * 1000
+
+
+class TestTimebase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = VirtualClock(epoch=0)  # RTC restarts at the epoch on power-up
+        self.clock.__enter__()
+        self.config = DictConfig(boot_id=0, time_offsets=[], time_handoff=None)
+        self.boot_utc = T0
+        self.tb = Timebase(self.config)
+
+    def tearDown(self) -> None:
+        self.clock.__exit__()
+
+    def utc(self) -> int:
+        return self.boot_utc + self.clock.ms // 1000
+
+    def record(self, n: int, step_ms: int = 60000) -> List[Dict[str, Any]]:
+        recs = []
+        for i in range(n):
+            recs.append(self.tb.stamp({"i": i, "true_ts": self.utc()}))
+            self.clock.advance(step_ms)
+        return recs
+
+    def reboot(self, sleep_ms: int, rtc_sleep_ms: int = -1) -> None:
+        """Deep sleep for sleep_ms of real time; the wake timer believes rtc_sleep_ms"""
+        self.tb.before_sleep(sleep_ms if rtc_sleep_ms < 0 else rtc_sleep_ms)
+        self.boot_utc = self.utc() + sleep_ms // 1000
+        self.clock.ms = 0
+        self.tb = Timebase(self.config)
+
+    def test_sync_hours_later_corrects_queued_records(self) -> None:
+        recs = self.record(30)  # 30 minutes offline, clock unknown
+        self.assertEqual({r["ts"] for r in recs}, {0})
+        self.assertEqual(self.tb.now(), 0)
+        self.clock.advance(5 * HOUR_MS)
+        self.tb.synced(self.utc())
+        for r in recs:
+            self.assertTrue(self.tb.correct(r))
+            self.assertEqual(r["ts"], r["true_ts"])
+            self.assertNotIn("ts_est", r)
+        self.assertEqual(self.tb.now(), self.utc())
+        later = self.record(1)[0]
+        self.assertEqual(later["ts"], later["true_ts"])
+
+    def test_sync_in_next_boot_reaches_back_over_deep_sleep(self) -> None:
+        recs = self.record(10)
+        self.reboot(2 * HOUR_MS)
+        self.assertEqual(self.tb.boot, 2)
+        self.assertFalse(self.tb.correct(recs[0]))  # Still nobody knows
+        self.clock.advance(3 * HOUR_MS)
+        self.tb.synced(self.utc())
+        for r in recs:
+            self.assertTrue(self.tb.correct(r))
+            self.assertEqual(r["ts"], r["true_ts"])
+            self.assertTrue(r["ts_est"])  # Through the sleep timer, not a sync of its own
+
+    def test_wake_continues_from_previous_sync(self) -> None:
+        self.tb.synced(self.utc())
+        self.clock.advance(HOUR_MS)
+        self.reboot(HOUR_MS, rtc_sleep_ms=HOUR_MS - 36000)  # Wake timer 1% fast
+        rec = self.record(1)[0]
+        self.assertEqual(rec["true_ts"] - rec["ts"], 36)  # Estimated before our own sync
+        self.assertFalse(self.tb.exact(self.tb.boot))
+        self.tb.synced(self.utc())
+        self.assertTrue(self.tb.correct(rec))
+        self.assertEqual(rec["ts"], rec["true_ts"])
+        self.assertNotIn("ts_est", rec)
+
+    def test_unknown_boot_and_unstamped_records(self) -> None:
+        self.tb.synced(self.utc())
+        self.assertFalse(self.tb.correct({"boot": 99, "mono": 5}))
+        self.assertTrue(self.tb.correct({"ts": T0}))
+        self.assertFalse(self.tb.correct({"ts": 5}))
+        self.tb.synced(12345)  # An unset RTC is never taken for a sync
+        self.assertEqual(self.tb.offset(1), T0)
+
+    def test_resync_and_table_write_economy(self) -> None:
+        self.tb.synced(self.utc())
+        writes = self.config.key_writes["time_offsets"]
+        for _ in range(24):
+            self.clock.advance(HOUR_MS)
+            self.tb.synced(self.utc())
+        self.assertEqual(self.config.key_writes["time_offsets"], writes)
+        self.tb.synced(self.utc() + 30)  # RTC drifted: the new offset is kept
+        self.assertEqual(self.config.key_writes["time_offsets"], writes + 1)
+        for _ in range(12):
+            self.reboot(60000)
+            self.tb.synced(self.utc())
+        table = self.config.get("time_offsets")
+        self.assertEqual([row[0] for row in table], list(range(6, 14)))
+        self.assertEqual(self.config.get("boot_id"), 13)
+
+    def test_monotonic_across_ticks_wrap(self) -> None:
+        period = 1 << 30  # MicroPython ticks_ms wraps after ~12.4 days
+
+        def ticks_diff(a: int, b: int) -> int:
+            return ((a - b + period // 2) & (period - 1)) - period // 2
+
+        with (
+            patch.object(time, "ticks_diff", ticks_diff),
+            patch.object(time, "ticks_ms", lambda: self.clock.ms & (period - 1)),
+        ):
+            tb = Timebase(self.config)
+            for _ in range(24 * 14):  # Two weeks without a reboot
+                self.clock.advance(HOUR_MS)
+                tb.mono_ms()
+            self.assertEqual(tb.mono_ms(), self.clock.ms)
+            self.assertGreater(tb.mono_ms(), period)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+import math
+import random
+import unittest
+from typing import Any, Dict, List, Tuple
+
+from lib.trip_detector import (
+    TRIP_EVT_END,
+    TRIP_EVT_START,
+    TRIP_IDLE,
+    TripDetector,
+    haversine_m,
+)
+
+DAY0 = 1718409600  # 2024-06-15 00:00:00 UTC
+M_PER_DEG = 111195.0
+
+# Legs of (seconds, kind, km/h, heading deg); one sample per second like a 1 Hz GPS log
+Leg = Tuple[int, str, float, float]
+
+DELIVERY_ROUTE: List[Leg] = [
+    (300, "park", 0, 0),  # Loading at the depot
+    (360, "drive", 40, 0),
+    (20, "park", 0, 0),  # Traffic light: shorter than a stop
+    (120, "drive", 40, 0),
+    (180, "park", 0, 0),  # Delivery 1
+    (240, "drive", 30, 90),
+    (60, "lost", 30, 90),  # Underpass: no fix, IMU still sees motion
+    (60, "drive", 30, 90),
+    (120, "park", 0, 0),  # Delivery 2
+    (300, "drive", 50, 180),
+    (240, "park", 0, 0),  # Delivery 3
+    (480, "drive", 45, 270),
+    (900, "park", 0, 0),  # Back at the depot
+]
+
+
+def route_samples(legs: List[Leg], seed: int = 3) -> Tuple[List[Dict[str, Any]], float]:
+    """GPS/IMU samples with realistic jitter, plus the true driven distance in metres"""
+    rng = random.Random(seed)
+    lat, lon = 52.52, 13.405
+    samples = []
+    truth = 0.0
+    t = 0
+    for seconds, kind, kmh, heading in legs:
+        for _ in range(seconds):
+            if kind == "park":
+                speed = rng.uniform(0.0, 2.5)  # Doppler jitter at rest
+                jlat = rng.uniform(-2e-5, 2e-5)
+                jlon = rng.uniform(-2e-5, 2e-5)
+                shock = rng.randint(0, 5)
+            else:
+                speed = kmh + rng.uniform(-3.0, 3.0)
+                step = kmh / 3.6
+                truth += step
+                lat += step * math.cos(math.radians(heading)) / M_PER_DEG
+                lon += (
+                    step
+                    * math.sin(math.radians(heading))
+                    / (M_PER_DEG * math.cos(math.radians(lat)))
+                )
+                jlat = jlon = 0.0
+                shock = rng.randint(20, 60)  # Road vibration
+            fix = kind != "lost"
+            samples.append(
+                {
+                    "t": t,
+                    "lat": lat + jlat if fix else 0.0,
+                    "lon": lon + jlon if fix else 0.0,
+                    "speed": speed if fix else 0.0,
+                    "gps_fix": fix,
+                    "shock": shock,
+                    "temp": 4.0 + 2.0 * math.sin(t / 600),
+                }
+            )
+            t += 1
+    return samples, truth
+
+
+Event = Tuple[int, int, Any]  # (t, TRIP_EVT_*, summary copy on end)
+
+
+def replay(det: TripDetector, samples: List[Dict[str, Any]]) -> List[Event]:
+    return replay_states(det, samples)[0]
+
+
+def replay_states(
+    det: TripDetector, samples: List[Dict[str, Any]]
+) -> Tuple[List[Event], List[int]]:
+    """Events plus the state after each sample, with consecutive repeats collapsed"""
+    events: List[Event] = []
+    states: List[int] = []
+    for s in samples:
+        evt = det.update(s, s["t"] * 1000, DAY0 + s["t"])
+        if not states or states[-1] != det.state:
+            states.append(det.state)
+        if evt:
+            events.append((s["t"], evt, dict(det.summary) if evt == TRIP_EVT_END else None))
+    return events, states
+
+
+class TestTripDetector(unittest.TestCase):
+    def test_delivery_route_is_one_trip(self) -> None:
+        samples, truth = route_samples(DELIVERY_ROUTE)
+        det = TripDetector()
+        events = replay(det, samples)
+        self.assertEqual([e for _, e, _ in events], [TRIP_EVT_START, TRIP_EVT_END])
+        self.assertEqual(events[0][0], 300 + 10)  # Start confirmed after 10 s of movement
+        self.assertEqual(events[1][0], 2480 + 600)  # End after 10 min parked
+
+        summary = events[1][2]
+        self.assertEqual(summary["trip"], 1)
+        self.assertEqual(summary["start_ts"], DAY0 + 300)  # Backdated to first movement
+        self.assertEqual(summary["end_ts"], DAY0 + 2480)
+        self.assertEqual(summary["duration_s"], 2180)
+        self.assertEqual(summary["stops"], 3)  # Traffic light not counted
+        self.assertEqual(summary["idle_s"], 180 + 120 + 240)
+        self.assertAlmostEqual(summary["distance_m"], truth, delta=truth * 0.02)
+        self.assertGreater(summary["max_speed"], 50)
+        self.assertLessEqual(summary["max_speed"], 53)
+        self.assertAlmostEqual(summary["temp_min"], 2.0, delta=0.05)
+        self.assertAlmostEqual(summary["temp_max"], 6.0, delta=0.05)
+
+    def test_state_sequence(self) -> None:
+        samples, _ = route_samples(DELIVERY_ROUTE)
+        _, states = replay_states(TripDetector(), samples)
+        self.assertEqual(states, [0, 1, 2, 1, 2, 1, 2, 1, 2, 0])
+
+    def test_jitter_at_rest_never_starts_a_trip(self) -> None:
+        samples, _ = route_samples([(7200, "park", 0, 0)])
+        for s in samples[::600]:
+            s["speed"] = 9.0  # Isolated multipath speed spikes
+        det = TripDetector()
+        self.assertEqual(replay(det, samples), [])
+        self.assertEqual(det.state, TRIP_IDLE)
+
+    def test_long_stop_splits_trips(self) -> None:
+        route: List[Leg] = [
+            (300, "drive", 40, 0),
+            (900, "park", 0, 0),  # Lunch break
+            (300, "drive", 40, 180),
+            (700, "park", 0, 0),
+        ]
+        det = TripDetector()
+        ends = [s for _, e, s in replay(det, route_samples(route)[0]) if e == TRIP_EVT_END]
+        self.assertEqual([s["trip"] for s in ends], [1, 2])
+        self.assertEqual([s["stops"] for s in ends], [0, 0])
+        self.assertEqual([s["duration_s"] for s in ends], [300, 300])
+
+    def test_motion_without_fix(self) -> None:
+        det = TripDetector()
+        events = replay(det, route_samples([(5, "park", 0, 0), (400, "lost", 30, 0)])[0])
+        self.assertEqual([e for _, e, _ in events], [TRIP_EVT_START])
+        self.assertEqual(det.distance_m, 0.0)
+        self.assertGreaterEqual(det.motion, 15)
+
+    def test_shocks_counted_only_during_trip(self) -> None:
+        det = TripDetector()
+        det.note_shock()  # Parked: not part of any trip
+        samples, _ = route_samples([(120, "drive", 40, 0), (700, "park", 0, 0)])
+        for s in samples:
+            det.update(s, s["t"] * 1000, DAY0 + s["t"])
+            if s["t"] in (30, 60):
+                det.note_shock()
+        self.assertEqual(det.summary["shocks"], 2)
+
+    def test_haversine(self) -> None:
+        self.assertAlmostEqual(haversine_m(0.0, 0.0, 1.0, 0.0), M_PER_DEG, delta=1)
+        self.assertAlmostEqual(haversine_m(52.52, 13.405, 48.8566, 2.3522), 877500, delta=1000)
+
+    def test_invalid_parameters(self) -> None:
+        with self.assertRaises(ValueError):
+            TripDetector(start_kmh=3, stop_kmh=5)
+        with self.assertRaises(ValueError):
+            TripDetector(stop_s=60, end_s=30)
+
+
+if __name__ == "__main__":
+    unittest.main()
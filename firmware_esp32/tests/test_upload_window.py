@@ -0,0 +1,127 @@
+import asyncio
+import json
+import unittest
+from typing import Any, Dict, List
+
+from lib.diagnostics import Diagnostics
+from tools.wifi_sim import DictConfig, FakeWLAN, VirtualClock
+
+from lib.upload_window import WIN_OFF, WIN_OPEN, UploadWindow
+from lib.wifi_manager import WiFiManager  # After tools.wifi_sim installs the fake network
+
+
+class FakePoster:
+    """post_records on the virtual clock; records the window state at each request"""
+
+    def __init__(self, clock: VirtualClock, fail_at: int = -1) -> None:
+        self.clock = clock
+        self.fail_at = fail_at
+        self.batches: List[List[Dict[str, Any]]] = []
+        self.states: List[int] = []
+        self.bytes_sent = 0
+        self.window: Any = None
+
+    async def post_records(self, records: List[Dict[str, Any]]) -> bool:
+        self.states.append(self.window.state)
+        self.clock.advance(400)
+        if len(self.batches) == self.fail_at:
+            return False
+        self.batches.append(list(records))
+        self.bytes_sent += len(json.dumps({"batch": records}))
+        return True
+
+
+class TestUploadWindow(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = VirtualClock()
+        self.clock.__enter__()
+        self.wlan = FakeWLAN(self.clock)
+        self.config = DictConfig(wifi_ssid="Depot", wifi_pass="secret")
+        self.diag = Diagnostics(self.config)
+        self.wifi = WiFiManager(self.config, diagnostics=self.diag)
+        asyncio.run(self.wifi.disconnect())
+        self.poster = FakePoster(self.clock)
+        self.window = UploadWindow(self.wifi, self.poster, batch_size=4, diagnostics=self.diag)
+        self.poster.window = self.window
+        self.queue = [{"seq": i} for i in range(10)]
+
+    def tearDown(self) -> None:
+        self.clock.__exit__()
+
+    def run_window(self, jobs: Any = ()) -> bool:
+        self.wlan.calls.clear()
+        return asyncio.run(self.window.run(self.queue, jobs))
+
+    def test_radio_only_on_inside_window(self) -> None:
+        states: List[int] = []
+
+        async def job() -> None:
+            states.append(self.window.state)
+
+        self.assertFalse(self.wlan.active())
+        self.assertTrue(self.run_window([job]))
+        self.assertEqual(self.wlan.calls[0], ("active", True))
+        self.assertEqual(self.wlan.calls[-1], ("active", False))
+        self.assertEqual(self.poster.states, [WIN_OPEN] * 3)
+        self.assertEqual(states, [WIN_OPEN])
+        self.assertEqual(self.window.state, WIN_OFF)
+        self.assertFalse(self.wlan.active())
+
+    def test_batches_oldest_first(self) -> None:
+        self.run_window()
+        sizes = [len(b) for b in self.poster.batches]
+        self.assertEqual(sizes, [4, 4, 2])
+        self.assertEqual(self.poster.batches[0][0], {"seq": 0})
+        self.assertEqual((self.queue, self.window.last_records), ([], 10))
+
+    def test_failed_post_keeps_rest_of_queue(self) -> None:
+        self.poster.fail_at = 1
+        self.assertTrue(self.run_window())
+        self.assertEqual(self.window.last_records, 4)
+        self.assertEqual(self.queue[0], {"seq": 4})
+        self.assertEqual(len(self.queue), 6)
+        self.assertFalse(self.wlan.active())
+
+    def test_failed_connect_powers_down(self) -> None:
+        self.config.set("wifi_pass", "wrong")
+        ran: List[int] = []
+
+        async def job() -> None:
+            ran.append(1)
+
+        self.assertFalse(self.run_window([job]))
+        self.assertEqual((len(self.queue), ran, self.poster.batches), (10, [], []))
+        self.assertEqual(self.wlan.calls[-1], ("active", False))
+        self.assertEqual(self.window.windows, 1)
+
+    def test_job_error_still_closes_window(self) -> None:
+        async def job() -> None:
+            raise OSError("ECONNRESET")
+
+        with self.assertRaises(OSError):
+            self.run_window([job])
+        self.assertEqual(self.window.state, WIN_OFF)
+        self.assertFalse(self.wlan.active())
+
+    def test_radio_time_and_bytes_accounted(self) -> None:
+        self.run_window()
+        first_ms = self.window.last_on_ms
+        self.assertGreater(first_ms, 1200)  # Association, DHCP and three requests
+        self.assertEqual(self.window.last_bytes, self.poster.bytes_sent)
+        self.clock.advance(300000)
+        self.queue.append({"seq": 10})
+        self.run_window()
+        self.assertLess(self.window.last_on_ms, first_ms)  # Fast reconnect, one request
+        self.assertEqual(self.window.total_bytes, self.poster.bytes_sent)
+        self.assertEqual(self.diag.gauges["wifi_windows"], 2)
+        self.assertEqual(self.diag.histograms["wifi_window_ms"].n, 2)
+        on_s = (first_ms + self.window.last_on_ms) // 1000
+        self.assertEqual(self.diag.gauges["wifi_radio_on_s"], on_s)
+
+    def test_invalid_batch_size(self) -> None:
+        with self.assertRaises(ValueError):
+            UploadWindow(self.wifi, self.poster, batch_size=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from typing import Any, Tuple
+
+from lib.wifi_locate import MIN_ACC_M, WifiLocator, fingerprint
+from tools.locate_sim import _Config, simulate
+
+A = b"\x24\x0a\xc4\x00\x00\x01"
+B = b"\x24\x0a\xc4\x00\x00\x02"
+C = b"\x24\x0a\xc4\x00\x00\x03"
+
+
+def row(bssid: bytes, rssi: int, ssid: bytes = b"Depot") -> Tuple[Any, ...]:
+    return (ssid, bssid, 6, rssi, 3, False)
+
+
+class TestWifiLocator(unittest.TestCase):
+    def setUp(self) -> None:
+        self.config = _Config()
+        self.loc = WifiLocator(self.config, capacity=4)
+
+    def test_fingerprint_strongest_first_without_nomap(self) -> None:
+        fp = fingerprint([row(A, -80), row(B, -50), row(C, -40, b"Van_nomap")])
+        self.assertEqual(fp, [["240ac4000002", -50], ["240ac4000001", -80]])
+        self.assertEqual(len(fingerprint([row(bytes(6), -60)] * 12)), 8)
+
+    def test_miss_then_server_then_local_hit(self) -> None:
+        scan = [row(A, -50), row(B, -70)]
+        self.assertFalse(self.loc.observe(scan, 0))
+        fp = self.loc.pending
+        assert fp is not None
+        reply = {"wifi_loc": {"lat": 52.5, "lon": 13.4, "acc": 35}}
+        self.assertTrue(self.loc.learn(fp, reply, 1000))
+        self.assertIsNone(self.loc.pending)
+        self.assertEqual((self.loc.lat, self.loc.acc_m, self.loc.fix_ms), (52.5, 35, 1000))
+        self.assertTrue(self.loc.observe([row(B, -60), row(C, -65)], 5000))
+        self.assertAlmostEqual(self.loc.lon, 13.4)
+        self.assertEqual(self.loc.age_ms(6000), 1000)
+        self.assertEqual((self.loc.lookups, self.loc.hits), (2, 1))
+
+    def test_per_ap_reply_weighted_by_rssi(self) -> None:
+        aps = {"240ac4000001": [52.0, 13.0, 30], "240ac4000002": [52.001, 13.0]}
+        self.loc.learn([], {"wifi_loc": {"lat": 52.0005, "lon": 13.0, "aps": aps}}, 0)
+        pos = self.loc.resolve([["240ac4000001", -40], ["240ac4000002", -90]])
+        assert pos is not None
+        lat, _, acc = pos
+        self.assertAlmostEqual(lat, 52.0 + 0.001 * 10 / 70)  # Weights 60 and 10
+        self.assertEqual(acc, 32)  # AP without acc takes the reply's default 50
+
+    def test_lru_eviction_and_persistence(self) -> None:
+        for i, bssid in enumerate(("a1", "a2", "a3", "a4")):
+            self.loc.learn([[bssid, -50]], {"wifi_loc": {"lat": i, "lon": 0.0}}, 0)
+        self.loc.resolve([["a1", -50]])  # Touch: a2 is now least recently used
+        self.loc.learn([["a5", -50]], {"wifi_loc": {"lat": 5, "lon": 0.0}}, 0)
+        self.assertIsNone(self.loc.resolve([["a2", -50]]))
+        self.assertIsNotNone(self.loc.resolve([["a1", -50]]))
+        saved = self.config.get("wifi_loc_cache")
+        self.assertEqual([r[0] for r in saved][-1], "a5")
+        reloaded = WifiLocator(self.config, capacity=2)
+        self.assertEqual(len(reloaded), 2)
+        self.assertEqual(reloaded.resolve([["a5", -50]]), (5.0, 0.0, 50))
+        reloaded.learn([["a6", -50]], {"wifi_loc": {"lat": 6, "lon": 0.0, "acc": 3}}, 0)
+        self.assertEqual(reloaded.acc_m, MIN_ACC_M)
+
+    def test_bad_replies_ignored(self) -> None:
+        for reply in (None, {}, {"wifi_loc": "x"}, {"wifi_loc": {"lat": "north", "lon": 1}}):
+            self.assertFalse(self.loc.learn([["a1", -50]], reply, 0))
+        self.assertEqual(len(self.loc), 0)
+        self.config.set("wifi_loc_cache", [["a1", "x", 0, 0], ["a2", 1.0, 2.0, 30]])
+        self.assertEqual(len(WifiLocator(self.config)), 1)
+        with self.assertRaises(ValueError):
+            WifiLocator(self.config, capacity=0)
+
+
+class TestLocateSimulation(unittest.TestCase):
+    def test_repeat_visits_resolve_locally(self) -> None:
+        small = simulate(visits=300, capacity=8, per_ap=False)
+        big = simulate(visits=300, capacity=32, per_ap=False)
+        self.assertGreater(big["hit_rate"], 0.8)
+        self.assertGreater(big["hit_rate"], small["hit_rate"] + 0.3)
+        self.assertLess(big["requests"], 60)
+        self.assertLess(big["p95_m"], 80)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,199 @@
+import asyncio
+import sys
+import time
+import unittest
+from typing import Any, Dict, List, Tuple
+
+from lib.diagnostics import Diagnostics, Histogram
+from tools.wifi_sim import DictConfig, FakeWLAN, VirtualClock, duty_cycle
+
+from lib.wifi_manager import WiFiManager  # After tools.wifi_sim installs the fake network
+
+
+class TestWiFiFastReconnect(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = VirtualClock()
+        self.clock.__enter__()
+        self.wlan = FakeWLAN(self.clock)
+        self.config = DictConfig(wifi_ssid="Depot", wifi_pass="secret")
+        self.diag = Diagnostics(self.config)
+        self.wifi = WiFiManager(self.config, diagnostics=self.diag)
+        asyncio.run(self.wifi.scan_networks())
+
+    def tearDown(self) -> None:
+        self.clock.__exit__()
+
+    def cycle(self) -> bool:
+        ok = asyncio.run(self.wifi.connect())
+        self.wlan.disconnect()
+        self.clock.advance(60000)
+        return ok
+
+    def connects(self) -> List[Tuple[Any, ...]]:
+        return [c for c in self.wlan.calls if c[0] == "connect"]
+
+    def test_first_connect_caches_link(self) -> None:
+        self.assertTrue(self.cycle())
+        cache = self.config.get("wifi_link_cache")
+        self.assertEqual(cache["bssid"], "240ac4112233")
+        self.assertEqual(cache["channel"], 6)
+        self.assertEqual(cache["ip"][0], "192.168.4.23")
+        self.assertEqual(self.diag.histograms["wifi_full_ms"].n, 1)
+
+    def test_fast_reconnect_skips_dhcp(self) -> None:
+        self.cycle()
+        writes = self.config.writes
+        for _ in range(5):
+            self.assertTrue(self.cycle())
+        self.assertEqual(self.connects()[-1], ("connect", "Depot", self.wlan.bssid))
+        self.assertIn(("ifconfig", tuple(self.wlan.lease)), self.wlan.calls)
+        fast = self.diag.histograms["wifi_fast_ms"]
+        full = self.diag.histograms["wifi_full_ms"]
+        self.assertEqual((fast.n, full.n), (5, 1))
+        self.assertLess(fast.max, full.max - 1000)  # No DHCP
+        self.assertEqual(self.config.writes, writes)  # Nothing changed, nothing written
+
+    def test_stale_lease_renewed_by_dhcp(self) -> None:
+        self.cycle()
+        self.clock.advance(3600 * 1000)
+        dhcp_ts = self.config.get("wifi_link_cache")["dhcp_ts"]
+        self.assertTrue(self.cycle())
+        ifconfig = [c for c in self.wlan.calls if c[0] == "ifconfig"]
+        self.assertEqual(ifconfig, [("ifconfig", "dhcp")])
+        self.assertGreater(self.config.get("wifi_link_cache")["dhcp_ts"], dhcp_ts)
+        self.assertGreater(self.diag.histograms["wifi_fast_ms"].max, 2000)
+
+    def test_lease_expires_between_fast_reconnects(self) -> None:
+        self.cycle()
+        self.assertTrue(self.cycle())  # Static lease applied to the interface
+        self.clock.advance(3600 * 1000)
+        self.wlan.lease = ("192.168.4.57",) + self.wlan.lease[1:]  # Handed out on renewal
+        self.assertTrue(self.cycle())
+        self.assertEqual(self.wlan.calls[-4], ("ifconfig", "dhcp"))  # Before the connect
+        self.assertEqual(self.config.get("wifi_link_cache")["ip"][0], "192.168.4.57")
+        self.assertGreater(self.diag.histograms["wifi_fast_ms"].max, 2000)  # DHCP round trip
+
+    def test_replaced_ap_falls_back_to_full_connect(self) -> None:
+        self.cycle()
+        self.wlan.bssid = b"\x24\x0a\xc4\x44\x55\x66"
+        self.wlan.channel = 11
+        self.assertTrue(self.cycle())
+        self.assertEqual(self.diag.counters["wifi_fast_fail"], 1)
+        self.assertEqual(self.connects()[-1], ("connect", "Depot", None))
+        self.assertIn(("ifconfig", "dhcp"), self.wlan.calls)
+        cache = self.config.get("wifi_link_cache")
+        self.assertEqual((cache["channel"], cache["bssid"]), (11, ""))  # Scan predates the move
+        self.assertTrue(self.cycle())
+        self.assertEqual(self.connects()[-1], ("connect", "Depot", None))
+
+    def test_wrong_password_reports_failure(self) -> None:
+        self.cycle()
+        self.config.set("wifi_pass", "wrong")
+        status: List[Tuple[str, str]] = []
+        ok = asyncio.run(self.wifi.connect(lambda s, d: status.append((s, d))))
+        self.assertFalse(ok)
+        self.assertEqual(status, [("FAILED", "Wrong Password")])
+        self.assertIsNone(self.config.get("wifi_link_cache"))
+        self.assertEqual(self.wifi.last_connect_ms, self.diag.histograms["wifi_full_ms"].max)
+
+    def test_report_includes_histograms(self) -> None:
+        self.cycle()
+        self.cycle()
+        report = self.diag.get_report()
+        self.assertEqual(report["wifi_fast_ms_n"], 1)
+        self.assertEqual(report["wifi_fast_ms_le_2000"], 1)
+        self.assertEqual(report["wifi_full_ms_le_4000"], 1)
+
+
+class TestAsyncScan(unittest.TestCase):
+    """Real time: scan() blocks its thread for 300 ms while a 10 ms sensor loop runs"""
+
+    def setUp(self) -> None:
+        self.wlan = FakeWLAN(VirtualClock(), scan_block_s=0.3)
+        self.config = DictConfig(wifi_scan_ttl_sec=30)
+        self.wifi = WiFiManager(self.config)
+
+    def sensor_jitter(self, scans: int = 1) -> Tuple[float, List[Any]]:
+        """Worst gap between 10 ms sensor ticks while scan_networks() runs"""
+        gaps: List[float] = []
+        done: List[Any] = []
+
+        async def sensor() -> None:
+            last = time.perf_counter()
+            while len(done) < scans:
+                await asyncio.sleep_ms(10)  # type: ignore[attr-defined]
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        async def scan() -> None:
+            done.append(await self.wifi.scan_networks(0 if scans == 1 else None))
+
+        async def both() -> None:
+            await asyncio.gather(sensor(), *[scan() for _ in range(scans)])
+
+        asyncio.run(both())
+        return max(gaps), done
+
+    def test_sensor_ticks_continue_during_scan(self) -> None:
+        worst, done = self.sensor_jitter()
+        self.assertLess(worst, 0.15)
+        self.assertEqual(done[0][0][0], "Depot")
+
+    def test_blocking_fallback_without_threads(self) -> None:
+        saved = sys.modules.get("_thread")
+        sys.modules["_thread"] = None  # type: ignore[assignment]
+        try:
+            worst, done = self.sensor_jitter()
+        finally:
+            sys.modules["_thread"] = saved  # type: ignore[assignment]
+        self.assertGreaterEqual(worst, 0.29)
+        self.assertEqual(len(done[0]), 2)
+
+    def test_results_cached_for_ttl(self) -> None:
+        self.wlan.scan_block_s = 0
+        first = asyncio.run(self.wifi.scan_networks())
+        self.assertIs(asyncio.run(self.wifi.scan_networks()), first)
+        self.assertEqual(self.wlan.scans, 1)
+        asyncio.run(self.wifi.scan_networks(0))
+        self.assertEqual(self.wlan.scans, 2)
+
+    def test_concurrent_requests_share_one_scan(self) -> None:
+        _, done = self.sensor_jitter(scans=3)
+        self.assertEqual(self.wlan.scans, 1)
+        self.assertTrue(done[0] is done[1] is done[2])
+
+    def test_scan_restores_radio_off(self) -> None:
+        self.wlan.scan_block_s = 0
+        self.wlan.active(False)
+        asyncio.run(self.wifi.scan_networks(0))
+        self.assertEqual(self.wlan.calls[-2:], [("active", True), ("active", False)])
+
+
+class TestHistogram(unittest.TestCase):
+    def test_buckets(self) -> None:
+        h = Histogram((100, 1000))
+        for v in (5, 100, 101, 999, 5000):
+            h.observe(v)
+        self.assertEqual(h.counts, [2, 2, 1])
+        out: Dict[str, Any] = {}
+        h.report("x", out)
+        self.assertEqual(out["x_gt_1000"], 1)
+        self.assertEqual((out["x_n"], out["x_max"], out["x_mean"]), (5, 5000, 1241))
+
+
+class TestDutyCycleSimulation(unittest.TestCase):
+    def test_mean_connect_time_drops(self) -> None:
+        baseline, _ = duty_cycle(30, 60, ttl_s=0)
+        cached, config = duty_cycle(30, 60)
+
+        def mean(d: Diagnostics) -> int:
+            return sum(h.total for h in d.histograms.values()) // 30
+
+        self.assertLess(mean(cached), mean(baseline) * 0.6)
+        self.assertLessEqual(config.key_writes["wifi_link_cache"], 2)
+        self.assertLessEqual(config.writes, 4)  # Plus the known-network entry and its ok_ts
+
+
+if __name__ == "__main__":
+    unittest.main()
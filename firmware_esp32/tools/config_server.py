@@ -0,0 +1,207 @@
+# config_server.py - Local stand-in for the config and ingest servers, and downlink latency
+#
+# ConfigServer serves GET /config with an ETag (304 on If-None-Match) and
+# accepts POST /ingest, answering with the downlink hint {"cfg": "<ETag>"}
+# (plus "cmd": 1 while commands are pending); an `ingest` callback can supply
+# the rest of the reply (tools/delta_server.py). The report replays days of
+# upload windows with config changes published at random times and compares
+# how fetches are triggered: the old unconditional daily GET, an hourly
+# conditional poll, and ingest-reply hints with the daily poll as fallback.
+#
+# Run from firmware_esp32/: `python3 tools/config_server.py`
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, ".")
+from tools.host_shims import install  # noqa: E402
+
+install()
+
+from lib.config import Config  # noqa: E402
+from lib.http_poster import HttpPoster  # noqa: E402
+from lib.logger import Logger  # noqa: E402
+from lib.remote_config import RemoteConfig  # noqa: E402
+
+
+class MemConfig(Config):
+    """Config without the file: counts saves instead"""
+
+    def __init__(self, **values: Any) -> None:
+        self.saves = 0
+        super().__init__()
+        self._config.update(values)
+
+    def load(self) -> None:
+        pass
+
+    def save(self) -> None:
+        self.saves += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+
+    def log_message(self, *args: Any) -> None:
+        pass  # Quiet
+
+    def _send(self, status: int, body: bytes = b"", etag: str = "") -> None:
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        stand_in = self.server.stand_in
+        if self.path != "/config":
+            self._send(404)
+            return
+        stand_in.gets += 1
+        etag = stand_in.etag
+        if self.headers.get("If-None-Match") == etag:
+            stand_in.not_modified += 1
+            self._send(304, etag=etag)
+            return
+        body = json.dumps(stand_in.document).encode()
+        stand_in.body_bytes += len(body)
+        self._send(200, body, etag)
+
+    def do_POST(self) -> None:
+        stand_in = self.server.stand_in
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path != "/ingest":
+            self._send(404)
+            return
+        stand_in.encodings.append(self.headers.get("Content-Encoding"))
+        if self.headers.get("Content-Encoding") == "deflate":
+            body = zlib.decompress(body)
+        payload = json.loads(body)
+        stand_in.posts.append(payload)
+        reply: Dict[str, Any] = stand_in.ingest(payload) if stand_in.ingest else {}
+        if stand_in.hints:
+            reply["cfg"] = stand_in.etag
+            if stand_in.cmd_pending:
+                reply["cmd"] = 1
+        self._send(200, json.dumps(reply).encode() if reply else b"")
+
+
+class _Server(HTTPServer):
+    stand_in: "ConfigServer"
+
+
+class ConfigServer:
+    """Context manager: HTTP server thread on 127.0.0.1 with a mutable config document"""
+
+    def __init__(self, document: Dict[str, Any], hints: bool = True) -> None:
+        self.document = dict(document)
+        self.hints = hints
+        self.cmd_pending = False
+        self.gets = 0
+        self.not_modified = 0
+        self.body_bytes = 0
+        self.posts: List[Dict[str, Any]] = []
+        self.encodings: List[Optional[str]] = []  # Content-Encoding per POST
+        self.ingest: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None  # Reply source
+        self._httpd = _Server(("127.0.0.1", 0), _Handler)
+        self._httpd.stand_in = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def etag(self) -> str:
+        digest = hashlib.sha1(json.dumps(self.document, sort_keys=True).encode()).hexdigest()
+        return '"%s"' % digest[:16]
+
+    def url(self, path: str) -> str:
+        return "http://127.0.0.1:%d%s" % (self._httpd.server_address[1], path)
+
+    def publish(self, **changes: Any) -> None:
+        self.document.update(changes)
+
+    def __enter__(self) -> "ConfigServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+
+
+def sample_document() -> Dict[str, Any]:
+    """A realistic remote config: intervals plus a few geofences (about 1.5 KB)"""
+    fences = []
+    for i in range(8):
+        corners = ((0, 0), (1, 0), (1, 1), (0, 1))
+        pts = [[52.5 + i * 0.01 + dx * 0.001, 13.4 + dy * 0.001] for dx, dy in corners]
+        fences.append({"id": "depot-%d" % i, "points": pts})
+    return {"ingest_interval_sec": 60, "log_interval_sec": 10, "geofences": fences}
+
+
+def simulate(
+    strategy: str, days: int = 3, window_s: int = 600, changes: int = 6, seed: int = 3
+) -> Dict[str, float]:
+    """Fetch trigger per strategy: daily (unconditional), hourly (conditional) or hints"""
+    rng = random.Random(seed)
+    horizon = days * 86400
+    change_at = sorted(rng.randrange(horizon) for _ in range(changes))
+    with ConfigServer(sample_document(), hints=strategy == "hints") as server:
+        config = MemConfig(ingest_url=server.url("/ingest"), config_url=server.url("/config"))
+        poster = HttpPoster(config)
+        remote = RemoteConfig(config)
+        poster.on_reply = remote.note_reply
+        poll_s = 3600 if strategy == "hourly" else 86400
+        next_poll = 0
+        version = 0
+        published: List[int] = []  # Publish times not yet applied on the device
+        latencies: List[int] = []
+        for t in range(0, horizon, window_s):
+            while change_at and change_at[0] <= t:
+                version += 1
+                server.publish(log_interval_sec=10 + version)
+                published.append(change_at.pop(0))
+            asyncio.run(poster.post_records([{"seq": t // window_s}]))
+            if t >= next_poll:
+                next_poll = t + poll_s
+                if strategy == "daily":
+                    config.set("config_etag", "")  # The old client never sent If-None-Match
+                remote.fetch()
+            elif remote.fetch_due:
+                remote.fetch()
+            if published and config.get("log_interval_sec") == 10 + version:
+                latencies.extend(t - p for p in published)
+                published = []
+        return {
+            "gets": server.gets,
+            "not_modified": server.not_modified,
+            "kb": server.body_bytes / 1024,
+            "mean_min": sum(latencies) / len(latencies) / 60 if latencies else 0.0,
+            "max_min": max(latencies) / 60 if latencies else 0.0,
+            "pending": len(published),
+        }
+
+
+def main() -> None:
+    Logger.LOG_FILE = os.path.join(tempfile.gettempdir(), "lmt_config_server_log.txt")
+    Logger.SILENT_PERIOD_MS = 1 << 40  # Keep the report readable
+    Logger.MAX_SIZE = 1 << 30  # Rotation renames into the cwd
+    head = ("trigger", "GETs", "304s", "config KB", "mean delay min", "max delay min")
+    print("%-8s %6s %6s %10s %14s %13s" % head)
+    for strategy in ("daily", "hourly", "hints"):
+        r = simulate(strategy)
+        row = (strategy, r["gets"], r["not_modified"], r["kb"], r["mean_min"], r["max_min"])
+        print("%-8s %6d %6d %10.1f %14.0f %13.0f" % row)
+    print("3 days, an upload window every 10 min, 6 config changes at random times")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# dr_eval.py - Host evaluation of dead reckoning against traces with GPS outages
+#
+# Replays an IMU + GPS trace through lib/dead_reckoning.py, drops the GPS fixes
+# inside the outage windows, and compares the estimate at each dropped fix
+# with the fix itself. The baseline is the old behaviour: the last fix frozen.
+#
+# Recorded traces are JSON lines in time order:
+#   {"t": ms, "imu": [ax, ay, az, gx, gy, gz]}    raw MPU6050 counts
+#   {"t": ms, "gps": [lat, lon, speed_kmh, course_deg]}
+# Without --trace, a synthetic delivery drive is simulated (100 Hz IMU with an
+# unknown mounting yaw and tilt, noise, vibration and gyro bias; 1 Hz GPS).
+#
+# Run from firmware_esp32/:
+#   python3 tools/dr_eval.py [--trace drive.jsonl] [--outage 60:100 ...] [--no-gyro]
+import json
+import math
+import random
+import sys
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+sys.path.insert(0, ".")
+from tools.host_shims import install  # noqa: E402
+
+install()
+
+from lib.dead_reckoning import M_PER_DEG, DeadReckoner  # noqa: E402
+
+Event = Tuple[str, int, Tuple[float, ...]]  # ("imu" | "gps", t_ms, values)
+Outage = Tuple[float, float]  # Seconds
+
+# (seconds, accel m/s^2, turn rate deg/s clockwise)
+DELIVERY_DRIVE = [
+    (20, 0.0, 0.0),  # Parked
+    (10, 1.5, 0.0),
+    (30, 0.0, 0.0),
+    (5, -1.0, 0.0),
+    (10, 0.0, 0.0),
+    (10, 0.0, 9.0),  # 90 deg right
+    (5, 1.0, 0.0),
+    (40, 0.0, 0.0),
+    (5, 0.0, -9.0),  # 45 deg left
+    (20, 0.0, 0.0),
+    (10, -1.5, 0.0),
+    (20, 0.0, 0.0),  # Delivery stop
+    (10, 1.2, 0.0),
+    (30, 0.0, 0.0),
+]
+DEFAULT_OUTAGES: List[Outage] = [(58, 100), (150, 190)]
+LAT0 = 52.52
+LON0 = 13.405
+
+
+def _rotate_y(v: Sequence[float], phi: float) -> Tuple[float, float, float]:
+    c = math.cos(phi)
+    s = math.sin(phi)
+    return (v[0] * c + v[2] * s, v[1], -v[0] * s + v[2] * c)
+
+
+def simulate(
+    segments: Sequence[Tuple[float, float, float]] = DELIVERY_DRIVE,
+    mount_deg: float = 35.0,
+    tilt_deg: float = 4.0,
+    seed: int = 1,
+) -> List[Event]:
+    """Synthetic trace: level sensor frame x/y/z-up rotated by the mount, then tilted"""
+    rng = random.Random(seed)
+    th = math.radians(mount_deg)
+    phi = math.radians(tilt_deg)
+    fwd = (math.cos(th), math.sin(th))
+    right = (math.sin(th), -math.cos(th))
+    bias = 40  # Gyro z bias, counts
+    kx = M_PER_DEG * math.cos(math.radians(LAT0))
+    v = heading = east = north = 0.0
+    events: List[Event] = []
+    t_ms = 0
+    for seconds, acc, turn in segments:
+        for _ in range(int(seconds * 100)):
+            a = acc if v > 0 or acc > 0 else 0.0
+            v = max(0.0, v + a * 0.01)
+            w = math.radians(turn) if v > 0.5 else 0.0
+            heading += w * 0.01
+            east += v * math.sin(heading) * 0.01
+            north += v * math.cos(heading) * 0.01
+            lat_acc = v * w
+            hx = a * fwd[0] + lat_acc * right[0]
+            hy = a * fwd[1] + lat_acc * right[1]
+            acc_v = _rotate_y((hx / 9.807, hy / 9.807, 1.0), phi)
+            gyro_v = _rotate_y((0.0, 0.0, -math.degrees(w)), phi)
+            vib = 600 if v > 0.5 else 40
+            imu = (
+                tuple(
+                    max(-32768, min(32767, int(g * 16384) + rng.randint(-vib, vib))) for g in acc_v
+                )
+                + tuple(int(d * 131) + rng.randint(-30, 30) for d in gyro_v[:2])
+                + (int(gyro_v[2] * 131) + bias + rng.randint(-30, 30),)
+            )
+            events.append(("imu", t_ms, imu))
+            if t_ms % 1000 == 0:
+                lat = LAT0 + (north + rng.uniform(-2, 2)) / M_PER_DEG
+                lon = LON0 + (east + rng.uniform(-2, 2)) / kx
+                kmh = max(0.0, v * 3.6 + rng.uniform(-0.3, 0.3))
+                course = (math.degrees(heading) + rng.uniform(-2, 2)) % 360
+                events.append(("gps", t_ms, (lat, lon, kmh, course)))
+            t_ms += 10
+    return events
+
+
+def load_trace(path: str) -> List[Event]:
+    events: List[Event] = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            if "imu" in rec:
+                events.append(("imu", int(rec["t"]), tuple(int(x) for x in rec["imu"])))
+            elif "gps" in rec:
+                events.append(("gps", int(rec["t"]), tuple(float(x) for x in rec["gps"])))
+    return events
+
+
+def _error_m(lat: float, lon: float, ref_lat: float, ref_lon: float) -> float:
+    dy = (lat - ref_lat) * M_PER_DEG
+    dx = (lon - ref_lon) * M_PER_DEG * math.cos(math.radians(ref_lat))
+    return math.sqrt(dx * dx + dy * dy)
+
+
+def evaluate(
+    events: Sequence[Event],
+    outages: Sequence[Outage] = DEFAULT_OUTAGES,
+    use_gyro: bool = True,
+    dr: Optional[DeadReckoner] = None,
+) -> Dict[str, Any]:
+    """Estimate vs dropped fixes: mean/max error for DR and the frozen last fix"""
+    dr = dr or DeadReckoner(use_gyro=use_gyro)
+    last: Optional[Tuple[float, float]] = None
+    dr_err: List[float] = []
+    frozen_err: List[float] = []
+    contained = 0
+    for kind, t_ms, v in events:
+        if kind == "imu":
+            dr.imu_sample(*[int(x) for x in v], t_ms)  # type: ignore[call-arg]
+            continue
+        lat, lon, kmh, course = v
+        if not any(a * 1000 <= t_ms < b * 1000 for a, b in outages):
+            dr.fix(lat, lon, kmh, course, t_ms)
+            last = (lat, lon)
+        elif last is not None and dr.estimate(t_ms):
+            err = _error_m(dr.lat, dr.lon, lat, lon)
+            dr_err.append(err)
+            frozen_err.append(_error_m(last[0], last[1], lat, lon))
+            contained += err <= dr.radius_m
+    n = max(1, len(dr_err))
+    return {
+        "points": len(dr_err),
+        "dr_mean": sum(dr_err) / n,
+        "dr_max": max(dr_err, default=0.0),
+        "frozen_mean": sum(frozen_err) / n,
+        "frozen_max": max(frozen_err, default=0.0),
+        "contained": contained / n,
+        "learned": dr.learned,
+    }
+
+
+def main(argv: List[str]) -> None:
+    events = load_trace(argv[argv.index("--trace") + 1]) if "--trace" in argv else simulate()
+    outages = [
+        (float(argv[i + 1].split(":")[0]), float(argv[i + 1].split(":")[1]))
+        for i, a in enumerate(argv)
+        if a == "--outage"
+    ] or DEFAULT_OUTAGES
+    stats = evaluate(events, outages, use_gyro="--no-gyro" not in argv)
+    print("outage points:     %d" % stats["points"])
+    print("dead reckoning:    mean %.1f m, max %.1f m" % (stats["dr_mean"], stats["dr_max"]))
+    frozen = (stats["frozen_mean"], stats["frozen_max"])
+    print("frozen last fix:   mean %.1f m, max %.1f m" % frozen)
+    print("inside radius:     %.0f%%" % (stats["contained"] * 100))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,213 @@
+# gps_sim.py - Fake u-blox NEO-6M on a UART, and the NMEA parser load per mode
+#
+# FakeUblox stands in for SensorHub's GPS UART: GpsController writes UBX
+# frames to it and the RMC parser reads NMEA lines from it. It validates every
+# frame (sync, length, checksum), records the command sequence, answers with
+# ACK-ACK / ACK-NAK frames, and emits the enabled sentences at the configured
+# navigation rate until put into backup. RX activity or the backup timer wakes it.
+#
+# Run from firmware_esp32/: `python3 tools/gps_sim.py`
+import struct
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, ".")
+from tools.host_shims import install  # noqa: E402
+
+install()
+
+from lib.gps_control import (  # noqa: E402
+    GPS_BACKUP,
+    GPS_ECO,
+    GPS_FULL,
+    MODE_NAMES,
+    NMEA_CLASS,
+    GpsController,
+    parse_rmc,
+    ubx_frame,
+)
+from lib.trip_detector import TRIP_IDLE, TRIP_MOVING, TRIP_STOPPED  # noqa: E402
+
+Command = Tuple[int, int, bytes]
+
+# Default NEO-6M output per navigation epoch, by NMEA message id
+_SENTENCES = {
+    0x00: ["GPGGA,120000.00,5231.20000,N,01324.30000,E,1,08,1.01,34.5,M,44.1,M,,"],
+    0x01: ["GPGLL,5231.20000,N,01324.30000,E,120000.00,A,A"],
+    0x02: ["GPGSA,A,3,01,03,08,11,14,17,22,28,,,,,1.85,1.01,1.55"],
+    0x03: [
+        "GPGSV,3,1,11,01,57,258,38,03,35,062,36,08,18,309,28,11,64,111,41",
+        "GPGSV,3,2,11,14,10,175,24,17,42,297,35,22,72,040,44,28,23,130,31",
+        "GPGSV,3,3,11,30,05,222,,31,15,089,22,32,01,330,",
+    ],
+    0x04: ["GPRMC,120000.00,A,5231.20000,N,01324.30000,E,0.512,77.52,150624,,,A"],
+    0x05: ["GPVTG,77.52,T,,M,0.512,N,0.948,K,A"],
+}
+
+
+def nmea(body: str) -> bytes:
+    ck = 0
+    for c in body.encode():
+        ck ^= c
+    return b"$%s*%02X\r\n" % (body.encode(), ck)
+
+
+class FakeUblox:
+    def __init__(self) -> None:
+        self.rates: Dict[int, int] = {k: 1 for k in _SENTENCES}
+        self.meas_ms = 1000
+        self.lp_mode = 0
+        self.asleep = False
+        self.wake_at: Optional[int] = None
+        self.commands: List[Command] = []
+        self.errors: List[str] = []
+        self.aid: Optional[Dict[str, Any]] = None
+        self.now_ms = 0
+        self._next_ms = 0
+        self._in = bytearray()
+        self._out = bytearray()
+
+    # UART interface used by SensorHub and GpsController
+    def any(self) -> int:
+        return len(self._out)
+
+    def readline(self) -> bytes:
+        i = self._out.find(b"\n")
+        n = len(self._out) if i < 0 else i + 1
+        line = bytes(self._out[:n])
+        del self._out[:n]
+        return line
+
+    def write(self, buf: bytes) -> int:
+        if self.asleep:
+            self._wake()  # The bytes that woke it are lost
+            return len(buf)
+        self._in += buf
+        self._parse()
+        return len(buf)
+
+    def tick(self, now_ms: int) -> None:
+        self.now_ms = now_ms
+        if self.asleep:
+            if self.wake_at is not None and now_ms >= self.wake_at:
+                self._wake()
+            return
+        while now_ms >= self._next_ms:
+            for msg_id, sentences in _SENTENCES.items():
+                if self.rates.get(msg_id):
+                    for s in sentences:
+                        self._out += nmea(s)
+            self._next_ms += self.meas_ms
+
+    def names(self) -> List[str]:
+        """Command sequence as readable names"""
+        names = {(6, 1): "CFG-MSG", (6, 8): "CFG-RATE", (6, 0x11): "CFG-RXM"}
+        names.update({(2, 0x41): "RXM-PMREQ", (0x0B, 1): "AID-INI"})
+        return [names.get((c, i), "%02X-%02X" % (c, i)) for c, i, _ in self.commands]
+
+    def _wake(self) -> None:
+        self.asleep = False
+        self.wake_at = None
+        self._next_ms = self.now_ms + 1000  # Restart before the first output
+
+    def _parse(self) -> None:
+        buf = self._in
+        while len(buf) >= 8:
+            if buf[0] != 0xB5 or buf[1] != 0x62:
+                self.errors.append("sync")
+                del buf[0]
+                continue
+            n = buf[4] | (buf[5] << 8)
+            if len(buf) < 8 + n:
+                return
+            frame = bytes(buf[: 8 + n])
+            del buf[: 8 + n]
+            cls, msg_id, payload = frame[2], frame[3], frame[6 : 6 + n]
+            if ubx_frame(cls, msg_id, payload) != frame:
+                self.errors.append("checksum")
+                continue
+            self.commands.append((cls, msg_id, payload))
+            ok = self._apply(cls, msg_id, payload)
+            self._out += ubx_frame(5, 1 if ok else 0, bytes((cls, msg_id)))
+
+    def _apply(self, cls: int, msg_id: int, p: bytes) -> bool:
+        if (cls, msg_id) == (6, 1) and len(p) == 3 and p[0] == NMEA_CLASS:
+            self.rates[p[1]] = p[2]
+        elif (cls, msg_id) == (6, 8) and len(p) == 6:
+            self.meas_ms = struct.unpack("<H", p[:2])[0]
+        elif (cls, msg_id) == (6, 0x11) and len(p) == 2:
+            self.lp_mode = p[1]
+        elif (cls, msg_id) == (2, 0x41) and len(p) == 8:
+            duration, flags = struct.unpack("<II", p)
+            if flags & 2:
+                self.asleep = True
+                self.wake_at = self.now_ms + duration if duration else None
+                self._out = bytearray()
+        elif (cls, msg_id) == (0x0B, 1) and len(p) == 48:
+            f = struct.unpack("<iiiIHHIiIIiII", p)
+            self.aid = {"lat": f[0] / 1e7, "lon": f[1] / 1e7, "pos_acc_cm": f[3]}
+            self.aid.update({"wn": f[5], "tow_ms": f[6], "flags": f[12]})
+        else:
+            self.errors.append("unsupported %02X-%02X" % (cls, msg_id))
+            return False
+        return True
+
+
+def drain(uart: Any, gps: Dict[str, Any]) -> Tuple[int, int]:
+    """SensorHub._read_gps without the hardware: (lines, bytes) read"""
+    lines = nbytes = 0
+    while uart.any():
+        line = uart.readline()
+        lines += 1
+        nbytes += len(line)
+        parse_rmc(line, gps)
+    return lines, nbytes
+
+
+def measure(
+    fake: FakeUblox, seconds: int = 60, ctrl: Optional[GpsController] = None, state: Any = None
+) -> Dict[str, float]:
+    """Lines, bytes and parser time per second, polled at 10 Hz like the sensor task"""
+    gps = {"lat": 0.0, "lon": 0.0, "speed": 0.0, "course": 0.0, "fix": False}
+    lines = nbytes = 0
+    parse_us = 0
+    start_ms = fake.now_ms
+    for k in range(1, seconds * 10 + 1):
+        now = start_ms + k * 100
+        fake.tick(now)
+        if ctrl is not None:
+            ctrl.update(state[0], state[1], now)
+        t0 = time.perf_counter()
+        n, b = drain(fake, gps)
+        parse_us += int((time.perf_counter() - t0) * 1e6)
+        lines += n
+        nbytes += b
+    return {"lines_s": lines / seconds, "bytes_s": nbytes / seconds, "us_s": parse_us / seconds}
+
+
+def _print_row(label: str, row: Dict[str, float]) -> None:
+    print("%-22s %8.1f %8.0f %10.0f" % (label, row["lines_s"], row["bytes_s"], row["us_s"]))
+
+
+def main() -> None:
+    print("%-22s %8s %8s %10s" % ("mode", "lines/s", "bytes/s", "parse us/s"))
+    fake = FakeUblox()
+    _print_row("default output", measure(fake))
+    ctrl = GpsController(fake)
+    ctrl.configure()
+    runs = (
+        ("moving", (TRIP_MOVING, False), GPS_FULL),
+        ("delivery stop", (TRIP_STOPPED, False), GPS_ECO),
+        ("parked", (TRIP_IDLE, False), GPS_BACKUP),
+    )
+    for name, state, mode in runs:
+        if mode == GPS_BACKUP:
+            measure(fake, 300, ctrl, state)  # Still long enough to go to backup
+        row = measure(fake, 60, ctrl, state)
+        _print_row("%s (%s)" % (name, MODE_NAMES[ctrl.mode]), row)
+    print("UBX frames sent: %d, rejected: %d" % (ctrl.frames, len(fake.errors)))
+
+
+if __name__ == "__main__":
+    main()
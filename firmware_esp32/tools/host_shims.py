@@ -0,0 +1,141 @@
+# host_shims.py - MicroPython compatibility shims for running firmware logic on CPython
+#
+# Used by the pytest suite and by benchmarks/*. On a MicroPython port (device or
+# unix) every shim is a no-op because the real modules already exist.
+import asyncio
+import sys
+import time
+import types
+from typing import Any, Callable
+
+
+def _identity(fn: Callable[..., Any]) -> Callable[..., Any]:
+    return fn
+
+
+def _install_time_shims() -> None:
+    """Provide the `time.ticks_*` family the firmware relies on."""
+    if hasattr(time, "ticks_ms"):
+        return
+    time.ticks_ms = lambda: int(time.monotonic() * 1000)  # type: ignore[attr-defined]
+    time.ticks_us = lambda: int(time.monotonic() * 1_000_000)  # type: ignore[attr-defined]
+    time.ticks_diff = lambda a, b: a - b  # type: ignore[attr-defined]
+    time.ticks_add = lambda a, b: a + b  # type: ignore[attr-defined]
+    time.sleep_ms = lambda ms: time.sleep(ms / 1000)  # type: ignore[attr-defined]
+
+
+def _install_micropython_module() -> None:
+    if "micropython" in sys.modules:
+        return
+    mod = types.ModuleType("micropython")
+    mod.const = lambda x: x  # type: ignore[attr-defined]
+    mod.native = _identity  # type: ignore[attr-defined]
+    mod.viper = _identity  # type: ignore[attr-defined]
+    sys.modules["micropython"] = mod
+
+
+def _install_uasyncio() -> None:
+    if "uasyncio" in sys.modules:
+        return
+
+    async def sleep_ms(ms: int) -> None:
+        await asyncio.sleep(ms / 1000)
+
+    asyncio.sleep_ms = sleep_ms  # type: ignore[attr-defined]
+    sys.modules["uasyncio"] = asyncio
+
+
+def _install_ubinascii() -> None:
+    if "ubinascii" in sys.modules:
+        return
+    import binascii
+
+    sys.modules["ubinascii"] = binascii
+
+
+class _Response:
+    """The parts of a urequests Response the firmware uses"""
+
+    def __init__(self, status: int, headers: Any, content: bytes) -> None:
+        self.status_code = status
+        self.headers = dict(headers.items())
+        self.content = content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode()
+
+    def json(self) -> Any:
+        import json
+
+        return json.loads(self.content)
+
+    def close(self) -> None:
+        pass
+
+
+def _install_urequests() -> None:
+    """urequests over urllib, for tests against local stand-in servers"""
+    if "urequests" in sys.modules:
+        return
+    import urllib.error
+    import urllib.request
+
+    def request(
+        method: str, url: str, data: Any = None, headers: Any = None, **_: Any
+    ) -> _Response:
+        body = data.encode() if isinstance(data, str) else data
+        req = urllib.request.Request(url, data=body, headers=headers or {}, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=5) as r:
+                return _Response(r.status, r.headers, r.read())
+        except urllib.error.HTTPError as e:  # 304 and errors still carry a response
+            return _Response(e.code, e.headers, e.read())
+
+    mod = types.ModuleType("urequests")
+    mod.request = request  # type: ignore[attr-defined]
+    mod.get = lambda url, **kw: request("GET", url, **kw)  # type: ignore[attr-defined]
+    mod.post = lambda url, **kw: request("POST", url, **kw)  # type: ignore[attr-defined]
+    sys.modules["urequests"] = mod
+
+
+def _install_deflate() -> None:
+    """Compressing `deflate.DeflateIO` over zlib (MicroPython 1.21+ module)"""
+    if "deflate" in sys.modules:
+        return
+    import zlib
+
+    raw, zlib_fmt, gzip_fmt = 1, 2, 3
+
+    class DeflateIO:
+        def __init__(self, stream: Any, format: int = 0, wbits: int = 0, close: bool = False):
+            bits = max(9, wbits or 8)  # zlib's smallest window is 512 bytes
+            wb = {raw: -bits, gzip_fmt: 16 + bits}.get(format, bits)
+            self._stream = stream
+            self._close = close
+            # Fixed Huffman codes, like MicroPython's compressor: ratios stay comparable
+            self._z = zlib.compressobj(6, zlib.DEFLATED, wb, 8, zlib.Z_FIXED)
+
+        def write(self, data: bytes) -> int:
+            self._stream.write(self._z.compress(data))
+            return len(data)
+
+        def close(self) -> None:
+            self._stream.write(self._z.flush())
+            if self._close:
+                self._stream.close()
+
+    mod = types.ModuleType("deflate")
+    mod.AUTO, mod.RAW = 0, raw  # type: ignore[attr-defined]
+    mod.ZLIB, mod.GZIP = zlib_fmt, gzip_fmt  # type: ignore[attr-defined]
+    mod.DeflateIO = DeflateIO  # type: ignore[attr-defined]
+    sys.modules["deflate"] = mod
+
+
+def install() -> None:
+    _install_time_shims()
+    _install_micropython_module()
+    _install_uasyncio()
+    _install_ubinascii()
+    _install_urequests()
+    _install_deflate()
@@ -0,0 +1,127 @@
+# locate_sim.py - Synthetic depot visits for the WiFi positioning cache
+#
+# A fleet route visits depots with skewed frequency (a few depots most days).
+# Each depot has fixed access points; every visit sees a random subset of
+# them with noisy RSSI, plus passing phone hotspots. The fake server knows the
+# fixed APs and answers uploaded fingerprints like a geolocation service.
+# The report gives the cache hit rate (visits resolved without a request),
+# server requests and position error per cache size.
+#
+# Run from firmware_esp32/: `python3 tools/locate_sim.py`
+import math
+import random
+import sys
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, ".")
+from tools.host_shims import install  # noqa: E402
+
+install()
+
+from lib.wifi_locate import WifiLocator  # noqa: E402
+
+AP = Tuple[bytes, float, float]  # bssid, lat, lon
+
+
+class _Config:
+    def __init__(self) -> None:
+        self.values: Dict[str, Any] = {}
+
+    def get(self, key: str) -> Any:
+        return self.values.get(key)
+
+    def set(self, key: str, value: Any) -> bool:
+        self.values[key] = value
+        return True
+
+
+def error_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    dy = (lat2 - lat1) * 111320.0
+    dx = (lon2 - lon1) * 111320.0 * math.cos(math.radians(lat1))
+    return math.sqrt(dx * dx + dy * dy)
+
+
+def make_depots(rng: random.Random, n: int, aps: int = 6) -> List[Tuple[float, float, List[AP]]]:
+    depots = []
+    for i in range(n):
+        lat = 52.40 + rng.random() * 0.2
+        lon = 13.20 + rng.random() * 0.4
+        fixed = []
+        for j in range(aps):
+            bssid = bytes((0x24, 0x0A, 0xC4, i >> 8, i & 0xFF, j))
+            fixed.append((bssid, lat + rng.gauss(0, 0.0003), lon + rng.gauss(0, 0.0005)))
+        depots.append((lat, lon, fixed))
+    return depots
+
+
+def scan_at(rng: random.Random, lat: float, lon: float, fixed: List[AP]) -> List[Tuple[Any, ...]]:
+    """Raw wlan.scan() rows: most fixed APs plus one or two passing hotspots"""
+    rows = []
+    for bssid, ap_lat, ap_lon in fixed:
+        if rng.random() < 0.8:
+            d = error_m(lat, lon, ap_lat, ap_lon)
+            rssi = int(-35 - 20 * math.log10(max(d, 1.0)) + rng.gauss(0, 4))
+            rows.append((b"Depot", bssid, 6, max(rssi, -95), 3, False))
+    for _ in range(rng.randint(0, 2)):
+        hotspot = bytes(rng.getrandbits(8) for _ in range(6))
+        rows.append((b"Phone", hotspot, 11, rng.randint(-92, -80), 3, False))
+    rows.append((b"Home_nomap", b"\x00\x11\x22\x33\x44\x55", 1, -50, 3, False))
+    return rows
+
+
+def serve(fp: List[List[Any]], aps: Dict[str, AP], per_ap: bool) -> Dict[str, Any]:
+    """Geolocation stand-in: weighted centroid of the APs it knows"""
+    known = [(aps[b], rssi) for b, rssi in fp if b in aps]
+    if not known:
+        return {}
+    w = [max(1, rssi + 100) for _, rssi in known]
+    lat = sum(a[1] * wi for (a, _), wi in zip(known, w)) / sum(w)
+    lon = sum(a[2] * wi for (a, _), wi in zip(known, w)) / sum(w)
+    loc: Dict[str, Any] = {"lat": lat, "lon": lon, "acc": 40}
+    if per_ap:
+        loc["aps"] = {b: [aps[b][1], aps[b][2], 30] for b, _ in fp if b in aps}
+    return {"wifi_loc": loc}
+
+
+def simulate(
+    visits: int = 400, depots: int = 12, capacity: int = 32, per_ap: bool = True, seed: int = 7
+) -> Dict[str, float]:
+    rng = random.Random(seed)
+    sites = make_depots(rng, depots)
+    aps = {ap[0].hex(): ap for _, _, fixed in sites for ap in fixed}
+    weights = [1.0 / (k + 1) for k in range(depots)]  # Zipf: the home yard most often
+    loc = WifiLocator(_Config(), capacity=capacity)
+    requests = 0
+    errors: List[float] = []
+    for v in range(visits):
+        lat, lon, fixed = rng.choices(sites, weights)[0]
+        now = v * 600000
+        if not loc.observe(scan_at(rng, lat, lon, fixed), now):
+            fp = loc.pending
+            requests += 1
+            if fp is None or not loc.learn(fp, serve(fp, aps, per_ap), now):
+                continue
+        errors.append(error_m(lat, lon, loc.lat, loc.lon))
+    errors.sort()
+    return {
+        "hit_rate": loc.hit_rate,
+        "requests": requests,
+        "median_m": errors[len(errors) // 2] if errors else 0.0,
+        "p95_m": errors[int(len(errors) * 0.95)] if errors else 0.0,
+        "cached": len(loc),
+    }
+
+
+def main() -> None:
+    print("%-26s %8s %9s %9s %7s" % ("scenario", "hit rate", "requests", "median m", "p95 m"))
+    for capacity in (8, 16, 32, 64):
+        for per_ap in (False, True):
+            r = simulate(capacity=capacity, per_ap=per_ap)
+            name = "cache %d, %s" % (capacity, "per-AP reply" if per_ap else "position only")
+            row = (name, r["hit_rate"] * 100, r["requests"], r["median_m"], r["p95_m"])
+            print("%-26s %7.1f%% %9d %9.0f %7.0f" % row)
+    print("400 visits to 12 depots (6 APs each), Zipf-weighted; requests = server round trips")
+
+
+if __name__ == "__main__":
+    main()
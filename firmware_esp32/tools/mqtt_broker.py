@@ -0,0 +1,264 @@
+# mqtt_broker.py - Minimal MQTT 3.1.1 broker stand-in, and transport throughput / reconnect report
+#
+# Broker runs on asyncio in the same event loop as the client under test. It
+# supports what MqttUplink uses: persistent sessions per client ID (the
+# subscriptions and unacknowledged QoS 1 messages survive a disconnect),
+# QoS 0/1 publishes routed to "+"/"#" filters, SUBSCRIBE, PING and
+# DISCONNECT. Test hooks: `ack_delay_ms` (broker round trip), `drop_acks`
+# (swallow the next N PUBACKs), `kill()` (cut a client's socket) and
+# `mute_pings`.
+#
+# The report publishes a run of live uploads through HttpPoster over
+# MqttUplink at several in-flight windows with a simulated round trip, then
+# cuts the link mid-stream and checks that nothing was lost.
+#
+# Run from firmware_esp32/: `python3 tools/mqtt_broker.py`
+import asyncio
+import os
+import struct
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+sys.path.insert(0, ".")
+from tools.host_shims import install  # noqa: E402
+
+install()
+
+from lib.logger import Logger  # noqa: E402
+from lib.mqtt_uplink import (  # noqa: E402
+    CONNACK,
+    PINGRESP,
+    PUBACK,
+    PUBLISH,
+    SUBACK,
+    MqttUplink,
+    packet,
+    publish_packet,
+    read_packet,
+)
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    p = pattern.split("/")
+    t = topic.split("/")
+    for i, part in enumerate(p):
+        if part == "#":
+            return True
+        if i >= len(t) or (part != "+" and part != t[i]):
+            return False
+    return len(p) == len(t)
+
+
+class _Session:
+    def __init__(self) -> None:
+        self.subs: Set[str] = set()
+        self.outbox: Dict[int, bytes] = {}  # Packet ID -> PUBLISH to this client, unacked
+        self.pid = 0
+        self.writer: Any = None
+
+
+class Broker:
+    def __init__(self, ack_delay_ms: int = 0, password: Optional[str] = None) -> None:
+        self.ack_delay_ms = ack_delay_ms
+        self.password = password  # None: any credentials
+        self.sessions: Dict[str, _Session] = {}
+        self.received: List[Tuple[str, str, bytes, bool]] = []  # client, topic, payload, dup
+        self.drop_acks = 0
+        self.mute_pings = False
+        self.connects = 0
+        self.pings = 0
+        self.port = 0
+        self._server: Any = None
+
+    async def start(self) -> "Broker":
+        self._server = await asyncio.start_server(self._client, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self) -> None:
+        for s in self.sessions.values():
+            if s.writer:
+                s.writer.close()
+        self._server.close()
+        await self._server.wait_closed()
+
+    def kill(self, client_id: str) -> None:
+        """Cut the client's connection without a DISCONNECT"""
+        s = self.sessions.get(client_id)
+        if s and s.writer:
+            s.writer.transport.abort()
+            s.writer = None
+
+    async def publish(self, topic: str, payload: bytes) -> None:
+        """Server-side QoS 1 publish; queued in sessions whose client is offline"""
+        for s in self.sessions.values():
+            if any(topic_matches(f, topic) for f in s.subs):
+                s.pid = s.pid % 65535 + 1
+                pkt = publish_packet(topic.encode(), payload, s.pid)
+                s.outbox[s.pid] = pkt
+                if s.writer:
+                    s.writer.write(pkt)
+                    await s.writer.drain()
+
+    def payloads(self, topic_prefix: str = "") -> List[bytes]:
+        return [p for _, t, p, _ in self.received if t.startswith(topic_prefix)]
+
+    async def _client(self, reader: Any, writer: Any) -> None:
+        session = None
+        try:
+            first, body = await read_packet(reader)
+            if first != 0x10:
+                return
+            session = self._connect(body, writer)
+            if session is None:
+                return
+            while True:
+                first, body = await read_packet(reader)
+                kind = first & 0xF0
+                if kind == PUBLISH:
+                    await self._on_publish(session, first, body, writer)
+                elif kind == PUBACK:
+                    session.outbox.pop(struct.unpack("!H", body)[0], None)
+                elif kind == 0x80:  # SUBSCRIBE
+                    pid = body[:2]
+                    n = struct.unpack_from("!H", body, 2)[0]
+                    session.subs.add(body[4 : 4 + n].decode())
+                    writer.write(packet(SUBACK, pid + b"\x01"))
+                elif kind == 0xC0:  # PINGREQ
+                    self.pings += 1
+                    if not self.mute_pings:
+                        writer.write(packet(PINGRESP, b""))
+                elif kind == 0xE0:  # DISCONNECT
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if session is not None and session.writer is writer:
+                session.writer = None
+            writer.close()
+
+    def _connect(self, body: bytes, writer: Any) -> Optional[_Session]:
+        n = struct.unpack_from("!H", body)[0]
+        flags = body[2 + n + 1]
+        pos = 2 + n + 4
+        cid_len = struct.unpack_from("!H", body, pos)[0]
+        client_id = body[pos + 2 : pos + 2 + cid_len].decode()
+        pos += 2 + cid_len
+        password = ""
+        if flags & 0x80:
+            pos += 2 + struct.unpack_from("!H", body, pos)[0]
+            if flags & 0x40:
+                m = struct.unpack_from("!H", body, pos)[0]
+                password = body[pos + 2 : pos + 2 + m].decode()
+        if self.password is not None and password != self.password:
+            writer.write(packet(CONNACK, b"\x00\x05"))  # Not authorized
+            return None
+        clean = bool(flags & 0x02)
+        present = client_id in self.sessions and not clean
+        if not present:
+            self.sessions[client_id] = _Session()
+        session = self.sessions[client_id]
+        session.writer = writer
+        self.connects += 1
+        writer.write(packet(CONNACK, bytes((1 if present else 0, 0))))
+        for pid in sorted(session.outbox):  # Queued while offline, or never acknowledged
+            pkt = session.outbox[pid]
+            writer.write(bytes((pkt[0] | 0x08,)) + pkt[1:] if present else pkt)
+        session.client_id = client_id  # type: ignore[attr-defined]
+        return session
+
+    async def _on_publish(self, session: _Session, first: int, body: bytes, writer: Any) -> None:
+        n = struct.unpack_from("!H", body)[0]
+        topic = body[2 : 2 + n].decode()
+        qos = (first >> 1) & 3
+        pos = 2 + n + (2 if qos else 0)
+        client = session.client_id  # type: ignore[attr-defined]
+        self.received.append((client, topic, body[pos:], bool(first & 0x08)))
+        for other in self.sessions.values():
+            if other is not session and any(topic_matches(f, topic) for f in other.subs):
+                if other.writer:
+                    other.writer.write(publish_packet(topic.encode(), body[pos:], 0, 0))
+        if not qos:
+            return
+        if self.drop_acks:
+            self.drop_acks -= 1
+            return
+        ack = packet(PUBACK, body[2 + n : pos])
+        if self.ack_delay_ms:
+            loop = asyncio.get_running_loop()
+            loop.call_later(self.ack_delay_ms / 1000, self._late, writer, ack)
+        else:
+            writer.write(ack)
+
+    def _late(self, writer: Any, ack: bytes) -> None:
+        if not writer.is_closing():
+            writer.write(ack)
+
+
+async def _throughput(window: int, batches: int, rtt_ms: int) -> Dict[str, float]:
+    from lib.http_poster import HttpPoster
+    from tools.config_server import MemConfig
+
+    broker = await Broker(ack_delay_ms=rtt_ms).start()
+    config = MemConfig(device_id="trk-0042", ingest_transport="mqtt")
+    poster = HttpPoster(config)
+    uplink = MqttUplink("127.0.0.1", "trk-0042", port=broker.port, inflight=window)
+    poster.use_mqtt(uplink, "lmt/trk-0042/up")
+    record = {"lat": 52.52, "lon": 13.405, "temp": 4.0, "shock": 3, "speed": 31.5}
+    start = time.monotonic()
+    for i in range(batches):
+        rec = dict(record, lat=52.52 + i * 0.01)  # 1 km apart: every sample passes the deadband
+        await poster.post_telemetry(rec)
+    await uplink.flush()
+    elapsed = time.monotonic() - start
+    await uplink.close()
+    await broker.close()
+    return {
+        "msgs_per_s": batches / elapsed,
+        "bytes_per_msg": uplink.bytes_out / batches,  # CONNECT, framing and PINGs included
+        "body_bytes": poster.bytes_sent / batches,
+        "delivered": len(broker.received),
+    }
+
+
+async def _reconnect(messages: int) -> Dict[str, int]:
+    broker = await Broker(ack_delay_ms=2).start()
+    uplink = MqttUplink("127.0.0.1", "trk-1", port=broker.port, inflight=8)
+    for i in range(messages):
+        if i == messages // 2:
+            broker.kill("trk-1")
+            await asyncio.sleep(0.01)
+        while not await uplink.publish("lmt/trk-1/up", b"%d" % i, wait=False):
+            await asyncio.sleep(0.01)
+    await uplink.flush()
+    got = {int(p) for p in broker.payloads()}
+    await uplink.close()
+    await broker.close()
+    return {
+        "sent": messages,
+        "unique": len(got),
+        "resent": uplink.resent,
+        "links": uplink.connects,
+    }
+
+
+def main() -> None:
+    Logger.LOG_FILE = os.path.join(tempfile.gettempdir(), "lmt_mqtt_broker_log.txt")
+    Logger.SILENT_PERIOD_MS = 1 << 40  # Keep the report readable
+    Logger.MAX_SIZE = 1 << 30  # Rotation renames into the cwd
+    print("window  msgs/s  body B  wire B/msg  delivered   (200 uploads, 20 ms broker round trip)")
+    for window in (1, 4, 16):
+        t = asyncio.run(_throughput(window, 200, 20))
+        row = (window, t["msgs_per_s"], t["body_bytes"], t["bytes_per_msg"], t["delivered"])
+        print("%6d %7.0f %7.0f %11.0f %10d" % row)
+    r = asyncio.run(_reconnect(200))
+    print(
+        "link cut mid-stream: %d sent, %d received, %d resent with DUP, %d connects"
+        % (r["sent"], r["unique"], r["resent"], r["links"])
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# ntp_sim.py - Local SNTP stand-in and a drifting device clock, resync cost per drift
+#
+# SntpServer answers SNTP requests on a localhost UDP port from a "true" clock.
+# DriftClock replaces time.ticks_ms with one that runs `ppm` fast (or slow)
+# against true time, which can be advanced instantly between syncs. A fake
+# `machine.RTC` records what NTPClient sets. The report gives the number of
+# syncs per day and the worst clock error seen before each resync, per drift,
+# against a fixed daily sync.
+#
+# Run from firmware_esp32/: `python3 tools/ntp_sim.py`
+import asyncio
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import types
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, ".")
+from tools.host_shims import install  # noqa: E402
+
+install()
+
+T0_MS = 1718409600000  # True time when a DriftClock starts: 2024-06-15 00:00:00 UTC
+_NTP_1970 = 2208988800
+rtc_sets: List[Tuple[int, ...]] = []  # datetime tuples given to the fake RTC
+
+
+def install_fake_machine() -> None:
+    """Register a `machine` module whose RTC().datetime(t) appends t to rtc_sets"""
+    if "machine" in sys.modules:
+        return
+
+    class RTC:
+        def datetime(self, t: Optional[Tuple[int, ...]] = None) -> Any:
+            if t is not None:
+                rtc_sets.append(t)
+            return rtc_sets[-1] if rtc_sets else None
+
+    mod = types.ModuleType("machine")
+    mod.RTC = RTC  # type: ignore[attr-defined]
+    sys.modules["machine"] = mod
+
+
+def _ntp(ms: int) -> bytes:
+    sec, rem = divmod(ms, 1000)
+    return struct.pack("!II", sec + _NTP_1970, (rem << 32) // 1000)
+
+
+class SntpServer:
+    """SNTP server thread on 127.0.0.1; `clock()` gives true Unix milliseconds"""
+
+    def __init__(self, clock: Callable[[], int], stratum: int = 2) -> None:
+        self.clock = clock
+        self.stratum = stratum
+        self.drop = False  # Unreachable: requests are read and ignored
+        self.requests = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.settimeout(0.05)
+        self.port = self._sock.getsockname()[1]
+        self._stop = False
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def __enter__(self) -> "SntpServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop = True
+        self._thread.join()
+        self._sock.close()
+
+    def _serve(self) -> None:
+        while not self._stop:
+            try:
+                req, addr = self._sock.recvfrom(512)
+            except OSError:
+                continue
+            self.requests += 1
+            if self.drop or len(req) < 48:
+                continue
+            t2 = self.clock()
+            head = bytes((0x24, self.stratum, 6, 0xEC)) + bytes(8) + b"GPS\x00"
+            reply = head + _ntp(t2 - 1000) + req[40:48] + _ntp(t2) + _ntp(self.clock())
+            self._sock.sendto(reply, addr)
+
+
+class DriftClock:
+    """Context manager: time.ticks_ms runs `ppm` fast against true time (negative: slow)"""
+
+    def __init__(self, ppm: float) -> None:
+        self.ppm = ppm
+        self.skipped_ms = 0
+        self._start = 0.0
+        self._saved: Any = None
+
+    def true_ms(self) -> int:
+        return T0_MS + int((time.monotonic() - self._start) * 1000) + self.skipped_ms
+
+    def advance(self, ms: int) -> None:
+        self.skipped_ms += ms
+
+    def __enter__(self) -> "DriftClock":
+        self._start = time.monotonic()
+        self._saved = time.ticks_ms  # type: ignore[attr-defined]
+        scale = 1 + self.ppm / 1e6
+        time.ticks_ms = lambda: int((self.true_ms() - T0_MS) * scale)  # type: ignore
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        time.ticks_ms = self._saved  # type: ignore[attr-defined]
+
+
+class _Config:
+    def __init__(self, **values: Any) -> None:
+        self.values = values
+
+    def get(self, key: str) -> Any:
+        return self.values.get(key)
+
+
+install_fake_machine()
+
+from lib.logger import Logger  # noqa: E402
+from lib.ntp_time import NTPClient  # noqa: E402
+
+
+def simulate(
+    ppm: float, days: float = 7, max_error_ms: int = 1000, daily: bool = False
+) -> Dict[str, float]:
+    """Resync whenever due (or daily); syncs per day and the worst error before a resync"""
+    with DriftClock(ppm) as clock, SntpServer(clock.true_ms) as server:
+        config = _Config(ntp_server="127.0.0.1", ntp_max_error_ms=max_error_ms)
+        ntp = NTPClient(config, port=server.port)
+        step_ms = 60000
+        worst = 0
+        syncs = 0
+        next_daily = 0
+        for _ in range(int(days * 86400000 // step_ms)):
+            due = clock.skipped_ms >= next_daily if daily else ntp.due()
+            if due:
+                local = ntp.now_ms()
+                if local is not None:
+                    worst = max(worst, abs(clock.true_ms() - local))
+                asyncio.run(ntp.sync())
+                syncs += 1
+                next_daily = clock.skipped_ms + 86400000
+            clock.advance(step_ms)
+    return {
+        "syncs_per_day": syncs / days,
+        "worst_ms": worst,
+        "drift_ppm": ntp.drift_ppm or 0.0,
+        "interval_s": 86400 if daily else ntp.interval_s,
+    }
+
+
+def main() -> None:
+    Logger.LOG_FILE = os.path.join(tempfile.gettempdir(), "lmt_ntp_sim_log.txt")
+    Logger.SILENT_PERIOD_MS = 1 << 40  # Keep the report readable
+    Logger.MAX_SIZE = 1 << 30  # Rotation renames into the cwd
+    print(
+        "%-16s %10s %9s %10s %11s" % ("clock", "syncs/day", "worst ms", "est. ppm", "interval s")
+    )
+    for ppm in (2, 10, 20, -40, 80):
+        for daily in (False, True):
+            r = simulate(ppm, days=7, daily=daily)
+            name = "%+d ppm, %s" % (ppm, "daily" if daily else "adaptive")
+            row = (name, r["syncs_per_day"], r["worst_ms"], r["drift_ppm"], r["interval_s"])
+            print("%-16s %10.1f %9d %10.1f %11d" % row)
+    print("7 simulated days, error bound 1000 ms; worst = largest error seen before a resync")
+    print("(the blocking client synced on every WiFi connect, i.e. every upload window)")
+
+
+if __name__ == "__main__":
+    main()
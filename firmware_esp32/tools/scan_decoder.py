@@ -0,0 +1,88 @@
+# scan_decoder.py - Reference decoder for packed WiFi scan notifications
+#
+# Mirrors what the phone app must do with notifications on characteristic
+# 0xFF01 after a packed scan request (binary OP_SCAN or "CMD:SCAN:PACKED"):
+#
+# 1. A notification whose first byte is 0xB3 is a page:
+#    magic(1), seq(1), count(1), then `count` entries of
+#    ssid_len(1), ssid(utf-8), rssi(int8 dBm), channel(1), authmode(1), bssid(6).
+#    seq starts at 0 and increments by one per page (mod 256); a gap means
+#    a page was lost and the scan should be re-requested.
+# 2. "SCAN:END:<n>" ends the scan; <n> is the total number of networks.
+#    If the entries received do not add up to <n>, the result is incomplete.
+# 3. Anything else (legacy "SSID,RSSI" lines, framed command responses) is
+#    not part of the packed scan stream.
+import struct
+from typing import Dict, List, Optional
+
+PAGE_MAGIC = 0xB3
+TRAILER_PREFIX = b"SCAN:END:"
+
+
+class ScanDecodeError(ValueError):
+    pass
+
+
+def decode_page(payload: bytes) -> List[Dict[str, object]]:
+    if len(payload) < 3 or payload[0] != PAGE_MAGIC:
+        raise ScanDecodeError("not a scan page")
+    count = payload[2]
+    off = 3
+    networks: List[Dict[str, object]] = []
+    for _ in range(count):
+        if off >= len(payload):
+            raise ScanDecodeError("truncated entry header")
+        n = payload[off]
+        end = off + 1 + n + 9
+        if end > len(payload):
+            raise ScanDecodeError("truncated entry")
+        ssid = payload[off + 1 : off + 1 + n].decode("utf-8", "replace")
+        rssi, channel, auth = struct.unpack_from("<bBB", payload, off + 1 + n)
+        bssid = payload[off + 1 + n + 3 : end]
+        networks.append(
+            {
+                "ssid": ssid,
+                "rssi": rssi,
+                "channel": channel,
+                "authmode": auth,
+                "bssid": ":".join("%02x" % b for b in bssid),
+            }
+        )
+        off = end
+    if off != len(payload):
+        raise ScanDecodeError("trailing bytes after entries")
+    return networks
+
+
+def parse_trailer(payload: bytes) -> Optional[int]:
+    if not payload.startswith(TRAILER_PREFIX):
+        return None
+    try:
+        return int(payload[len(TRAILER_PREFIX) :])
+    except ValueError:
+        raise ScanDecodeError("bad trailer count") from None
+
+
+class ScanAssembler:
+    """Feed notifications in arrival order; `result` is set once the scan completes."""
+
+    def __init__(self) -> None:
+        self.networks: List[Dict[str, object]] = []
+        self.result: Optional[List[Dict[str, object]]] = None
+        self._next_seq = 0
+
+    def feed(self, payload: bytes) -> bool:
+        """Returns True once the trailer arrived and the scan is complete"""
+        if payload[:1] == bytes((PAGE_MAGIC,)):
+            if payload[1] != self._next_seq:
+                raise ScanDecodeError("page %d lost" % self._next_seq)
+            self._next_seq = (self._next_seq + 1) & 0xFF
+            self.networks.extend(decode_page(payload))
+            return False
+        total = parse_trailer(payload)
+        if total is None:
+            return False
+        if total != len(self.networks):
+            raise ScanDecodeError("expected %d networks, got %d" % (total, len(self.networks)))
+        self.result = self.networks
+        return True
@@ -0,0 +1,176 @@
+# shock_eval.py - Host evaluation harness for the on-device shock classifier
+#
+# Replays labeled accelerometer traces through the same ShockBuffer capture
+# and ShockClassifier the firmware uses, then prints a confusion matrix.
+#
+# Recorded traces are JSON lines, one event per line:
+#   {"label": "drop", "rate_hz": 100, "samples": [[x, y, z], ...]}
+# with raw MPU6050 counts (16384 per g). Without --events, a synthetic set is
+# generated so the default tree can be checked without hardware.
+#
+# Run from firmware_esp32/:
+#   python3 tools/shock_eval.py [--events recorded.jsonl] [--tree tree.json]
+import json
+import math
+import random
+import sys
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+sys.path.insert(0, ".")
+from tools.host_shims import install  # noqa: E402
+
+install()
+
+from lib.shock_buffer import LSB_PER_G, ShockBuffer  # noqa: E402
+from lib.shock_classifier import CLASS_NAMES, ShockClassifier  # noqa: E402
+
+Sample = Tuple[int, int, int]
+Labeled = Tuple[str, int, List[Sample]]  # (label, rate_hz, samples)
+
+G = LSB_PER_G
+
+
+def _clip(v: float) -> int:
+    return max(-32768, min(32767, int(v)))
+
+
+def _noise(rng: random.Random, s: Sample, mg: int = 15) -> Sample:
+    n = mg * G // 1000
+    return (
+        _clip(s[0] + rng.randint(-n, n)),
+        _clip(s[1] + rng.randint(-n, n)),
+        _clip(s[2] + rng.randint(-n, n)),
+    )
+
+
+def _rest(count: int, g: Sample = (0, 0, G)) -> List[Sample]:
+    return [g] * count
+
+
+def _drop(rng: random.Random) -> List[Sample]:
+    fall = rng.randint(8, 18)  # 80-180 ms of free fall (3-16 cm)
+    out = _rest(60)
+    out += [(rng.randint(-800, 800), rng.randint(-800, 800), rng.randint(-800, 800))] * fall
+    land = 2.0 + rng.random()
+    out += [(_clip(0.6 * G), _clip(-0.5 * G), _clip(land * G))] * 2
+    for k in range(12):  # Bounce
+        amp = 0.8 * math.exp(-k / 3) * (1 if k % 2 else -1)
+        out.append((0, 0, _clip((1 + amp) * G)))
+    return out + _rest(60)
+
+
+def _impact(rng: random.Random) -> List[Sample]:
+    sx = rng.choice((-1, 1))
+    sy = rng.choice((-1, 1))
+    out = _rest(60)
+    out += [(_clip(sx * 2.2 * G), _clip(sy * 2.1 * G), _clip(1.3 * G))] * rng.randint(1, 3)
+    for k in range(8):
+        amp = 0.5 * math.exp(-k / 2) * (1 if k % 2 else -1)
+        out.append((_clip(amp * G), 0, G))
+    return out + _rest(60)
+
+
+def _bump(rng: random.Random) -> List[Sample]:
+    out = _rest(60)
+    x = (1.8 + 0.15 * rng.random()) * G
+    out += [(_clip(x / 2), 0, G), (_clip(x), 0, G), (_clip(x / 2), 0, G)]
+    return out + _rest(60)
+
+
+def _vibration(rng: random.Random) -> List[Sample]:
+    freq = rng.uniform(14, 24)
+    amp = rng.uniform(1.1, 1.4)
+    out = _rest(20)
+    for i in range(140):  # Rattling on a truck bed: mostly vertical, some lateral
+        w = 2 * math.pi * freq * i / 100
+        x = 0.6 * amp * math.sin(w + 1.0)
+        out.append((_clip(x * G), 0, _clip((1 + amp * math.sin(w)) * G)))
+    return out + _rest(20)
+
+
+def _tip_over(rng: random.Random) -> List[Sample]:
+    steps = rng.randint(8, 14)
+    out = _rest(60)
+    for k in range(steps):  # Rotate z-up to x-up over 80-140 ms
+        a = (math.pi / 2) * (k + 1) / steps
+        out.append((_clip(math.sin(a) * G), 0, _clip(math.cos(a) * G)))
+    out += [(_clip(2.3 * G), _clip(0.4 * G), _clip(-0.3 * G))] * 2  # Lands on its side
+    return out + _rest(60, (G, 0, 0))
+
+
+GENERATORS = {
+    "drop": _drop,
+    "impact": _impact,
+    "bump": _bump,
+    "vibration": _vibration,
+    "tip_over": _tip_over,
+}
+
+
+def synthetic_events(per_class: int = 40, seed: int = 1) -> List[Labeled]:
+    rng = random.Random(seed)
+    events = []
+    for label, gen in GENERATORS.items():
+        for _ in range(per_class):
+            events.append((label, 100, [_noise(rng, s) for s in gen(rng)]))
+    return events
+
+
+def load_events(path: str) -> List[Labeled]:
+    events = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                ev = json.loads(line)
+                samples = [(int(s[0]), int(s[1]), int(s[2])) for s in ev["samples"]]
+                events.append((ev["label"], int(ev.get("rate_hz", 100)), samples))
+    return events
+
+
+def classify_trace(
+    classifier: ShockClassifier, rate_hz: int, samples: Iterable[Sample]
+) -> Optional[int]:
+    """Capture the first event in a trace as the firmware would and classify it"""
+    buf = ShockBuffer(rate_hz=rate_hz)
+    for i, (x, y, z) in enumerate(samples):
+        ev = buf.add_sample(x, y, z, i * 1000 // rate_hz)
+        if ev is not None:
+            return classifier.classify(ev.wave, buf.window, buf.pre, rate_hz)
+    return None  # Never left the threshold band
+
+
+def evaluate(
+    events: Sequence[Labeled], tree: Optional[List[List[int]]] = None
+) -> Tuple[Dict[str, Dict[str, int]], float]:
+    """Confusion matrix {label: {predicted: count}} and accuracy"""
+    classifier = ShockClassifier(tree)
+    confusion: Dict[str, Dict[str, int]] = {}
+    correct = 0
+    for label, rate_hz, samples in events:
+        cls = classify_trace(classifier, rate_hz, samples)
+        predicted = CLASS_NAMES[cls] if cls is not None else "none"
+        row = confusion.setdefault(label, {})
+        row[predicted] = row.get(predicted, 0) + 1
+        correct += predicted == label
+    return confusion, correct / max(1, len(events))
+
+
+def main(argv: List[str]) -> None:
+    events = synthetic_events()
+    tree = None
+    if "--events" in argv:
+        events = load_events(argv[argv.index("--events") + 1])
+    if "--tree" in argv:
+        with open(argv[argv.index("--tree") + 1]) as f:
+            tree = json.load(f)
+
+    confusion, accuracy = evaluate(events, tree)
+    columns = list(CLASS_NAMES) + ["none"]
+    print("%-10s" % "label" + "".join("%10s" % c for c in columns))
+    for label, row in sorted(confusion.items()):
+        print("%-10s" % label + "".join("%10d" % row.get(c, 0) for c in columns))
+    print("accuracy: %.1f%% over %d events" % (accuracy * 100, len(events)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
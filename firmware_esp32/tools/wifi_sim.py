@@ -0,0 +1,242 @@
+# wifi_sim.py - Fake network.WLAN on a virtual clock, and connect latency per strategy
+#
+# FakeWLAN models an ESP32 station connecting to one AP: a fast scan that
+# stops at the AP's channel (all 13 channels if it is not found), association,
+# then DHCP unless a static address was set. `time.ticks_ms`, `time.time` and
+# `asyncio.sleep_ms` run on a VirtualClock, so WiFiManager's polling loop
+# advances simulated time instead of sleeping.
+#
+# Run from firmware_esp32/: `python3 tools/wifi_sim.py`
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import types
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, ".")
+from tools.host_shims import install  # noqa: E402
+
+install()
+
+STAT_IDLE = 1000
+STAT_CONNECTING = 1001
+STAT_GOT_IP = 1010
+STAT_NO_AP_FOUND = 201
+STAT_WRONG_PASSWORD = 202
+STAT_CONNECT_FAIL = 204
+
+_current: List["FakeWLAN"] = []
+
+
+def install_fake_network() -> None:
+    """Register a `network` module whose WLAN() returns the current FakeWLAN"""
+    if "network" in sys.modules:
+        return
+    mod = types.ModuleType("network")
+    mod.STA_IF = 0  # type: ignore[attr-defined]
+    mod.WLAN = lambda iface: _current[-1]  # type: ignore[attr-defined]
+    for name, value in list(globals().items()):
+        if name.startswith("STAT_"):
+            setattr(mod, name, value)
+    sys.modules["network"] = mod
+
+
+class VirtualClock:
+    """Context manager: ticks_ms/time/sleep_ms on simulated time"""
+
+    def __init__(self, epoch: int = 1718409600) -> None:
+        self.ms = 0
+        self.epoch = epoch
+        self._saved: Tuple[Any, ...] = ()
+
+    def advance(self, ms: int) -> None:
+        self.ms += ms
+
+    def __enter__(self) -> "VirtualClock":
+        self._saved = (time.ticks_ms, time.time, asyncio.sleep_ms)  # type: ignore[attr-defined]
+
+        async def sleep_ms(ms: int) -> None:
+            self.ms += ms
+            await asyncio.sleep(0)
+
+        time.ticks_ms = lambda: self.ms  # type: ignore[attr-defined]
+        time.time = lambda: self.epoch + self.ms // 1000  # type: ignore[assignment]
+        asyncio.sleep_ms = sleep_ms  # type: ignore[attr-defined]
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        time.ticks_ms, time.time, asyncio.sleep_ms = self._saved  # type: ignore
+
+
+class FakeWLAN:
+    def __init__(
+        self,
+        clock: VirtualClock,
+        ssid: str = "Depot",
+        key: str = "secret",
+        channel: int = 6,
+        bssid: bytes = b"\x24\x0a\xc4\x11\x22\x33",
+        scan_ms_per_channel: int = 120,
+        assoc_ms: int = 300,
+        dhcp_ms: int = 1500,
+        scan_block_s: float = 0.0,
+    ) -> None:
+        self.clock = clock
+        self.ssid = ssid
+        self.key = key
+        self.channel = channel
+        self.bssid = bssid
+        self.scan_ms = scan_ms_per_channel
+        self.assoc_ms = assoc_ms
+        self.dhcp_ms = dhcp_ms
+        self.scan_block_s = scan_block_s  # Real time scan() holds the caller, like the IDF scan
+        self.scans = 0
+        self.lease = ("192.168.4.23", "255.255.255.0", "192.168.4.1", "192.168.4.1")
+        self.calls: List[Tuple[Any, ...]] = []
+        self._active = False
+        self._static: Optional[Tuple[str, str, str, str]] = None
+        self._ready_ms: Optional[int] = None
+        self._fail: Optional[int] = None
+        _current.append(self)
+
+    def active(self, on: Optional[bool] = None) -> bool:
+        if on is not None:
+            self.calls.append(("active", bool(on)))
+            self._active = bool(on)
+            if not on:
+                self._ready_ms = None
+        return self._active
+
+    def connect(self, ssid: str, key: str, bssid: Optional[bytes] = None) -> None:
+        self.calls.append(("connect", ssid, bssid))
+        now = self.clock.ms
+        if ssid != self.ssid or (bssid is not None and bssid != self.bssid):
+            self._ready_ms = now + 13 * self.scan_ms
+            self._fail = STAT_NO_AP_FOUND
+            return
+        assoc = now + self.channel * self.scan_ms + self.assoc_ms
+        if key != self.key:
+            self._ready_ms = assoc
+            self._fail = STAT_WRONG_PASSWORD
+            return
+        self._ready_ms = assoc + (0 if self._static else self.dhcp_ms)
+        self._fail = None
+
+    def disconnect(self) -> None:
+        self.calls.append(("disconnect",))
+        self._ready_ms = None
+
+    def isconnected(self) -> bool:
+        r = self._ready_ms
+        return r is not None and self._fail is None and self.clock.ms >= r
+
+    def status(self, *args: Any) -> int:
+        r = self._ready_ms
+        if r is None:
+            return STAT_IDLE
+        if self.clock.ms < r:
+            return STAT_CONNECTING
+        return self._fail or STAT_GOT_IP
+
+    def ifconfig(self, cfg: Any = None) -> Tuple[str, str, str, str]:
+        if cfg is None:
+            return self._static or (self.lease if self.isconnected() else ("0.0.0.0",) * 4)
+        self.calls.append(("ifconfig", cfg))
+        self._static = None if cfg == "dhcp" else tuple(cfg)  # type: ignore[assignment]
+        return self.ifconfig()
+
+    def config(self, *args: Any, **kwargs: Any) -> Any:
+        if kwargs:
+            self.calls.append(("config", kwargs))
+            return None
+        if args == ("channel",):
+            return self.channel if self.isconnected() else 1
+        raise ValueError("unknown config param")
+
+    def scan(self) -> List[Tuple[bytes, bytes, int, int, int, bool]]:
+        self.scans += 1
+        if self.scan_block_s:
+            time.sleep(self.scan_block_s)
+        self.clock.advance(13 * self.scan_ms)
+        return [
+            (self.ssid.encode(), self.bssid, self.channel, -58, 3, False),
+            (self.ssid.encode(), b"\x24\x0a\xc4\x99\x99\x99", 1, -80, 3, False),
+            (b"Neighbour", b"\x00\x11\x22\x33\x44\x55", 11, -70, 3, False),
+        ]
+
+
+class DictConfig:
+    def __init__(self, **values: Any) -> None:
+        self.values: Dict[str, Any] = {"wifi_lease_ttl_sec": 3600, "wifi_link_cache": None}
+        self.values.update(values)
+        self.writes = 0
+        self.key_writes: Dict[str, int] = {}
+
+    def get(self, key: str) -> Any:
+        return self.values.get(key)
+
+    def set(self, key: str, value: Any) -> bool:
+        self.values[key] = value
+        self.writes += 1
+        self.key_writes[key] = self.key_writes.get(key, 0) + 1
+        return True
+
+
+install_fake_network()
+
+from lib.diagnostics import Diagnostics  # noqa: E402
+from lib.logger import Logger  # noqa: E402
+from lib.wifi_manager import WiFiManager  # noqa: E402
+
+
+def duty_cycle(
+    cycles: int, interval_s: int, ttl_s: int = 3600, change_ap_at: int = -1, scan: bool = True
+) -> Tuple[Diagnostics, DictConfig]:
+    """Connect, upload, disconnect every interval_s; optionally replace the AP mid-run"""
+    with VirtualClock() as clock:
+        wlan = FakeWLAN(clock)
+        config = DictConfig(wifi_ssid="Depot", wifi_pass="secret", wifi_lease_ttl_sec=ttl_s)
+        diag = Diagnostics(config)
+        wifi = WiFiManager(config, diagnostics=diag)
+        if scan:
+            asyncio.run(wifi.scan_networks())
+        for i in range(cycles):
+            if i == change_ap_at:
+                wlan.bssid = b"\x24\x0a\xc4\x44\x55\x66"
+                wlan.channel = 11
+            asyncio.run(wifi.connect())
+            clock.advance(2000)  # Upload
+            wlan.disconnect()
+            clock.advance(interval_s * 1000)
+    return diag, config
+
+
+def main() -> None:
+    Logger.LOG_FILE = os.path.join(tempfile.gettempdir(), "lmt_wifi_sim_log.txt")
+    Logger.SILENT_PERIOD_MS = 1 << 40  # Keep the report readable
+    Logger.MAX_SIZE = 1 << 30  # Rotation renames into the cwd
+    print("%-34s %6s %9s %8s %6s" % ("scenario", "full", "fast", "mean ms", "max"))
+    scenarios = (
+        ("every 60 s, lease reuse off", 120, 60, 0, -1),
+        ("every 60 s, lease ttl 1 h", 120, 60, 3600, -1),
+        ("every 15 min, lease ttl 1 h", 40, 900, 3600, -1),
+        ("every 60 s, AP replaced at 60", 120, 60, 3600, 60),
+    )
+    for name, cycles, interval, ttl, change in scenarios:
+        diag, _ = duty_cycle(cycles, interval, ttl, change)
+        full = diag.histograms.get("wifi_full_ms")
+        fast = diag.histograms.get("wifi_fast_ms")
+        hs = [h for h in (full, fast) if h]
+        n = sum(h.n for h in hs)
+        mean = sum(h.total for h in hs) // n
+        worst = max(h.max for h in hs)
+        fails = diag.counters.get("wifi_fast_fail", 0)
+        fast_txt = "%d/%d" % (fast.n if fast else 0, fails)
+        print("%-34s %6d %9s %8d %6d" % (name, full.n if full else 0, fast_txt, mean, worst))
+    print("fast column: successful fast reconnects / fast attempts that fell back")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+# Type stub for the MicroPython builtin module; only what the firmware imports.
+from typing import TypeVar
+
+_T = TypeVar("_T")
+
+def const(expr: _T) -> _T: ...